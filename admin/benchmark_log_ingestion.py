@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+    Measures analysis log ingestion time on a synthetic run directory, comparing serial parsing with thread and
+    process pools.
+
+    Usage:
+        python3 admin/benchmark_log_ingestion.py [--num_logs 10000] [--jobs 8] [--log_kb 64] [--directory /path]
+                                                 [--latency_ms 0]
+
+    Use --directory to build the tree on the filesystem of interest, e.g. a network mount, where per-file latency
+    dominates and thread pools show the largest benefit. Without such a filesystem at hand, --latency_ms adds a fixed
+    delay to every log read, standing in for the round trip of a network filesystem, so that the overlap of reads by
+    concurrent jobs can be measured on a local disk or a single core.
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+from typing import Any, Callable, Dict
+
+import gromax.analysis
+from gromax.analysis import constructGromaxData
+from gromax.file_io import SanitizeDirectoryStructure, parseDirectoryStructure
+
+_COMPONENTS_PER_TRIAL = 4
+_TRIALS_PER_GROUP = 5
+
+
+def _buildTree(directory: str, num_logs: int, log_kb: int):
+    filler: str = "Step           Time\n    1000        2.00000\n" * (log_kb * 1024 // 45)
+    num_groups: int = max(1, num_logs // (_COMPONENTS_PER_TRIAL * _TRIALS_PER_GROUP))
+    for group in range(1, num_groups + 1):
+        for trial in range(1, _TRIALS_PER_GROUP + 1):
+            trial_dir: str = os.path.join(directory, "group_{}".format(group), "trial_{}".format(trial))
+            os.makedirs(trial_dir)
+            for component in range(1, _COMPONENTS_PER_TRIAL + 1):
+                name: str = "group_{}_trial_{}_component_{}".format(group, trial, component)
+                with open(os.path.join(trial_dir, name + ".log"), "w") as fout:
+                    fout.write("Command line:\n  gmx mdrun -deffnm {} -nb gpu -nt 4 -ntmpi 1 -ntomp 4 -pin on "
+                               "-pinoffset {} -pinstride 1\n\n".format(name, 4 * (component - 1)))
+                    fout.write(filler)
+                    fout.write("Performance:       {:.3f}        0.708\n".format(10.0 + group % 17 + trial))
+
+
+def _injectLatency(latency_ms: float):
+    """
+        Delays every log read by latency_ms. Worker processes are forked after this is applied, so they inherit it.
+    """
+    parse: Callable[..., Dict[str, Any]] = gromax.analysis.parseLogFile
+
+    def delayedParse(path: str, *args, **kwargs) -> Dict[str, Any]:
+        time.sleep(latency_ms / 1000.0)
+        return parse(path, *args, **kwargs)
+
+    gromax.analysis.parseLogFile = delayedParse
+
+
+def _time(label: str, directory: str, **kwargs) -> float:
+    start: float = time.perf_counter()
+    content = parseDirectoryStructure(directory)
+    SanitizeDirectoryStructure(content)
+    constructGromaxData(content, **kwargs).groupStatistics()
+    elapsed: float = time.perf_counter() - start
+    print("{:<32s}{:8.2f} s".format(label, elapsed))
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--num_logs", type=int, default=10000)
+    parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--log_kb", type=int, default=64, help="Approximate size of each synthetic log.")
+    parser.add_argument("--directory", type=str, default=None, help="Where to build the synthetic tree.")
+    parser.add_argument("--latency_ms", type=float, default=0.0,
+                        help="Simulated latency added to every log read, e.g. 2 for a network filesystem.")
+    args = parser.parse_args()
+    if args.latency_ms > 0:
+        _injectLatency(args.latency_ms)
+
+    directory: str = tempfile.mkdtemp(dir=args.directory)
+    try:
+        _buildTree(directory, args.num_logs, args.log_kb)
+        print("Built {} logs of ~{} KB in {}, with {} ms simulated read latency".format(
+            args.num_logs, args.log_kb, directory, args.latency_ms))
+        serial: float = _time("serial", directory)
+        serial_full: float = _time("serial, full log scan", directory, full_scan=True)
+        threads: float = _time("{} threads".format(args.jobs), directory, jobs=args.jobs)
+        processes: float = _time("{} processes".format(args.jobs), directory, jobs=args.jobs, use_processes=True)
+        print("Speedup vs serial: threads {:.2f}x, processes {:.2f}x (full scan serial: {:.2f}x slower)".format(
+            serial / threads, serial / processes, serial_full / serial))
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+    Compares benchmark search strategies on a simulated node, using the bundled fake mdrun in place of GROMACS.
+
+    Each strategy is run with gromax execute in a fresh directory. Reports the wall time taken, the number of
+    simulations launched, and the best aggregate performance found.
+
+    Usage:
+        python3 admin/benchmark_search_strategies.py [--cpu_ids 0-31] [--gpu_ids 0-3] [--gmx_version 2020]
+            [--time_scale 0.0001] [--model package.module:function]
+"""
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+_STRATEGIES: Dict[str, List[str]] = {
+    "exhaustive": [],
+    "successive halving": ["--successive_halving"],
+    "adaptive": ["--adaptive_search"],
+}
+
+
+def _countLogs(directory: str) -> int:
+    return sum(len([name for name in files if name.endswith(".log")]) for _, _, files in os.walk(directory))
+
+
+def _runStrategy(label: str, strategy_args: List[str], args: argparse.Namespace, env: Dict[str, str]):
+    directory: str = tempfile.mkdtemp()
+    command: List[str] = [sys.executable, "-m", "gromax.main", "execute", "--directory", directory, "--tpr",
+                          "topol.tpr", "--cpu_ids", args.cpu_ids, "--gpu_ids", args.gpu_ids, "--gmx_version",
+                          args.gmx_version, "--gmx_executable", "{} -m gromax.fake_mdrun".format(sys.executable),
+                          "--log_level", "silent"] + strategy_args
+    try:
+        start: float = time.perf_counter()
+        result = subprocess.run(command, env=env, stdout=subprocess.PIPE, universal_newlines=True, check=True)
+        elapsed: float = time.perf_counter() - start
+        best: str = result.stdout.split("Aggregate performance:")[1].split()[0]
+        print("{:<24s}{:8.1f} s{:8d} runs{:>12s} ns/day".format(label, elapsed, _countLogs(directory), best))
+    finally:
+        shutil.rmtree(directory)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cpu_ids", type=str, default="0-31")
+    parser.add_argument("--gpu_ids", type=str, default="0-3")
+    parser.add_argument("--gmx_version", type=str, default="2020")
+    parser.add_argument("--time_scale", type=float, default=0.0001,
+                        help="Fraction of modeled mdrun wall time each fake simulation sleeps for.")
+    parser.add_argument("--model", type=str, default="", help="Fake mdrun performance model, as module:function.")
+    args = parser.parse_args()
+
+    state_dir: str = tempfile.mkdtemp()
+    package_root: str = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env: Dict[str, str] = dict(os.environ, PYTHONPATH=package_root, GROMAX_FAKE_MDRUN_STATE_DIR=state_dir,
+                               GROMAX_FAKE_MDRUN_STARTUP="0.2", GROMAX_FAKE_MDRUN_TIME_SCALE=str(args.time_scale),
+                               GROMAX_FAKE_MDRUN_MODEL=args.model)
+    try:
+        for label, strategy_args in _STRATEGIES.items():
+            _runStrategy(label, strategy_args, args, env)
+    finally:
+        shutil.rmtree(state_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,24 @@
 import logging
 import math
 import re
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import repeat
 # import pandas as pd
-from gromax.file_io import allDirectoryContent
-from gromax.log_parser import BasicParser, ParseGmxCommandError, ParsePerformanceError
-from typing import Dict, List, Union, Any, Callable
+from gromax.file_io import DirectoryWalk, SanitizeDirectoryStructure, allDirectoryContent, readLogHeadAndTail
+from gromax.log_parser import BasicParser, LogParser, ParseGmxCommandError, ParsePerformanceError, \
+    ParseSectionError, cycleTable
+from gromax.manifest import manifestEntry, manifestKey, manifestRunData
+from gromax.parse_cache import ParseCache, fileKey
+from gromax.results_table import ResultsTable, rowKey
+from typing import Dict, Iterable, Iterator, List, Union, Any, Callable, Optional, Set, Tuple, Type
 
 # Possible data types.
 dataPoint = Union[int, float, str, bool]
 
 # The base unit of results is a dictionary. This dict holds parameters for an individual run,
-# as well as simulation performance. This level is flat, in that there is no more nesting.
-# Parameters are strings.
-singleRunData = Dict[str, dataPoint]
+# as well as simulation performance. This level is flat, in that there is no more nesting, except for the cycle
+# accounting table if it was parsed. Parameters are strings.
+singleRunData = Dict[str, Union[dataPoint, cycleTable]]
 
 # Per-component results of a trial
 singleTrialData = Dict[int, singleRunData]
@@ -26,6 +32,9 @@ allData = Dict[int, singleGroupData]
 # Compiled statistics and run commands for a group result
 groupStats = Dict[str, Any]
 
+# Number of logs sent to a worker process at a time when the total is not known in advance.
+_STREAMED_PROCESS_CHUNK_SIZE: int = 16
+
 
 def standardError(vals: List[float]):
     """
@@ -81,85 +90,396 @@ def _calculateTrialPerformance(trial: singleTrialData) -> float:
     return components_sum
 
 
+def _calculateCostBreakdown(group: singleGroupData) -> Dict[str, float]:
+    """
+        Combines the cycle accounting tables of all components and trials of a group into the percentage of run time
+        spent on each task, weighting each table by its total wall time. Returns an empty dict if no tables were
+        parsed.
+    """
+    row_times: Dict[str, float] = {}
+    total_time: float = 0.0
+    for trial in group.values():
+        for component_content in trial.values():
+            if "cycle_accounting" not in component_content:
+                continue
+            component_time: float = component_content["cycle_total_wall_time"]
+            total_time += component_time
+            for name, row in component_content["cycle_accounting"].items():
+                row_times[name] = row_times.get(name, 0.0) + row["percent"] / 100.0 * component_time
+    if total_time <= 0.0:
+        return {}
+    return {name: 100.0 * row_time / total_time for name, row_time in row_times.items()}
+
+
+def _isGpuWaitRow(name: str) -> bool:
+    return name.startswith("Wait") and "GPU" in name
+
+
+def _calculateGpuWaitFraction(group: singleGroupData) -> Optional[float]:
+    """
+        Returns the fraction of CPU run time spent waiting for GPU results, over all components and trials of a
+        group, or None if no component waited for a GPU.
+    """
+    wait_time: float = 0.0
+    total_time: float = 0.0
+    found: bool = False
+    for trial in group.values():
+        for component_content in trial.values():
+            if "cycle_accounting" not in component_content:
+                continue
+            component_time: float = component_content["cycle_total_wall_time"]
+            total_time += component_time
+            for name, row in component_content["cycle_accounting"].items():
+                if _isGpuWaitRow(name):
+                    found = True
+                    wait_time += row["percent"] / 100.0 * component_time
+    if not found or total_time <= 0.0:
+        return None
+    return wait_time / total_time
+
+
+def _calculateGpuIdleFraction(group: singleGroupData) -> Optional[float]:
+    """
+        Returns the average fraction of time each GPU of a group was idle, or None if GPU timings were not parsed.
+
+        Each component keeps its GPUs busy for its GPU time as a fraction of its run time, split evenly between the
+        GPUs in its -gputasks. Components that share a GPU are assumed to run concurrently, so their busy fractions add
+        up. A component without -gputasks is assumed to have a GPU to itself.
+    """
+    idle_fractions: List[float] = []
+    for trial in group.values():
+        busy: Dict[str, float] = {}
+        for component_index, component_content in trial.items():
+            if "gpu_timings" not in component_content or "cycle_total_wall_time" not in component_content:
+                continue
+            run_time: float = component_content["cycle_total_wall_time"]
+            if run_time <= 0.0:
+                continue
+            # Each character of -gputasks is a GPU ID.
+            gputasks: Optional[str] = component_content.get("gputasks")
+            gpus: Set[str] = set(gputasks) if gputasks else {"component_{}".format(component_index)}
+            for gpu in gpus:
+                busy[gpu] = busy.get(gpu, 0.0) + component_content["gpu_total_wall_time"] / run_time / len(gpus)
+        idle_fractions.extend(max(0.0, 1.0 - fraction) for fraction in busy.values())
+    if not idle_fractions:
+        return None
+    return sum(idle_fractions) / len(idle_fractions)
+
+
 def _analyzeGroupData(group: singleGroupData) -> groupStats:
     """
         Collects information about the run parameters and performance of a group.
     """
     trial_performances: List[float] = [_calculateTrialPerformance(trial) for trial in group.values()]
-    return {
+    stats: groupStats = {
         "command_string": _getGroupRunString(group),
         "performance":  sum(trial_performances) / float(len(trial_performances)),
+        "standard_error": standardError(trial_performances),
+        "num_trials": len(trial_performances),
         # take number of sims per trial from first trial.
         "concurrent_sims": len(list(group.values())[0])
     }
+    cost_breakdown: Dict[str, float] = _calculateCostBreakdown(group)
+    if cost_breakdown:
+        stats["cost_breakdown"] = cost_breakdown
+        stats["dominant_cost"] = max(cost_breakdown, key=cost_breakdown.get)
+    gpu_wait_fraction: Optional[float] = _calculateGpuWaitFraction(group)
+    if gpu_wait_fraction is not None:
+        stats["gpu_wait_fraction"] = gpu_wait_fraction
+    gpu_idle_fraction: Optional[float] = _calculateGpuIdleFraction(group)
+    if gpu_idle_fraction is not None:
+        stats["gpu_idle_fraction"] = gpu_idle_fraction
+    first_run: singleRunData = list(list(group.values())[0].values())[0]
+    if "smt" in first_run:
+        stats["smt"] = first_run["smt"]
+    return stats
 
 
 class GromaxData(object):
     """
-        Holds gromax data points indexed in the group/trial/component layout.
+        Holds gromax data points indexed in the group/trial/component layout, stored in a table with one row per
+        component run.
         TODO - check double insertion of same key
         TODO - type safety
     """
     def __init__(self):
-        self._data: allData = {}
+        self._table: ResultsTable = ResultsTable()
 
     def insertDataPoint(self, group: int, trial: int, component: int, key: str, data_point: dataPoint):
-        if group not in self._data:
-            self._data[group]: singleGroupData = {}
-        if trial not in self._data[group]:
-            self._data[group][trial]: singleTrialData = {}
-        if component not in self._data[group][trial]:
-            self._data[group][trial][component]: singleTrialData = {}
-        self._data[group][trial][component][key]: dataPoint = data_point
+        self._table.setValue((group, trial, component), key, data_point)
+
+    def insertRuns(self, runs: Iterable[Tuple[rowKey, singleRunData]]):
+        """
+            Inserts all values of many component runs, each given by its (group, trial, component) key.
+        """
+        self._table.insertRows(runs)
 
     def remove(self, group: int, trial: int):
         """
             Safely remove a trial if it exists.
         """
-        if group in self._data:
-            if trial in self._data[group]:
-                del self._data[group][trial]
+        self._table.removeRows({key for key in self._table.keys() if key[:2] == (group, trial)})
+
+    @property
+    def table(self) -> ResultsTable:
+        return self._table
+
+    def _nestedData(self) -> allData:
+        data: allData = {}
+        for key in self._table.keys():
+            group, trial, component = key
+            data.setdefault(group, {}).setdefault(trial, {})[component] = self._table.row(key)
+        return data
 
     def groupStatistics(self) -> Dict[int, groupStats]:
         results: Dict[int, groupStats] = {}
-        for group_index, group_content in self._data.items():
+        for group_index, group_content in self._nestedData().items():
             if not len(group_content) == 0:
                 results[group_index] = _analyzeGroupData(group_content)
         return results
 
 
-def constructGromaxData(directory_structure: allDirectoryContent) -> GromaxData:
+def parseLogFile(path: str, parser: LogParser, full_scan: bool = False) -> Dict[str, dataPoint]:
+    """
+        Reads and parses a log file. Unless full_scan is set, only the start and end of the file are parsed at first,
+        and the whole file is parsed only if that fails or a section such as the cycle accounting table is missing. A
+        section missing from the whole file is reported, and the rest of the result is returned.
+
+        Raises IOError if the file cannot be read, or a parsing error if the contents cannot be parsed.
+    """
+    logger: logging.Logger = logging.getLogger("gromax")
+    if not full_scan:
+        contents, complete = readLogHeadAndTail(path)
+        try:
+            return parser.parse(contents)
+        except (ParseGmxCommandError, ParsePerformanceError, ParseSectionError) as e:
+            if complete:
+                if isinstance(e, ParseSectionError):
+                    logger.warning("{} in file {}".format(e, path))
+                    return e.result
+                raise
+            logger.debug("Parsing head and tail of {} failed, reading whole file".format(path))
+    with open(path, 'r') as fin:
+        contents = fin.read()
+    try:
+        return parser.parse(contents)
+    except ParseSectionError as e:
+        logger.warning("{} in file {}".format(e, path))
+        return e.result
+
+
+def _parseComponentLog(path: str, parser: LogParser, full_scan: bool) -> Tuple[Optional[Dict[str, dataPoint]],
+                                                                                Optional[str]]:
+    """
+        Parses a single component log. Returns the parsed values, or None and a message describing why the log could
+        not be used. Defined at module level so that it can be dispatched to a process pool.
+    """
+    try:
+        return parseLogFile(path, parser, full_scan), None
+    except IOError as e:
+        return None, "Unable to open log file {}: {}, discarding trial".format(path, e)
+    except ParseGmxCommandError as e:
+        return None, "Unable to parse command line input in file {} with {}, discarding trial".format(path, e)
+    except ParsePerformanceError as e:
+        return None, "Unable to parse performance in file {} with {}, discarding trial".format(path, e)
+
+
+def _parseInParallel(paths: Iterable[str], parser: LogParser, full_scan: bool, jobs: int,
+                     use_processes: bool) -> Dict[str, Tuple[Optional[Dict[str, dataPoint]], Optional[str]]]:
+    """
+        Parses all logs using a pool of jobs workers. Threads suit filesystems where latency dominates, processes
+        suit parsing-heavy workloads. Work is submitted as paths are produced, so parsing of logs found early in a
+        directory walk overlaps with the rest of the walk.
+    """
+    pool_type: Type[Executor] = ProcessPoolExecutor if use_processes else ThreadPoolExecutor
+    # Batch work for processes to amortize inter-process communication.
+    chunksize: int = 1
+    if use_processes:
+        chunksize = max(1, len(paths) // (4 * jobs)) if isinstance(paths, list) else _STREAMED_PROCESS_CHUNK_SIZE
+    submitted: List[str] = []
+
+    def record(path: str) -> str:
+        submitted.append(path)
+        return path
+
+    with pool_type(max_workers=jobs) as pool:
+        # Executor.map submits all work before returning, so submitted is complete when results are collected.
+        results = pool.map(_parseComponentLog, map(record, paths), repeat(parser), repeat(full_scan),
+                           chunksize=chunksize)
+        return dict(zip(submitted, results))
+
+
+def constructGromaxData(directory_structure: Union[allDirectoryContent, DirectoryWalk], full_scan: bool = False,
+                        jobs: int = 1, use_processes: bool = False, parser: Optional[LogParser] = None,
+                        cache: Optional[ParseCache] = None,
+                        manifest: Optional[Dict[manifestKey, manifestEntry]] = None,
+                        uneven_trials_expected: bool = False) -> GromaxData:
+    """
+        Parses all component logs and collects the results. If any component of a trial fails to parse, the whole
+        trial is discarded.
+
+        If a manifest is given, run parameters and command lines are taken from it rather than from the logs, which
+        then only need to provide metrics. Trials with a component that is not in the manifest are discarded.
+
+        With jobs > 1, logs are read and parsed concurrently with a thread pool, or a process pool if use_processes
+        is set. The result is identical to serial parsing. If given a DirectoryWalk rather than the directory
+        structure, logs are parsed as the walk finds them, both serially and concurrently, and the structure is
+        sanitized once the walk is complete, with uneven_trials_expected passed to SanitizeDirectoryStructure.
+
+        If a cache is given, logs that are unchanged since they were cached are not parsed again, and new results are
+        added to the cache. The cache must have been opened with the same parser.
+    """
     data: GromaxData = GromaxData()
-    parser: BasicParser = BasicParser()
+    if parser is None:
+        parser = BasicParser()
     logger: logging.Logger = logging.getLogger("gromax")
+    paths: Iterable[str]
+    if isinstance(directory_structure, DirectoryWalk):
+        paths = directory_structure
+    else:
+        paths = [component_file for group_content in directory_structure.values()
+                 for trial_content in group_content.values() for component_file in trial_content.values()]
+
+    results: Dict[str, Tuple[Optional[Dict[str, dataPoint]], Optional[str]]] = {}
+    cache_keys: Dict[str, fileKey] = {}
+    num_paths: int = 0
+
+    def uncachedPaths() -> Iterator[str]:
+        nonlocal num_paths
+        for path in paths:
+            num_paths += 1
+            if cache is not None:
+                try:
+                    cache_keys[path] = cache.fileKey(path)
+                except OSError:
+                    # Reported when parsing.
+                    yield path
+                    continue
+                cached: Optional[Dict[str, dataPoint]] = cache.get(cache_keys[path])
+                if cached is not None:
+                    results[path] = (cached, None)
+                    continue
+            yield path
+
+    parsed: Dict[str, Tuple[Optional[Dict[str, dataPoint]], Optional[str]]]
+    if jobs > 1:
+        parsed = _parseInParallel(uncachedPaths(), parser, full_scan, jobs, use_processes)
+    else:
+        parsed = {path: _parseComponentLog(path, parser, full_scan) for path in uncachedPaths()}
+    cached_paths: Set[str] = set(results)
+    if cache is not None:
+        logger.debug("Using cached results for {} of {} logs".format(len(cached_paths), num_paths))
+    results.update(parsed)
+    if isinstance(directory_structure, DirectoryWalk):
+        directory_structure = directory_structure.content
+        SanitizeDirectoryStructure(directory_structure, uneven_trials_expected=uneven_trials_expected)
+
     for group_index, group_content in directory_structure.items():
         for trial_index, trial_content in group_content.items():
+            trial_runs: List[Tuple[rowKey, singleRunData]] = []
             for component_index, component_file in trial_content.items():
-                try:
-                    with open(component_file, 'r') as fin:
-                        contents: str = fin.read()
-                except IOError as e:
-                    logger.warning("Unable to open log file {}: {}, discarding trial".format(component_file, e))
-                    data.remove(group_index, trial_index)
+                extracted_elements, error = results[component_file]
+                if error is not None:
+                    logger.warning(error)
+                    trial_runs = []
                     break
-                try:
-                    extracted_elements: Dict[str, dataPoint] = parser.parse(contents)
-                except ParseGmxCommandError as e:
-                    logger.warning(
-                        "Unable to parse command line input in file {} with {}, discarding trial".format(component_file,
-                                                                                                         e))
-                    data.remove(group_index, trial_index)
-                    break
-                except ParsePerformanceError as e:
-                    logger.warning(
-                        "Unable to parse performance in file {} with {}, discarding trial".format(component_file, e))
-                    data.remove(group_index, trial_index)
-                    break
-                for key, val in extracted_elements.items():
-                    data.insertDataPoint(group_index, trial_index, component_index, key, val)
+                if manifest is not None:
+                    entry: Optional[manifestEntry] = manifest.get((group_index, component_index))
+                    if entry is None:
+                        logger.warning("{} is not in the run manifest, discarding its trial".format(component_file))
+                        trial_runs = []
+                        break
+                    extracted_elements = dict(manifestRunData(entry, trial_index), **extracted_elements)
+                trial_runs.append(((group_index, trial_index, component_index), extracted_elements))
+            data.insertRuns(trial_runs)
+    if cache is not None:
+        num_added: int = 0
+        for path, key in cache_keys.items():
+            extracted_elements, _ = results.get(path, (None, None))
+            if extracted_elements is not None and path not in cached_paths:
+                cache.put(key, extracted_elements)
+                num_added += 1
+        logger.debug("Added {} results to the parse cache".format(num_added))
     return data
 
 
+class IncrementalAnalysis(object):
+    """
+        Keeps the parsed results of a run directory in memory, and updates group statistics as logs are added or
+        change, parsing only those logs. As with SanitizeDirectoryStructure, a trial is only used once it has as many
+        components as the largest trial of its group, and as with constructGromaxData, once all of them parse.
+    """
+    def __init__(self, parser: Optional[LogParser] = None, full_scan: bool = False, jobs: int = 1,
+                 use_processes: bool = False, manifest: Optional[Dict[manifestKey, manifestEntry]] = None):
+        self._parser: LogParser = parser if parser is not None else BasicParser()
+        self._full_scan: bool = full_scan
+        self._jobs: int = jobs
+        self._use_processes: bool = use_processes
+        self._manifest: Optional[Dict[manifestKey, manifestEntry]] = manifest
+        # Results by group, trial and component, or None for logs that could not be used (yet).
+        self._results: Dict[int, Dict[int, Dict[int, Optional[singleRunData]]]] = {}
+        self.stats: Dict[int, groupStats] = {}
+
+    def _runData(self, key: rowKey, path: str, extracted_elements: Optional[Dict[str, dataPoint]],
+                 error: Optional[str]) -> Optional[singleRunData]:
+        logger: logging.Logger = logging.getLogger("gromax")
+        if error is not None:
+            # Most likely the run is still going.
+            logger.debug(error)
+            return None
+        if self._manifest is None:
+            return extracted_elements
+        group_index, trial_index, component_index = key
+        entry: Optional[manifestEntry] = self._manifest.get((group_index, component_index))
+        if entry is None:
+            logger.warning("{} is not in the run manifest, discarding its trial".format(path))
+            return None
+        return dict(manifestRunData(entry, trial_index), **extracted_elements)
+
+    def _completeTrials(self, group_index: int) -> singleGroupData:
+        trials: Dict[int, Dict[int, Optional[singleRunData]]] = self._results[group_index]
+        num_components: int = max(len(trial) for trial in trials.values())
+        return {trial_index: trial for trial_index, trial in trials.items()
+                if len(trial) == num_components and all(run is not None for run in trial.values())}
+
+    def update(self, logs: List[Tuple[rowKey, str]]) -> List[str]:
+        """
+            Parses new or changed logs, given with their (group, trial, component) key, and updates the statistics
+            of their groups. Returns the logs that were parsed successfully.
+        """
+        paths: List[str] = [path for _, path in logs]
+        if self._jobs > 1:
+            results: Dict[str, Tuple[Optional[Dict[str, dataPoint]], Optional[str]]] = _parseInParallel(
+                paths, self._parser, self._full_scan, self._jobs, self._use_processes)
+        else:
+            results = {path: _parseComponentLog(path, self._parser, self._full_scan) for path in paths}
+        parsed: List[str] = []
+        for key, path in logs:
+            run: Optional[singleRunData] = self._runData(key, path, *results[path])
+            if run is not None:
+                parsed.append(path)
+            group_index, trial_index, component_index = key
+            self._results.setdefault(group_index, {}).setdefault(trial_index, {})[component_index] = run
+        for group_index in {key[0] for key, _ in logs}:
+            group_content: singleGroupData = self._completeTrials(group_index)
+            if group_content:
+                self.stats[group_index] = _analyzeGroupData(group_content)
+            else:
+                self.stats.pop(group_index, None)
+        return parsed
+
+    def data(self) -> GromaxData:
+        """
+            Returns the results of all complete trials.
+        """
+        data: GromaxData = GromaxData()
+        for group_index in self._results:
+            for trial_index, trial in self._completeTrials(group_index).items():
+                data.insertRuns(((group_index, trial_index, component_index), run)
+                                for component_index, run in trial.items())
+        return data
+
+
 def _defaultConstraint(_: groupStats) -> bool:
     return True
 
@@ -208,6 +528,60 @@ def _reportGrouping(stat: groupStats) -> str:
     return "  " + "\n  ".join(combined_result.split("\n"))
 
 
+def _formatCosts(stat: groupStats, num_costs: int) -> str:
+    if "cost_breakdown" not in stat:
+        return "no cycle accounting available"
+    costs: List[Tuple[str, float]] = sorted(stat["cost_breakdown"].items(), key=lambda item: item[1], reverse=True)
+    result: str = ", ".join("{} {:.1f}%".format(name, percent) for name, percent in costs[:num_costs])
+    gpu_balance: List[str] = []
+    if "gpu_wait_fraction" in stat:
+        gpu_balance.append("CPU waiting for GPU {:.1f}%".format(100.0 * stat["gpu_wait_fraction"]))
+    if "gpu_idle_fraction" in stat:
+        gpu_balance.append("GPU idle {:.1f}%".format(100.0 * stat["gpu_idle_fraction"]))
+    if gpu_balance:
+        result += "; " + ", ".join(gpu_balance)
+    return result
+
+
+def reportBottlenecks(stats: Dict[int, groupStats], num_costs: int = 3) -> str:
+    """
+        Lists the largest costs from cycle accounting of every group, fastest group first, with the fraction of time
+        the CPU waited for the GPU and the GPU was idle where available. Groups where the CPU mostly waits for the GPU
+        may benefit from moving work to the CPU, and groups with idle GPUs from moving work to the GPU or from
+        another simulation sharing the GPU.
+    """
+    lines: List[str] = [_formatHeader("Largest costs per group")]
+    for group_index, stat in sorted(stats.items(), key=lambda item: item[1]["performance"], reverse=True):
+        lines.append("  Group {}: {:.2f} ns/day, {}".format(group_index + 1, stat["performance"],
+                                                            _formatCosts(stat, num_costs)))
+    return "\n".join(lines) + "\n"
+
+
+def reportSmtComparison(stats: Dict[int, groupStats]) -> str:
+    """
+        Compares the best group using all hardware threads with the best group using one thread per core, for each
+        number of concurrent simulations run in both ways by an SMT sweep. Returns an empty string if there are none.
+    """
+    best: Dict[Tuple[int, bool], groupStats] = {}
+    for stat in stats.values():
+        if "smt" not in stat:
+            continue
+        key: Tuple[int, bool] = (stat["concurrent_sims"], stat["smt"])
+        if key not in best or stat["performance"] > best[key]["performance"]:
+            best[key] = stat
+    sim_counts: List[int] = sorted({sims for sims, _ in best if (sims, True) in best and (sims, False) in best})
+    if not sim_counts:
+        return ""
+    lines: List[str] = [_formatHeader("SMT comparison")]
+    for sims in sim_counts:
+        with_smt: float = best[(sims, True)]["performance"]
+        without_smt: float = best[(sims, False)]["performance"]
+        lines.append("  {} concurrent simulation{}: {:.2f} ns/day with SMT, {:.2f} ns/day without, {:+.1f}% from "
+                     "SMT".format(sims, "" if sims == 1 else "s", with_smt, without_smt,
+                                  100.0 * (with_smt / without_smt - 1.0)))
+    return "\n".join(lines) + "\n"
+
+
 def reportStatistics(stats: Dict[int, Dict[str, Any]]) -> str:
     total_best: groupStats = _bestWithConstraint(stats)
     best_single_sim: groupStats = _bestWithConstraint(stats, constraint=_singleSimConstraint)
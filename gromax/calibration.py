@@ -0,0 +1,127 @@
+import logging
+import math
+import os
+from dataclasses import dataclass, replace
+from typing import Dict, List, Optional, Tuple, Union
+
+from gromax.analysis import parseLogFile
+from gromax.combination_generator import CpuSetGroup, ParameterSetGroup
+from gromax.executor import ExecuteOptions, RunResult, executeGroups
+from gromax.log_parser import LogParser, ParsePerformanceError, TimingParser
+"""
+    Calibration of run length. A short probe run per hardware split measures the step rate, from which nsteps and
+    resetstep are chosen so that the timed part of each run lasts a target wall time.
+"""
+
+# Identifies a hardware split by the thread count and pinning offset, or CPU set, of each concurrent simulation.
+splitKey = Tuple[Tuple[int, Union[int, str]], ...]
+
+
+@dataclass(frozen=True)
+class CalibrationOptions:
+    """
+        Options for run length calibration.
+
+        Attributes:
+            target_seconds: Wall time of the timed steps, after resetstep, of each calibrated run.
+            probe_nsteps: Number of steps of each probe run.
+            probe_resetstep: Step at which probe performance counters are reset.
+            warmup_fraction: resetstep as a fraction of the number of timed steps, for runs long enough that it
+                             exceeds min_warmup_steps. Gives dynamic load balancing more steps to settle in long runs.
+            min_warmup_steps: Minimum resetstep. PME tuning and the first load balancing happen in the first few
+                              hundred steps of a run, which is why probes are timed after probe_resetstep steps.
+            step_multiple: nsteps and resetstep are rounded up to multiples of this.
+    """
+    target_seconds: float = 60.0
+    probe_nsteps: int = 2000
+    probe_resetstep: int = 1000
+    warmup_fraction: float = 0.1
+    min_warmup_steps: int = 1000
+    step_multiple: int = 100
+
+
+def getSplitKey(group: ParameterSetGroup, cpu_sets: Optional[CpuSetGroup] = None) -> splitKey:
+    return tuple((int(params.get("nt", 0)), cpu_sets[component] if cpu_sets and cpu_sets[component] is not None else
+                  int(params.get("pinoffset", 0))) for component, params in enumerate(group))
+
+
+def groupBySplit(groups: Dict[int, ParameterSetGroup],
+                 group_cpu_sets: Optional[Dict[int, CpuSetGroup]] = None) -> Dict[splitKey, List[int]]:
+    """
+        Returns the group indices for each hardware split, in group order. Components of groups in group_cpu_sets are
+        identified by their CPU set.
+    """
+    result: Dict[splitKey, List[int]] = {}
+    for index in sorted(groups):
+        cpu_sets: Optional[CpuSetGroup] = group_cpu_sets.get(index) if group_cpu_sets else None
+        result.setdefault(getSplitKey(groups[index], cpu_sets), []).append(index)
+    return result
+
+
+def _roundUp(value: float, multiple: int) -> int:
+    return max(multiple, int(math.ceil(value / multiple)) * multiple)
+
+
+def calibratedSteps(steps_per_second: float, options: CalibrationOptions) -> Tuple[int, int]:
+    """
+        Returns (nsteps, resetstep) such that the steps after resetstep take options.target_seconds at the given rate.
+        Warmup adds the larger of options.min_warmup_steps and options.warmup_fraction of the timed steps.
+    """
+    timed_steps: int = _roundUp(steps_per_second * options.target_seconds, options.step_multiple)
+    resetstep: int = _roundUp(max(options.min_warmup_steps, timed_steps * options.warmup_fraction),
+                              options.step_multiple)
+    return resetstep + timed_steps, resetstep
+
+
+def _stepRate(results: List[RunResult], timed_steps: int, parser: LogParser) -> Optional[float]:
+    """
+        Returns the step rate of the slowest component of a probe, or None if any component failed.
+    """
+    logger: logging.Logger = logging.getLogger("gromax")
+    rates: List[float] = []
+    for result in results:
+        if not result.succeeded:
+            return None
+        try:
+            wall_time: float = parseLogFile(result.log_file, parser)["wall_time"]
+        except (IOError, ParsePerformanceError) as e:
+            logger.warning("Unable to read probe timing from {}: {}".format(result.log_file, e))
+            return None
+        if wall_time <= 0:
+            return None
+        rates.append(timed_steps / wall_time)
+    return min(rates) if rates else None
+
+
+def calibrateGroups(groups: Dict[int, ParameterSetGroup], directory: str, options: ExecuteOptions,
+                    calibration: CalibrationOptions) -> Dict[int, Tuple[int, int]]:
+    """
+        Runs a single trial of the first group of each hardware split with probe run lengths, writing results to
+        directory. Returns (nsteps, resetstep) for every group of each split with a successful probe, keyed by group
+        index. Groups in splits whose probe failed are left out.
+    """
+    logger: logging.Logger = logging.getLogger("gromax")
+    parser: LogParser = TimingParser()
+    probe_options: ExecuteOptions = replace(options, nsteps=calibration.probe_nsteps,
+                                            resetstep=calibration.probe_resetstep, group_steps={})
+    timed_steps: int = calibration.probe_nsteps - calibration.probe_resetstep
+    result: Dict[int, Tuple[int, int]] = {}
+    for split, indices in groupBySplit(groups, options.group_cpu_sets).items():
+        probe: int = indices[0]
+        logger.info("Calibrating run length for {} concurrent simulations with group {}".format(len(split),
+                                                                                              probe + 1))
+        results: List[RunResult] = executeGroups({probe: groups[probe]}, directory, probe_options, trials=[0])
+        rate: Optional[float] = _stepRate(results, timed_steps, parser)
+        if rate is None:
+            logger.warning("Calibration probe for group {} failed, using default run length for {} groups".format(
+                probe + 1, len(indices)))
+            continue
+        steps: Tuple[int, int] = calibratedSteps(rate, calibration)
+        logger.info("Measured {:.1f} steps/s, using nsteps={} and resetstep={}".format(rate, *steps))
+        for index in indices:
+            result[index] = steps
+    return result
+
+
+def calibrationDirectory(directory: str) -> str:
+    return os.path.join(directory, "calibration")
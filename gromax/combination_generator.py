@@ -1,11 +1,14 @@
+import functools
+import itertools
 import math
 
+from collections import ChainMap
 from dataclasses import dataclass
 
 from gromax.constants import _SUPPORTED_GMX_VERSIONS
-from gromax.hardware_config import HardwareConfig
-from copy import deepcopy
-from typing import List, Dict, Any, Callable
+from gromax.hardware_config import HardwareConfig, distributeGpuIdsToTasks, formatCpuList
+from gromax.topology import Topology
+from typing import List, Dict, Any, Callable, Iterator, Mapping, Optional, Sequence, Tuple
 
 # Convenience definitions
 # A grouping of GPU ids.
@@ -16,12 +19,21 @@ ParameterSet = Dict
 ParameterSetGroup = List[ParameterSet]
 # A breakdown of hardware configs (presumably adding to the full config) for gromacs runs to run on concurrently.
 HardwareConfigBreakdown = List[HardwareConfig]
+# A dimension of the parameter space - an option key and its possible values.
+OptionAxis = Tuple[str, Sequence[Any]]
+# Condition on a parameter set, used to prune combinations.
+ParameterPredicate = Callable[[Mapping[str, Any]], bool]
 
+# The CPU list each simulation of a group is launched under with taskset, for CPU sets that mdrun cannot pin to with
+# -pinoffset and -pinstride, or None for simulations pinned by mdrun. Not an mdrun option, so kept out of the
+# parameter sets.
+CpuSetGroup = List[Optional[str]]
 
-@dataclass
+
+@dataclass(frozen=True)
 class GenerateOptions:
     """
-        Consolidated options for parameter combination generation.
+        Consolidated options for parameter combination generation. Frozen so that it can be used as a cache key.
     """
     max_sims_per_gpu: int = 4
     max_ranks_for_pme_gpu: int = 8
@@ -54,11 +66,14 @@ def genNtmpiOptions(total_procs: int, num_gpus: int, max_ranks_per_gpu: int = 4)
     return options
 
 
-def determineGpuTasks(ntmpi: int, gpu_ids: GpuIds, pme_on_gpu: bool = True) -> str:
+def determineGpuTasks(ntmpi: int, gpu_ids: GpuIds, pme_on_gpu: bool = True,
+                      rank_numa_nodes: Optional[Sequence[Optional[int]]] = None,
+                      gpu_numa_nodes: Optional[Dict[int, int]] = None) -> str:
     """
         Given a known number of ranks and GPU IDs, allocate the GPU IDs to each rank.
 
-        Handles the special case of 1 rank, where two GPU tasks are required. Otherwise each rank gets a task.
+        Handles the special case of 1 rank, where two GPU tasks are required. Otherwise each rank gets a task. If the
+        NUMA node of each rank and of the GPUs are given, ranks preferably use a GPU on their own NUMA node.
 
         Returns the GPUtasks in Gromacs command line string form, such as '0011' for a 4 rank run over 2 GPUs.
     """
@@ -66,6 +81,10 @@ def determineGpuTasks(ntmpi: int, gpu_ids: GpuIds, pme_on_gpu: bool = True) -> s
         return 2 * str(gpu_ids[0])
     assert ntmpi % len(gpu_ids) == 0
 
+    if rank_numa_nodes is not None and gpu_numa_nodes:
+        return "".join(str(rank_ids[0]) for rank_ids in distributeGpuIdsToTasks(gpu_ids, ntmpi, rank_numa_nodes,
+                                                                                gpu_numa_nodes))
+
     factor: int = int(ntmpi / len(gpu_ids))
 
     return "".join([factor * str(gpu_id) for gpu_id in gpu_ids])
@@ -92,11 +111,11 @@ def addConfigDependentOptions(base_options: ParameterSet, hw_config: HardwareCon
         is known.
     """
     base_options["nt"] = hw_config.num_cpus
-    pinstride: int = 1
-    if hw_config.num_cpus > 1:
-        pinstride = hw_config.cpu_ids[1] - hw_config.cpu_ids[0]
-    base_options["pinstride"] = pinstride
-    base_options["pinoffset"] = hw_config.cpu_ids[0]
+    if hw_config.is_strided:
+        base_options["pinstride"] = hw_config.cpu_stride
+        base_options["pinoffset"] = hw_config.cpu_range[0]
+    else:
+        _disableMdrunPinning(base_options)
     # GPU NB offload is always better
     if hw_config.num_gpus > 0:
         base_options["nb"] = "gpu"
@@ -104,57 +123,64 @@ def addConfigDependentOptions(base_options: ParameterSet, hw_config: HardwareCon
         base_options["nb"] = "cpu"
 
 
-def applyOptionToAll(parameters: List[ParameterSet], key: str, possible_values: List) -> List[ParameterSet]:
+def _disableMdrunPinning(params: ParameterSet):
     """
-        Duplicates a group of parameter sets with each possibility in possible_values. So, given an original
-        parameter set of 5 combinations, and a key "other_option" with possible values 1, 2, and 3, a group
-        of 15 combinations will be returned, 5 with the original set and "other_option":1, 5 with "other_option": 2,
-        and so on.
+        Turns off mdrun pinning for a simulation bound to the config's CPUs with taskset, leaving thread placement
+        within the set to the OS. The CPU set itself is given by launcherCpuSet.
     """
-    new_parameters: List[ParameterSet] = []
-    for param_set in parameters:
-        for possible_value in possible_values:
-            new_parameters.append(deepcopy(param_set))
-            new_parameters[-1][key] = possible_value
-    return new_parameters
+    params.pop("pinoffset", None)
+    params.pop("pinstride", None)
+    params["pin"] = "off"
 
 
-def applyOptionIf(parameters: List[ParameterSet], key: str, value: Any,
-                  predicate: Callable[[ParameterSet], bool]) -> List[ParameterSet]:
+def expandOptionAxes(base: ParameterSet, axes: Sequence[OptionAxis],
+                     prune_predicates: Sequence[ParameterPredicate] = ()) -> Iterator[ParameterSet]:
     """
-        Loops over all option groups, and adds the key:val pair to a parameter set if the predicate is satisfied.
-        Returns a modified copy of the original group of parameter sets.
-    """
-    new_parameters: List[ParameterSet] = []
-    for param_set in parameters:
-        new_parameters.append(deepcopy(param_set))
-        if predicate(param_set):
-            new_parameters[-1][key] = value
-    return new_parameters
-
+        Lazily generates every combination of the option axes applied to a base parameter set, in itertools.product
+        order, so the first axis varies slowest.
 
-def pruneOptionIf(parameters: List[ParameterSet], predicate: Callable[[ParameterSet], bool]) -> List[ParameterSet]:
+        Combinations for which any prune predicate is true are skipped before a parameter set is built. Predicates are
+        passed a read-only view of the base options and the combination.
     """
-        Removes a parameterset from the possibilities if it meets the predicate conditions
-    """
-    return [option for option in parameters if not predicate(option)]
+    keys: List[str] = [key for key, _ in axes]
+    for values in itertools.product(*(possible_values for _, possible_values in axes)):
+        combination: ParameterSet = dict(zip(keys, values))
+        view: ChainMap = ChainMap(combination, base)
+        if any(predicate(view) for predicate in prune_predicates):
+            continue
+        yield {**base, **combination}
 
 
-def _pruneUnlikelyCombinations(parameters: List[ParameterSet]) -> List[ParameterSet]:
+def _unlikelyCombinationPredicate(params: Mapping[str, Any]) -> bool:
     """
-        Removes combinations where PME != bonded != update - such as:
+        True for combinations where PME != bonded != update - such as:
 
         * PME GPU with bonded or update CPU
         * PME CPU with bonded or update GPU
     """
-    def removalPredicate(params: ParameterSet) -> bool:
-        pme = params["pme"]
-        # For earlier versions without these options (eg. 2016),
-        # set the other options to PME so the inequality isn't triggered.
-        update = params.get("update", pme)
-        bonded = params.get("bonded", pme)
-        return pme != update or pme != bonded
-    return pruneOptionIf(parameters, removalPredicate)
+    # For earlier versions without these options (eg. 2016), everything is on the CPU. Set the other options to PME
+    # so the inequality isn't triggered.
+    pme = params.get("pme", "cpu")
+    update = params.get("update", pme)
+    bonded = params.get("bonded", pme)
+    return pme != update or pme != bonded
+
+
+def _addDerivedOptions(params: ParameterSet, hw_config: HardwareConfig):
+    """
+        Sets options that are fully determined by the other options in a parameter set.
+    """
+    nt: int = params["nt"]
+    ntmpi: int = params["ntmpi"]
+    # These should be guaranteed to be divisible from genNtmpiOptions
+    assert nt % ntmpi == 0
+    params["ntomp"] = int(nt / ntmpi)
+    using_pme_on_gpu: bool = params.get("pme", "cpu") == "gpu"
+    # set npme if more than one rank.
+    if using_pme_on_gpu and ntmpi > 1:
+        params["npme"] = 1
+    if params.get("nb") == "gpu":
+        params["gputasks"] = determineGpuTasks(ntmpi, hw_config.gpu_ids, using_pme_on_gpu)
 
 
 def _createVersionedOptions(base_opts: ParameterSet, hw_config: HardwareConfig, gmx_version: str,
@@ -162,53 +188,41 @@ def _createVersionedOptions(base_opts: ParameterSet, hw_config: HardwareConfig,
     """
         Given a partial base parameter set, a hardware config, and a target Gromacs version, creates all of the
         parameter combination possibilities.
+
+        The parameter space is streamed as a product of option axes, with invalid or unwanted combinations pruned
+        before they are built.
     """
-    options: List[ParameterSet] = [base_opts]
-
-    # Add thread information
-    ntmpi_possibilities: List[int] = genNtmpiOptions(hw_config.num_cpus, hw_config.num_gpus)
-    options = applyOptionToAll(options, "ntmpi", ntmpi_possibilities)
-    # Once ntmpi is set, ntomp is unambiguous.
-    for opt in options:
-        nt: int = opt["nt"]
-        ntmpi: int = opt["ntmpi"]
-        # These should be guaranteed to be divisible from genNtmpiOptions
-        assert nt % ntmpi == 0
-        opt["ntomp"] = int(nt / ntmpi)
-
-    if not hw_config.num_gpus > 0:
-        return options
-
-    if gmx_version >= "2018":
-        options = applyOptionToAll(options, "pme", ["cpu", "gpu"])
-
-        # Cap max ranks for PME GPU
-        def excessRanksPredicate(params: ParameterSet) -> bool:
-            return params["pme"] == "gpu" and params["ntmpi"] > generate_options.max_ranks_for_pme_gpu
-        options = pruneOptionIf(options, excessRanksPredicate)
-
-        # set npme if more than one rank.
-        def nPmePredicate(params: ParameterSet) -> bool:
-            return params["pme"] == "gpu" and params["ntmpi"] > 1
-        options = applyOptionIf(options, "npme", 1, nPmePredicate)
-    if gmx_version >= "2019":
-        # Note that this is valid even if PME=CPU, it's just nb=GPU that's mandatory, which is guaranteed here.
-        options = applyOptionToAll(options, "bonded", ["cpu", "gpu"])
-    if gmx_version >= "2020":
-        # Similarly to bonded, update=GPU only needs nb=gpu and any combination of pme, bonded, and update is allowed
-        options = applyOptionToAll(options, "update", ["cpu", "gpu"])
-
-        # PME = cpu, update = GPU only works on single rank simulations
-        def multiRankPredicate(params: ParameterSet):
-            return params["pme"] == "cpu" and params["update"] == "gpu" and params["ntmpi"] > 1
-        options = pruneOptionIf(options, multiRankPredicate)
-    if not generate_options.generate_exhaustive_options:
-        options = _pruneUnlikelyCombinations(options)
-    # Add gputasks
-    for opt in options:
-        if opt.get("nb") == "gpu":
-            using_pme_on_gpu: bool = opt.get("pme", "cpu") == "gpu"
-            opt["gputasks"] = determineGpuTasks(opt["ntmpi"], hw_config.gpu_ids, using_pme_on_gpu)
+    # Add thread information. Once ntmpi is set, ntomp is unambiguous.
+    axes: List[OptionAxis] = [("ntmpi", genNtmpiOptions(hw_config.num_cpus, hw_config.num_gpus))]
+    prune_predicates: List[ParameterPredicate] = []
+
+    if hw_config.num_gpus > 0:
+        if gmx_version >= "2018":
+            axes.append(("pme", ["cpu", "gpu"]))
+
+            # Cap max ranks for PME GPU
+            def excessRanksPredicate(params: Mapping[str, Any]) -> bool:
+                return params["pme"] == "gpu" and params["ntmpi"] > generate_options.max_ranks_for_pme_gpu
+            prune_predicates.append(excessRanksPredicate)
+        if gmx_version >= "2019":
+            # Note that this is valid even if PME=CPU, it's just nb=GPU that's mandatory, which is guaranteed here.
+            axes.append(("bonded", ["cpu", "gpu"]))
+        if gmx_version >= "2020":
+            # Similarly to bonded, update=GPU only needs nb=gpu and any combination of pme, bonded, and update is
+            # allowed
+            axes.append(("update", ["cpu", "gpu"]))
+
+            # PME = cpu, update = GPU only works on single rank simulations
+            def multiRankPredicate(params: Mapping[str, Any]) -> bool:
+                return params["pme"] == "cpu" and params["update"] == "gpu" and params["ntmpi"] > 1
+            prune_predicates.append(multiRankPredicate)
+        if not generate_options.generate_exhaustive_options:
+            prune_predicates.append(_unlikelyCombinationPredicate)
+
+    options: ParameterSetGroup = []
+    for opt in expandOptionAxes(base_opts, axes, prune_predicates):
+        _addDerivedOptions(opt, hw_config)
+        options.append(opt)
     return options
 
 
@@ -230,8 +244,85 @@ def createRunOptionsForSingleConfig(hw_config: HardwareConfig, gmx_version: str,
     return _createVersionedOptions(base_options, hw_config, gmx_version, generate_options)
 
 
+@functools.lru_cache(maxsize=128)
+def _createShapeOptions(num_cpus: int, num_gpus: int, cpu_stride: int, gmx_version: str,
+                        generate_options: GenerateOptions) -> Tuple[ParameterSet, ...]:
+    """
+        Generates the run options for any hardware config of the given shape, using a template config with CPU IDs
+        starting at 0 and GPU IDs 0 to num_gpus - 1. Only pinoffset and gputasks depend on the actual IDs. Memoized,
+        as the components of a split config usually share the same shape. Configs without a constant CPU stride use
+        a cpu_stride of 1 and have their pinning replaced.
+
+        The returned parameter sets are shared between calls and must not be modified.
+    """
+    template_config: HardwareConfig = HardwareConfig(cpu_ids=range(0, num_cpus * cpu_stride, cpu_stride),
+                                                     gpu_ids=list(range(num_gpus)))
+    return tuple(createRunOptionsForSingleConfig(template_config, gmx_version, generate_options))
+
+
+def _rankNumaNodes(hw_config: HardwareConfig, ntmpi: int, topology: Topology) -> List[Optional[int]]:
+    """
+        Returns the NUMA node of each thread-MPI rank, which mdrun pins to consecutive blocks of the config's CPUs.
+    """
+    cpus_per_rank: int = hw_config.num_cpus // ntmpi
+    cpu_range: range = hw_config.cpu_range
+    return [topology.numaNode(cpu_range[rank * cpus_per_rank:(rank + 1) * cpus_per_rank]) for rank in range(ntmpi)]
+
+
+def _pinsById(hw_config: HardwareConfig, topology: Optional[Topology]) -> bool:
+    """
+        mdrun pins by logical CPU index, so configs are only pinned by CPU ID if the topology, when given, numbers CPUs
+        the same way, or if they use every CPU. Otherwise, e.g. for one thread per core with Linux SMT numbering, they
+        are bound to their CPU set.
+    """
+    return hw_config.is_strided and (topology is None or topology.numbers_like_mdrun or
+                                     hw_config.cpu_range == range(topology.num_cpus))
+
+
+def launcherCpuSet(hw_config: HardwareConfig, topology: Optional[Topology] = None) -> Optional[str]:
+    """
+        Returns the CPU list that simulations on a config are launched under with taskset, or None if mdrun pins them.
+    """
+    if _pinsById(hw_config, topology):
+        return None
+    return formatCpuList(hw_config.cpu_range)
+
+
+def _createRunOptionsFromShape(hw_config: HardwareConfig, gmx_version: str, generate_options: GenerateOptions,
+                               topology: Optional[Topology] = None,
+                               gpu_numa_nodes: Optional[Dict[int, int]] = None) -> ParameterSetGroup:
+    """
+        Equivalent to createRunOptionsForSingleConfig, but patches memoized options for the config shape with the
+        config's CPU offset and GPU IDs instead of regenerating all combinations. GPU tasks follow NUMA locality if a
+        topology and GPU NUMA nodes are given. Ranks of configs bound to a CPU set are not pinned, so their NUMA nodes
+        are unknown and GPU tasks are assigned in order.
+    """
+    pin_by_id: bool = _pinsById(hw_config, topology)
+    use_locality: bool = (topology is not None and bool(gpu_numa_nodes) and hw_config.num_gpus > 1 and pin_by_id)
+    template: Tuple[ParameterSet, ...] = _createShapeOptions(hw_config.num_cpus, hw_config.num_gpus,
+                                                             hw_config.cpu_stride if pin_by_id else 1, gmx_version,
+                                                             generate_options)
+    gpu_ids: GpuIds = hw_config.gpu_ids
+    options: ParameterSetGroup = []
+    for template_opt in template:
+        opt: ParameterSet = dict(template_opt)
+        if pin_by_id:
+            opt["pinoffset"] = hw_config.cpu_range[0]
+        else:
+            _disableMdrunPinning(opt)
+        if "gputasks" in opt:
+            rank_numa_nodes: Optional[List[Optional[int]]] = None
+            if use_locality:
+                rank_numa_nodes = _rankNumaNodes(hw_config, opt["ntmpi"], topology)
+            opt["gputasks"] = determineGpuTasks(opt["ntmpi"], gpu_ids, opt.get("pme", "cpu") == "gpu",
+                                                rank_numa_nodes, gpu_numa_nodes)
+        options.append(opt)
+    return options
+
+
 def createRunOptionsForConfigGroup(configs: HardwareConfigBreakdown, gmx_version: str,
-                                   generate_options: GenerateOptions) -> List[ParameterSetGroup]:
+                                   generate_options: GenerateOptions, topology: Optional[Topology] = None,
+                                   gpu_numa_nodes: Optional[Dict[int, int]] = None) -> List[ParameterSetGroup]:
     """
         Generate all the parameter combinations for a given subconfiguration of the hardware.
 
@@ -240,6 +331,9 @@ def createRunOptionsForConfigGroup(configs: HardwareConfigBreakdown, gmx_version
         where each concurrent grouping is a list of Gromacs parameter sets to be executed concurrently. In other words,
         each top level element of the returned list is the set of one or more concurrent Gromacs commands to fully
         exercise the hardware.
+
+        If a topology and the NUMA node of each GPU are given, ranks of multi-GPU simulations are preferably given GPUs
+        on their own NUMA node.
     """
     if len(configs) == 0:
         return []
@@ -250,8 +344,9 @@ def createRunOptionsForConfigGroup(configs: HardwareConfigBreakdown, gmx_version
 
     # This gets us all the combinations we want, but with the wrong structure. The top level is for each partial
     # hardware config, and the second level is over the options within each subconfig.
-    breakdowns_per_config: List[ParameterSetGroup] = [createRunOptionsForSingleConfig(config, gmx_version,
-                                                                                      generate_options)
+    breakdowns_per_config: List[ParameterSetGroup] = [_createRunOptionsFromShape(config, gmx_version,
+                                                                                 generate_options, topology,
+                                                                                 gpu_numa_nodes)
                                                       for config in configs]
     # Now we reorder, inverting the organization such that
     #   [[subconfig1_option1, subconfig1_option2], [subconfig2_option1, subconfig2_option2]]
@@ -1,12 +1,16 @@
 import argparse
-from typing import List, Iterable
+import importlib.util
+from typing import Dict, List, Iterable
 
 from gromax.constants import _SUPPORTED_GMX_VERSIONS, _GROMAX_VERSION
+from gromax.results_table import exportFormat
+from gromax.topology import DEFAULT_SYSFS_ROOT
 from gromax.utils import fatalError
 
 # File constants.
 _DESCRIPTION = "Gromax is a tool to build benchmarking scripts for Gromax and analyze the results. \n" \
-               "Generate scripts with the 'gromax generate' command, and analyze results with 'gromax analyze'."
+               "Generate scripts with the 'gromax generate' command, run benchmarks directly with " \
+               "'gromax execute', and analyze results with 'gromax analyze'."
 _EPILOG = "For more details on parameters and usage, visit https://github.com/scal444/gromax/docs\n"
 
 
@@ -21,27 +25,52 @@ def parseIDString(ids: str) -> List[int]:
             0-31
         Colon range with stride
             0:2:31 == 0,2,4,....,30
+        Comma separated mix of the above, e.g. for CPU sets without a constant stride
+            0-15,64-79
     """
     try:
         return [int(ids)]
     except (TypeError, ValueError):
         pass
 
-    if ',' in ids:
-        return [int(i) for i in ids.split(',')]
-    elif '-' in ids:
-        split: List[str] = ids.split("-")
+    try:
+        return [i for item in ids.split(",") for i in _parseIDRange(item)]
+    except ValueError:
+        raise ValueError("Invalid ID string '{}'".format(ids))
+
+
+def _parseIDRange(item: str) -> List[int]:
+    """
+        Parses a single integer, dashed range or colon range with optional stride. Raises ValueError if invalid.
+    """
+    if '-' in item:
+        split: List[str] = item.split("-")
         if len(split) == 2:
             return list(range(int(split[0]), int(split[1]) + 1))
-    elif ':' in ids:
-        split: List[str] = ids.split(":")
+    elif ':' in item:
+        split: List[str] = item.split(":")
         stride: int = 1
         if len(split) == 3:
             stride = int(split[1])
         if len(split) == 2 or len(split) == 3:
             # This takes the first and last part of the split, handling size 2 and 3.
             return list(range(int(split[0]), int(split[-1]) + 1, stride))
-    raise ValueError("Invalid ID string '{}'".format(ids))
+    else:
+        return [int(item)]
+    raise ValueError("Invalid ID range '{}'".format(item))
+
+
+def parseGpuNumaNodes(mapping: str) -> Dict[int, int]:
+    """
+        Parses a comma separated list of GPU ID to NUMA node pairs, such as "0:0,1:0,2:1,3:1".
+    """
+    result: Dict[int, int] = {}
+    for item in mapping.split(","):
+        split: List[str] = item.split(":")
+        if len(split) != 2:
+            raise ValueError("Invalid GPU NUMA node mapping '{}', expected GPU:NODE pairs".format(mapping))
+        result[int(split[0])] = int(split[1])
+    return result
 
 
 def _buildParser() -> argparse.ArgumentParser:
@@ -74,10 +103,113 @@ def _buildParser() -> argparse.ArgumentParser:
     generate_group.add_argument("--num_gpus", type=int, metavar="",
                                 help="Number of GPUs to run on, indexed from 0. Use this option OR --gpu_ids (if not "
                                      "using all GPUs on the node), but not both.", default=0)
+    generate_group.add_argument("--detect", action="store_true",
+                                help="If set, detect the CPUs and GPUs not given with --cpu_ids/--num_cpus or "
+                                     "--gpu_ids/--num_gpus: the CPUs this process may run on, which excludes CPUs "
+                                     "outside a job's cgroup cpuset, and the GPUs made visible by CUDA_VISIBLE_DEVICES "
+                                     "or ROCR_VISIBLE_DEVICES, or else listed by --gpu_list_command. Also reads the "
+                                     "CPU topology and GPU NUMA nodes from /sys unless --sysfs_root is given.")
+    generate_group.add_argument("--gpu_list_command", type=str, metavar="",
+                                help="Command printing one 'GPU <index>:' line per GPU, as 'nvidia-smi -L' does, used "
+                                     "by --detect when neither CUDA_VISIBLE_DEVICES nor ROCR_VISIBLE_DEVICES is set.")
     generate_group.add_argument("--single_sim_only", action="store_true",
                                 help="If set, do not divide the hardware among multiple concurrent simulations")
+    generate_group.add_argument("--script_format", type=str, default="expanded", choices=("expanded", "compact"),
+                                help="'expanded' (default) writes a block of script per group. 'compact' lists all "
+                                     "simulations in a table run by a single loop, which is much shorter for large "
+                                     "campaigns, and takes optional first and last group numbers as arguments to run "
+                                     "a subset of groups.")
+    generate_group.add_argument("--calibrate", action="store_true",
+                                help="If set, run a short probe for each hardware split before benchmarking, and "
+                                     "choose nsteps and resetstep per group from the measured step rate. Requires "
+                                     "--tpr. Launches one real mdrun probe of 2000 steps per hardware split on the "
+                                     "node gromax runs on, so generate takes longer and should run on the target node. "
+                                     "Calibrated runs add untimed warmup steps, 1000 or a tenth of the timed steps "
+                                     "if more. Probe results are written to the calibration subdirectory of "
+                                     "--directory.")
+    generate_group.add_argument("--sysfs_root", type=str, metavar="",
+                                help="Root of the sysfs tree to read the CPU topology and GPU NUMA nodes from, used to "
+                                     "try hardware splits that respect NUMA node, L3 cache and core boundaries first "
+                                     "and to give simulations local GPUs. Not read unless given, or with --detect, "
+                                     "which reads {} of the node gromax runs on. Use a copy of another node's "
+                                     "/sys/devices and /sys/bus trees to generate for that node.".format(
+                                         DEFAULT_SYSFS_ROOT))
+    generate_group.add_argument("--smt_sweep", action="store_true",
+                                help="If set, benchmark every split both with all given hardware threads and with one "
+                                     "thread per physical core, using the SMT siblings in the topology under "
+                                     "--sysfs_root, and report the difference per split. Requires --sysfs_root or "
+                                     "--detect.")
+    generate_group.add_argument("--gpu_numa_nodes", type=str, metavar="",
+                                help="NUMA node of each GPU as GPU:NODE pairs, e.g. '0:0,1:0,2:1,3:1'. Used to give "
+                                     "simulations and ranks GPUs on their own NUMA node. Defaults to reading the NUMA "
+                                     "node of each PCI GPU under --sysfs_root, in PCI bus order.")
+    generate_group.add_argument("--calibration_target_seconds", type=float, default=60.0, metavar="",
+                                help="Target wall time of the timed part of each calibrated run. Defaults to 60.")
+    execute_group = parser.add_argument_group("execute", "arguments for 'gromax execute', which also accepts all "
+                                                         "'gromax generate' arguments except --run_file")
+    execute_group.add_argument("--timeout", type=float, metavar="",
+                               help="Maximum wall time in seconds for each trial. Runs still going are killed.")
+    execute_group.add_argument("--successive_halving", action="store_true",
+                               help="If set, screen all groups with short runs and promote only the best groups to "
+                                    "longer runs with more trials, over several rounds.")
+    execute_group.add_argument("--halving_rounds", type=int, default=3, metavar="",
+                               help="Number of successive halving rounds, including the final full length round. "
+                                    "Defaults to 3.")
+    execute_group.add_argument("--halving_keep_fraction", type=float, default=1.0 / 3.0, metavar="",
+                               help="Fraction of groups promoted to the next successive halving round. Defaults to "
+                                    "1/3.")
+    execute_group.add_argument("--halving_step_factor", type=int, default=3, metavar="",
+                               help="Factor by which run length grows each successive halving round. Defaults to 3.")
+    execute_group.add_argument("--adaptive_search", action="store_true",
+                               help="If set, benchmark groups one at a time, choosing each next group using a model "
+                                    "fitted to the results so far, and stop once no further improvement is expected.")
+    execute_group.add_argument("--search_budget", type=int, metavar="",
+                               help="Maximum number of groups to benchmark with --adaptive_search. Defaults to no "
+                                    "limit.")
+    execute_group.add_argument("--ei_threshold", type=float, default=0.001, metavar="",
+                               help="Adaptive search stops when the expected improvement of every remaining group is "
+                                    "below this fraction of the best performance so far. Defaults to 0.001.")
+    execute_group.add_argument("--rel_se_threshold", type=float, metavar="",
+                               help="If set, repeat trials of each group until the standard error of its mean "
+                                    "performance is below this fraction of the mean, or the group is out of "
+                                    "contention with the best group. Replaces --trials_per_group.")
+    execute_group.add_argument("--min_trials", type=int, default=2, metavar="",
+                               help="Minimum number of trials per group with --rel_se_threshold. Defaults to 2.")
+    execute_group.add_argument("--max_trials", type=int, default=10, metavar="",
+                               help="Maximum number of trials per group with --rel_se_threshold. Defaults to 10.")
     analyze_group = parser.add_argument_group("analyze", "arguments for 'gromax analyze'")
     analyze_group.add_argument("--directory", type=str, help="Path to execution/analysis directory.", metavar="")
+    analyze_group.add_argument("--full_log_scan", action="store_true",
+                               help="If set, parse the whole of each log file. By default only the start and end of "
+                                    "each log are read, falling back to the whole file if needed.")
+    analyze_group.add_argument("--bottlenecks", action="store_true",
+                               help="If set, parse the cycle accounting table of each log and report the largest "
+                                    "costs of every group, e.g. time spent waiting for the GPU.")
+    analyze_group.add_argument("--export_file", type=str, metavar="",
+                               help="If set, write every parsed component run to this file, with one row per run and "
+                                    "one column per parameter or metric. The format follows the extension: .csv, "
+                                    ".jsonl (JSON Lines) or .parquet (requires pyarrow).")
+    analyze_group.add_argument("--manifest", type=str, metavar="",
+                               help="Run manifest written by 'gromax generate', from which run parameters are taken "
+                                    "rather than parsed from each log. Defaults to gromax_manifest.jsonl in the "
+                                    "analysis directory, if present.")
+    analyze_group.add_argument("--no_manifest", action="store_true",
+                               help="If set, ignore any run manifest and parse run parameters from each log.")
+    analyze_group.add_argument("--watch", action="store_true",
+                               help="If set, keep running and parse new or changed logs as results arrive, printing "
+                                    "the report whenever the best results change. Stop with Ctrl-C.")
+    analyze_group.add_argument("--watch_interval", type=float, default=10.0, metavar="",
+                               help="Seconds between checks for new results with --watch. Defaults to 10.")
+    analyze_group.add_argument("--no_cache", action="store_true",
+                               help="If set, do not read or update the cache of parsed results, and parse every log.")
+    analyze_group.add_argument("--cache_dir", type=str, metavar="",
+                               help="Directory of the cache of parsed results. Defaults to gromax in the user cache "
+                                    "directory, $XDG_CACHE_HOME or ~/.cache.")
+    analyze_group.add_argument("--jobs", type=int, default=1, metavar="",
+                               help="Number of log files to read and parse concurrently. Defaults to 1.")
+    analyze_group.add_argument("--jobs_backend", type=str, default="thread", choices=("thread", "process"),
+                               help="Parse logs concurrently using threads (default, best for slow or network "
+                                    "filesystems) or processes (best when parsing dominates).")
     parser.add_argument("--version", action="version", version=_GROMAX_VERSION)
     parser.add_argument("--log_level", type=str, default="info", metavar="",
                         help="Set logging verbosity - 'silent', 'info'(default), or 'debug'")
@@ -88,18 +220,78 @@ def _checkGenerateArgs(args: argparse.Namespace) -> None:
     if args.gmx_version not in _SUPPORTED_GMX_VERSIONS:
         fatalError("Invalid gmx version {}, must be one of {}".format(args.gmx_version,
                                                                       sorted(_SUPPORTED_GMX_VERSIONS)))
-    if not args.cpu_ids and not args.num_cpus:
-        fatalError("One of --cpu_ids or --num_cpus is required")
+    if not args.cpu_ids and not args.num_cpus and not args.detect:
+        fatalError("One of --cpu_ids, --num_cpus or --detect is required")
     if args.num_cpus:
         if args.cpu_ids:
             fatalError("Cannot specify both --cpu_ids and --num_cpus")
         args.cpu_ids = ",".join([str(identifier) for identifier in range(args.num_cpus)])
-    if not args.gpu_ids and not args.num_gpus:
-        fatalError("One of --gpu_ids or --num_gpus is required")
+    if not args.gpu_ids and not args.num_gpus and not args.detect:
+        fatalError("One of --gpu_ids, --num_gpus or --detect is required")
     if args.num_gpus:
         if args.gpu_ids:
             fatalError("Cannot specify both --gpu_ids and --num_gpus")
         args.gpu_ids = ",".join([str(identifier) for identifier in range(args.num_gpus)])
+    if args.gpu_list_command and not args.detect:
+        fatalError("--gpu_list_command is only used with --detect")
+    if args.smt_sweep and not args.sysfs_root and not args.detect:
+        fatalError("--smt_sweep needs the CPU topology, from --sysfs_root or --detect")
+    if args.calibrate and not args.tpr:
+        fatalError("--tpr is required for --calibrate")
+    if args.gpu_numa_nodes:
+        try:
+            parseGpuNumaNodes(args.gpu_numa_nodes)
+        except ValueError as e:
+            fatalError("Invalid --gpu_numa_nodes: {}".format(e))
+    if args.calibration_target_seconds <= 0:
+        fatalError("--calibration_target_seconds must be positive, got {}".format(args.calibration_target_seconds))
+
+
+def _checkAnalyzeArgs(args: argparse.Namespace) -> None:
+    if args.jobs < 1:
+        fatalError("--jobs must be at least 1, got {}".format(args.jobs))
+    if args.export_file:
+        try:
+            export_format: str = exportFormat(args.export_file)
+        except ValueError as e:
+            fatalError("Invalid --export_file: {}".format(e))
+        if export_format == "parquet" and importlib.util.find_spec("pyarrow") is None:
+            fatalError("Exporting to Parquet requires pyarrow, which is not installed")
+    if args.manifest and args.no_manifest:
+        fatalError("Cannot specify both --manifest and --no_manifest")
+    if args.watch_interval <= 0:
+        fatalError("--watch_interval must be positive, got {}".format(args.watch_interval))
+
+
+def _checkExecuteArgs(args: argparse.Namespace) -> None:
+    _checkGenerateArgs(args)
+    _checkAnalyzeArgs(args)
+    if not args.tpr:
+        fatalError("--tpr is required for direct execution")
+    if args.watch:
+        fatalError("--watch is only supported by gromax analyze")
+    if args.timeout is not None and args.timeout <= 0:
+        fatalError("--timeout must be positive, got {}".format(args.timeout))
+    if args.halving_rounds < 1:
+        fatalError("--halving_rounds must be at least 1, got {}".format(args.halving_rounds))
+    if not 0 < args.halving_keep_fraction <= 1:
+        fatalError("--halving_keep_fraction must be in (0, 1], got {}".format(args.halving_keep_fraction))
+    if args.halving_step_factor < 1:
+        fatalError("--halving_step_factor must be at least 1, got {}".format(args.halving_step_factor))
+    if args.successive_halving and args.adaptive_search:
+        fatalError("Cannot specify both --successive_halving and --adaptive_search")
+    if args.rel_se_threshold is not None:
+        if args.successive_halving or args.adaptive_search:
+            fatalError("--rel_se_threshold cannot be combined with --successive_halving or --adaptive_search")
+        if args.rel_se_threshold <= 0:
+            fatalError("--rel_se_threshold must be positive, got {}".format(args.rel_se_threshold))
+        if not 2 <= args.min_trials <= args.max_trials:
+            fatalError("Need 2 <= --min_trials <= --max_trials, got {} and {}".format(args.min_trials,
+                                                                                       args.max_trials))
+    if args.search_budget is not None and args.search_budget < 1:
+        fatalError("--search_budget must be at least 1, got {}".format(args.search_budget))
+    if args.ei_threshold < 0:
+        fatalError("--ei_threshold must not be negative, got {}".format(args.ei_threshold))
 
 
 def checkArgs(args: argparse.Namespace) -> None:
@@ -109,6 +301,10 @@ def checkArgs(args: argparse.Namespace) -> None:
 
     if args.mode == "generate":
         _checkGenerateArgs(args)
+    if args.mode == "execute":
+        _checkExecuteArgs(args)
+    if args.mode == "analyze":
+        _checkAnalyzeArgs(args)
 
 
 def parseArgs(args: List[str]) -> argparse.Namespace:
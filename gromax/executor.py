@@ -0,0 +1,158 @@
+import logging
+import os
+import shlex
+import subprocess
+import time
+from dataclasses import dataclass, field, replace
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from gromax.combination_generator import CpuSetGroup, ParameterSet, ParameterSetGroup
+from gromax.output import LauncherArgList, ParamsToArgList, componentName, trialDirectory
+"""
+    Direct execution of benchmark groups as local subprocesses.
+
+    Results are written in the same group_N/trial_M/group_N_trial_M_component_K.log layout that the generated bash
+    scripts create, so that they can be analyzed with the standard analysis workflow.
+"""
+
+
+@dataclass
+class ExecuteOptions:
+    """
+        Consolidated options for direct benchmark execution.
+
+        Attributes:
+            gmx: Command used to invoke mdrun, e.g. "gmx mdrun" or "/path/to/gmx_mpi mdrun"
+            tpr: Path to the tpr file to benchmark.
+            num_trials: Number of times each group is run.
+            nsteps: Number of simulation steps per run.
+            resetstep: Step at which performance counters are reset.
+            timeout: Maximum wall time in seconds for a single trial, measured from the launch of its first
+                     component, or None for no limit.
+            group_steps: Per group (nsteps, resetstep) overriding nsteps and resetstep, keyed by 0-based group index.
+            group_cpu_sets: Per group CPU set of each component, keyed by 0-based group index. Components with a CPU
+                            set are launched under taskset.
+    """
+    gmx: str = "gmx mdrun"
+    tpr: Optional[str] = None
+    num_trials: int = 3
+    nsteps: int = 15000
+    resetstep: int = 10000
+    timeout: Optional[float] = None
+    group_steps: Dict[int, Tuple[int, int]] = field(default_factory=dict)
+    group_cpu_sets: Dict[int, CpuSetGroup] = field(default_factory=dict)
+
+    def forGroup(self, group_index: int) -> "ExecuteOptions":
+        """
+            Returns the options with nsteps and resetstep set for a group.
+        """
+        if group_index not in self.group_steps:
+            return self
+        nsteps, resetstep = self.group_steps[group_index]
+        return replace(self, nsteps=nsteps, resetstep=resetstep)
+
+
+@dataclass
+class RunResult:
+    """
+        Outcome of a single component run. Indices are 0-based, matching the analysis data layout.
+    """
+    group: int
+    trial: int
+    component: int
+    log_file: str
+    returncode: Optional[int]
+    timed_out: bool = False
+
+    @property
+    def succeeded(self) -> bool:
+        return not self.timed_out and self.returncode == 0
+
+
+def buildComponentCommand(params: ParameterSet, name: str, options: ExecuteOptions,
+                          cpu_set: Optional[str] = None) -> List[str]:
+    """
+        Creates the argument list to launch a single component run, injecting file naming, tpr and timing options.
+        Components bound to a CPU set are launched under taskset.
+    """
+    full_params: ParameterSet = dict(params)
+    full_params["deffnm"] = name
+    full_params["nsteps"] = options.nsteps
+    full_params["resetstep"] = options.resetstep
+    if options.tpr:
+        full_params["s"] = options.tpr
+    return LauncherArgList(cpu_set) + shlex.split(options.gmx) + ParamsToArgList(full_params)
+
+
+def _terminate(process: subprocess.Popen):
+    process.kill()
+    process.wait()
+
+
+def executeTrial(group_index: int, trial_index: int, group: ParameterSetGroup, directory: str,
+                 options: ExecuteOptions) -> List[RunResult]:
+    """
+        Runs all components of a group concurrently and waits for them to finish or time out. The time limit covers
+        the whole trial, starting before the first component is launched. On timeout, all components still running
+        are killed.
+
+        If a component cannot be launched, e.g. because the executable is missing, components already running are
+        killed and the error is raised.
+    """
+    logger: logging.Logger = logging.getLogger("gromax")
+    trial_dir: str = os.path.join(directory, trialDirectory(group_index, trial_index))
+    os.makedirs(trial_dir, exist_ok=True)
+    options = options.forGroup(group_index)
+    cpu_sets: CpuSetGroup = options.group_cpu_sets.get(group_index, [])
+
+    deadline: Optional[float] = None if options.timeout is None else time.monotonic() + options.timeout
+    processes: List[subprocess.Popen] = []
+    results: List[RunResult] = []
+    try:
+        for component_index, params in enumerate(group):
+            name: str = componentName(group_index, trial_index, component_index)
+            command: List[str] = buildComponentCommand(params, name, options,
+                                                       cpu_sets[component_index] if cpu_sets else None)
+            logger.debug("Launching {}".format(" ".join(command)))
+            with open(os.path.join(trial_dir, name + ".out"), "w") as fout:
+                processes.append(subprocess.Popen(command, cwd=trial_dir, stdout=fout, stderr=subprocess.STDOUT))
+            results.append(RunResult(group=group_index, trial=trial_index, component=component_index,
+                                     log_file=os.path.join(trial_dir, name + ".log"), returncode=None))
+    except Exception:
+        logger.error("Could not launch component {} of group {}, killing the {} components already running".format(
+            len(processes) + 1, group_index + 1, len(processes)))
+        for process in processes:
+            _terminate(process)
+        raise
+
+    for process, result in zip(processes, results):
+        try:
+            remaining: Optional[float] = None if deadline is None else max(0.0, deadline - time.monotonic())
+            result.returncode = process.wait(timeout=remaining)
+        except subprocess.TimeoutExpired:
+            _terminate(process)
+            result.timed_out = True
+            logger.warning("{} exceeded the time limit of {} seconds and was killed".format(result.log_file,
+                                                                                           options.timeout))
+            continue
+        if result.returncode != 0:
+            logger.warning("{} exited with code {}".format(result.log_file, result.returncode))
+    return results
+
+
+def executeGroups(groups: Dict[int, ParameterSetGroup], directory: str, options: ExecuteOptions,
+                  trials: Optional[Iterable[int]] = None) -> List[RunResult]:
+    """
+        Runs each group of concurrent simulations for each trial. Groups are run one after another, as each group
+        is expected to occupy the whole of the benchmarked hardware.
+
+        Group and trial indices are 0-based. By default trials 0 to options.num_trials - 1 are run.
+    """
+    logger: logging.Logger = logging.getLogger("gromax")
+    trial_indices: List[int] = list(range(options.num_trials)) if trials is None else list(trials)
+    results: List[RunResult] = []
+    for group_index in sorted(groups):
+        logger.info("Running group {} ({} concurrent simulations)".format(group_index + 1, len(groups[group_index])))
+        for trial_index in trial_indices:
+            results.extend(executeTrial(group_index, trial_index, groups[group_index], directory, options))
+    return results
@@ -0,0 +1,429 @@
+import importlib
+import json
+import os
+import sys
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Callable, Dict, List, Optional, Tuple
+
+from gromax.constants import _GROMAX_VERSION
+"""
+    Stand-in for 'gmx mdrun' that writes a log in the format gromax analyzes, with a performance value taken from a
+    model of the requested configuration and any concurrently running fake simulations. No GPUs or GROMACS
+    installation are required.
+
+    Usage:
+        python -m gromax.fake_mdrun mdrun -deffnm name -nt 8 -ntmpi 1 -ntomp 8 -nb gpu -gputasks 0 ...
+
+    For example, to run the gromax execute workflow without GROMACS:
+        gromax execute --gmx_executable "python -m gromax.fake_mdrun" ...
+
+    Behavior is configured with environment variables:
+        GROMAX_FAKE_MDRUN_MODEL: Performance model as "package.module:function", see PerformanceModel. Defaults to
+                                 defaultPerformanceModel.
+        GROMAX_FAKE_MDRUN_STATE_DIR: Directory in which simulations record when they run, so that concurrent
+                                     simulations contend for CPUs and GPUs. If not set, each simulation is modeled as
+                                     if it had the node to itself.
+        GROMAX_FAKE_MDRUN_STARTUP: Seconds to wait after registering before looking for concurrent simulations, so
+                                   that simulations launched together see each other. Defaults to 1 when a state
+                                   directory is set, otherwise 0.
+        GROMAX_FAKE_MDRUN_TIME_SCALE: Sleep for this fraction of the modeled wall time before finishing. Defaults to 0.
+        GROMAX_FAKE_MDRUN_EXIT_CODE: Exit code to return after writing the log. Defaults to 0.
+"""
+
+# Simulated time per step, in ps.
+_TIMESTEP_PS = 0.002
+
+# Clock rate used to report cycle counts, in GHz.
+_CLOCK_GHZ = 3.0
+
+# Work per step offloadable to a GPU, as a fraction of the total work on a CPU.
+_WORK_FRACTIONS: Dict[str, float] = {
+    "nb": 0.60,
+    "pme": 0.25,
+    "bonded": 0.05,
+    "update": 0.10,
+}
+
+# Relative speed of a whole GPU compared with a single CPU thread.
+_GPU_SPEEDUP = 40.0
+
+# Performance of a single CPU thread running all work, in ns/day.
+_SINGLE_THREAD_NS_PER_DAY = 4.0
+
+# mdrun flags that take no value, each also accepted with a "no" prefix. All other flags take the next argument.
+_BOOLEAN_FLAGS = {"append", "confout", "cpnum", "ddcheck", "reprod", "rerunvsite", "resethway", "tunepme", "v"}
+
+# Seconds, on top of the startup delay, that finished registrations are kept for simulations that started before the
+# registered one finished but have not yet looked for concurrent simulations.
+_REGISTRATION_GRACE_SECONDS = 10.0
+
+
+@dataclass
+class FakeRun:
+    """
+        A simulation as seen by the performance model.
+
+        Attributes:
+            params: mdrun flags, with values as strings and flags without values as True.
+            cpu_ids: Logical CPUs the simulation is pinned to, or all CPUs it may use if unpinned.
+            gpu_ids: GPU assigned to each GPU task, in task order. Empty for CPU-only runs.
+            ntmpi: Number of thread-MPI ranks.
+            ntomp: Number of OpenMP threads per rank.
+            offloaded: Work types (nb, pme, bonded, update) run on a GPU.
+            pinned: Whether threads are pinned to cpu_ids.
+    """
+    params: Dict[str, object]
+    cpu_ids: List[int]
+    gpu_ids: List[int]
+    ntmpi: int
+    ntomp: int
+    offloaded: List[str] = field(default_factory=list)
+    pinned: bool = False
+
+    @property
+    def num_threads(self) -> int:
+        return self.ntmpi * self.ntomp
+
+
+# Takes the modeled simulation and all other simulations running concurrently, returns performance in ns/day.
+PerformanceModel = Callable[[FakeRun, List[FakeRun]], float]
+
+
+def parseMdrunArgs(args: List[str]) -> Dict[str, object]:
+    """
+        Parses mdrun flags into a dict. Boolean flags map to True, other flags to the string value that follows them,
+        which may itself start with '-', e.g. a negative number.
+    """
+    params: Dict[str, object] = {}
+    index: int = 0
+    while index < len(args):
+        key: str = args[index]
+        if not key.startswith("-"):
+            raise ValueError("Unexpected mdrun argument '{}'".format(key))
+        name: str = key[1:]
+        if name in _BOOLEAN_FLAGS or (name.startswith("no") and name[2:] in _BOOLEAN_FLAGS):
+            params[name] = True
+            index += 1
+            continue
+        if index + 1 == len(args):
+            raise ValueError("Missing value for mdrun argument '{}'".format(key))
+        params[name] = args[index + 1]
+        index += 2
+    return params
+
+
+def createFakeRun(params: Dict[str, object], affinity: Optional[List[int]] = None) -> FakeRun:
+    """
+        Determines the resources used by a simulation from its mdrun flags, following mdrun defaults where flags are
+        missing. A simulation that mdrun does not pin, but that is restricted to the CPUs in affinity, e.g. by taskset,
+        has its threads placed on those CPUs in turn.
+    """
+    ntmpi: int = int(params.get("ntmpi", 1))
+    nt: Optional[int] = int(params["nt"]) if "nt" in params else None
+    ntomp: int = int(params.get("ntomp", nt // ntmpi if nt else 1))
+    num_threads: int = ntmpi * ntomp
+    pinned: bool = params.get("pin") == "on"
+    offset: int = int(params.get("pinoffset", 0))
+    stride: int = int(params.get("pinstride", 1))
+    cpu_ids: List[int] = [offset + i * stride for i in range(num_threads)]
+    if not pinned and affinity:
+        cpu_ids = [affinity[i % len(affinity)] for i in range(num_threads)]
+        pinned = True
+
+    offloaded: List[str] = [work for work in ("nb", "pme", "bonded", "update") if params.get(work) == "gpu"]
+    gpu_ids: List[int] = []
+    if offloaded:
+        gpu_ids = [int(task) for task in str(params.get("gputasks", "0" * ntmpi))]
+    return FakeRun(params=params, cpu_ids=cpu_ids, gpu_ids=gpu_ids, ntmpi=ntmpi, ntomp=ntomp, offloaded=offloaded,
+                   pinned=pinned)
+
+
+def _stepTimes(run: FakeRun, peers: List[FakeRun]) -> Tuple[float, float]:
+    """
+        Returns the CPU and GPU time per step of the default model, in units of single thread time for all work.
+    """
+    cpu_sharers: Dict[int, int] = {}
+    gpu_sharers: Dict[int, int] = {}
+    for other in [run] + peers:
+        if other.pinned:
+            for cpu in other.cpu_ids:
+                cpu_sharers[cpu] = cpu_sharers.get(cpu, 0) + 1
+        for gpu in set(other.gpu_ids):
+            gpu_sharers[gpu] = gpu_sharers.get(gpu, 0) + 1
+
+    # Oversubscribed cores are split between their simulations. Unpinned threads are assumed to find free cores.
+    effective_threads: float = sum(1.0 / cpu_sharers[cpu] for cpu in run.cpu_ids) if run.pinned else run.num_threads
+    # Parallel efficiency drops with thread count and with the number of domains.
+    cpu_speed: float = effective_threads ** 0.85 / (1.0 + 0.05 * (run.ntmpi - 1))
+    cpu_work: float = sum(fraction for work, fraction in _WORK_FRACTIONS.items() if work not in run.offloaded)
+    gpu_work: float = sum(fraction for work, fraction in _WORK_FRACTIONS.items() if work in run.offloaded)
+
+    gpu_time: float = 0.0
+    if run.gpu_ids:
+        # Simulations sharing a GPU overlap their work, so each slows down less than the number of sharers.
+        gpu_speed: float = sum(_GPU_SPEEDUP / gpu_sharers[gpu] ** 0.7 for gpu in set(run.gpu_ids))
+        gpu_time = gpu_work / gpu_speed
+        # Launches and transfers cost CPU time for each offloaded task.
+        cpu_work += 0.01 * len(run.gpu_ids)
+    return cpu_work / cpu_speed, gpu_time
+
+
+def defaultPerformanceModel(run: FakeRun, peers: List[FakeRun]) -> float:
+    """
+        Models a step as CPU and GPU work that mostly overlap. Accounts for thread scaling, domain decomposition
+        overhead, CPUs shared through overlapping pinning, and GPUs shared between simulations.
+    """
+    cpu_time, gpu_time = _stepTimes(run, peers)
+    step_time: float = max(cpu_time, gpu_time) + 0.1 * min(cpu_time, gpu_time)
+    return _SINGLE_THREAD_NS_PER_DAY / step_time
+
+
+def loadPerformanceModel(spec: Optional[str]) -> PerformanceModel:
+    """
+        Loads a model from a "package.module:function" specification, or returns the default model if spec is empty.
+    """
+    if not spec:
+        return defaultPerformanceModel
+    module_name, _, function_name = spec.partition(":")
+    if not function_name:
+        raise ValueError("Performance model '{}' must be of the form module:function".format(spec))
+    return getattr(importlib.import_module(module_name), function_name)
+
+
+def _writeRegistration(path: str, run: FakeRun, start: float, end: Optional[float]):
+    tmp_path: str = path + ".tmp"
+    with open(tmp_path, "w") as fout:
+        json.dump({"run": asdict(run), "start": start, "end": end, "pid": os.getpid()}, fout)
+    os.replace(tmp_path, path)
+
+
+def _isRunning(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _concurrentPeers(state_dir: str, own_path: str, start: float, prune_before: float) -> List[FakeRun]:
+    """
+        Returns the simulations registered in state_dir that were running at any point since start. Registrations of
+        simulations that finished before prune_before, or that were killed before finishing, are removed, so that the
+        state directory only holds recent simulations.
+    """
+    peers: List[FakeRun] = []
+    for name in sorted(os.listdir(state_dir)):
+        path: str = os.path.join(state_dir, name)
+        if not name.endswith(".json") or path == own_path:
+            continue
+        try:
+            with open(path) as fin:
+                registration: Dict = json.load(fin)
+        except (OSError, ValueError):
+            continue
+        end: Optional[float] = registration["end"]
+        if (end is not None and end < prune_before) or (end is None and not _isRunning(registration["pid"])):
+            try:
+                os.remove(path)
+            except OSError:
+                # Already removed by another simulation.
+                pass
+            continue
+        if end is None or end > start:
+            peers.append(FakeRun(**registration["run"]))
+    return peers
+
+
+def _cycleRows(run: FakeRun, cpu_time: float, gpu_time: float, wall_time: float) -> List[Tuple[str, float]]:
+    """
+        Splits wall time into cycle accounting rows in proportion to the modeled work.
+    """
+    weights: List[Tuple[str, float]] = [
+        ("Neighbor search", 0.03),
+        ("Force", _WORK_FRACTIONS["bonded"] + (0.0 if "nb" in run.offloaded else _WORK_FRACTIONS["nb"])),
+    ]
+    if run.gpu_ids:
+        weights.append(("Launch GPU ops.", 0.01 * len(run.gpu_ids)))
+    if "pme" not in run.offloaded:
+        weights.append(("PME mesh", _WORK_FRACTIONS["pme"]))
+    if "nb" in run.offloaded:
+        weights.append(("Wait GPU NB local", max(gpu_time - cpu_time, 0.0) / max(cpu_time, gpu_time)))
+    weights.append(("Update", 0.0 if "update" in run.offloaded else _WORK_FRACTIONS["update"] / 2))
+    weights.append(("Constraints", 0.0 if "update" in run.offloaded else _WORK_FRACTIONS["update"] / 2))
+    weights.append(("Rest", 0.02))
+    total: float = sum(weight for _, weight in weights)
+    return [(name, wall_time * weight / total) for name, weight in weights]
+
+
+# GPU timing rows for each offloadable task, with the share of the task's GPU time.
+_GPU_TIMING_ROWS: Dict[str, List[Tuple[str, float]]] = {
+    "nb": [("X / q H2D", 0.05), ("Nonbonded F kernel", 0.85), ("F D2H", 0.10)],
+    "pme": [("PME spline", 0.15), ("PME spread", 0.40), ("PME solve", 0.15), ("PME gather", 0.30)],
+    "bonded": [("Bonded F kernel", 1.0)],
+    "update": [("Update and constraints", 1.0)],
+}
+
+
+def _gpuTimingRows(run: FakeRun, gpu_wall_time: float) -> List[Tuple[str, float]]:
+    """
+        Splits GPU wall time into GPU timing rows in proportion to the offloaded work.
+    """
+    weights: List[Tuple[str, float]] = []
+    for work, fraction in _WORK_FRACTIONS.items():
+        if work in run.offloaded:
+            weights.extend((name, fraction * share) for name, share in _GPU_TIMING_ROWS[work])
+    total: float = sum(weight for _, weight in weights)
+    return [(name, gpu_wall_time * weight / total) for name, weight in weights]
+
+
+def _countedSteps(run: FakeRun) -> int:
+    return max(int(run.params.get("nsteps", 0)) - int(run.params.get("resetstep", 0)), 1)
+
+
+def modeledWallTime(run: FakeRun, performance: float) -> float:
+    """
+        Wall time in seconds of the timed part of a simulation, i.e. the steps after resetstep.
+    """
+    return _countedSteps(run) * _TIMESTEP_PS / 1000.0 / performance * 86400.0
+
+
+def formatLog(run: FakeRun, performance: float, cpu_time: float = 1.0, gpu_time: float = 0.0) -> str:
+    """
+        Writes a log with the sections gromax parses: the command line, cycle accounting, GPU timings if work is
+        offloaded, timing and performance. The cycle accounting and GPU timing breakdowns follow the CPU and GPU step
+        times of the default model.
+    """
+    args: List[str] = []
+    for key, value in run.params.items():
+        args.append("-" + key)
+        if value is not True:
+            args.append(str(value))
+    counted_steps: int = _countedSteps(run)
+    wall_time: float = modeledWallTime(run, performance)
+    num_threads: int = run.num_threads
+
+    lines: List[str] = [
+        "Log file opened on {}".format(time.strftime("%a %b %d %H:%M:%S %Y")),
+        "                      :-) GROMACS - gmx mdrun, fake (-:",
+        "",
+        "GROMACS:      gmx mdrun, gromax fake_mdrun {}".format(_GROMAX_VERSION),
+        "Command line:",
+        "  gmx mdrun {}".format(" ".join(args)),
+        "",
+        "",
+        "     R E A L   C Y C L E   A N D   T I M E   A C C O U N T I N G",
+        "",
+        "On {} MPI rank{}, each using {} OpenMP threads".format(run.ntmpi, "s" if run.ntmpi > 1 else "", run.ntomp),
+        "",
+        " Computing:          Num   Num      Call    Wall time         Giga-Cycles",
+        "                     Ranks Threads  Count      (s)         total sum    %",
+        "-" * 77,
+    ]
+    for name, row_time in _cycleRows(run, cpu_time, gpu_time, wall_time):
+        cycles: float = row_time * num_threads * _CLOCK_GHZ
+        percent: float = 100.0 * row_time / wall_time
+        if name == "Rest":
+            lines.append(" {:<20s}{:>20s}{:>12.3f}{:>15.3f}{:>6.1f}".format(name, "", row_time, cycles, percent))
+        else:
+            lines.append(" {:<20s}{:>4d}{:>5d}{:>11d}{:>12.3f}{:>15.3f}{:>6.1f}".format(
+                name, run.ntmpi, run.ntomp, counted_steps, row_time, cycles, percent))
+    lines.extend([
+        "-" * 77,
+        " {:<20s}{:>20s}{:>12.3f}{:>15.3f}{:>6.1f}".format("Total", "", wall_time,
+                                                             wall_time * num_threads * _CLOCK_GHZ, 100.0),
+        "-" * 77,
+        "",
+    ])
+    if run.offloaded and gpu_time > 0.0:
+        # The GPU is busy for its share of each step, the rest of the step it waits for the CPU.
+        gpu_wall_time: float = wall_time * gpu_time / max(cpu_time, gpu_time)
+        lines.extend([
+            " GPU timings",
+            "-" * 77,
+            " Computing:                         Count  Wall t (s)      ms/step       %",
+            "-" * 77,
+        ])
+        for name, row_time in _gpuTimingRows(run, gpu_wall_time):
+            lines.append(" {:<32s}{:>9d}{:>12.3f}{:>13.3f}{:>8.1f}".format(
+                name, counted_steps, row_time, 1000.0 * row_time / counted_steps, 100.0 * row_time / gpu_wall_time))
+        lines.extend([
+            "-" * 77,
+            " {:<32s}{:>9s}{:>12.3f}{:>13.3f}{:>8.1f}".format("Total", "", gpu_wall_time,
+                                                              1000.0 * gpu_wall_time / counted_steps, 100.0),
+            "-" * 77,
+            "",
+            "Average per-step force GPU/CPU evaluation time ratio: {:.3f} ms/{:.3f} ms = {:.3f}".format(
+                1000.0 * gpu_wall_time / counted_steps,
+                1000.0 * wall_time * cpu_time / max(cpu_time, gpu_time) / counted_steps, gpu_time / cpu_time),
+            "For optimal resource utilization this ratio should be close to 1",
+            "",
+        ])
+    lines.extend([
+        "               Core t (s)   Wall t (s)        (%)",
+        "       Time:  {:>11.3f}  {:>11.3f}  {:>9.1f}".format(wall_time * num_threads, wall_time,
+                                                             100.0 * num_threads),
+        "                 (ns/day)    (hour/ns)",
+        "Performance:  {:>11.3f}  {:>11.3f}".format(performance, 24.0 / performance),
+        "Finished mdrun on rank 0 {}".format(time.strftime("%a %b %d %H:%M:%S %Y")),
+        "",
+    ])
+    return "\n".join(lines)
+
+
+def _restrictedAffinity() -> Optional[List[int]]:
+    """
+        Returns the CPUs this process may run on, if it is restricted to a subset of the CPUs.
+    """
+    if not hasattr(os, "sched_getaffinity"):
+        return None
+    affinity: List[int] = sorted(os.sched_getaffinity(0))
+    return affinity if len(affinity) < (os.cpu_count() or 0) else None
+
+
+def main(argv: List[str]) -> int:
+    if argv and argv[0] == "mdrun":
+        argv = argv[1:]
+    try:
+        params: Dict[str, object] = parseMdrunArgs(argv)
+        run: FakeRun = createFakeRun(params, _restrictedAffinity())
+        model: PerformanceModel = loadPerformanceModel(os.environ.get("GROMAX_FAKE_MDRUN_MODEL"))
+    except (ValueError, ImportError, AttributeError) as e:
+        sys.stderr.write("fake mdrun: {}\n".format(e))
+        return 1
+
+    # Registrations are kept after finishing, so that simulations which started shortly before this one finished still
+    # see it, and are pruned by later simulations.
+    state_dir: Optional[str] = os.environ.get("GROMAX_FAKE_MDRUN_STATE_DIR")
+    start: float = time.time()
+    registration: Optional[str] = None
+    if state_dir:
+        os.makedirs(state_dir, exist_ok=True)
+        registration = os.path.join(state_dir, "{}_{}.json".format(os.getpid(), start))
+        _writeRegistration(registration, run, start, None)
+    try:
+        startup: float = float(os.environ.get("GROMAX_FAKE_MDRUN_STARTUP", "1" if state_dir else "0"))
+        time.sleep(startup)
+        peers: List[FakeRun] = []
+        if state_dir:
+            peers = _concurrentPeers(state_dir, registration, start,
+                                     time.time() - startup - _REGISTRATION_GRACE_SECONDS)
+        performance: float = model(run, peers)
+        cpu_time, gpu_time = _stepTimes(run, peers)
+        log: str = formatLog(run, performance, cpu_time, gpu_time)
+        time_scale: float = float(os.environ.get("GROMAX_FAKE_MDRUN_TIME_SCALE", "0"))
+        if time_scale > 0:
+            time.sleep(modeledWallTime(run, performance) * time_scale)
+    finally:
+        if registration is not None:
+            _writeRegistration(registration, run, start, time.time())
+
+    with open(str(params.get("deffnm", "md")) + ".log", "w") as fout:
+        fout.write(log)
+    return int(os.environ.get("GROMAX_FAKE_MDRUN_EXIT_CODE", "0"))
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
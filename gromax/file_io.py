@@ -1,6 +1,11 @@
 import os
 import logging
-from typing import Dict
+import re
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, Iterable, Iterator, List, Match, Optional, Pattern, Set, Tuple
+
+from gromax.inotify import IN_CREATE, IN_MOVED_TO, IN_Q_OVERFLOW, Inotify
 
 # Typing definitons
 # component index to log file path
@@ -11,92 +16,255 @@ groupContent = Dict[int, trialContent]
 allDirectoryContent = Dict[int, groupContent]
 
 
-# Extraction methods to get index of a folder or file.
-def _splitAndGrabSuffix(path: str, splitter: str):
+# Number of bytes read from the start and end of a log file when not scanning the full file. The command line is
+# reported within the first few KB of a log, and the performance and timing summaries within the last few KB.
+_LOG_HEAD_BYTES: int = 16 * 1024
+_LOG_TAIL_BYTES: int = 32 * 1024
+
+
+def readLogHeadAndTail(path: str, head_bytes: int = _LOG_HEAD_BYTES,
+                       tail_bytes: int = _LOG_TAIL_BYTES) -> Tuple[str, bool]:
     """
-        Splits a string and takes the suffix remainder.
+        Reads the start and end of a log file, skipping the middle. Returns the text read, and whether the text
+        comprises the whole file. Files that are small enough are read in full.
+
+        Raises IOError if the file cannot be read.
     """
-    split_path = path.split(splitter)
-    if len(split_path) != 2:
-        raise ValueError("Ambiguous split of path {} with splitter {}".format(path, splitter))
-    return split_path[-1]
+    with open(path, 'rb') as fin:
+        size: int = os.fstat(fin.fileno()).st_size
+        if size <= head_bytes + tail_bytes:
+            return fin.read().decode(errors="replace"), True
+        head: bytes = fin.read(head_bytes)
+        fin.seek(size - tail_bytes)
+        tail: bytes = fin.read()
+    # The newline keeps line-anchored regexes from matching across the gap.
+    return "\n".join((head.decode(errors="replace"), tail.decode(errors="replace"))), False
+
 
+# Patterns of group and trial directory and component log names, capturing the 1-based number. Names containing
+# the keyword more than once, e.g. "group_1_group_2", are ambiguous and do not match.
+_GROUP_DIR_RE: Pattern = re.compile(r"(?:(?!group_).)*group_([0-9]+)")
+_TRIAL_DIR_RE: Pattern = re.compile(r"(?:(?!trial_).)*trial_([0-9]+)")
+_COMPONENT_LOG_RE: Pattern = re.compile(r"(?:(?!component_).)*component_([0-9]+)\.log")
 
-def _getGroupIndex(group: str) -> int:
+
+def _scanIndexed(directory: str, pattern: Pattern, description: str, candidate: Callable[[str], bool],
+                 directories: bool) -> Iterator[Tuple[int, str]]:
     """
-        Returns the 0-based index of a group ID. Input needs to be of the form /some/path/prefix/group_{num},
-        where num is a 1-based group number.
+        Yields the 0-based index and path of each entry of directory whose name matches pattern, and which is a
+        directory if directories is set or else a file. Entries that look like candidates but do not match are
+        logged as warnings, and other entries at debug level.
     """
-    return int(_splitAndGrabSuffix(group, "group_")) - 1
+    logger: logging.Logger = logging.getLogger("gromax")
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            match: Optional[Match] = pattern.fullmatch(entry.name)
+            if match is None:
+                if candidate(entry.name):
+                    logger.warning("Failed to parse {}: not a valid {} name".format(entry.path, description))
+                else:
+                    logger.debug("Skipping {} - not a {}".format(entry.path, description))
+                continue
+            # DirEntry caches the file type from the directory listing, so this does not need another stat on
+            # most filesystems.
+            if entry.is_dir() != directories:
+                logger.debug("Skipping {} - not a {}".format(entry.path, description))
+                continue
+            yield int(match.group(1)) - 1, entry.path
 
 
-def _getTrialIndex(trial: str) -> int:
+def _scanGroup(group_dir: str) -> groupContent:
     """
-        Returns the 0-based index of a trial ID. Input needs to be of the form /some/path/prefix/trial_{num},
-        where num is a 1-based trial number.
+        Returns the trials of a group directory and their component logs.
     """
-    return int(_splitAndGrabSuffix(trial, "trial_")) - 1
+    return {trial_index: dict(_scanIndexed(trial_dir, _COMPONENT_LOG_RE, "component log",
+                                           lambda name: name.endswith(".log"), directories=False))
+            for trial_index, trial_dir in _scanIndexed(group_dir, _TRIAL_DIR_RE, "trial folder",
+                                                       lambda name: "trial_" in name, directories=True)}
 
 
-def _getComponentIndex(component: str) -> int:
+class DirectoryWalk(object):
     """
-        Returns the 0-based index of a component ID. Input needs to be of the form /some/path/prefix/component_{num},
-        where num is a 1-based component number.
+        Walks a gromax run directory, yielding component log paths as they are found so that they can be processed
+        before the walk is complete. The group directories are listed on construction, and the full structure is
+        available from content once iteration has finished. With jobs > 1, group directories are scanned
+        concurrently by a thread pool, which helps on high latency filesystems.
     """
-    return int(_splitAndGrabSuffix(component, "component_").split(".log")[0]) - 1
+    def __init__(self, directory: str, jobs: int = 1):
+        self._directory: str = directory
+        self._jobs: int = jobs
+        self.group_directories: Dict[int, str] = dict(_scanIndexed(directory, _GROUP_DIR_RE, "group folder",
+                                                                   lambda name: "group_" in name, directories=True))
+        self.content: allDirectoryContent = {}
 
+    def _scanGroups(self) -> Iterator[Tuple[int, groupContent]]:
+        if self._jobs <= 1:
+            for group_index, group_dir in self.group_directories.items():
+                yield group_index, _scanGroup(group_dir)
+            return
+        with ThreadPoolExecutor(max_workers=self._jobs) as pool:
+            futures: Dict[Future, int] = {pool.submit(_scanGroup, group_dir): group_index
+                                          for group_index, group_dir in self.group_directories.items()}
+            for future in as_completed(futures):
+                yield futures[future], future.result()
 
-def _getGroupFoldersWithIndices(directory: str) -> Dict[int, str]:
-    result: Dict[int, str] = {}
-    folder_path: str
-    for folder_path in os.listdir(directory):
-        if "group_" not in folder_path:
-            logging.getLogger("gromax").debug("Skipping folder {} - not a group folder".format(
-                os.path.join(directory, folder_path)))
-            continue
-        try:
-            result[_getGroupIndex(folder_path)] = os.path.join(directory, folder_path)
-        except (TypeError, ValueError) as e:
-            logging.getLogger("gromax").warning("Failed to parse {}: {}".format(directory + '/' + folder_path, e))
+    def __iter__(self) -> Iterator[str]:
+        start: float = time.perf_counter()
+        content: allDirectoryContent = {}
+        num_logs: int = 0
+        for group_index, group_content in self._scanGroups():
+            content[group_index] = group_content
+            for trial_content in group_content.values():
+                num_logs += len(trial_content)
+                yield from trial_content.values()
+        # Groups finish in any order when scanned concurrently.
+        self.content = {group_index: content[group_index] for group_index in self.group_directories}
+        logging.getLogger("gromax").debug("Found {} groups with {} logs in {} in {:.3f} s".format(
+            len(self.content), num_logs, self._directory, time.perf_counter() - start))
 
-    return result
 
+class DirectoryWatcher(object):
+    """
+        Reports component logs of a gromax run directory that are new or have changed. The first poll reports every
+        log already present.
 
-def _getTrialFoldersWithIndices(directory: str) -> Dict[int, str]:
-    result: Dict[int, str] = {}
-    folder_path: str
-    for folder_path in os.listdir(directory):
-        if "trial_" not in folder_path:
-            logging.getLogger("gromax").debug("Skipping folder {} - not a trial folder".format(
-                os.path.join(directory, folder_path)))
-            continue
-        try:
-            result[_getTrialIndex(folder_path)] = os.path.join(directory, folder_path)
-        except (TypeError, ValueError) as e:
-            logging.getLogger("gromax").warning("Failed to parse {}: {}".format(directory + '/' + folder_path, e))
-    return result
-
-
-def _getComponentFoldersWithIndices(directory: str) -> Dict[int, str]:
-    result: Dict[int, str] = {}
-    file_path: str
-    for file_path in os.listdir(directory):
-        if not file_path.endswith(".log"):
-            logging.getLogger("gromax").debug("Skipping file {} - not a log file".format(
-                os.path.join(directory, file_path)))
-            continue
-        # Treat each subdirectory as a group directory, but some might not be so it's ok to fail.
+        Uses inotify where available, so that only directories and logs with activity are looked at. Otherwise each
+        poll checks the modification time of every directory, and the size and modification time of logs that have
+        not been settled, i.e. reported by the caller as complete. With polling, a settled log that is rewritten is
+        not noticed.
+    """
+    def __init__(self, directory: str, use_inotify: bool = True):
+        self._directory: str = directory
+        # Directories by path, with their group and trial index, or None at levels above.
+        self._directories: Dict[str, Tuple[Optional[int], Optional[int]]] = {}
+        self._directory_mtimes: Dict[str, int] = {}
+        self._logs: Dict[str, Tuple[int, int, int]] = {}
+        self._log_stats: Dict[str, Tuple[int, int]] = {}
+        self._watches: Dict[int, str] = {}
+        self._inotify: Optional[Inotify] = None
+        self._first_poll: bool = True
+        if use_inotify:
+            try:
+                self._inotify = Inotify()
+            except OSError as e:
+                logging.getLogger("gromax").debug("Not using inotify: {}".format(e))
+        logging.getLogger("gromax").debug("Watching {} {}".format(
+            directory, "with inotify" if self._inotify else "by polling"))
+
+    @property
+    def uses_inotify(self) -> bool:
+        return self._inotify is not None
+
+    def close(self):
+        if self._inotify is not None:
+            self._inotify.close()
+            self._inotify = None
+
+    def _addDirectory(self, path: str, indices: Tuple[Optional[int], Optional[int]], changed: Set[str]):
+        """
+            Starts tracking a directory and scans it, adding its logs and those of its subdirectories to changed.
+        """
+        if path in self._directories:
+            return
+        self._directories[path] = indices
+        if self._inotify is not None:
+            # Watch before scanning, so that entries created in between are not missed.
+            self._watches[self._inotify.addWatch(path)] = path
+        self._scanDirectory(path, changed)
+
+    def _scanDirectory(self, path: str, changed: Set[str]):
+        """
+            Looks for subdirectories and logs of a tracked directory that are not yet tracked.
+        """
         try:
-            result[_getComponentIndex(file_path)] = os.path.join(directory, file_path)
-        except (TypeError, ValueError) as e:
-            logging.getLogger("gromax").warning("Failed to parse {}: {}".format(directory + '/' + file_path, e))
-    return result
+            self._directory_mtimes[path] = os.stat(path).st_mtime_ns
+        except OSError:
+            return
+        group, trial = self._directories[path]
+        if group is None:
+            for group_index, group_dir in _scanIndexed(path, _GROUP_DIR_RE, "group folder",
+                                                       lambda name: "group_" in name, directories=True):
+                self._addDirectory(group_dir, (group_index, None), changed)
+        elif trial is None:
+            for trial_index, trial_dir in _scanIndexed(path, _TRIAL_DIR_RE, "trial folder",
+                                                       lambda name: "trial_" in name, directories=True):
+                self._addDirectory(trial_dir, (group, trial_index), changed)
+        else:
+            for component_index, log in _scanIndexed(path, _COMPONENT_LOG_RE, "component log",
+                                                     lambda name: name.endswith(".log"), directories=False):
+                if log not in self._logs:
+                    self._logs[log] = (group, trial, component_index)
+                    changed.add(log)
+
+    def _pollDirectories(self, changed: Set[str]):
+        for path in list(self._directories):
+            try:
+                mtime: int = os.stat(path).st_mtime_ns
+            except OSError:
+                continue
+            if mtime != self._directory_mtimes.get(path):
+                self._scanDirectory(path, changed)
+        for log in list(self._log_stats):
+            try:
+                stat: os.stat_result = os.stat(log)
+            except OSError:
+                continue
+            if (stat.st_mtime_ns, stat.st_size) != self._log_stats[log]:
+                changed.add(log)
+
+    def _readEvents(self, changed: Set[str]):
+        for wd, mask, name in self._inotify.read():
+            if mask & IN_Q_OVERFLOW:
+                logging.getLogger("gromax").debug("inotify queue overflowed, rescanning {}".format(self._directory))
+                for path in list(self._directories):
+                    self._scanDirectory(path, changed)
+                changed.update(self._log_stats)
+                continue
+            path: Optional[str] = self._watches.get(wd)
+            if path is None or not name:
+                continue
+            entry: str = os.path.join(path, name)
+            if entry in self._logs:
+                changed.add(entry)
+            elif mask & (IN_CREATE | IN_MOVED_TO):
+                self._scanDirectory(path, changed)
+
+    def poll(self, timeout: float) -> List[Tuple[Tuple[int, int, int], str]]:
+        """
+            Waits timeout seconds, except on the first call, and returns the (group, trial, component) index and path
+            of each new or changed log, in index order.
+        """
+        changed: Set[str] = set()
+        if self._first_poll:
+            self._first_poll = False
+            self._addDirectory(self._directory, (None, None), changed)
+        else:
+            time.sleep(timeout)
+            if self._inotify is not None:
+                self._readEvents(changed)
+            else:
+                self._pollDirectories(changed)
+        for log in changed:
+            try:
+                stat: os.stat_result = os.stat(log)
+            except OSError:
+                continue
+            self._log_stats[log] = (stat.st_mtime_ns, stat.st_size)
+        return sorted((self._logs[log], log) for log in changed)
+
+    def settle(self, logs: Iterable[str]):
+        """
+            Marks logs as complete, so that polling no longer checks them for changes.
+        """
+        for log in logs:
+            self._log_stats.pop(log, None)
 
 
-def parseDirectoryStructure(directory: str) -> allDirectoryContent:
+def parseDirectoryStructure(directory: str, jobs: int = 1) -> allDirectoryContent:
     """
         Walks a directory tree and lists the log files within the structure as a nested dict, with the keys being
         0-based indices into the group, trial, or component, and the leaf values being component log file paths.
+        Group directories are scanned by jobs threads.
         TODO figure out how best to handle errors
         Expected dir structure is
             group_1
@@ -127,17 +295,10 @@ def parseDirectoryStructure(directory: str) -> allDirectoryContent:
             },
          }
     """
-    result: allDirectoryContent = {}
-    group_index: int
-    group_dir: str
-    for group_index, group_dir in _getGroupFoldersWithIndices(directory).items():
-        group_result: groupContent = {}
-        trial_index: int
-        trial_dir: str
-        for trial_index, trial_dir in _getTrialFoldersWithIndices(group_dir).items():
-            group_result[trial_index] = {key: val for key, val in _getComponentFoldersWithIndices(trial_dir).items()}
-        result[group_index] = group_result
-    return result
+    walk: DirectoryWalk = DirectoryWalk(directory, jobs=jobs)
+    for _ in walk:
+        pass
+    return walk.content
 
 
 def _maxItems(content: Dict):
@@ -158,14 +319,17 @@ def _maxItems(content: Dict):
     return max_trials
 
 
-def SanitizeDirectoryStructure(content: allDirectoryContent):
+def SanitizeDirectoryStructure(content: allDirectoryContent, uneven_trials_expected: bool = False):
     """
-        Logs missing trials, and purges trials with missing components.
+        Logs missing trials, and purges trials with missing components. Missing trials are only logged at debug level
+        if uneven_trials_expected is set, e.g. when trial counts are chosen per group.
     """
     max_trials = _maxItems(content)
+    log_missing_trial = logging.getLogger("gromax").debug if uneven_trials_expected else \
+        logging.getLogger("gromax").warning
     for group_idx, group in content.items():
         if len(group) < max_trials:
-            logging.getLogger("gromax").warning(
+            log_missing_trial(
                 "Group {} has only {} trials, other groups have up to {}".format(group_idx, len(group), max_trials))
         max_components = _maxItems(group)
         # Can't use items() since we're dynamically changing the size of the dict on error cases.
@@ -1,34 +1,41 @@
 import gromax.utils as utils
 import math
-from copy import deepcopy
-from typing import List
+from gromax.topology import Topology
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple, Union
 
 # Convenience Definitions
 GpuIDs = List[int]
+CpuIDs = Union[List[int], range]
+CpuSequence = Union[range, Tuple[int, ...]]
 
 
 class HardwareConfig(object):
     """
         Representation of the available hardware. This may represent all or part of a system.
 
-        Attributes:
-            cpu_ids: List of integers of CPU IDs
-            gpu_ids: List of integers of GPU IDs
+        CPU IDs with a constant stride are stored as a range, so that slicing a config into subconfigs is cheap
+        regardless of the number of CPUs. Other CPU sets, e.g. "0-15,64-79", are stored as a sorted tuple, and can only
+        be pinned to as a set rather than with an offset and stride. GPU IDs are stored as a tuple. Configs are
+        immutable, hashable value objects, used as dictionary and cache keys - create a new config, e.g. with
+        subConfig, for other IDs.
 
         Properties:
+            cpu_ids: List of integers of CPU IDs
+            gpu_ids: List of integers of GPU IDs
             num_cpus: number of CPUs
             num_gpus: number of GPUs
+            cpu_range: CPU IDs as an immutable sequence, a range if they have a constant stride
+            cpu_stride: distance between consecutive CPU IDs, or None if it is not constant
+            is_strided: whether the CPU IDs have a constant stride
     """
+    __slots__ = ("_cpu_ids", "_gpu_ids")
+
+    def __init__(self, cpu_ids: CpuIDs = None, gpu_ids: List[int] = None):
+        object.__setattr__(self, "_cpu_ids", _toCpuSequence(cpu_ids) if cpu_ids else range(0))
+        object.__setattr__(self, "_gpu_ids", _toGpuTuple(gpu_ids) if gpu_ids else ())
 
-    def __init__(self, cpu_ids: List[int] = None, gpu_ids: List[int] = None):
-        if cpu_ids:
-            self.cpu_ids: List[int] = cpu_ids
-        else:
-            self.cpu_ids: List[int] = []
-        if gpu_ids:
-            self.gpu_ids: List[int] = gpu_ids
-        else:
-            self.gpu_ids: List[int] = []
+    def __setattr__(self, name: str, value):
+        raise AttributeError("HardwareConfig is immutable, create a new config instead of setting '{}'".format(name))
 
     @property
     def num_cpus(self) -> int:
@@ -40,31 +47,36 @@ class HardwareConfig(object):
 
     @property
     def cpu_ids(self) -> List[int]:
-        return deepcopy(self._cpu_ids)
+        return list(self._cpu_ids)
 
-    @cpu_ids.setter
-    def cpu_ids(self, cpu_ids):
-        checkProcessorIDContent(cpu_ids)
-        self._cpu_ids = cpu_ids
+    @property
+    def cpu_range(self) -> CpuSequence:
+        return self._cpu_ids
+
+    @property
+    def is_strided(self) -> bool:
+        return isinstance(self._cpu_ids, range)
+
+    @property
+    def cpu_stride(self) -> Optional[int]:
+        if not self.is_strided:
+            return None
+        return self._cpu_ids.step if len(self._cpu_ids) > 1 else 1
 
     @property
     def gpu_ids(self) -> List[int]:
-        return deepcopy(self._gpu_ids)
-
-    @gpu_ids.setter
-    def gpu_ids(self, gpu_ids: List[int]):
-        try:
-            for item in gpu_ids:
-                if not isinstance(item, int):
-                    utils.fatalError("All gpu ids must be integers: {} is not an int".format(item))
-                if item < 0:
-                    utils.fatalError("Cannot have a negative GPU ID")
-            self._gpu_ids = gpu_ids
-        except TypeError:
-            utils.fatalError("gpu_ids paramater must be iterable")
+        return list(self._gpu_ids)
+
+    def subConfig(self, start: int, stop: int, gpu_ids: List[int]) -> "HardwareConfig":
+        """
+            Returns a config with the CPUs at positions [start, stop) of this config, and the given GPU IDs.
+        """
+        cpu_slice: CpuSequence = self._cpu_ids[start:stop]
+        # A slice of a non-uniform set may have a constant stride, and is then stored as a range.
+        return HardwareConfig(cpu_ids=cpu_slice if isinstance(cpu_slice, range) else list(cpu_slice), gpu_ids=gpu_ids)
 
     def __str__(self) -> str:
-        return "\nHardware config:\n\tcpu IDs : {}\n\tgpu IDs : {}".format(self._cpu_ids, self._gpu_ids)
+        return "\nHardware config:\n\tcpu IDs : {}\n\tgpu IDs : {}".format(list(self._cpu_ids), list(self._gpu_ids))
 
     def __repr__(self) -> str:
         return self.__str__()
@@ -72,18 +84,74 @@ class HardwareConfig(object):
     def __eq__(self, other) -> bool:
         if not isinstance(other, HardwareConfig):
             return False
-        return self.cpu_ids == other.cpu_ids and self.gpu_ids == other.gpu_ids
+        return self._cpu_ids == other._cpu_ids and self._gpu_ids == other._gpu_ids
 
     def __ne__(self, other) -> bool:
         return not self.__eq__(other)
 
+    def __hash__(self) -> int:
+        return hash((self._cpu_ids, self._gpu_ids))
+
+
+def _toCpuSequence(cpu_ids: CpuIDs) -> CpuSequence:
+    """
+        Validates CPU IDs and converts them to their stored form, a range if they have a constant stride and a sorted
+        tuple otherwise. Exits the program if they are invalid.
+    """
+    if isinstance(cpu_ids, range):
+        if len(cpu_ids) and min(cpu_ids[0], cpu_ids[-1]) < 0:
+            utils.fatalError("Not all values in 'cpu_ids' are ints")
+        return cpu_ids
+    checkProcessorIDContent(cpu_ids)
+    return _toRange(cpu_ids) if _hasConstantStride(cpu_ids) else tuple(sorted(cpu_ids))
 
-def distributeGpuIdsToTasks(gpu_ids: GpuIDs, ntasks: int) -> List[GpuIDs]:
+
+def _toGpuTuple(gpu_ids: List[int]) -> Tuple[int, ...]:
+    """
+        Validates GPU IDs and converts them to a tuple. Exits the program if they are invalid.
+    """
+    try:
+        for item in gpu_ids:
+            if not isinstance(item, int):
+                utils.fatalError("All gpu ids must be integers: {} is not an int".format(item))
+            if item < 0:
+                utils.fatalError("Cannot have a negative GPU ID")
+        return tuple(gpu_ids)
+    except TypeError:
+        utils.fatalError("gpu_ids paramater must be iterable")
+        return ()
+
+
+def _hasConstantStride(cpu_ids: List[int]) -> bool:
+    if len(cpu_ids) < 2:
+        return True
+    stride: int = cpu_ids[1] - cpu_ids[0]
+    return stride != 0 and all(cpu_ids[i + 1] - cpu_ids[i] == stride for i in range(len(cpu_ids) - 1))
+
+
+def _toRange(cpu_ids: List[int]) -> range:
+    """
+        Converts a validated, constant stride list of IDs to the equivalent range.
+    """
+    if not cpu_ids:
+        return range(0)
+    if len(cpu_ids) == 1:
+        return range(cpu_ids[0], cpu_ids[0] + 1)
+    stride: int = cpu_ids[1] - cpu_ids[0]
+    return range(cpu_ids[0], cpu_ids[-1] + stride, stride)
+
+
+def distributeGpuIdsToTasks(gpu_ids: GpuIDs, ntasks: int, task_numa_nodes: Optional[Sequence[Optional[int]]] = None,
+                            gpu_numa_nodes: Optional[Dict[int, int]] = None) -> List[GpuIDs]:
     """
         Creates a list of lists of [[task 0 gpu ids],[task 1 gpu ids]]
 
         There can be multiple gpu_ids assigned to a task, or the same GPU can be assigned
         to multiple tasks, depending on the workload.
+
+        If the NUMA node of each task and of the GPUs are given, tasks are first given GPUs on their own NUMA node, and
+        the remaining GPUs are then assigned in order. Each GPU is still shared by the same number of tasks. Without
+        locality information, consecutive tasks share consecutive GPUs.
     """
     if not isinstance(gpu_ids, list):
         raise TypeError("Gpu IDs must be a list - is {}".format(gpu_ids))
@@ -93,24 +161,32 @@ def distributeGpuIdsToTasks(gpu_ids: GpuIDs, ntasks: int) -> List[GpuIDs]:
         raise ValueError("The number of tasks ({}) needs to be divisible by the number of GPU ids ".format(ntasks) +
                          "({}), or vice versa".format(n_gpu_ids))
 
-    result: List[GpuIDs] = []
-    current_index: int = 0
-    for i, task in enumerate(range(ntasks)):
-        task_ids: GpuIDs = []
-        if n_gpu_ids > ntasks:
-            ratio: int = int(n_gpu_ids / ntasks)
-            for r in range(ratio):
-                task_ids.append(gpu_ids[current_index])
-                current_index += 1
-        else:
-            ratio: int = int(ntasks / n_gpu_ids)
-            task_ids.append(gpu_ids[math.floor(i / ratio)])
-
-        result.append(task_ids)
-    return result
-
-
-def generateConfigSplitOptions(hw_config: HardwareConfig, max_sims_per_gpu: int = 4) -> List[List[HardwareConfig]]:
+    gpus_per_task: int = max(1, n_gpu_ids // ntasks)
+    remaining_uses: List[int] = [max(1, ntasks // n_gpu_ids)] * n_gpu_ids
+    result: List[GpuIDs] = [[] for _ in range(ntasks)]
+
+    def assign(local_only: bool):
+        for task, task_ids in enumerate(result):
+            for gpu_index, gpu_id in enumerate(gpu_ids):
+                if len(task_ids) == gpus_per_task:
+                    break
+                if remaining_uses[gpu_index] == 0 or gpu_id in task_ids:
+                    continue
+                if local_only and (task_numa_nodes[task] is None or
+                                   gpu_numa_nodes.get(gpu_id) != task_numa_nodes[task]):
+                    continue
+                task_ids.append(gpu_id)
+                remaining_uses[gpu_index] -= 1
+
+    if task_numa_nodes is not None and gpu_numa_nodes:
+        assign(local_only=True)
+    assign(local_only=False)
+    return [sorted(task_ids, key=gpu_ids.index) for task_ids in result]
+
+
+def generateConfigSplitOptions(hw_config: HardwareConfig, max_sims_per_gpu: int = 4,
+                               topology: Optional[Topology] = None,
+                               gpu_numa_nodes: Optional[Dict[int, int]] = None) -> List[List[HardwareConfig]]:
     """
         Hardware configs can be split for simultaneous simulations with the following constraints:
 
@@ -124,6 +200,13 @@ def generateConfigSplitOptions(hw_config: HardwareConfig, max_sims_per_gpu: int
         configsplit1 should add up to the entire config.
 
         Will not create a breakdown such that more than max_sims_per_gpu simulations use the same GPU.
+
+        If a topology covering all CPUs of the config is given, components take CPUs in its locality order rather than
+        in ID order, so that e.g. with Linux SMT numbering a component can hold both hardware threads of its cores, or
+        a whole NUMA node such as CPUs 0-15 and 32-47, which is then bound to as a CPU set. Breakdowns whose
+        components straddle fewer NUMA nodes, then L3 cache domains, then physical cores come first, and the order is
+        otherwise unchanged. If the NUMA node of each GPU is also given, components
+        are preferably given GPUs on the NUMA node holding most of their CPUs.
     """
     num_total_cpus: int = hw_config.num_cpus
     num_total_gpus: int = hw_config.num_gpus
@@ -135,6 +218,11 @@ def generateConfigSplitOptions(hw_config: HardwareConfig, max_sims_per_gpu: int
     if num_total_gpus == 0:
         return config_possibilities
 
+    use_topology: bool = topology is not None and topology.covers(hw_config.cpu_range)
+    # Components take consecutive CPUs of this order. Without a topology, slices of the config are used directly.
+    cpu_order: Sequence[int] = topology.localityOrder(hw_config.cpu_range) if use_topology else hw_config.cpu_range
+    in_id_order: bool = list(cpu_order) == list(hw_config.cpu_range)
+
     # Search division options, between 1 cpu per sim and half of the cpus per sim. Note that the all CPUs
     # per sim option is already accounted for above.
     cpu_per_sim_options: List[int] = [i for i in range(1, int(num_total_cpus / 2) + 1)
@@ -145,13 +233,21 @@ def generateConfigSplitOptions(hw_config: HardwareConfig, max_sims_per_gpu: int
         sims_in_set: int = int(num_total_cpus / cpus_per_sim)
 
         config_set: List[HardwareConfig] = []
-        gpu_id_assignments: List[List[int]] = distributeGpuIdsToTasks(hw_config.gpu_ids, sims_in_set)
+        task_numa_nodes: Optional[List[Optional[int]]] = None
+        if topology is not None and gpu_numa_nodes:
+            task_numa_nodes = [topology.numaNode(cpu_order[i * cpus_per_sim:(i + 1) * cpus_per_sim])
+                               for i in range(sims_in_set)]
+        gpu_id_assignments: List[List[int]] = distributeGpuIdsToTasks(hw_config.gpu_ids, sims_in_set,
+                                                                      task_numa_nodes, gpu_numa_nodes)
         for i, gpu_assignment in enumerate(gpu_id_assignments):
-            config: HardwareConfig = HardwareConfig()
-            config.cpu_ids = hw_config.cpu_ids[i * cpus_per_sim: (i + 1) * cpus_per_sim]
-            config.gpu_ids = gpu_assignment
-            config_set.append(config)
+            if in_id_order:
+                config_set.append(hw_config.subConfig(i * cpus_per_sim, (i + 1) * cpus_per_sim, gpu_assignment))
+            else:
+                config_set.append(HardwareConfig(cpu_ids=sorted(cpu_order[i * cpus_per_sim:(i + 1) * cpus_per_sim]),
+                                                 gpu_ids=gpu_assignment))
         config_possibilities.append(config_set)
+    if use_topology:
+        config_possibilities.sort(key=lambda split: topology.alignmentKey([config.cpu_range for config in split]))
     return config_possibilities
 
 
@@ -160,7 +256,9 @@ def checkProcessorIDContent(cpu_ids: List[int]):
         Given an assigned value for cpu_ids, assure that
         1. It is a list
         2. The list contains all integers
-        3. The stride between integers is consistent.
+        3. No ID is listed twice.
+
+        The IDs do not need a constant stride.
 
         Exits the program if a condition is not met.
     """
@@ -174,9 +272,20 @@ def checkProcessorIDContent(cpu_ids: List[int]):
     if not cpu_ids:
         return
 
-    if len(cpu_ids) > 1:
-        diff: int = cpu_ids[1] - cpu_ids[0]
+    if len(set(cpu_ids)) != len(cpu_ids):
+        utils.fatalError("Duplicate values in 'cpu_ids'")
+
 
-        for i, val in enumerate(cpu_ids[:-1]):
-            if (cpu_ids[i+1] - val) != diff:
-                utils.fatalError("Inconsistent stride between cpu ids")
+def formatCpuList(cpu_ids: Iterable[int]) -> str:
+    """
+        Formats CPU IDs as a sorted list of ranges, e.g. "0-15,64-79", as accepted by taskset -c.
+    """
+    items: List[str] = []
+    sorted_ids: List[int] = sorted(cpu_ids)
+    start: int = 0
+    for i in range(1, len(sorted_ids) + 1):
+        if i == len(sorted_ids) or sorted_ids[i] != sorted_ids[i - 1] + 1:
+            first, last = sorted_ids[start], sorted_ids[i - 1]
+            items.append(str(first) if first == last else "{}-{}".format(first, last))
+            start = i
+    return ",".join(items)
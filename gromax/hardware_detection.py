@@ -0,0 +1,115 @@
+import logging
+import os
+import re
+import shlex
+import subprocess
+from typing import List, Mapping, Optional, Tuple
+
+"""
+    Detection of the CPUs and GPUs available to this process, so that benchmarks on shared nodes only use the hardware
+    a job was given. CPUs are read from the process affinity, which the kernel restricts to the job's cgroup cpuset,
+    and GPUs from the device visibility variables of the CUDA and ROCm runtimes, or from a GPU listing command.
+"""
+
+# Environment variables restricting the GPUs visible to the CUDA and ROCm runtimes, in order of precedence.
+VISIBLE_DEVICES_VARIABLES: Tuple[str, ...] = ("CUDA_VISIBLE_DEVICES", "ROCR_VISIBLE_DEVICES")
+
+# Lines of 'nvidia-smi -L' output, e.g. "GPU 0: NVIDIA A100-SXM4-40GB (UUID: GPU-...)". MIG devices are listed on
+# indented lines below their GPU, and are not matched.
+_GPU_LISTING_RE = re.compile(r"^GPU ([0-9]+):", re.MULTILINE)
+
+_GPU_LIST_COMMAND_TIMEOUT: float = 30.0
+
+
+def readAllowedCpus() -> Optional[List[int]]:
+    """
+        Returns the sorted IDs of the CPUs this process may run on, from its affinity. Returns None on platforms that do
+        not report it.
+    """
+    if not hasattr(os, "sched_getaffinity"):
+        return None
+    return sorted(os.sched_getaffinity(0))
+
+
+def parseVisibleDevices(value: str) -> List[str]:
+    """
+        Parses a CUDA_VISIBLE_DEVICES style list of device indices or UUIDs. As in the CUDA runtime, devices listed
+        after an invalid entry, such as -1 or an empty entry, are not visible.
+    """
+    devices: List[str] = []
+    for entry in value.split(","):
+        entry = entry.strip()
+        if not entry or entry.startswith("-") or entry == "NoDevFiles":
+            break
+        devices.append(entry)
+    return devices
+
+
+def visibleDevices(environ: Mapping[str, str] = os.environ) -> Optional[Tuple[str, List[str]]]:
+    """
+        Returns the first set device visibility variable and the devices it makes visible, or None if none is set.
+    """
+    for variable in VISIBLE_DEVICES_VARIABLES:
+        if variable in environ:
+            return variable, parseVisibleDevices(environ[variable])
+    return None
+
+
+def physicalGpuIndices(environ: Mapping[str, str] = os.environ) -> Optional[List[int]]:
+    """
+        Returns the node-wide index of each visible GPU, in the order the runtime numbers them, or None if all GPUs are
+        visible or the devices are given by UUID.
+    """
+    visible: Optional[Tuple[str, List[str]]] = visibleDevices(environ)
+    if visible is None or not all(device.isdigit() for device in visible[1]):
+        return None
+    return [int(device) for device in visible[1]]
+
+
+def parseGpuListing(output: str) -> List[int]:
+    """
+        Parses the GPU indices from 'nvidia-smi -L' style output, with a "GPU <index>:" line per GPU.
+    """
+    return [int(match.group(1)) for match in _GPU_LISTING_RE.finditer(output)]
+
+
+def runGpuListCommand(command: str) -> Optional[List[int]]:
+    """
+        Runs a command printing 'nvidia-smi -L' style output, and returns the GPU indices it lists, or None if it fails.
+    """
+    logger: logging.Logger = logging.getLogger("gromax")
+    try:
+        result: subprocess.CompletedProcess = subprocess.run(shlex.split(command), stdout=subprocess.PIPE,
+                                                             stderr=subprocess.PIPE, universal_newlines=True,
+                                                             timeout=_GPU_LIST_COMMAND_TIMEOUT)
+    except (OSError, ValueError, subprocess.TimeoutExpired) as e:
+        logger.warning("Could not run GPU list command '{}': {}".format(command, e))
+        return None
+    if result.returncode != 0:
+        logger.warning("GPU list command '{}' failed with exit code {}: {}".format(command, result.returncode,
+                                                                                 result.stderr.strip()))
+        return None
+    return parseGpuListing(result.stdout)
+
+
+def detectGpuIds(environ: Mapping[str, str] = os.environ,
+                 gpu_list_command: Optional[str] = None) -> Optional[List[int]]:
+    """
+        Returns the IDs mdrun uses for the GPUs visible to this process, which the GPU runtimes number from 0. GPUs are
+        counted from CUDA_VISIBLE_DEVICES or ROCR_VISIBLE_DEVICES if set, as listing commands such as nvidia-smi
+        ignore them, and otherwise from the output of gpu_list_command.
+
+        Returns None if the GPUs cannot be determined.
+    """
+    logger: logging.Logger = logging.getLogger("gromax")
+    visible: Optional[Tuple[str, List[str]]] = visibleDevices(environ)
+    if visible is not None:
+        variable, devices = visible
+        logger.info("{}={} makes {} GPUs visible".format(variable, environ[variable], len(devices)))
+        return list(range(len(devices)))
+    if gpu_list_command:
+        listed: Optional[List[int]] = runGpuListCommand(gpu_list_command)
+        if listed is not None:
+            logger.info("'{}' lists {} GPUs".format(gpu_list_command, len(listed)))
+            return list(range(len(listed)))
+    return None
@@ -0,0 +1,68 @@
+import ctypes
+import ctypes.util
+import os
+import struct
+import sys
+from typing import List, Tuple
+"""
+    Minimal ctypes binding to the Linux inotify API, used to watch run directories for new and changed logs without
+    polling.
+"""
+
+# inotify event flags, from <sys/inotify.h>.
+IN_MODIFY: int = 0x00000002
+IN_CLOSE_WRITE: int = 0x00000008
+IN_MOVED_TO: int = 0x00000080
+IN_CREATE: int = 0x00000100
+IN_Q_OVERFLOW: int = 0x00004000
+IN_ISDIR: int = 0x40000000
+_IN_NONBLOCK: int = 0o4000
+_IN_CLOEXEC: int = 0o2000000
+WATCH_MASK: int = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+# wd, mask, cookie and name length.
+_INOTIFY_EVENT: struct.Struct = struct.Struct("iIII")
+
+
+class Inotify(object):
+    """
+        An inotify instance, read without blocking.
+
+        Raises OSError on construction if inotify is not available.
+    """
+    def __init__(self):
+        if not sys.platform.startswith("linux"):
+            raise OSError("inotify is only available on Linux")
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self._fd: int = self._libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+    def addWatch(self, path: str, mask: int = WATCH_MASK) -> int:
+        """
+            Watches path for the events in mask, and returns the watch descriptor reported with its events.
+        """
+        wd: int = self._libc.inotify_add_watch(self._fd, os.fsencode(path), mask)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_add_watch failed for {}".format(path))
+        return wd
+
+    def read(self) -> List[Tuple[int, int, str]]:
+        """
+            Returns the pending events as (watch descriptor, mask, name) without blocking.
+        """
+        events: List[Tuple[int, int, str]] = []
+        while True:
+            try:
+                buffer: bytes = os.read(self._fd, 64 * 1024)
+            except BlockingIOError:
+                return events
+            offset: int = 0
+            while offset < len(buffer):
+                wd, mask, _, name_length = _INOTIFY_EVENT.unpack_from(buffer, offset)
+                offset += _INOTIFY_EVENT.size
+                name: str = os.fsdecode(buffer[offset:offset + name_length].rstrip(b"\0"))
+                offset += name_length
+                events.append((wd, mask, name))
+
+    def close(self):
+        os.close(self._fd)
@@ -1,6 +1,6 @@
 import re
 
-from typing import List, Callable, Dict, Iterable, Optional, Union, Type
+from typing import Any, List, Callable, Dict, Iterable, Mapping, Optional, Sequence, Tuple, Union, Type
 """
     Gromacs log parsing functionality.
 
@@ -17,9 +17,15 @@ regexOp = Callable[[str], Optional[Dict]]
 # Possible data types for a command line parameter
 valueType = Union[float, str, bool, int]
 
+# Per-row values of the cycle and time accounting table, keyed by row name and then by "wall_time" or "percent".
+cycleTable = Dict[str, Dict[str, float]]
+
 # regex for gromacs log full command line argument.
 _COMMAND_LINE_RE = r"^Command line:(.)*\n(.)+\n"
 
+# GROMACS indents the command line in logs.
+_LOG_COMMAND_LINE_INDENT: str = "  "
+
 
 def _getCommandLine(contents: str) -> Optional[str]:
     """
@@ -95,6 +101,27 @@ def _convert(val: str, val_type: Type) -> valueType:
     raise ParseGmxCommandError("Unexpected type input {} for value".format(val_type, val))
 
 
+def convertParams(params: Mapping[str, Any]) -> Dict[str, valueType]:
+    """
+        Converts parameter values to the types they are given when parsed from a log command line. Flags that are
+        turned off are left out, as they do not appear on the command line.
+
+        Raises ParseGmxCommandError for an unknown key or malformed value.
+    """
+    return {key: _convert(str(val), _typeOfParam(key)) for key, val in params.items() if val is not False}
+
+
+def commandRunData(params: Mapping[str, Any], command: Sequence[str]) -> Dict[str, valueType]:
+    """
+        Returns the values that the command line ops parse from a log, for a run known to be launched with the given
+        parameters and command: the parameters converted by convertParams, and the full command line as it appears in
+        the log.
+
+        Raises ParseGmxCommandError for an unknown key or malformed value.
+    """
+    return dict(convertParams(params), full_command_line=_LOG_COMMAND_LINE_INDENT + " ".join(command))
+
+
 def _commandInputRegexOp(contents: str) -> Optional[Dict]:
     """
         Searches for and parses the explicit command line options used to invoke gromacs. This occurs near
@@ -147,6 +174,122 @@ def _performanceRegexOp(contents: str) -> Optional[Dict]:
     return None
 
 
+def _wallTimeRegexOp(contents: str) -> Optional[Dict]:
+    """
+        Parses the timing summary printed just before the performance line, of the form
+
+                       Core t (s)   Wall t (s)        (%)
+               Time:      203.877       25.485      800.0
+
+        Timings cover the steps after the performance counters were reset.
+    """
+    search = re.search(r"^\s*Time:\s+(\d+\.\d+)\s+(\d+\.\d+)", contents, flags=re.MULTILINE)
+    if search is not None:
+        return {"core_time": float(search.group(1)), "wall_time": float(search.group(2))}
+    return None
+
+
+_CYCLE_TABLE_HEADER: str = "R E A L   C Y C L E   A N D   T I M E   A C C O U N T I N G"
+
+_GPU_TIMINGS_HEADER_RE = re.compile(r"^ GPU timings\s*$", flags=re.MULTILINE)
+
+# A row of an accounting table: a name, any counts, the wall time, a second timing column and the percentage. Counts
+# are absent for some rows, such as "Rest".
+_ACCOUNTING_ROW_RE = re.compile(r"^ (?P<name>\S.*?)\s+(?:\d+\s+)*(?P<wall_time>\d+\.\d+)\s+\d+\.\d+\s+"
+                                r"(?P<percent>\d+\.\d+)\s*$")
+
+_GPU_CPU_RATIO_RE = re.compile(r"^Average per-step force GPU/CPU evaluation time ratio:.*=\s*(\d+\.\d+)",
+                               flags=re.MULTILINE)
+
+
+def _parseAccountingTable(contents: str, start: int,
+                          num_header_separators: int) -> Optional[Tuple[cycleTable, float]]:
+    """
+        Parses the rows of an accounting table starting at index start of contents. Rows follow num_header_separators
+        dashed lines and end at the next one, after which comes the total. Returns the rows and the total wall time,
+        or None if the table is incomplete.
+    """
+    table: cycleTable = {}
+    num_separators: int = 0
+    for line in contents[start:].splitlines():
+        if line.startswith("-----"):
+            num_separators += 1
+            if num_separators > num_header_separators + 1:
+                break
+            continue
+        if num_separators < num_header_separators:
+            continue
+        match = _ACCOUNTING_ROW_RE.match(line)
+        if match is None:
+            continue
+        name: str = match.group("name").rstrip(" *")
+        if num_separators > num_header_separators:
+            if name == "Total" and table:
+                return table, float(match.group("wall_time"))
+            break
+        table[name] = {"wall_time": float(match.group("wall_time")), "percent": float(match.group("percent"))}
+    return None
+
+
+def _cycleAccountingRegexOp(contents: str) -> Optional[Dict]:
+    """
+        Parses the cycle and time accounting table printed at the end of a run, of the form
+
+             R E A L   C Y C L E   A N D   T I M E   A C C O U N T I N G
+            ...
+            -----------------------------------------------------------------------------
+             Neighbor search        1    1         63       4.599         17.903   5.2
+             ...
+             Rest                                           2.352          9.157   2.7
+            -----------------------------------------------------------------------------
+             Total                                         87.919        342.241 100.0
+
+        Returns the wall time and percentage of each row under "cycle_accounting", and the total wall time under
+        "cycle_total_wall_time". Rows of ranks doing only PME are marked with a trailing '*', which is removed.
+        Percentages are taken from the log rather than computed from wall times, as with separate PME ranks the wall
+        times sum to more than the total.
+    """
+    start: int = contents.rfind(_CYCLE_TABLE_HEADER)
+    if start < 0:
+        return None
+    parsed: Optional[Tuple[cycleTable, float]] = _parseAccountingTable(contents, start, 1)
+    if parsed is None:
+        return None
+    return {"cycle_accounting": parsed[0], "cycle_total_wall_time": parsed[1]}
+
+
+def _gpuTimingsRegexOp(contents: str) -> Optional[Dict]:
+    """
+        Parses the GPU timings table, printed after the cycle accounting table when GPU timing is enabled, of the form
+
+             GPU timings
+            -----------------------------------------------------------------------------
+             Computing:                         Count  Wall t (s)      ms/step       %
+            -----------------------------------------------------------------------------
+             Pair list H2D                        501       0.050        0.100     0.4
+             Nonbonded F kernel                 49000      11.366        0.232    82.2
+             ...
+            -----------------------------------------------------------------------------
+             Total                                         13.826        0.277   100.0
+
+            Average per-step force GPU/CPU evaluation time ratio: 0.277 ms/3.024 ms = 0.092
+
+        Returns the wall time and percentage of each row under "gpu_timings", the total GPU wall time under
+        "gpu_total_wall_time", and the GPU/CPU force time ratio under "gpu_cpu_time_ratio" if reported.
+    """
+    headers: List = list(_GPU_TIMINGS_HEADER_RE.finditer(contents))
+    if not headers:
+        return None
+    parsed: Optional[Tuple[cycleTable, float]] = _parseAccountingTable(contents, headers[-1].start(), 2)
+    if parsed is None:
+        return None
+    result: Dict = {"gpu_timings": parsed[0], "gpu_total_wall_time": parsed[1]}
+    ratio = _GPU_CPU_RATIO_RE.search(contents, headers[-1].start())
+    if ratio is not None:
+        result["gpu_cpu_time_ratio"] = float(ratio.group(1))
+    return result
+
+
 class ParsePerformanceError(Exception):
     pass
 
@@ -155,6 +298,16 @@ class ParseGmxCommandError(Exception):
     pass
 
 
+class ParseSectionError(Exception):
+    """
+        Raised when a section that is parsed but not needed to use the run, such as the cycle accounting table, is
+        missing. The values that were parsed are available as result.
+    """
+    def __init__(self, message: str, result: Optional[Dict[str, valueType]] = None):
+        super().__init__(message)
+        self.result: Dict[str, valueType] = result if result is not None else {}
+
+
 def _handleFailure(op: regexOp):
     """
         TODO - configurable error handling
@@ -163,6 +316,11 @@ def _handleFailure(op: regexOp):
         raise ParseGmxCommandError()
     if op == _performanceRegexOp:
         raise ParsePerformanceError("Unable to find performance readout in log")
+    if op == _wallTimeRegexOp:
+        raise ParsePerformanceError("Unable to find timing readout in log")
+    if op == _cycleAccountingRegexOp:
+        raise ParseSectionError("Unable to find cycle accounting table in log")
+    # GPU timings are only reported if enabled when GROMACS is built or run, so their absence is not an error.
 
 
 class LogParser(object):
@@ -183,20 +341,65 @@ class LogParser(object):
         """
         self._operations.append(op)
 
+    def signature(self) -> str:
+        """
+            Returns a string identifying the registered ops, which changes if the set or order of ops changes.
+        """
+        return ",".join("{}.{}".format(op.__module__, op.__qualname__) for op in self._operations)
+
     def parse(self, contents: str) -> Dict[str, valueType]:
         """
             Apply all regex ops registered to the string, return in dict format.
+
+            Raises ParseSectionError, holding the rest of the result, if only an optional section is missing.
         """
         result: Dict[str, valueType] = {}
+        section_error: Optional[ParseSectionError] = None
         for op in self._operations:
             op_match: Optional[Dict] = op(contents)
             if op_match is None:
-                _handleFailure(op)
+                try:
+                    _handleFailure(op)
+                except ParseSectionError as e:
+                    section_error = e
             else:
                 result.update(op_match)
+        if section_error is not None:
+            section_error.result = result
+            raise section_error
         return result
 
 
 def BasicParser() -> LogParser:
     parser: LogParser = LogParser(ops=(_commandInputRegexOp, _performanceRegexOp, _fullCommandRegexOp))
     return parser
+
+
+def DetailedParser() -> LogParser:
+    """
+        Parses everything BasicParser does, and the cycle accounting and GPU timing tables. GPU timings are only
+        parsed when present, a missing cycle accounting table raises ParseSectionError.
+    """
+    parser: LogParser = BasicParser()
+    parser.addOp(_cycleAccountingRegexOp)
+    parser.addOp(_gpuTimingsRegexOp)
+    return parser
+
+
+def MetricsParser(detailed: bool = False) -> LogParser:
+    """
+        Parses only the performance, and if detailed is set the cycle accounting and GPU timing tables, for runs whose
+        parameters are known from a manifest.
+    """
+    parser: LogParser = LogParser(ops=(_performanceRegexOp,))
+    if detailed:
+        parser.addOp(_cycleAccountingRegexOp)
+        parser.addOp(_gpuTimingsRegexOp)
+    return parser
+
+
+def TimingParser() -> LogParser:
+    """
+        Parses the performance and the wall time of the timed steps.
+    """
+    return LogParser(ops=(_performanceRegexOp, _wallTimeRegexOp))
@@ -3,13 +3,26 @@ import argparse
 import logging
 import os
 import sys
-from gromax.analysis import GromaxData, constructGromaxData, reportStatistics
-from gromax.file_io import parseDirectoryStructure, allDirectoryContent, SanitizeDirectoryStructure
-from gromax.combination_generator import createRunOptionsForConfigGroup, GenerateOptions
-from gromax.command_line import checkArgs, parseArgs, parseIDString
-from gromax.hardware_config import HardwareConfig, generateConfigSplitOptions
-from gromax.output import ParamsToString, WriteRunScript
-from typing import Callable, List, Dict
+from gromax.analysis import GromaxData, IncrementalAnalysis, constructGromaxData, groupStats, reportBottlenecks, \
+    reportSmtComparison, reportStatistics
+from gromax.calibration import CalibrationOptions, calibrateGroups, calibrationDirectory
+from gromax.executor import ExecuteOptions, RunResult, executeGroups
+from gromax.file_io import DirectoryWalk, DirectoryWatcher
+from gromax.combination_generator import createRunOptionsForConfigGroup, CpuSetGroup, GenerateOptions, \
+    HardwareConfigBreakdown, launcherCpuSet, ParameterSetGroup
+from gromax.command_line import checkArgs, parseArgs, parseGpuNumaNodes, parseIDString
+from gromax.hardware_config import HardwareConfig, formatCpuList, generateConfigSplitOptions
+from gromax.hardware_detection import detectGpuIds, physicalGpuIndices, readAllowedCpus
+from gromax.log_parser import BasicParser, DetailedParser, LogParser, MetricsParser
+from gromax.manifest import MANIFEST_FILE_NAME, createManifestEntries, manifestEntry, manifestKey, missingLogFiles, \
+    readManifest, writeManifest
+from gromax.output import GenerateCompactScriptChunks, GenerateScriptChunks, WriteRunScript
+from gromax.parse_cache import ParseCache, defaultCacheDirectory, openParseCache
+from gromax.results_table import ResultsTable
+from gromax.topology import DEFAULT_SYSFS_ROOT, Topology, describeMisalignment, readGpuNumaNodes, readTopology
+from gromax.search import AdaptiveSearchOptions, AdaptiveTrialOptions, SuccessiveHalvingOptions, runAdaptiveSearch, \
+    runAdaptiveTrials, runSuccessiveHalving
+from typing import Callable, List, Dict, Optional, Tuple
 """
     Command line entry point.
 """
@@ -21,16 +34,24 @@ def _populateGenerateOptions(args: argparse.Namespace) -> GenerateOptions:
                            generate_exhaustive_options=args.generate_exhaustive_combinations)
 
 
-def _executeGenerateWorkflow(args: argparse.Namespace) -> None:
+def _createRunOptionsWithHardware(args: argparse.Namespace) -> Tuple[List[ParameterSetGroup],
+                                                                     List[HardwareConfigBreakdown],
+                                                                     Dict[int, CpuSetGroup],
+                                                                     Optional[List[bool]]]:
+    """
+        Builds the hardware config from the command line and generates all groups of concurrent run options, along
+        with the hardware slice of each component of each group, and the CPU sets of groups with components launched
+        under taskset, keyed by group index. With an SMT sweep, groups using all hardware threads are followed by
+        groups using one thread per core, and whether each group uses SMT is returned too.
+    """
     logger: logging.Logger = logging.getLogger("gromax")
     logger.info("Generating run options.")
     # Assign hardware config
-    cpu_ids: List[int] = parseIDString(args.cpu_ids)
+    cpu_ids, gpu_ids = _hardwareIds(args)
     logger.info("CPU IDs: {}".format(cpu_ids))
     num_cpus: int = len(cpu_ids)
     if num_cpus % 2 == 1:
         logger.warning("Detected an odd number of CPU IDs ({}), this is atypical.".format(num_cpus))
-    gpu_ids: List[int] = parseIDString(args.gpu_ids)
     logger.info("GPU IDs: {}".format(gpu_ids))
     num_gpus: int = len(gpu_ids)
     modval: int = num_cpus % num_gpus
@@ -41,45 +62,396 @@ def _executeGenerateWorkflow(args: argparse.Namespace) -> None:
     hw_config: HardwareConfig = HardwareConfig(cpu_ids=cpu_ids, gpu_ids=gpu_ids)
 
     generate_options: GenerateOptions = _populateGenerateOptions(args)
-    if args.single_sim_only:
-        config_splits: List[List[HardwareConfig]] = [[hw_config]]
+    topology: Optional[Topology] = _readTopology(args, hw_config)
+    gpu_numa_nodes: Dict[int, int] = _gpuNumaNodes(args, gpu_ids, topology)
+    hw_configs: List[HardwareConfig] = [hw_config]
+    if args.smt_sweep:
+        hw_configs.append(_oneThreadPerCoreConfig(args, hw_config, topology))
+    run_opts: List[ParameterSetGroup] = []
+    hardware: List[HardwareConfigBreakdown] = []
+    group_cpu_sets: Dict[int, CpuSetGroup] = {}
+    smt: List[bool] = []
+    for config_index, config in enumerate(hw_configs):
+        if args.single_sim_only:
+            config_splits: List[List[HardwareConfig]] = [[config]]
+        else:
+            config_splits: List[List[HardwareConfig]] = generateConfigSplitOptions(
+                config, max_sims_per_gpu=generate_options.max_sims_per_gpu, topology=topology,
+                gpu_numa_nodes=gpu_numa_nodes)
+            _logSplitAlignment(topology, config_splits)
+        logger.debug("Generated {} hardware config breakdowns".format(len(config_splits)))
+        for config_split in config_splits:
+            split_opts: List[ParameterSetGroup] = createRunOptionsForConfigGroup(config_split, args.gmx_version,
+                                                                                 generate_options, topology,
+                                                                                 gpu_numa_nodes)
+            cpu_sets: CpuSetGroup = [launcherCpuSet(sub_config, topology) for sub_config in config_split]
+            if any(cpu_set is not None for cpu_set in cpu_sets):
+                group_cpu_sets.update((len(run_opts) + i, cpu_sets) for i in range(len(split_opts)))
+            run_opts.extend(split_opts)
+            hardware.extend([config_split] * len(split_opts))
+            smt.extend([config_index == 0] * len(split_opts))
+    return run_opts, hardware, group_cpu_sets, smt if args.smt_sweep else None
+
+
+def _hardwareIds(args: argparse.Namespace) -> Tuple[List[int], List[int]]:
+    """
+        Returns the requested CPU and GPU IDs, detecting those not given on the command line with --detect. Exits if
+        they cannot be detected. With --detect, warns if requested CPUs are outside the set this process may run on.
+        Otherwise the CPUs are usually those of another node, and are not checked.
+    """
+    logger: logging.Logger = logging.getLogger("gromax")
+    allowed_cpus: Optional[List[int]] = readAllowedCpus() if args.detect else None
+    if args.cpu_ids:
+        cpu_ids: List[int] = parseIDString(args.cpu_ids)
+        outside: List[int] = sorted(set(cpu_ids) - set(allowed_cpus)) if allowed_cpus else []
+        if outside:
+            logger.warning("CPUs {} are not in the set this process may run on ({}), and may be in use by other "
+                           "jobs. Leave out --cpu_ids to run on the allowed CPUs.".format(formatCpuList(outside),
+                                                                                  formatCpuList(allowed_cpus)))
+    else:
+        if not allowed_cpus:
+            logger.error("Could not detect the CPUs this process may run on, use --cpu_ids, exiting.")
+            sys.exit(1)
+        logger.info("Detected CPUs {} from the process affinity".format(formatCpuList(allowed_cpus)))
+        cpu_ids: List[int] = allowed_cpus
+    if args.gpu_ids:
+        gpu_ids: List[int] = parseIDString(args.gpu_ids)
+    else:
+        detected_gpus: Optional[List[int]] = detectGpuIds(os.environ, args.gpu_list_command)
+        if not detected_gpus:
+            logger.error("Could not detect any GPUs from CUDA_VISIBLE_DEVICES, ROCR_VISIBLE_DEVICES or "
+                         "--gpu_list_command, use --gpu_ids, exiting.")
+            sys.exit(1)
+        gpu_ids: List[int] = detected_gpus
+    return cpu_ids, gpu_ids
+
+
+def _oneThreadPerCoreConfig(args: argparse.Namespace, hw_config: HardwareConfig,
+                            topology: Optional[Topology]) -> HardwareConfig:
+    """
+        Returns the config using the lowest requested hardware thread of each physical core of hw_config, for an SMT
+        sweep. Exits if the topology is unknown or there is no SMT. The CPU IDs need not have a constant stride. Where
+        hardware threads of a core are numbered apart, as on most x86 Linux nodes, the config's simulations are bound
+        to its CPU set, and otherwise pinned by mdrun with a stride of the threads per core.
+    """
+    logger: logging.Logger = logging.getLogger("gromax")
+    if topology is None:
+        logger.error("--smt_sweep needs the CPU topology of the requested CPUs, exiting.")
+        sys.exit(1)
+    cpu_ids: List[int] = topology.firstThreads(hw_config.cpu_ids)
+    if len(cpu_ids) == hw_config.num_cpus:
+        logger.error("No two requested CPUs are hardware threads of the same core, there is no SMT to sweep, "
+                     "exiting.")
+        sys.exit(1)
+    modval: int = len(cpu_ids) % hw_config.num_gpus
+    if modval != 0:
+        logger.warning("Number of physical cores({}) is not divisible by the number of GPUs({}), will only use {} "
+                       "cores without SMT.".format(len(cpu_ids), hw_config.num_gpus, len(cpu_ids) - modval))
+        cpu_ids = cpu_ids[:-modval]
+    logger.info("CPU IDs without SMT: {}".format(cpu_ids))
+    return HardwareConfig(cpu_ids=cpu_ids, gpu_ids=hw_config.gpu_ids)
+
+
+def _sysfsRoot(args: argparse.Namespace) -> Optional[str]:
+    """
+        Returns the sysfs tree to read the node's topology from, or None if it is not to be read.
+    """
+    if args.sysfs_root:
+        return args.sysfs_root
+    return DEFAULT_SYSFS_ROOT if args.detect else None
+
+
+def _readTopology(args: argparse.Namespace, hw_config: HardwareConfig) -> Optional[Topology]:
+    """
+        Reads the CPU topology used to rank hardware splits, or returns None if it is unavailable or does not describe
+        all requested CPUs. The topology is only read from --sysfs_root, or from the node gromax runs on with
+        --detect, so that scripts generated for another node do not depend on the node generating them.
+    """
+    logger: logging.Logger = logging.getLogger("gromax")
+    sysfs_root: Optional[str] = _sysfsRoot(args)
+    if not sysfs_root:
+        logger.debug("No --sysfs_root or --detect, hardware splits are not ranked by topology")
+        return None
+    topology: Optional[Topology] = readTopology(sysfs_root)
+    if topology is None:
+        logger.info("No CPU topology found under {}, hardware splits are not ranked by topology".format(
+            sysfs_root))
+        return None
+    if not topology.covers(hw_config.cpu_range):
+        logger.warning("Not all CPU IDs are in the topology under {}, hardware splits are not ranked by "
+                       "topology".format(sysfs_root))
+        return None
+    # Splits depend on the topology, so report which one was used.
+    numa_nodes: Dict[int, List[int]] = topology.domains(hw_config.cpu_range, "numa_node")
+    logger.info("Using the CPU topology under {}: {} cores in {} L3 cache domains, NUMA nodes {}".format(
+        sysfs_root, len(topology.domains(hw_config.cpu_range, "core")),
+        len(topology.domains(hw_config.cpu_range, "l3_cache")),
+        ", ".join("{}: CPUs {}".format(node, formatCpuList(cpus)) for node, cpus in numa_nodes.items())))
+    return topology
+
+
+def _gpuNumaNodes(args: argparse.Namespace, gpu_ids: List[int], topology: Optional[Topology]) -> Dict[int, int]:
+    """
+        Returns the NUMA node of the requested GPUs, from the command line or sysfs. GPU locality needs the NUMA node
+        of the CPUs too, so nothing is returned without a topology.
+    """
+    logger: logging.Logger = logging.getLogger("gromax")
+    if topology is None:
+        if args.gpu_numa_nodes:
+            logger.warning("Ignoring --gpu_numa_nodes, as the NUMA nodes of the CPUs are unknown")
+        return {}
+    if args.gpu_numa_nodes:
+        gpu_numa_nodes: Dict[int, int] = parseGpuNumaNodes(args.gpu_numa_nodes)
     else:
-        config_splits: List[List[HardwareConfig]] = generateConfigSplitOptions(
-            hw_config, max_sims_per_gpu=generate_options.max_sims_per_gpu)
-    logger.debug("Generated {} hardware config breakdowns".format(len(config_splits)))
-    run_opts: List[List[Dict]] = []
+        gpu_numa_nodes: Dict[int, int] = readGpuNumaNodes(_sysfsRoot(args))
+        # Sysfs numbers all GPUs of the node, while mdrun numbers those made visible to it.
+        physical_gpus: Optional[List[int]] = physicalGpuIndices(os.environ)
+        if physical_gpus is not None:
+            gpu_numa_nodes = {gpu_id: gpu_numa_nodes[physical] for gpu_id, physical in enumerate(physical_gpus)
+                              if physical in gpu_numa_nodes}
+    gpu_numa_nodes = {gpu_id: node for gpu_id, node in gpu_numa_nodes.items() if gpu_id in gpu_ids}
+    if len(set(gpu_numa_nodes.values())) > 1:
+        logger.info("GPU NUMA nodes: {}".format(", ".join("{}:{}".format(gpu_id, node)
+                                                         for gpu_id, node in sorted(gpu_numa_nodes.items()))))
+    else:
+        logger.debug("Requested GPUs are not on distinct NUMA nodes, GPUs are assigned in order")
+    return gpu_numa_nodes
+
+
+def _logSplitAlignment(topology: Optional[Topology], config_splits: List[List[HardwareConfig]]) -> None:
+    if topology is None:
+        return
+    logger: logging.Logger = logging.getLogger("gromax")
     for config_split in config_splits:
-        run_opts.extend(createRunOptionsForConfigGroup(config_split, args.gmx_version, generate_options))
+        misalignment: str = describeMisalignment(topology, [config.cpu_range for config in config_split])
+        if misalignment:
+            logger.debug("Split into {} simulations straddles {} boundaries".format(len(config_split), misalignment))
+
+
+def _executeGenerateWorkflow(args: argparse.Namespace) -> None:
+    run_opts, hardware, group_cpu_sets, smt = _createRunOptionsWithHardware(args)
     # Serialize options.
     out_file: str = args.run_file
     # TODO Make this configurable and robust
     gmx: str = args.gmx_executable + " mdrun"
     tpr: str = args.tpr
     num_trials: int = args.trials_per_group
-    WriteRunScript(out_file, ParamsToString(run_opts, tpr, gmx, num_trials))
+    group_steps: Dict[int, Tuple[int, int]] = {}
+    if args.calibrate:
+        group_steps = _calibrate(args, run_opts, _createExecuteOptions(args, group_cpu_sets))
+    if args.script_format == "compact":
+        WriteRunScript(out_file, GenerateCompactScriptChunks(run_opts, tpr, gmx, num_trials, group_steps=group_steps,
+                                                             group_cpu_sets=group_cpu_sets))
+    else:
+        WriteRunScript(out_file, GenerateScriptChunks(run_opts, tpr, gmx, num_trials, group_steps=group_steps,
+                                                      group_cpu_sets=group_cpu_sets))
+    manifest_file: str = os.path.join(os.path.dirname(os.path.abspath(out_file)), MANIFEST_FILE_NAME)
+    logging.getLogger("gromax").info("Writing run manifest to {}".format(manifest_file))
+    writeManifest(manifest_file, createManifestEntries(run_opts, gmx, tpr, num_trials, hardware=hardware,
+                                                       group_steps=group_steps, smt=smt,
+                                                       group_cpu_sets=group_cpu_sets))
 
 
-def _executeAnalyzeWorkflow(args: argparse.Namespace) -> None:
+def _createExecuteOptions(args: argparse.Namespace, group_cpu_sets: Dict[int, CpuSetGroup]) -> ExecuteOptions:
+    return ExecuteOptions(gmx=args.gmx_executable + " mdrun", tpr=os.path.abspath(args.tpr),
+                          num_trials=args.trials_per_group, timeout=args.timeout, group_cpu_sets=group_cpu_sets)
+
+
+def _calibrate(args: argparse.Namespace, run_opts: List[ParameterSetGroup],
+               options: ExecuteOptions) -> Dict[int, Tuple[int, int]]:
+    """
+        Runs calibration probes in the calibration subdirectory of the working directory, returning per group
+        (nsteps, resetstep).
+    """
+    folder: str = calibrationDirectory(_getWorkingDirectory(args))
+    calibration: CalibrationOptions = CalibrationOptions(target_seconds=args.calibration_target_seconds)
+    return calibrateGroups(dict(enumerate(run_opts)), folder, options, calibration)
+
+
+def _getWorkingDirectory(args: argparse.Namespace) -> str:
     logger: logging.Logger = logging.getLogger("gromax")
     folder: str = args.directory
     if folder is None:
         logger.info("No directory specified using --directory, using current directory.")
         folder = os.getcwd()
     if not os.path.isdir(folder):
-        logger.error("Analysis path {} is not a directory".format(folder))
+        logger.error("Path {} is not a directory".format(folder))
+        sys.exit(1)
+    return folder
+
+
+def _loadManifest(folder: str, args: argparse.Namespace, report_missing: bool = True
+                  ) -> Optional[Dict[manifestKey, manifestEntry]]:
+    """
+        Reads the run manifest given with --manifest, or else the one written by gromax generate in the analysis
+        directory if there is one, and if report_missing is set reports runs in the manifest without a log. Runs
+        started by gromax execute are always analyzed from their logs, as the directory may hold a manifest from an
+        unrelated generate run.
+    """
+    if args.mode != "analyze" or args.no_manifest:
+        return None
+    logger: logging.Logger = logging.getLogger("gromax")
+    manifest_file: Optional[str] = args.manifest
+    if manifest_file is None:
+        manifest_file = os.path.join(folder, MANIFEST_FILE_NAME)
+        if not os.path.isfile(manifest_file):
+            return None
+    try:
+        manifest: Dict[manifestKey, manifestEntry] = readManifest(manifest_file)
+    except (IOError, ValueError) as e:
+        logger.error("Could not read run manifest: {}".format(e))
         sys.exit(1)
+    logger.info("Using run parameters from manifest {}".format(manifest_file))
+    missing: List[str] = missingLogFiles(manifest, folder) if report_missing else []
+    if missing:
+        logger.warning("{} of {} runs in the manifest have no log, e.g. {}".format(
+            len(missing), sum(len(entry["log_files"]) for entry in manifest.values()), ", ".join(missing[:5])))
+        logger.debug("Runs without a log: {}".format(", ".join(missing)))
+    return manifest
+
+
+def _createParser(args: argparse.Namespace, manifest: Optional[Dict[manifestKey, manifestEntry]]) -> LogParser:
+    if manifest is not None:
+        return MetricsParser(detailed=args.bottlenecks)
+    return DetailedParser() if args.bottlenecks else BasicParser()
+
+
+def _analyzeDirectory(folder: str, args: argparse.Namespace) -> Dict[int, groupStats]:
+    logger: logging.Logger = logging.getLogger("gromax")
     logger.info("Analyzing gromax run results in directory {}.".format(folder))
-    directory_content: allDirectoryContent = parseDirectoryStructure(folder)
-    if len(directory_content) == 0:
+    # Logs are parsed as the walk finds them.
+    walk: DirectoryWalk = DirectoryWalk(folder, jobs=args.jobs)
+    if len(walk.group_directories) == 0:
         logger.error("Analysis path {} contains no results in gromax format, exiting.".format(folder))
         sys.exit(1)
-    SanitizeDirectoryStructure(directory_content)
-    result_data: GromaxData = constructGromaxData(directory_content)
-    sys.stdout.write(reportStatistics(result_data.groupStatistics()))
+    manifest: Optional[Dict[manifestKey, manifestEntry]] = _loadManifest(folder, args)
+    parser: LogParser = _createParser(args, manifest)
+    cache: Optional[ParseCache] = None
+    if not args.no_cache:
+        cache = openParseCache(args.cache_dir or defaultCacheDirectory(), parser)
+    try:
+        result_data: GromaxData = constructGromaxData(walk, full_scan=args.full_log_scan, jobs=args.jobs,
+                                                      use_processes=args.jobs_backend == "process", parser=parser,
+                                                      cache=cache, manifest=manifest)
+    finally:
+        if cache is not None:
+            cache.close()
+    _exportTable(result_data.table, args)
+    return result_data.groupStatistics()
+
+
+def _createIncrementalAnalysis(args: argparse.Namespace,
+                               manifest: Optional[Dict[manifestKey, manifestEntry]] = None) -> IncrementalAnalysis:
+    return IncrementalAnalysis(_createParser(args, manifest), full_scan=args.full_log_scan, jobs=args.jobs,
+                               use_processes=args.jobs_backend == "process", manifest=manifest)
 
 
-def _executeExecuteWorkflow(_: argparse.Namespace) -> None:
-    raise NotImplementedError("Direct execution not yet supported.")
+def _exportTable(table: ResultsTable, args: argparse.Namespace) -> None:
+    if args.export_file:
+        logging.getLogger("gromax").info("Exporting {} component runs to {}".format(len(table), args.export_file))
+        table.export(args.export_file)
+
+
+def _writeReport(stats: Dict[int, groupStats], args: argparse.Namespace) -> None:
+    sys.stdout.write(reportStatistics(stats))
+    sys.stdout.write(reportSmtComparison(stats))
+    if args.bottlenecks:
+        sys.stdout.write(reportBottlenecks(stats))
+
+
+def _watchDirectory(folder: str, args: argparse.Namespace) -> None:
+    """
+        Analyzes results as they are written, parsing only new or changed logs, and prints the report whenever the best
+        results change. Runs until interrupted, then exports results if requested.
+    """
+    logger: logging.Logger = logging.getLogger("gromax")
+    manifest: Optional[Dict[manifestKey, manifestEntry]] = _loadManifest(folder, args, report_missing=False)
+    analysis: IncrementalAnalysis = _createIncrementalAnalysis(args, manifest)
+    watcher: DirectoryWatcher = DirectoryWatcher(folder)
+    logger.info("Watching {} for results, press Ctrl-C to stop.".format(folder))
+    last_report: Optional[str] = None
+    try:
+        while True:
+            changed: List[Tuple[Tuple[int, int, int], str]] = watcher.poll(args.watch_interval)
+            if not changed:
+                continue
+            watcher.settle(analysis.update(changed))
+            logger.debug("Parsed {} new or changed logs".format(len(changed)))
+            # The report needs a single simulation result as well as the best overall.
+            if not any(stat["concurrent_sims"] == 1 for stat in analysis.stats.values()):
+                continue
+            report: str = reportStatistics(analysis.stats)
+            if report != last_report:
+                last_report = report
+                _writeReport(analysis.stats, args)
+                sys.stdout.flush()
+    except KeyboardInterrupt:
+        logger.info("Stopped watching {}".format(folder))
+    finally:
+        watcher.close()
+    _exportTable(analysis.data().table, args)
+
+
+def _executeAnalyzeWorkflow(args: argparse.Namespace) -> None:
+    folder: str = _getWorkingDirectory(args)
+    if args.watch:
+        _watchDirectory(folder, args)
+        return
+    _writeReport(_analyzeDirectory(folder, args), args)
+
+
+def _executeExecuteWorkflow(args: argparse.Namespace) -> None:
+    logger: logging.Logger = logging.getLogger("gromax")
+    folder: str = _getWorkingDirectory(args)
+    run_opts, _, group_cpu_sets, smt = _createRunOptionsWithHardware(args)
+    options: ExecuteOptions = _createExecuteOptions(args, group_cpu_sets)
+    if args.calibrate:
+        options.group_steps = _calibrate(args, run_opts, options)
+    # Searches parse the logs of each run as it finishes, the last analysis holding the final results.
+    analyses: List[IncrementalAnalysis] = []
+
+    def newAnalysis() -> IncrementalAnalysis:
+        analyses.append(_createIncrementalAnalysis(args))
+        return analyses[-1]
+
+    if args.successive_halving:
+        halving: SuccessiveHalvingOptions = SuccessiveHalvingOptions(num_rounds=args.halving_rounds,
+                                                                     keep_fraction=args.halving_keep_fraction,
+                                                                     step_factor=args.halving_step_factor)
+        logger.info("Executing {} groups with successive halving in directory {}".format(len(run_opts), folder))
+        stats: Dict[int, groupStats] = runSuccessiveHalving(
+            dict(enumerate(run_opts)), folder, options, halving, new_analysis=newAnalysis)
+    elif args.adaptive_search:
+        search: AdaptiveSearchOptions = AdaptiveSearchOptions(budget=args.search_budget,
+                                                              ei_threshold=args.ei_threshold)
+        logger.info("Searching {} groups adaptively in directory {}".format(len(run_opts), folder))
+        stats: Dict[int, groupStats] = runAdaptiveSearch(dict(enumerate(run_opts)), folder, options, search,
+                                                         new_analysis=newAnalysis)
+    elif args.rel_se_threshold is not None:
+        trial_options: AdaptiveTrialOptions = AdaptiveTrialOptions(rel_se_threshold=args.rel_se_threshold,
+                                                                   min_trials=args.min_trials,
+                                                                   max_trials=args.max_trials)
+        logger.info("Executing {} groups with up to {} trials each in directory {}".format(
+            len(run_opts), trial_options.max_trials, folder))
+        stats: Dict[int, groupStats] = runAdaptiveTrials(dict(enumerate(run_opts)), folder, options, trial_options,
+                                                         new_analysis=newAnalysis)
+    else:
+        logger.info("Executing {} groups with {} trials each in directory {}".format(len(run_opts),
+                                                                                    options.num_trials, folder))
+        results: List[RunResult] = executeGroups(dict(enumerate(run_opts)), folder, options)
+        num_failed: int = len([result for result in results if not result.succeeded])
+        if num_failed:
+            logger.warning("{} of {} runs failed or timed out".format(num_failed, len(results)))
+        stats: Dict[int, groupStats] = _analyzeDirectory(folder, args)
+    if analyses:
+        _exportTable(analyses[-1].data().table, args)
+    if len(stats) == 0:
+        logger.error("No successful benchmark results in {}, exiting.".format(folder))
+        sys.exit(1)
+    if smt is not None:
+        for group_index, stat in stats.items():
+            stat["smt"] = smt[group_index]
+    _writeReport(stats, args)
 
 
 def _selectWorkflow(args: argparse.Namespace) -> Callable[[argparse.Namespace], None]:
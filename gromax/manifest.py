@@ -0,0 +1,115 @@
+import json
+import os
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from gromax.combination_generator import CpuSetGroup, HardwareConfigBreakdown, ParameterSet, ParameterSetGroup
+from gromax.log_parser import ParseGmxCommandError, commandRunData, convertParams
+from gromax.output import ParamsToArgList, componentName, trialDirectory
+"""
+    Run manifests list every simulation of a benchmark campaign with its parameters, hardware and expected log files,
+    so that analysis can take parameters from the manifest rather than from each log's command line.
+"""
+
+MANIFEST_FILE_NAME: str = "gromax_manifest.jsonl"
+
+# A manifest entry, describing one component of a group.
+manifestEntry = Dict[str, Any]
+
+# Identifies a manifest entry by 0-based group and component index.
+manifestKey = Tuple[int, int]
+
+def logFilePath(group: int, trial: int, component: int) -> str:
+    """
+        Returns the path of a component log relative to the run directory, given 0-based indices.
+    """
+    return os.path.join(trialDirectory(group, trial), componentName(group, trial, component) + ".log")
+
+
+def createManifestEntries(groups: Iterable[ParameterSetGroup], gmx: str, tpr: Optional[str], num_trials: int,
+                          nsteps: int = 15000, resetstep: int = 10000,
+                          hardware: Optional[List[HardwareConfigBreakdown]] = None,
+                          group_steps: Optional[Dict[int, Tuple[int, int]]] = None,
+                          smt: Optional[List[bool]] = None,
+                          group_cpu_sets: Optional[Dict[int, CpuSetGroup]] = None) -> Iterator[manifestEntry]:
+    """
+        Yields an entry per component of each group, with the parameters it is run with apart from -deffnm, which
+        differs between trials. If given, hardware holds the hardware slice of each component of each group. Groups in
+        group_steps, keyed by 0-based index, use the given (nsteps, resetstep). For an SMT sweep, smt tags each group
+        with whether it uses all hardware threads. Components of groups in group_cpu_sets that are launched under
+        taskset record their CPU set.
+    """
+    for group_index, group in enumerate(groups):
+        group_nsteps, group_resetstep = (nsteps, resetstep)
+        if group_steps and group_index in group_steps:
+            group_nsteps, group_resetstep = group_steps[group_index]
+        cpu_sets: CpuSetGroup = group_cpu_sets.get(group_index, []) if group_cpu_sets else []
+        for component_index, params in enumerate(group):
+            full_params: ParameterSet = dict(params, nsteps=group_nsteps, resetstep=group_resetstep)
+            if tpr:
+                full_params["s"] = tpr
+            entry: manifestEntry = {
+                "group": group_index + 1,
+                "component": component_index + 1,
+                "gmx": gmx,
+                "params": full_params,
+                "log_files": [logFilePath(group_index, trial, component_index) for trial in range(num_trials)],
+            }
+            if hardware is not None:
+                entry["cpu_ids"] = hardware[group_index][component_index].cpu_ids
+                entry["gpu_ids"] = hardware[group_index][component_index].gpu_ids
+            if smt is not None:
+                entry["smt"] = smt[group_index]
+            if cpu_sets and cpu_sets[component_index] is not None:
+                entry["cpu_set"] = cpu_sets[component_index]
+            yield entry
+
+
+def writeManifest(path: str, entries: Iterable[manifestEntry]):
+    """
+        Writes entries as JSON Lines.
+    """
+    with open(path, "w") as fout:
+        for entry in entries:
+            fout.write(json.dumps(entry) + "\n")
+
+
+def readManifest(path: str) -> Dict[manifestKey, manifestEntry]:
+    """
+        Reads a manifest, keyed by 0-based group and component index.
+
+        Raises IOError if the file cannot be read, and ValueError if it is malformed or has parameters that gromax
+        does not parse from logs.
+    """
+    manifest: Dict[manifestKey, manifestEntry] = {}
+    with open(path) as fin:
+        for line_number, line in enumerate(fin, start=1):
+            if not line.strip():
+                continue
+            try:
+                entry: manifestEntry = json.loads(line)
+                convertParams(entry["params"])
+                manifest[(int(entry["group"]) - 1, int(entry["component"]) - 1)] = entry
+            except (ValueError, KeyError, TypeError, ParseGmxCommandError) as e:
+                raise ValueError("Invalid manifest entry on line {} of {}: {}".format(line_number, path, e))
+    return manifest
+
+
+def manifestRunData(entry: manifestEntry, trial: int) -> Dict[str, Any]:
+    """
+        Returns the parameters and command line of a component run in a given 0-based trial, as they would be parsed
+        from its log, along with the SMT tag of an SMT sweep.
+    """
+    params: ParameterSet = dict(entry["params"],
+                                deffnm=componentName(entry["group"] - 1, trial, entry["component"] - 1))
+    run_data: Dict[str, Any] = commandRunData(params, [entry["gmx"]] + ParamsToArgList(params))
+    if "smt" in entry:
+        run_data["smt"] = bool(entry["smt"])
+    return run_data
+
+
+def missingLogFiles(manifest: Dict[manifestKey, manifestEntry], directory: str) -> List[str]:
+    """
+        Returns the log files listed in the manifest that do not exist in directory, relative to directory.
+    """
+    return [log_file for _, entry in sorted(manifest.items()) for log_file in entry["log_files"]
+            if not os.path.isfile(os.path.join(directory, log_file))]
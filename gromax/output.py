@@ -1,23 +1,37 @@
 import logging
 import os
-from copy import deepcopy
-from gromax.combination_generator import ParameterSet, ParameterSetGroup
-from typing import Any, List
+from gromax.combination_generator import CpuSetGroup, ParameterSet, ParameterSetGroup
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple, Union
 
 # TODO turn group_1, group_2... to group_${group}
 
+# File name prefix of a component run, given the group, trial and component numbers.
+_COMPONENT_NAME: str = "group_{}_trial_{}_component_{}"
 
-def _serializeParams(params: ParameterSet, prepend: str = None) -> str:
+
+def componentName(group: int, trial: int, component: int) -> str:
     """
-        Turn dictionary of parameters into a string. Orders based on internal python sorting of keys. If the gmx
-        parameter is specified, will prepend the contents.
+        Returns the file name prefix of a component run, given 0-based indices.
+    """
+    return _COMPONENT_NAME.format(group + 1, trial + 1, component + 1)
+
+
+def trialDirectory(group: int, trial: int) -> str:
+    """
+        Returns the directory of a trial relative to the run directory, given 0-based indices.
+    """
+    return os.path.join("group_{}".format(group + 1), "trial_{}".format(trial + 1))
+
+
+def ParamsToArgList(params: ParameterSet) -> List[str]:
+    """
+        Turn dictionary of parameters into a list of command line arguments, ordered based on internal python sorting
+        of keys.
 
         Note that this is specifically for gromacs parameters, and will append single dashes to keywords, so
-        {"ntomp": 80} as input will yield a string '-ntomp 80'
+        {"ntomp": 80} as input will yield ['-ntomp', '80']
     """
     kvs: List[str] = []
-    if prepend:
-        kvs.append(prepend)
     for key in sorted(params):
         val: Any = params[key]
         if val is not False:
@@ -26,20 +40,46 @@ def _serializeParams(params: ParameterSet, prepend: str = None) -> str:
         # is not boolean.
         if val is not None and not isinstance(val, bool):
             kvs.append(str(val))
+    return kvs
+
+
+def LauncherArgList(cpu_set: Optional[str]) -> List[str]:
+    """
+        Returns the command that a simulation is launched under, e.g. ['taskset', '-c', '0-3,8-11'] for a simulation
+        bound to a CPU set, or an empty list.
+    """
+    if cpu_set is None:
+        return []
+    return ["taskset", "-c", cpu_set]
+
+
+def _serializeParams(params: ParameterSet, prepend: str = None, cpu_set: Optional[str] = None) -> str:
+    """
+        Turn dictionary of parameters into a string. Orders based on internal python sorting of keys. If the gmx
+        parameter is specified, will prepend the contents, preceded by the launcher of simulations bound to cpu_set.
 
+        Note that this is specifically for gromacs parameters, and will append single dashes to keywords, so
+        {"ntomp": 80} as input will yield a string '-ntomp 80'
+    """
+    kvs: List[str] = LauncherArgList(cpu_set)
+    if prepend:
+        kvs.append(prepend)
+    kvs.extend(ParamsToArgList(params))
     return " ".join(kvs)
 
 
-def _serializeConcurrentGroup(param_group: ParameterSetGroup, prepend: str = None) -> str:
+def _serializeConcurrentGroup(param_group: ParameterSetGroup, prepend: str = None,
+                              cpu_sets: Optional[CpuSetGroup] = None) -> str:
     """
         Turn a concurrent group of parameters into a line separated bash string, with ampersands to send the initial
         processes to background for concurrent execution.
 
-        Optionally will prepend/append contents of prepend/append variables to each line.
+        Optionally will prepend/append contents of prepend/append variables to each line. Simulations with a CPU set
+        in cpu_sets are launched under taskset.
     """
     param_lines: List[str] = []
-    for params in param_group:
-        param_lines.append(_serializeParams(params, prepend))
+    for component, params in enumerate(param_group):
+        param_lines.append(_serializeParams(params, prepend, cpu_sets[component] if cpu_sets else None))
     return " &\n".join(param_lines)
 
 
@@ -64,8 +104,7 @@ def _incrementLines(lines: str, amount: int) -> str:
 def _injectFileNaming(param_group: ParameterSetGroup, group_placeholder: str = "${group}",
                       trial_placeholder: str = "${i}"):
     for component_ID, param in enumerate(param_group):
-        param["deffnm"] = "group_{}_trial_{}_component_{}".format(group_placeholder, trial_placeholder,
-                                                                  1 + component_ID)
+        param["deffnm"] = _COMPONENT_NAME.format(group_placeholder, trial_placeholder, 1 + component_ID)
 
 
 def _injectTpr(param_group: ParameterSetGroup, placeholder: str = "${tpr}"):
@@ -104,33 +143,42 @@ def _wrapInLoop(serialized_group: str, loop_variable: str, tab_increment=2) -> s
 
 
 def _ProcessSingleGroup(param_group: ParameterSetGroup, gmx: str, loop_var: str,
-                        resetstep: str, nsteps: str, tab_increment: int) -> str:
-    param_group_copy: ParameterSetGroup = deepcopy(param_group)
+                        resetstep: str, nsteps: str, tab_increment: int,
+                        cpu_sets: Optional[CpuSetGroup] = None) -> str:
+    # Parameter values are immutable, so copying each parameter set is enough to leave the input untouched.
+    param_group_copy: ParameterSetGroup = [dict(params) for params in param_group]
     _injectTpr(param_group_copy)
     _injectFileNaming(param_group_copy)
     _injectTiming(param_group_copy, nsteps, resetstep)
-    serialized: str = _serializeConcurrentGroup(param_group_copy, prepend=gmx) + "\nwait"
+    serialized: str = _serializeConcurrentGroup(param_group_copy, prepend=gmx, cpu_sets=cpu_sets) + "\nwait"
     serialized_with_dir_handling: str = _addDirectoryHandling(serialized, )
     return _wrapInLoop(serialized_with_dir_handling, loop_var, tab_increment=tab_increment)
 
 
-def _ProcessAllGroups(groups: List[ParameterSetGroup], loop_variable: str, gmx: str,
-                      nsteps: str = "${nsteps}", resetstep: str = "${resetstep}", tab_increment: int = 2) -> str:
+def _GenerateGroupChunks(groups: Iterable[ParameterSetGroup], loop_variable: str, gmx: str,
+                         nsteps: str = "${nsteps}", resetstep: str = "${resetstep}", tab_increment: int = 2,
+                         group_steps: Optional[Dict[int, Tuple[int, int]]] = None,
+                         group_cpu_sets: Optional[Dict[int, CpuSetGroup]] = None) -> Iterator[str]:
     """
-        Creates the body of a bash script to run groups of concurrent gromacs simulations. Each group is wrapped in
-        a loop.
+        Yields the bash script section running each group of concurrent gromacs simulations in turn. Each group is
+        wrapped in a loop. Groups in group_steps, keyed by 0-based index, use the given (nsteps, resetstep) instead of
+        nsteps and resetstep. Simulations of groups in group_cpu_sets are launched under taskset with their CPU set.
     """
-    result: str = ""
     for i, group in enumerate(groups):
         group_num: int = i + 1
-        result += "group={}\n".format(group_num)
-        result += "groupdir=$workdir/group_${group}\n"
-        result += "mkdir $groupdir\n"
-        result += "cd $groupdir\n"
-        result += _ProcessSingleGroup(group, gmx, loop_variable, nsteps=nsteps, resetstep=resetstep,
-                                      tab_increment=tab_increment)
-        result += "\n\n\n"
-    return result
+        group_nsteps, group_resetstep = (nsteps, resetstep)
+        if group_steps and i in group_steps:
+            group_nsteps, group_resetstep = (str(value) for value in group_steps[i])
+        yield "".join((
+            "group={}\n".format(group_num),
+            "groupdir=$workdir/group_${group}\n",
+            "mkdir $groupdir\n",
+            "cd $groupdir\n",
+            _ProcessSingleGroup(group, gmx, loop_variable, nsteps=group_nsteps, resetstep=group_resetstep,
+                                tab_increment=tab_increment,
+                                cpu_sets=group_cpu_sets.get(i) if group_cpu_sets else None),
+            "\n\n\n",
+        ))
 
 
 def _addHeader(gmx: str, tpr: str, nsteps: int, num_trials: int, resetstep: int) -> str:
@@ -138,25 +186,152 @@ def _addHeader(gmx: str, tpr: str, nsteps: int, num_trials: int, resetstep: int)
         gmx, tpr, nsteps, num_trials, resetstep)
 
 
-def ParamsToString(groups: List[ParameterSetGroup], tpr: str, gmx: str, num_trials: int,
-                   loop_var: str = "i", nsteps: int = 15000, resetstep: int = 10000, tab_increment: int = 2) -> str:
-    result: str = _addHeader(gmx, tpr, nsteps, resetstep, num_trials)
-    result += "\n\n" + "#" * 80 + "\n\n"
-    result += _ProcessAllGroups(groups, loop_var, "$gmx", tab_increment=tab_increment)
-    result += "\n\nexit\n"
-    return result
+def _scriptPrologue(tpr: str, gmx: str, num_trials: int, nsteps: int, resetstep: int) -> str:
+    return _addHeader(gmx, tpr, nsteps, resetstep, num_trials) + "\n\n" + "#" * 80 + "\n\n"
+
+
+_SCRIPT_EPILOGUE: str = "\n\nexit\n"
+
+
+def GenerateScriptChunks(groups: Iterable[ParameterSetGroup], tpr: str, gmx: str, num_trials: int,
+                         loop_var: str = "i", nsteps: int = 15000, resetstep: int = 10000, tab_increment: int = 2,
+                         group_steps: Optional[Dict[int, Tuple[int, int]]] = None,
+                         group_cpu_sets: Optional[Dict[int, CpuSetGroup]] = None) -> Iterator[str]:
+    """
+        Yields the run script piece by piece, one chunk per group, so that it can be written without building the
+        whole script in memory.
+    """
+    yield _scriptPrologue(tpr, gmx, num_trials, nsteps, resetstep)
+    yield from _GenerateGroupChunks(groups, loop_var, "$gmx", tab_increment=tab_increment, group_steps=group_steps,
+                                    group_cpu_sets=group_cpu_sets)
+    yield _SCRIPT_EPILOGUE
+
+
+# Arguments common to all simulations are abbreviated to markers in compact scripts, by parameter.
+_COMPACT_MARKERS: Dict[str, str] = {
+    "deffnm": "@deffnm",
+    "nsteps": "@nsteps",
+    "resetstep": "@resetstep",
+    "s": "@tpr",
+}
+
+# Runs the simulations listed in a compact script. Markers are expanded in place, so that command lines match those
+# of the expanded script. mapfile needs bash 4.0 or later, so the last entry is not read with a negative index, which
+# needs bash 4.3.
+_COMPACT_SCRIPT_RUNNER: str = """
+# Optional arguments select the first and last group to run, e.g. to resume a campaign or to split it between nodes.
+num_groups=${simulations[${#simulations[@]}-1]%% *}
+first_group=${1:-1}
+last_group=${2:-$num_groups}
+
+run_group() {
+  local group=$1
+  shift
+  local groupdir=$workdir/group_${group}
+  mkdir $groupdir
+  cd $groupdir
+  for i in $(seq 1 ${ntrials}); do
+    trialdir=${groupdir}/trial_${i}
+    mkdir $trialdir
+    cd $trialdir
+    local component=0 args launcher
+    for args in "$@"; do
+      component=$((component + 1))
+      launcher=""
+      if [ "${args%% *}" == "@taskset" ]; then
+        args=${args#* }
+        launcher="taskset -c ${args%% *}"
+        args=${args#* }
+      fi
+      args=${args//@deffnm/-deffnm group_${group}_trial_${i}_component_${component}}
+      args=${args//@nsteps/-nsteps ${nsteps}}
+      args=${args//@resetstep/-resetstep ${resetstep}}
+      args=${args//@tpr/-s ${tpr}}
+      $launcher $gmx $args &
+    done
+    wait
+    cd ${groupdir}
+  done
+}
+
+components=()
+for index in "${!simulations[@]}"; do
+  entry=${simulations[$index]}
+  group=${entry%% *}
+  components+=("${entry#* }")
+  next_entry=${simulations[$((index + 1))]}
+  if [ "${next_entry%% *}" != "$group" ]; then
+    if [ $group -ge $first_group ] && [ $group -le $last_group ]; then
+      run_group $group "${components[@]}"
+    fi
+    components=()
+  fi
+done
+"""
+
+
+def _compactArgs(params: ParameterSet, steps: Optional[Tuple[int, int]] = None, cpu_set: Optional[str] = None) -> str:
+    """
+        Serializes parameters in the same order as the expanded script, with output naming, the tpr and run lengths
+        given by markers. Run lengths are written out if steps, as (nsteps, resetstep), are given. Simulations bound
+        to a CPU set start with "@taskset <CPU list>".
+    """
+    marked: ParameterSet = dict(params, **_COMPACT_MARKERS)
+    if steps is not None:
+        marked["nsteps"], marked["resetstep"] = steps
+    serialized: str = " ".join(ParamsToArgList(marked))
+    for key, marker in _COMPACT_MARKERS.items():
+        serialized = serialized.replace("-{} {}".format(key, marker), marker)
+    if cpu_set is not None:
+        serialized = "@taskset {} {}".format(cpu_set, serialized)
+    return serialized
+
+
+def _GenerateSimulationTableLines(groups: Iterable[ParameterSetGroup],
+                                  group_steps: Optional[Dict[int, Tuple[int, int]]] = None,
+                                  group_cpu_sets: Optional[Dict[int, CpuSetGroup]] = None) -> Iterator[str]:
+    """
+        Yields the lines of each group's simulations, of the form "<group number> <mdrun arguments>".
+    """
+    for i, group in enumerate(groups):
+        steps: Optional[Tuple[int, int]] = group_steps.get(i) if group_steps else None
+        cpu_sets: CpuSetGroup = group_cpu_sets.get(i, []) if group_cpu_sets else []
+        yield "".join("{} {}\n".format(i + 1, _compactArgs(params, steps, cpu_sets[component] if cpu_sets else None))
+                      for component, params in enumerate(group))
+
+
+def GenerateCompactScriptChunks(groups: Iterable[ParameterSetGroup], tpr: str, gmx: str, num_trials: int,
+                                nsteps: int = 15000, resetstep: int = 10000,
+                                group_steps: Optional[Dict[int, Tuple[int, int]]] = None,
+                                group_cpu_sets: Optional[Dict[int, CpuSetGroup]] = None) -> Iterator[str]:
+    """
+        Yields a run script that lists every simulation in a table, one line each, followed by a single loop that runs
+        them group by group. The script runs the same simulations as GenerateScriptChunks, and takes optional first
+        and last group numbers as arguments to run a subset of groups.
+    """
+    yield _scriptPrologue(tpr, gmx, num_trials, nsteps, resetstep)
+    yield "# One line per simulation: the group number, then the mdrun arguments.\n"
+    yield "mapfile -t simulations <<'END_OF_SIMULATIONS'\n"
+    yield from _GenerateSimulationTableLines(groups, group_steps=group_steps, group_cpu_sets=group_cpu_sets)
+    yield "END_OF_SIMULATIONS\n"
+    yield _COMPACT_SCRIPT_RUNNER
+    yield _SCRIPT_EPILOGUE
 
 
-def WriteRunScript(file: str, content: str):
+def WriteRunScript(file: str, content: Union[str, Iterable[str]]):
     """
-        Writes out the script to execute gromacs.
+        Writes out the script to execute gromacs. Content is either the whole script, or an iterable of chunks such
+        as GenerateScriptChunks, which are written as they are produced.
     """
     logger: logging.Logger = logging.getLogger("gromax")
     path: str = os.path.abspath(file)
+    if isinstance(content, str):
+        content = (content,)
     try:
         with open(path, 'wt') as fout:
             logger.info("Writing run run script to {}".format(path))
-            fout.write(content)
+            for chunk in content:
+                fout.write(chunk)
     except IOError as e:
         logger.error("Unable to open file for writing: {}".format(e))
         raise SystemExit(1)
@@ -0,0 +1,161 @@
+import json
+import logging
+import os
+import sqlite3
+import time
+from typing import Dict, List, Mapping, Optional, Tuple
+
+from gromax.constants import _GROMAX_VERSION
+from gromax.log_parser import LogParser, valueType
+"""
+    On-disk cache of parsed log results, so that re-analyzing a growing run directory only parses new or changed logs.
+
+    The cache is kept in the user's cache directory rather than next to the logs, which are often in a shared or
+    read-only results tree. Entries are keyed by the parser (and gromax version) that produced them, the absolute log
+    path, the file size and the modification time, so that entries of different parsers live side by side.
+"""
+
+_CACHE_FILE_NAME = "parse_cache.sqlite"
+
+# Bump when the stored format changes.
+_CACHE_SCHEMA_VERSION = 2
+
+# Least recently used entries past this count are evicted.
+_DEFAULT_MAX_ENTRIES = 200000
+
+# New entries are committed, and the size limit enforced, after this many insertions and when the cache is closed.
+_COMMIT_INTERVAL = 1000
+
+# Absolute path, size in bytes, modification time in ns.
+fileKey = Tuple[str, int, int]
+
+
+def _parserSignature(parser: LogParser) -> str:
+    return "{}:{}".format(_GROMAX_VERSION, parser.signature())
+
+
+def defaultCacheDirectory(environ: Mapping[str, str] = os.environ) -> str:
+    """
+        Returns the gromax directory in the user's cache directory, $XDG_CACHE_HOME or ~/.cache.
+    """
+    cache_home: str = environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(cache_home, "gromax")
+
+
+class ParseCache(object):
+    """
+        SQLite-backed store of LogParser.parse output per log file.
+
+        Only successful parses are stored. Lookups and insertions are expected from a single thread. If the cache
+        fails after it is opened, e.g. on a full filesystem, it is disabled with a warning and behaves as empty.
+    """
+    def __init__(self, directory: str, parser: LogParser, max_entries: int = _DEFAULT_MAX_ENTRIES,
+                 file_name: str = _CACHE_FILE_NAME):
+        """
+            Opens or creates the cache in the given directory. Raises sqlite3.Error if the cache can't be used.
+        """
+        self._max_entries: int = max_entries
+        self._signature: str = _parserSignature(parser)
+        self._used: List[Tuple[float, str, str]] = []
+        self._num_uncommitted: int = 0
+        self._connection: Optional[sqlite3.Connection] = sqlite3.connect(os.path.join(directory, file_name))
+        try:
+            with self._connection:
+                self._connection.execute("CREATE TABLE IF NOT EXISTS metadata (key TEXT PRIMARY KEY, value TEXT)")
+                stored = self._connection.execute("SELECT value FROM metadata WHERE key = 'schema'").fetchone()
+                if stored is None or stored[0] != str(_CACHE_SCHEMA_VERSION):
+                    self._connection.execute("DROP TABLE IF EXISTS entries")
+                    self._connection.execute("INSERT OR REPLACE INTO metadata VALUES ('schema', ?)",
+                                             (str(_CACHE_SCHEMA_VERSION),))
+                self._connection.execute("CREATE TABLE IF NOT EXISTS entries (signature TEXT, path TEXT, "
+                                         "size INTEGER, mtime_ns INTEGER, last_used REAL, result TEXT, "
+                                         "PRIMARY KEY (signature, path))")
+                self._evict()
+        except sqlite3.Error:
+            self._connection.close()
+            raise
+
+    def fileKey(self, path: str) -> fileKey:
+        """
+            Returns the cache key for a log file. Raises OSError if the file can't be accessed.
+        """
+        stat: os.stat_result = os.stat(path)
+        return os.path.abspath(path), stat.st_size, stat.st_mtime_ns
+
+    def get(self, key: fileKey) -> Optional[Dict[str, valueType]]:
+        """
+            Returns the cached parse result, or None if the file is not cached or has changed since.
+        """
+        if self._connection is None:
+            return None
+        try:
+            row = self._connection.execute("SELECT size, mtime_ns, result FROM entries WHERE signature = ? AND "
+                                           "path = ?", (self._signature, key[0])).fetchone()
+        except sqlite3.Error as e:
+            self._disable(e)
+            return None
+        if row is None or (row[0], row[1]) != key[1:]:
+            return None
+        self._used.append((time.time(), self._signature, key[0]))
+        return json.loads(row[2])
+
+    def put(self, key: fileKey, result: Dict[str, valueType]):
+        if self._connection is None:
+            return
+        try:
+            self._connection.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?)",
+                                     (self._signature, key[0], key[1], key[2], time.time(), json.dumps(result)))
+            self._num_uncommitted += 1
+            if self._num_uncommitted >= _COMMIT_INTERVAL:
+                with self._connection:
+                    self._evict()
+        except sqlite3.Error as e:
+            self._disable(e)
+
+    def _evict(self):
+        """
+            Records lookups and evicts the least recently used entries past the size limit, in the open transaction.
+        """
+        self._connection.executemany("UPDATE entries SET last_used = ? WHERE signature = ? AND path = ?", self._used)
+        self._used = []
+        self._connection.execute("DELETE FROM entries WHERE rowid IN (SELECT rowid FROM entries ORDER BY last_used "
+                                 "DESC LIMIT -1 OFFSET ?)", (self._max_entries,))
+        self._num_uncommitted = 0
+
+    def _disable(self, error: sqlite3.Error):
+        logging.getLogger("gromax").warning("Parse cache failed: {}, parsing logs without it".format(error))
+        try:
+            self._connection.close()
+        except sqlite3.Error:
+            pass
+        self._connection = None
+
+    def close(self):
+        """
+            Commits new entries, evicts the least recently used entries past the size limit, and closes the cache.
+            Failures are logged rather than raised, as the analysis results do not depend on the cache.
+        """
+        if self._connection is None:
+            return
+        try:
+            with self._connection:
+                self._evict()
+            self._connection.close()
+        except sqlite3.Error as e:
+            self._disable(e)
+            return
+        self._connection = None
+
+
+def openParseCache(directory: str, parser: LogParser) -> Optional[ParseCache]:
+    """
+        Opens the parse cache in a directory, creating the directory if needed, or returns None with a warning if that
+        is not possible, e.g. for a read-only directory.
+    """
+    try:
+        os.makedirs(directory, exist_ok=True)
+        return ParseCache(directory, parser)
+    except (OSError, sqlite3.Error) as e:
+        logging.getLogger("gromax").warning("Unable to use parse cache in {}: {}, parsing all logs".format(directory,
+                                                                                                           e))
+        return None
@@ -0,0 +1,182 @@
+import csv
+import json
+import os
+import sys
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+"""
+    Column-oriented storage of parsed results, with one row per component run and one column per parsed parameter or
+    metric, and export to CSV, JSON Lines and Parquet.
+"""
+
+# Identifies a row by group, trial and component index.
+rowKey = Tuple[int, int, int]
+
+# Columns identifying each row, which come first in exports.
+INDEX_COLUMNS: Tuple[str, str, str] = ("group", "trial", "component")
+
+# Export formats by file extension.
+EXPORT_FORMATS: Dict[str, str] = {
+    ".csv": "csv",
+    ".jsonl": "jsonl",
+    ".parquet": "parquet",
+}
+
+# Separates the levels of nested values, such as cycle accounting tables, when flattened into columns.
+_FLATTEN_SEPARATOR: str = ":"
+
+
+def _flatten(prefix: str, value: Any, result: Dict[str, Any]):
+    if isinstance(value, dict):
+        for key, item in value.items():
+            _flatten(prefix + _FLATTEN_SEPARATOR + str(key), item, result)
+    else:
+        result[prefix] = value
+
+
+class ResultsTable(object):
+    """
+        Results of component runs stored column by column. Columns are added as values for new keys are inserted, and
+        rows without a value for a column hold None. Strings are interned, so that values repeated in many rows, such
+        as command lines and parameter values, are stored once.
+    """
+    def __init__(self):
+        self._keys: List[rowKey] = []
+        self._rows: Dict[rowKey, int] = {}
+        self._columns: Dict[str, List[Any]] = {}
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def columnNames(self) -> List[str]:
+        return list(self._columns)
+
+    def _rowIndex(self, key: rowKey) -> int:
+        if key not in self._rows:
+            self._rows[key] = len(self._keys)
+            self._keys.append(key)
+            for column in self._columns.values():
+                column.append(None)
+        return self._rows[key]
+
+    def setValue(self, key: rowKey, column_name: str, value: Any):
+        """
+            Sets a single value, adding the row and column if needed.
+        """
+        row: int = self._rowIndex(key)
+        if column_name not in self._columns:
+            self._columns[column_name] = [None] * len(self._keys)
+        self._columns[column_name][row] = sys.intern(value) if isinstance(value, str) else value
+
+    def insertRows(self, rows: Iterable[Tuple[rowKey, Dict[str, Any]]]):
+        """
+            Inserts or updates many rows, each given by its key and values by column name.
+        """
+        for key, values in rows:
+            for column_name, value in values.items():
+                self.setValue(key, column_name, value)
+
+    def removeRows(self, keys: Set[rowKey]):
+        """
+            Removes the given rows, ignoring keys that are not present.
+        """
+        kept: List[int] = [row for row, key in enumerate(self._keys) if key not in keys]
+        if len(kept) == len(self._keys):
+            return
+        self._keys = [self._keys[row] for row in kept]
+        self._rows = {key: row for row, key in enumerate(self._keys)}
+        for column_name, column in self._columns.items():
+            self._columns[column_name] = [column[row] for row in kept]
+
+    def keys(self) -> List[rowKey]:
+        return list(self._keys)
+
+    def column(self, column_name: str) -> List[Any]:
+        """
+            Returns the values of a column in row order.
+
+            Raises KeyError for unknown columns.
+        """
+        return list(self._columns[column_name])
+
+    def row(self, key: rowKey) -> Dict[str, Any]:
+        """
+            Returns the values of a row that are not None, by column name.
+        """
+        row: int = self._rows[key]
+        return {name: column[row] for name, column in self._columns.items() if column[row] is not None}
+
+    def records(self, flatten: bool = False) -> Iterator[Dict[str, Any]]:
+        """
+            Yields each row in key order as a dict, starting with 1-based group, trial and component numbers matching
+            the run directory layout. Values that are None are left out. If flatten is set, nested values are split
+            into one entry per leaf, e.g. "cycle_accounting:Force:percent".
+        """
+        for key in sorted(self._keys):
+            record: Dict[str, Any] = {name: index + 1 for name, index in zip(INDEX_COLUMNS, key)}
+            for name, value in self.row(key).items():
+                if flatten:
+                    _flatten(name, value, record)
+                else:
+                    record[name] = value
+            yield record
+
+    def _flatColumnNames(self, records: List[Dict[str, Any]]) -> List[str]:
+        names: Dict[str, None] = dict.fromkeys(INDEX_COLUMNS)
+        for record in records:
+            names.update(dict.fromkeys(record))
+        return list(names)
+
+    def writeCsv(self, path: str):
+        records: List[Dict[str, Any]] = list(self.records(flatten=True))
+        with open(path, "w", newline="") as fout:
+            writer: csv.DictWriter = csv.DictWriter(fout, fieldnames=self._flatColumnNames(records))
+            writer.writeheader()
+            writer.writerows(records)
+
+    def writeJsonLines(self, path: str):
+        with open(path, "w") as fout:
+            for record in self.records():
+                fout.write(json.dumps(record) + "\n")
+
+    def writeParquet(self, path: str):
+        """
+            Writes a Parquet file with flattened columns.
+
+            Raises ImportError if pyarrow is not installed.
+        """
+        import pyarrow
+        import pyarrow.parquet
+        records: List[Dict[str, Any]] = list(self.records(flatten=True))
+        names: List[str] = self._flatColumnNames(records)
+        table = pyarrow.table({name: [record.get(name) for record in records] for name in names})
+        pyarrow.parquet.write_table(table, path)
+
+    def export(self, path: str, export_format: Optional[str] = None):
+        """
+            Writes all rows to path, in the given format or else the format matching the file extension.
+
+            Raises ValueError for unknown formats, and ImportError if the format needs a package that is not installed.
+        """
+        if export_format is None:
+            export_format = exportFormat(path)
+        if export_format == "csv":
+            self.writeCsv(path)
+        elif export_format == "jsonl":
+            self.writeJsonLines(path)
+        elif export_format == "parquet":
+            self.writeParquet(path)
+        else:
+            raise ValueError("Unknown export format {}".format(export_format))
+
+
+def exportFormat(path: str) -> str:
+    """
+        Returns the export format for a file name.
+
+        Raises ValueError for unsupported extensions.
+    """
+    extension: str = os.path.splitext(path)[1].lower()
+    if extension not in EXPORT_FORMATS:
+        raise ValueError("Unsupported export file extension '{}', use one of {}".format(
+            extension, ", ".join(sorted(EXPORT_FORMATS))))
+    return EXPORT_FORMATS[extension]
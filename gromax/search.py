@@ -0,0 +1,396 @@
+import logging
+import math
+import os
+import random
+from dataclasses import dataclass, replace
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from gromax.analysis import IncrementalAnalysis, groupStats
+from gromax.combination_generator import ParameterSetGroup
+from gromax.executor import ExecuteOptions, RunResult, executeGroups
+"""
+    Search strategies that decide which groups to benchmark, and for how long, based on results so far.
+"""
+
+
+@dataclass
+class SuccessiveHalvingOptions:
+    """
+        Options for successive halving.
+
+        Attributes:
+            num_rounds: Number of rounds, including the final round.
+            keep_fraction: Fraction of groups promoted from one round to the next.
+            step_factor: Factor by which run length grows each round. The final round uses the full execution nsteps
+                         and resetstep, each earlier round is step_factor times shorter than the next.
+    """
+    num_rounds: int = 3
+    keep_fraction: float = 1.0 / 3.0
+    step_factor: int = 3
+
+
+def roundDirectory(directory: str, round_index: int) -> str:
+    """
+        Returns the directory results for a 0-based round are written to.
+    """
+    return os.path.join(directory, "round_{}".format(round_index + 1))
+
+
+def _addResults(analysis: IncrementalAnalysis, results: List[RunResult]) -> Dict[int, groupStats]:
+    """
+        Parses the logs of finished runs into the running analysis, returning the updated group statistics.
+    """
+    analysis.update([((result.group, result.trial, result.component), result.log_file) for result in results])
+    return analysis.stats
+
+
+def _topGroups(stats: Dict[int, groupStats], keep_fraction: float) -> List[int]:
+    num_kept: int = max(1, math.ceil(keep_fraction * len(stats))) if stats else 0
+    return sorted(stats, key=lambda group: stats[group]["performance"], reverse=True)[:num_kept]
+
+
+def selectTopGroups(stats: Dict[int, groupStats], keep_fraction: float) -> List[int]:
+    """
+        Returns the indices of the best performing fraction of groups, rounded up. The best fraction of single
+        simulation groups is always included, so that the best single simulation can still be reported.
+    """
+    single_sim_stats: Dict[int, groupStats] = {group: stat for group, stat in stats.items()
+                                               if stat["concurrent_sims"] == 1}
+    return sorted(set(_topGroups(stats, keep_fraction)) | set(_topGroups(single_sim_stats, keep_fraction)))
+
+
+def roundExecuteOptions(options: ExecuteOptions, halving: SuccessiveHalvingOptions,
+                        round_index: int) -> ExecuteOptions:
+    """
+        Scales the run length and trial count of the full execution options down for an earlier round.
+    """
+    rounds_remaining: int = halving.num_rounds - 1 - round_index
+    scale: int = halving.step_factor ** rounds_remaining
+    return replace(options,
+                   nsteps=max(1, options.nsteps // scale),
+                   resetstep=options.resetstep // scale,
+                   group_steps={group: (max(1, nsteps // scale), resetstep // scale)
+                                for group, (nsteps, resetstep) in options.group_steps.items()},
+                   num_trials=max(1, math.ceil(options.num_trials * (round_index + 1) / halving.num_rounds)))
+
+
+def runSuccessiveHalving(groups: Dict[int, ParameterSetGroup], directory: str, options: ExecuteOptions,
+                         halving: SuccessiveHalvingOptions,
+                         new_analysis: Callable[[], IncrementalAnalysis] = IncrementalAnalysis
+                         ) -> Dict[int, groupStats]:
+    """
+        Runs every group briefly, then repeatedly promotes the best groups to longer runs with more trials. Each round
+        is written to its own round_N subdirectory, with group numbering kept the same across rounds. The logs of each
+        round are parsed into an analysis from new_analysis as the round's runs finish, and rounds are ranked by its
+        statistics.
+
+        Returns the group statistics of the final round.
+    """
+    logger: logging.Logger = logging.getLogger("gromax")
+    candidates: Dict[int, ParameterSetGroup] = dict(groups)
+    final_round: int = halving.num_rounds - 1
+    round_index: int = 0
+    while True:
+        round_options: ExecuteOptions = roundExecuteOptions(options, halving, round_index)
+        round_dir: str = roundDirectory(directory, round_index)
+        logger.info("Successive halving round {} of {}: {} groups, nsteps={}, {} trials".format(
+            round_index + 1, halving.num_rounds, len(candidates), round_options.nsteps, round_options.num_trials))
+        stats: Dict[int, groupStats] = _addResults(new_analysis(),
+                                                   executeGroups(candidates, round_dir, round_options))
+        if round_index == final_round or len(stats) == 0:
+            return stats
+        candidates = {group: groups[group] for group in selectTopGroups(stats, halving.keep_fraction)}
+        # A single remaining group has nothing left to compete with, so only its full length result is needed.
+        round_index = final_round if len(candidates) == 1 else round_index + 1
+
+
+@dataclass
+class AdaptiveSearchOptions:
+    """
+        Options for model-based adaptive search.
+
+        Attributes:
+            budget: Maximum number of groups to benchmark, or None to allow every group.
+            initial_samples: Number of randomly chosen groups benchmarked before the model is used.
+            ei_threshold: Search stops once the largest expected improvement of any remaining group falls below this
+                          fraction of the best performance so far.
+            length_scale: Gaussian process kernel length scale, in units of the normalized feature range.
+            noise: Observation noise variance, relative to the variance of the observed performances.
+            seed: Random seed used to choose initial samples.
+    """
+    budget: Optional[int] = None
+    initial_samples: int = 4
+    ei_threshold: float = 0.001
+    length_scale: float = 0.8
+    noise: float = 1e-3
+    seed: int = 0
+
+
+def encodeGroup(group: ParameterSetGroup) -> List[float]:
+    """
+        Encodes a group of concurrent simulations as a numerical feature vector. All components of a group share the
+        same options apart from CPU and GPU placement, so only the first component is encoded. Counts are encoded on a
+        log scale, as they are generated in powers of two.
+    """
+    params = group[0]
+    return [
+        math.log2(len(group)),
+        math.log2(params.get("ntmpi", 1)),
+        math.log2(params.get("ntomp", params.get("nt", 1))),
+        float(params.get("nb") == "gpu"),
+        float(params.get("pme") == "gpu"),
+        float(params.get("bonded") == "gpu"),
+        float(params.get("update") == "gpu"),
+    ]
+
+
+def _normalizeFeatures(features: Dict[int, List[float]]) -> Dict[int, List[float]]:
+    """
+        Scales each feature to the range [0, 1] across all candidates. Constant features are mapped to 0.
+    """
+    columns: List[Tuple[float, ...]] = list(zip(*features.values()))
+    lows: List[float] = [min(column) for column in columns]
+    spans: List[float] = [max(column) - low or 1.0 for column, low in zip(columns, lows)]
+    return {key: [(value - low) / span for value, low, span in zip(vector, lows, spans)]
+            for key, vector in features.items()}
+
+
+def _rbfKernel(a: Sequence[float], b: Sequence[float], length_scale: float) -> float:
+    squared_distance: float = sum((x - y) ** 2 for x, y in zip(a, b))
+    return math.exp(-0.5 * squared_distance / length_scale ** 2)
+
+
+def _cholesky(matrix: List[List[float]]) -> List[List[float]]:
+    """
+        Returns the lower triangular Cholesky factor of a symmetric positive definite matrix.
+    """
+    size: int = len(matrix)
+    lower: List[List[float]] = [[0.0] * size for _ in range(size)]
+    for i in range(size):
+        for j in range(i + 1):
+            partial: float = sum(lower[i][k] * lower[j][k] for k in range(j))
+            if i == j:
+                lower[i][j] = math.sqrt(max(matrix[i][i] - partial, 1e-12))
+            else:
+                lower[i][j] = (matrix[i][j] - partial) / lower[j][j]
+    return lower
+
+
+def _solveLower(lower: List[List[float]], vector: Sequence[float]) -> List[float]:
+    result: List[float] = []
+    for i, row in enumerate(lower):
+        result.append((vector[i] - sum(row[k] * result[k] for k in range(i))) / row[i])
+    return result
+
+
+def _solveUpperTransposed(lower: List[List[float]], vector: Sequence[float]) -> List[float]:
+    size: int = len(lower)
+    result: List[float] = [0.0] * size
+    for i in reversed(range(size)):
+        result[i] = (vector[i] - sum(lower[k][i] * result[k] for k in range(i + 1, size))) / lower[i][i]
+    return result
+
+
+class GaussianProcess(object):
+    """
+        Gaussian process regression with a squared exponential kernel, fitted to standardized observations.
+    """
+    def __init__(self, points: List[List[float]], values: List[float], length_scale: float, noise: float):
+        self._points: List[List[float]] = points
+        self._length_scale: float = length_scale
+        self._mean: float = sum(values) / len(values)
+        variance: float = sum((value - self._mean) ** 2 for value in values) / len(values)
+        self._scale: float = math.sqrt(variance) or 1.0
+        standardized: List[float] = [(value - self._mean) / self._scale for value in values]
+        covariance: List[List[float]] = [[_rbfKernel(a, b, length_scale) for b in points] for a in points]
+        for i in range(len(points)):
+            covariance[i][i] += noise
+        self._lower: List[List[float]] = _cholesky(covariance)
+        self._alpha: List[float] = _solveUpperTransposed(self._lower, _solveLower(self._lower, standardized))
+
+    def predict(self, point: Sequence[float]) -> Tuple[float, float]:
+        """
+            Returns the posterior mean and standard deviation at a point, in the units of the observations.
+        """
+        cross: List[float] = [_rbfKernel(point, other, self._length_scale) for other in self._points]
+        mean: float = sum(k * a for k, a in zip(cross, self._alpha))
+        projected: List[float] = _solveLower(self._lower, cross)
+        variance: float = max(1.0 - sum(v * v for v in projected), 0.0)
+        return self._mean + self._scale * mean, self._scale * math.sqrt(variance)
+
+
+def expectedImprovement(mean: float, std: float, best: float) -> float:
+    """
+        Expected amount by which a point with the given posterior mean and standard deviation improves on best.
+    """
+    if std <= 0.0:
+        return max(mean - best, 0.0)
+    z: float = (mean - best) / std
+    cdf: float = 0.5 * (1.0 + math.erf(z / math.sqrt(2.0)))
+    pdf: float = math.exp(-0.5 * z * z) / math.sqrt(2.0 * math.pi)
+    return (mean - best) * cdf + std * pdf
+
+
+def _groupFeatures(groups: Dict[int, ParameterSetGroup]) -> Dict[int, List[float]]:
+    return _normalizeFeatures({index: encodeGroup(group) for index, group in groups.items()})
+
+
+def _fitModel(features: Dict[int, List[float]], results: Dict[int, Optional[float]],
+              options: AdaptiveSearchOptions) -> Optional[GaussianProcess]:
+    """
+        Fits a model to the successful results, or returns None if there are none.
+    """
+    observed: Dict[int, float] = {index: value for index, value in results.items() if value is not None}
+    if not observed:
+        return None
+    return GaussianProcess([features[index] for index in observed], list(observed.values()), options.length_scale,
+                           options.noise)
+
+
+def adaptiveSearch(groups: Dict[int, ParameterSetGroup], objective: Callable[[int], Optional[float]],
+                   options: AdaptiveSearchOptions) -> Dict[int, Optional[float]]:
+    """
+        Benchmarks groups one at a time, choosing each next group by the expected improvement predicted by a
+        Gaussian process fitted to the results so far. The objective returns the aggregate performance of a group
+        index, or None if the group produced no result.
+
+        Search stops when the run budget is spent, every group has been benchmarked, or no remaining group is
+        expected to improve on the best result by more than options.ei_threshold of it.
+
+        Returns the objective result for every benchmarked group.
+    """
+    logger: logging.Logger = logging.getLogger("gromax")
+    features: Dict[int, List[float]] = _groupFeatures(groups)
+    budget: int = len(groups) if options.budget is None else min(options.budget, len(groups))
+    remaining: List[int] = sorted(groups)
+    initial: List[int] = random.Random(options.seed).sample(remaining, min(options.initial_samples, budget))
+    results: Dict[int, Optional[float]] = {}
+
+    def evaluate(index: int):
+        remaining.remove(index)
+        results[index] = objective(index)
+        logger.info("Adaptive search: group {} performance {}".format(index + 1, results[index]))
+
+    for index in initial:
+        evaluate(index)
+    while remaining and len(results) < budget:
+        model: Optional[GaussianProcess] = _fitModel(features, results, options)
+        if model is None:
+            evaluate(remaining[0])
+            continue
+        best: float = max(value for value in results.values() if value is not None)
+        improvements: Dict[int, float] = {index: expectedImprovement(*model.predict(features[index]), best)
+                                          for index in remaining}
+        candidate: int = max(remaining, key=lambda index: improvements[index])
+        if improvements[candidate] < options.ei_threshold * best:
+            logger.info("Adaptive search: expected improvement below threshold after {} groups".format(len(results)))
+            break
+        evaluate(candidate)
+    return results
+
+
+def runAdaptiveSearch(groups: Dict[int, ParameterSetGroup], directory: str, options: ExecuteOptions,
+                      search: AdaptiveSearchOptions,
+                      new_analysis: Callable[[], IncrementalAnalysis] = IncrementalAnalysis) -> Dict[int, groupStats]:
+    """
+        Runs an adaptive search, executing each chosen group in directory. If no single simulation group was chosen,
+        the best single simulation group according to the search is also run, so that it can be reported. Only the
+        logs of each newly executed group are parsed, into an analysis from new_analysis.
+
+        Returns the group statistics of every executed group.
+    """
+    analysis: IncrementalAnalysis = new_analysis()
+
+    def objective(index: int) -> Optional[float]:
+        stat: Optional[groupStats] = _addResults(analysis, executeGroups({index: groups[index]}, directory,
+                                                                         options)).get(index)
+        return None if stat is None else stat["performance"]
+
+    results: Dict[int, Optional[float]] = adaptiveSearch(groups, objective, search)
+    single_sims: List[int] = [index for index, group in groups.items() if len(group) == 1]
+    pending: List[int] = [index for index in single_sims if index not in results]
+    if pending and not any(results.get(index) is not None for index in single_sims):
+        features: Dict[int, List[float]] = _groupFeatures(groups)
+        model: Optional[GaussianProcess] = _fitModel(features, results, search)
+        if model is not None:
+            objective(max(pending, key=lambda index: model.predict(features[index])[0]))
+    return analysis.stats
+
+
+@dataclass
+class AdaptiveTrialOptions:
+    """
+        Options for repeating trials until each group's mean performance is known well enough.
+
+        Attributes:
+            rel_se_threshold: A group stops once the standard error of its mean is below this fraction of the mean.
+            min_trials: Number of trials run for every group before any group can stop.
+            max_trials: Maximum number of trials for any group.
+            contention_z: A group stops once its mean plus contention_z standard errors is below the best group's
+                          mean minus contention_z of that group's standard errors.
+    """
+    rel_se_threshold: float = 0.02
+    min_trials: int = 2
+    max_trials: int = 10
+    contention_z: float = 2.0
+
+
+def _converged(stat: groupStats, trial_options: AdaptiveTrialOptions) -> bool:
+    return stat["standard_error"] <= trial_options.rel_se_threshold * stat["performance"]
+
+
+def _outOfContention(stat: groupStats, best: groupStats, trial_options: AdaptiveTrialOptions) -> bool:
+    upper: float = stat["performance"] + trial_options.contention_z * stat["standard_error"]
+    return upper < best["performance"] - trial_options.contention_z * best["standard_error"]
+
+
+def finishedGroups(stats: Dict[int, groupStats], active: List[int],
+                   trial_options: AdaptiveTrialOptions) -> Dict[int, str]:
+    """
+        Returns the active groups that need no further trials, with the reason. Groups without results are finished,
+        as all of their trials so far failed.
+    """
+    best: Optional[groupStats] = max(stats.values(), key=lambda stat: stat["performance"]) if stats else None
+    finished: Dict[int, str] = {}
+    for group in active:
+        stat: Optional[groupStats] = stats.get(group)
+        if stat is None:
+            finished[group] = "no successful trials"
+        elif stat["num_trials"] >= trial_options.max_trials:
+            finished[group] = "reached the maximum number of trials"
+        elif stat["num_trials"] < trial_options.min_trials:
+            continue
+        elif _converged(stat, trial_options):
+            finished[group] = "standard error below threshold"
+        elif _outOfContention(stat, best, trial_options):
+            finished[group] = "out of contention with the best group"
+    return finished
+
+
+def runAdaptiveTrials(groups: Dict[int, ParameterSetGroup], directory: str, options: ExecuteOptions,
+                      trial_options: AdaptiveTrialOptions,
+                      new_analysis: Callable[[], IncrementalAnalysis] = IncrementalAnalysis) -> Dict[int, groupStats]:
+    """
+        Runs trials in passes over all groups still active. After min_trials passes, a group stops once its standard
+        error is below the relative threshold, or it is out of contention with the best group, or it has run
+        max_trials. The logs of each pass are added to an analysis from new_analysis, so earlier passes are not
+        parsed again.
+
+        Returns the group statistics of all groups.
+    """
+    logger: logging.Logger = logging.getLogger("gromax")
+    analysis: IncrementalAnalysis = new_analysis()
+    active: List[int] = sorted(groups)
+    stats: Dict[int, groupStats] = {}
+    for trial in range(trial_options.max_trials):
+        logger.info("Running trial {} of {} active groups".format(trial + 1, len(active)))
+        stats = _addResults(analysis, executeGroups({group: groups[group] for group in active}, directory, options,
+                                                    trials=[trial]))
+        if trial + 1 < trial_options.min_trials:
+            continue
+        for group, reason in finishedGroups(stats, active, trial_options).items():
+            logger.info("Group {} finished after {} trials: {}".format(group + 1, trial + 1, reason))
+            active.remove(group)
+        if not active:
+            break
+    return stats
@@ -1,5 +1,12 @@
+import os
+import tempfile
 import unittest
-from gromax.analysis import standardError, _commonKeyVals, GromaxData
+from unittest import mock
+import gromax.analysis
+from gromax.analysis import standardError, _commonKeyVals, GromaxData, IncrementalAnalysis, parseLogFile, \
+    constructGromaxData, reportBottlenecks, reportSmtComparison
+from gromax.file_io import DirectoryWalk, SanitizeDirectoryStructure, parseDirectoryStructure
+from gromax.log_parser import BasicParser, DetailedParser, MetricsParser, ParsePerformanceError
 
 
 class StandardErrorTests(unittest.TestCase):
@@ -48,5 +55,304 @@ class GmxDataTest(unittest.TestCase):
         self.data.remove(0, 1)
         self.assertDictEqual(self.data.groupStatistics(), {})
 
+    def testInsertRuns(self):
+        self.data.insertRuns([((0, 0, 0), {"performance": 10.0, "full_command_line": "gmx mdrun"}),
+                              ((0, 1, 0), {"performance": 20.0, "full_command_line": "gmx mdrun"})])
+        self.data.remove(0, 1)
+        self.assertEqual(self.data.table.keys(), [(0, 0, 0)])
+        self.assertAlmostEqual(self.data.groupStatistics()[0]["performance"], 10.0)
+
     def testRemoveOnEmptyDoesntCrash(self):
         self.data.remove(0, 0)
+
+    def testGroupStatistics(self):
+        for trial, performances in enumerate(([10.0, 6.0], [12.0, 8.0], [14.0, 10.0])):
+            for component, performance in enumerate(performances):
+                self.data.insertDataPoint(0, trial, component, "performance", performance)
+                self.data.insertDataPoint(0, trial, component, "full_command_line", "gmx mdrun")
+        stats = self.data.groupStatistics()[0]
+        self.assertAlmostEqual(stats["performance"], 20.0)
+        self.assertAlmostEqual(stats["standard_error"], standardError([16.0, 20.0, 24.0]))
+        self.assertEqual(stats["num_trials"], 3)
+        self.assertEqual(stats["concurrent_sims"], 2)
+
+    def testSmtTag(self):
+        self.data.insertRuns([((0, 0, 0), {"performance": 10.0, "full_command_line": "gmx mdrun", "smt": False}),
+                              ((1, 0, 0), {"performance": 10.0, "full_command_line": "gmx mdrun"})])
+        stats = self.data.groupStatistics()
+        self.assertIs(stats[0]["smt"], False)
+        self.assertNotIn("smt", stats[1])
+
+    def testCostBreakdown(self):
+        # The second component runs twice as long, so counts twice as much.
+        for component, (total, force, wait) in enumerate(((10.0, 60.0, 30.0), (20.0, 30.0, 60.0))):
+            self.data.insertDataPoint(0, 0, component, "performance", 10.0)
+            self.data.insertDataPoint(0, 0, component, "full_command_line", "gmx mdrun")
+            self.data.insertDataPoint(0, 0, component, "cycle_total_wall_time", total)
+            self.data.insertDataPoint(0, 0, component, "cycle_accounting", {
+                "Force": {"wall_time": total * force / 100, "percent": force},
+                "Wait GPU NB local": {"wall_time": total * wait / 100, "percent": wait}})
+        stats = self.data.groupStatistics()[0]
+        self.assertAlmostEqual(stats["cost_breakdown"]["Force"], 40.0)
+        self.assertAlmostEqual(stats["cost_breakdown"]["Wait GPU NB local"], 50.0)
+        self.assertEqual(stats["dominant_cost"], "Wait GPU NB local")
+
+    def _insertGpuComponent(self, trial: int, component: int, gputasks: str, run_time: float, gpu_time: float,
+                            wait_percent: float):
+        self.data.insertDataPoint(0, trial, component, "performance", 10.0)
+        self.data.insertDataPoint(0, trial, component, "full_command_line", "gmx mdrun")
+        self.data.insertDataPoint(0, trial, component, "gputasks", gputasks)
+        self.data.insertDataPoint(0, trial, component, "cycle_total_wall_time", run_time)
+        self.data.insertDataPoint(0, trial, component, "cycle_accounting", {
+            "Force": {"wall_time": run_time * (100 - wait_percent) / 100, "percent": 100 - wait_percent},
+            "Wait GPU NB local": {"wall_time": run_time * wait_percent / 100, "percent": wait_percent}})
+        self.data.insertDataPoint(0, trial, component, "gpu_total_wall_time", gpu_time)
+        self.data.insertDataPoint(0, trial, component, "gpu_timings", {
+            "Nonbonded F kernel": {"wall_time": gpu_time, "percent": 100.0}})
+
+    def testGpuFractions(self):
+        # Two simulations share GPU 0, each keeping it busy 30% of the time. A third uses GPU 1 for 80% of the time.
+        self._insertGpuComponent(0, 0, "00", 10.0, 3.0, 10.0)
+        self._insertGpuComponent(0, 1, "0", 20.0, 6.0, 10.0)
+        self._insertGpuComponent(0, 2, "1", 10.0, 8.0, 50.0)
+        stats = self.data.groupStatistics()[0]
+        self.assertAlmostEqual(stats["gpu_idle_fraction"], (0.4 + 0.2) / 2)
+        self.assertAlmostEqual(stats["gpu_wait_fraction"], (1.0 + 2.0 + 5.0) / 40.0)
+
+    def testGpuWaitWithoutGpuTimings(self):
+        for key, value in (("performance", 10.0), ("full_command_line", "gmx mdrun"), ("cycle_total_wall_time", 10.0),
+                           ("cycle_accounting", {"Wait PME GPU gather": {"wall_time": 2.0, "percent": 20.0}})):
+            self.data.insertDataPoint(0, 0, 0, key, value)
+        stats = self.data.groupStatistics()[0]
+        self.assertAlmostEqual(stats["gpu_wait_fraction"], 0.2)
+        self.assertNotIn("gpu_idle_fraction", stats)
+
+    def testNoCostBreakdownWithoutTables(self):
+        self.data.insertDataPoint(0, 0, 0, "performance", 10.0)
+        self.data.insertDataPoint(0, 0, 0, "full_command_line", "gmx mdrun")
+        self.assertNotIn("dominant_cost", self.data.groupStatistics()[0])
+        self.assertNotIn("gpu_wait_fraction", self.data.groupStatistics()[0])
+        self.assertNotIn("gpu_idle_fraction", self.data.groupStatistics()[0])
+
+
+class ReportBottlenecksTest(unittest.TestCase):
+    def testReport(self):
+        stats = {
+            0: {"performance": 10.0},
+            1: {"performance": 20.0, "cost_breakdown": {"Force": 20.0, "PME mesh": 50.0, "Update": 5.0,
+                                                        "Rest": 25.0}},
+        }
+        report = reportBottlenecks(stats, num_costs=2)
+        self.assertIn("  Group 2: 20.00 ns/day, PME mesh 50.0%, Rest 25.0%\n"
+                      "  Group 1: 10.00 ns/day, no cycle accounting available\n", report)
+
+    def testReportGpuFractions(self):
+        stats = {0: {"performance": 10.0, "cost_breakdown": {"Wait GPU NB local": 30.0}, "gpu_wait_fraction": 0.3,
+                     "gpu_idle_fraction": 0.45}}
+        self.assertIn("  Group 1: 10.00 ns/day, Wait GPU NB local 30.0%; CPU waiting for GPU 30.0%, GPU idle 45.0%\n",
+                      reportBottlenecks(stats))
+
+
+class ReportSmtComparisonTest(unittest.TestCase):
+    def testReport(self):
+        stats = {
+            0: {"performance": 100.0, "concurrent_sims": 1, "smt": True},
+            1: {"performance": 110.0, "concurrent_sims": 1, "smt": True},
+            2: {"performance": 200.0, "concurrent_sims": 2, "smt": True},
+            3: {"performance": 100.0, "concurrent_sims": 1, "smt": False},
+            4: {"performance": 250.0, "concurrent_sims": 2, "smt": False},
+            # Only run with SMT, so not compared.
+            5: {"performance": 300.0, "concurrent_sims": 4, "smt": True},
+        }
+        self.assertEqual(reportSmtComparison(stats).split("\n")[3:],
+                         ["  1 concurrent simulation: 110.00 ns/day with SMT, 100.00 ns/day without, +10.0% from SMT",
+                          "  2 concurrent simulations: 200.00 ns/day with SMT, 250.00 ns/day without, -20.0% from SMT",
+                          ""])
+
+    def testNoSweep(self):
+        self.assertEqual(reportSmtComparison({0: {"performance": 100.0, "concurrent_sims": 1}}), "")
+
+
+class ParseLogFileTest(unittest.TestCase):
+    header = "Log start\nCommand line:\n  gmx mdrun -ntomp 4\n\n"
+    footer = "Performance:       33.910        0.708\n"
+
+    def setUp(self):
+        self.file = tempfile.NamedTemporaryFile(mode="w", suffix=".log", delete=False)
+        self.parser = BasicParser()
+
+    def tearDown(self):
+        os.remove(self.file.name)
+
+    def _write(self, contents: str):
+        self.file.write(contents)
+        self.file.close()
+
+    def testHeadAndTail(self):
+        self._write(self.header + "step output\n" * 100000 + self.footer)
+        result = parseLogFile(self.file.name, self.parser)
+        self.assertEqual(result["ntomp"], 4)
+        self.assertEqual(result["performance"], 33.910)
+
+    @mock.patch("gromax.analysis.readLogHeadAndTail")
+    def testFallsBackToFullScan(self, mock_read):
+        self._write(self.header + self.footer)
+        # Simulate the command line falling in the skipped section.
+        mock_read.return_value = (self.footer, False)
+        result = parseLogFile(self.file.name, self.parser)
+        self.assertEqual(result["ntomp"], 4)
+
+    @mock.patch("gromax.analysis.readLogHeadAndTail")
+    def testFullScanSkipsHeadAndTail(self, mock_read):
+        self._write(self.header + self.footer)
+        self.assertEqual(parseLogFile(self.file.name, self.parser, full_scan=True)["ntomp"], 4)
+        mock_read.assert_not_called()
+
+    def testFallsBackToFullScanForSectionOutsideTail(self):
+        table: str = ("     R E A L   C Y C L E   A N D   T I M E   A C C O U N T I N G\n\n"
+                      " Computing:          Num   Num      Call    Wall time         Giga-Cycles\n"
+                      "                     Ranks Threads  Count      (s)         total sum    %\n"
+                      "-----------------------------------------------------------------------------\n"
+                      " PME mesh               1    4       5001       9.392        146.245  60.0\n"
+                      "-----------------------------------------------------------------------------\n"
+                      " Total                                         18.200        566.770 100.0\n"
+                      "-----------------------------------------------------------------------------\n")
+        # The table is followed by more than the tail that is read at first.
+        self._write(self.header + "step output\n" * 10000 + table + "step output\n" * 10000 + self.footer)
+        result = parseLogFile(self.file.name, DetailedParser())
+        self.assertEqual(result["cycle_accounting"]["PME mesh"]["percent"], 60.0)
+        self.assertEqual(result["performance"], 33.910)
+
+    def testReportsMissingSection(self):
+        self._write(self.header + "step output\n" * 10000 + self.footer)
+        with self.assertLogs("gromax", level="WARNING") as logs:
+            result = parseLogFile(self.file.name, DetailedParser())
+        self.assertIn("Unable to find cycle accounting table", logs.output[0])
+        self.assertNotIn("cycle_accounting", result)
+        self.assertEqual(result["performance"], 33.910)
+
+    def testNoFallbackForCompleteRead(self):
+        self._write(self.header)
+        with self.assertRaises(ParsePerformanceError):
+            parseLogFile(self.file.name, self.parser)
+
+
+class ConstructGromaxDataParallelTest(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.structure = {}
+        for group in range(3):
+            self.structure[group] = {}
+            for trial in range(2):
+                self.structure[group][trial] = {}
+                for component in range(2):
+                    path = os.path.join(self.tempdir.name, "g{}t{}c{}.log".format(group, trial, component))
+                    with open(path, "w") as fout:
+                        fout.write("Command line:\n  gmx mdrun -nt {}\n\n".format(component + 1))
+                        # Leave out the performance of one component to discard its trial.
+                        if (group, trial, component) != (1, 1, 0):
+                            fout.write("Performance: {:.3f}\n".format(10.0 * group + trial + component))
+                    self.structure[group][trial][component] = path
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def testMatchesSerial(self):
+        expected = constructGromaxData(self.structure).groupStatistics()
+        self.assertEqual(len(expected), 3)
+        for use_processes in (False, True):
+            with self.subTest(use_processes=use_processes):
+                result = constructGromaxData(self.structure, jobs=3, use_processes=use_processes).groupStatistics()
+                self.assertDictEqual(result, expected)
+
+    def testManifest(self):
+        manifest = {(group, component): {"group": group + 1, "component": component + 1, "gmx": "gmx mdrun",
+                                         "params": {"nt": 4 + component, "s": "my-topol.tpr"}}
+                    for group in range(3) for component in range(2)}
+        # Trials with a component missing from the manifest are discarded.
+        del manifest[(2, 1)]
+        data = constructGromaxData(self.structure, parser=MetricsParser(), manifest=manifest)
+        self.assertEqual(data.table.keys(), [(0, 0, 0), (0, 0, 1), (0, 1, 0), (0, 1, 1), (1, 0, 0), (1, 0, 1)])
+        self.assertEqual(data.table.row((0, 1, 1)), {
+            "nt": 5, "s": "my-topol.tpr", "deffnm": "group_1_trial_2_component_2", "performance": 2.0,
+            "full_command_line": "  gmx mdrun -deffnm group_1_trial_2_component_2 -nt 5 -s my-topol.tpr"})
+
+
+class ConstructGromaxDataFromWalkTest(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        for group in range(4):
+            for trial in range(2):
+                trial_dir = os.path.join(self.tempdir.name, "group_{}".format(group + 1), "trial_{}".format(trial + 1))
+                os.makedirs(trial_dir)
+                # The second trial of the last group is missing a component, and is discarded.
+                num_components = 1 if (group, trial) == (3, 1) else 2
+                for component in range(num_components):
+                    path = os.path.join(trial_dir, "group_{}_trial_{}_component_{}.log".format(
+                        group + 1, trial + 1, component + 1))
+                    with open(path, "w") as fout:
+                        fout.write("Command line:\n  gmx mdrun -nt {}\n\n".format(component + 1))
+                        fout.write("Performance: {:.3f}\n".format(10.0 * group + trial + component))
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def testMatchesDirectoryStructure(self):
+        structure = parseDirectoryStructure(self.tempdir.name)
+        SanitizeDirectoryStructure(structure)
+        expected = constructGromaxData(structure)
+        self.assertEqual(len(expected.table), 14)
+        for jobs in (1, 3):
+            with self.subTest(jobs=jobs):
+                result = constructGromaxData(DirectoryWalk(self.tempdir.name, jobs=jobs), jobs=jobs)
+                self.assertEqual(sorted(result.table.keys()), sorted(expected.table.keys()))
+                self.assertDictEqual(result.groupStatistics(), expected.groupStatistics())
+
+    def testSerialParsingOverlapsWalk(self):
+        walk = DirectoryWalk(self.tempdir.name)
+        walk_complete = []
+        parse = gromax.analysis._parseComponentLog
+
+        def recordingParse(*args):
+            walk_complete.append(bool(walk.content))
+            return parse(*args)
+
+        with mock.patch("gromax.analysis._parseComponentLog", side_effect=recordingParse):
+            result = constructGromaxData(walk)
+        self.assertEqual(len(result.table), 14)
+        self.assertEqual(len(walk_complete), 15)
+        self.assertFalse(any(walk_complete))
+
+
+class IncrementalAnalysisTest(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def _writeLog(self, key, performance=None) -> str:
+        path = os.path.join(self.tempdir.name, "g{}t{}c{}.log".format(*key))
+        with open(path, "w") as fout:
+            fout.write("Command line:\n  gmx mdrun -nt 4\n\n")
+            if performance is not None:
+                fout.write("Performance: {:.3f}\n".format(performance))
+        return path
+
+    def testUpdatesGroupsAsTrialsComplete(self):
+        analysis = IncrementalAnalysis()
+        logs = [((0, 0, 0), self._writeLog((0, 0, 0), 10.0)), ((0, 0, 1), self._writeLog((0, 0, 1)))]
+        self.assertEqual(analysis.update(logs), [logs[0][1]])
+        # The trial is incomplete until every component has a performance.
+        self.assertEqual(analysis.stats, {})
+        self.assertEqual(analysis.update([((0, 0, 1), self._writeLog((0, 0, 1), 20.0))]), [logs[1][1]])
+        self.assertEqual(analysis.stats[0]["performance"], 30.0)
+        # A trial with fewer components than others in its group is not used.
+        analysis.update([((0, 1, 0), self._writeLog((0, 1, 0), 5.0)), ((1, 0, 0), self._writeLog((1, 0, 0), 8.0))])
+        self.assertEqual(analysis.stats[0]["num_trials"], 1)
+        self.assertEqual(analysis.stats[1]["performance"], 8.0)
+        self.assertEqual(sorted(analysis.data().table.keys()), [(0, 0, 0), (0, 0, 1), (1, 0, 0)])
+        # A complete log that is rewritten without a result takes its trial out again.
+        analysis.update([((1, 0, 0), self._writeLog((1, 0, 0)))])
+        self.assertNotIn(1, analysis.stats)
+
@@ -0,0 +1,84 @@
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+import gromax
+from gromax.calibration import CalibrationOptions, calibrateGroups, calibratedSteps, groupBySplit
+from gromax.executor import ExecuteOptions
+from gromax.fake_mdrun import createFakeRun, defaultPerformanceModel, parseMdrunArgs
+
+_PACKAGE_ROOT: str = os.path.dirname(os.path.dirname(os.path.abspath(gromax.__file__)))
+
+
+class GroupBySplitTest(unittest.TestCase):
+    def testGroupsByThreadsAndOffsets(self):
+        groups = {
+            0: [{"nt": 8, "pinoffset": 0, "pme": "cpu"}],
+            1: [{"nt": 4, "pinoffset": 0}, {"nt": 4, "pinoffset": 4}],
+            2: [{"nt": 8, "pinoffset": 0, "pme": "gpu"}],
+            3: [{"nt": 4, "pinoffset": 0, "pme": "gpu"}, {"nt": 4, "pinoffset": 4, "pme": "gpu"}],
+        }
+        self.assertEqual(list(groupBySplit(groups).values()), [[0, 2], [1, 3]])
+
+    def testGroupsByCpuSets(self):
+        groups = {
+            0: [{"nt": 4, "pin": "off", "pme": "cpu"}],
+            1: [{"nt": 4, "pin": "off", "pme": "cpu"}],
+            2: [{"nt": 4, "pin": "off", "pme": "gpu"}],
+        }
+        cpu_sets = {0: ["0-1,8-9"], 1: ["2-3,10-11"], 2: ["0-1,8-9"]}
+        self.assertEqual(list(groupBySplit(groups, cpu_sets).values()), [[0, 2], [1]])
+
+
+class CalibratedStepsTest(unittest.TestCase):
+    def testTargetsWallTime(self):
+        self.assertEqual(calibratedSteps(100.0, CalibrationOptions(target_seconds=60.0)), (7000, 1000))
+
+    def testWarmupFractionForLongRuns(self):
+        self.assertEqual(calibratedSteps(1000.0, CalibrationOptions(target_seconds=60.0)), (66000, 6000))
+
+    def testRoundsUp(self):
+        options = CalibrationOptions(target_seconds=10.0, warmup_fraction=0.25, step_multiple=1000)
+        self.assertEqual(calibratedSteps(150.0, options), (3000, 1000))
+
+    def testMinimumOneMultiple(self):
+        self.assertEqual(calibratedSteps(0.001, CalibrationOptions(min_warmup_steps=0)), (200, 100))
+
+
+class CalibrateGroupsTest(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.options = ExecuteOptions(gmx="{} -m gromax.fake_mdrun mdrun".format(sys.executable), tpr="topol.tpr")
+        self.groups = {
+            0: [{"nt": 8, "pinoffset": 0, "pin": "on", "nb": "gpu"}],
+            1: [{"nt": 8, "pinoffset": 0, "pin": "on", "nb": "gpu", "pme": "gpu"}],
+            2: [{"nt": 4, "pinoffset": 0, "pin": "on", "nb": "gpu", "gputasks": "0"},
+                {"nt": 4, "pinoffset": 4, "pin": "on", "nb": "gpu", "gputasks": "0"}],
+        }
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def testCalibratesEachSplit(self):
+        with mock.patch.dict(os.environ, {"PYTHONPATH": _PACKAGE_ROOT}):
+            result = calibrateGroups(self.groups, self.tempdir.name, self.options,
+                                     CalibrationOptions(target_seconds=10.0))
+        self.assertEqual(sorted(os.listdir(self.tempdir.name)), ["group_1", "group_3"])
+        self.assertEqual(result[0], result[1])
+        # The fake mdrun reports 2 fs steps, so 1 ns/day is 1 / (0.002 * 86400 / 1000) steps/s.
+        performance = defaultPerformanceModel(createFakeRun(parseMdrunArgs(["-nt", "8", "-pin", "on", "-nb", "gpu"])),
+                                              [])
+        expected = calibratedSteps(performance * 1000.0 / (0.002 * 86400.0), CalibrationOptions(target_seconds=10.0))
+        self.assertEqual(result[0], expected)
+        self.assertIn(2, result)
+
+    def testFailedProbeLeavesDefaults(self):
+        with mock.patch.dict(os.environ, {"PYTHONPATH": _PACKAGE_ROOT, "GROMAX_FAKE_MDRUN_EXIT_CODE": "1"}):
+            result = calibrateGroups(self.groups, self.tempdir.name, self.options, CalibrationOptions())
+        self.assertEqual(result, {})
+
+
+if __name__ == "__main__":
+    unittest.main()
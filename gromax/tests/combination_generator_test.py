@@ -2,6 +2,7 @@ import unittest
 
 import gromax.combination_generator as cg
 from gromax.hardware_config import HardwareConfig
+from gromax.topology import CpuTopology, Topology
 
 
 class GenNtmpiOptionsTest(unittest.TestCase):
@@ -44,56 +45,47 @@ class DetermineGpuTasksTest(unittest.TestCase):
     def testMultiRankMultiGpu(self):
         self.assertEqual(cg.determineGpuTasks(6, [0, 4]), "000444")
 
-
-class ApplyOptionToAllTest(unittest.TestCase):
-
-    def testEmpty(self):
-        self.assertEqual(cg.applyOptionToAll([], "key", ["value"]), [])
-
-    def testCorrectCombinationsGenerated(self):
-        options = [{"o1": "v1"}, {"o2": "v2"}]
-        result = cg.applyOptionToAll(options, "new_key", ["val1", "val2"])
-        self.assertEqual(result, [
-            {"o1": "v1", "new_key": "val1"},
-            {"o1": "v1", "new_key": "val2"},
-            {"o2": "v2", "new_key": "val1"},
-            {"o2": "v2", "new_key": "val2"},
+    def testNumaLocality(self):
+        # GPU 0 is on node 1, and GPU 4 on node 0.
+        self.assertEqual(cg.determineGpuTasks(4, [0, 4], True, [0, 0, 1, 1], {0: 1, 4: 0}), "4400")
+        # Ranks with unknown nodes, or GPUs without nodes, take the remaining GPUs in order.
+        self.assertEqual(cg.determineGpuTasks(2, [0, 4], True, [None, 0], {4: 0}), "04")
+        self.assertEqual(cg.determineGpuTasks(2, [0, 4], True, [1, 1], {0: 1, 4: 1}), "04")
+        self.assertEqual(cg.determineGpuTasks(4, [0, 4], True, None, {0: 1, 4: 0}), "0044")
+
+
+class ExpandOptionAxesTest(unittest.TestCase):
+    def testNoAxes(self):
+        self.assertEqual(list(cg.expandOptionAxes({"a": 1}, [])), [{"a": 1}])
+
+    def testFirstAxisVariesSlowest(self):
+        axes = [("b", [1, 2, 3]), ("c", ["x", "y"])]
+        self.assertEqual(list(cg.expandOptionAxes({"a": 1}, axes)), [
+            {"a": 1, "b": 1, "c": "x"},
+            {"a": 1, "b": 1, "c": "y"},
+            {"a": 1, "b": 2, "c": "x"},
+            {"a": 1, "b": 2, "c": "y"},
+            {"a": 1, "b": 3, "c": "x"},
+            {"a": 1, "b": 3, "c": "y"},
         ])
 
+    def testPruning(self):
+        axes = [("b", [1, 2, 3]), ("c", ["x", "y"])]
 
-def testPredicate(opt) -> bool:
-    return opt["num"] > 3
-
-
-class ApplyOptionIfTests(unittest.TestCase):
-    def testEmpty(self):
-        self.assertEqual(cg.applyOptionIf([], "key", "val", testPredicate), [])
-
-    def testPartiallyModified(self):
-        options = [{"num": 3}, {"num": 4}]
-        result = cg.applyOptionIf(options, "key", "val", testPredicate)
-        self.assertListEqual(result, [
-            {"num": 3},
-            {"num": 4,
-             "key": "val"}
-        ])
-
-
-class PruneOptionIfTests(unittest.TestCase):
-    def testEmpty(self):
-        self.assertEqual(cg.pruneOptionIf([], testPredicate), [])
-
-    def testRemoveWorks(self):
-        options = [{"num": 3}, {"num": 4}]
-        result = cg.pruneOptionIf(options, testPredicate)
-        self.assertListEqual(result, [
-            {"num": 3},
+        def predicate(params) -> bool:
+            return params["b"] > params["a"] and params["c"] == "x"
+        result = list(cg.expandOptionAxes({"a": 1}, axes, [predicate]))
+        self.assertEqual(result, [
+            {"a": 1, "b": 1, "c": "x"},
+            {"a": 1, "b": 1, "c": "y"},
+            {"a": 1, "b": 2, "c": "y"},
+            {"a": 1, "b": 3, "c": "y"},
         ])
 
-    def testNoMatches(self):
-        options = [{"num": 3}, {"num": 2}]
-        result = cg.pruneOptionIf(options, testPredicate)
-        self.assertListEqual(result, options)
+    def testBaseNotModified(self):
+        base = {"a": 1}
+        list(cg.expandOptionAxes(base, [("b", [1, 2])]))
+        self.assertDictEqual(base, {"a": 1})
 
 
 class AddConfigDependentOptionsTest(unittest.TestCase):
@@ -135,6 +127,16 @@ class AddConfigDependentOptionsTest(unittest.TestCase):
         })
 
 
+    def testCpuSet(self):
+        config = HardwareConfig(cpu_ids=[0, 1, 8, 9], gpu_ids=[0])
+        cg.addConfigDependentOptions(self.options, config)
+        self.assertDictEqual(self.options, {
+            "pin": "off",
+            "nt": 4,
+            "nb": "gpu"
+        })
+
+
 class CreateRunOptionsForSingleConfigTestv2016(unittest.TestCase):
     expected_base = {
         **cg._createBaseOptions(),
@@ -163,7 +165,7 @@ class CreateRunOptionsForSingleConfigTestv2016(unittest.TestCase):
 
     def testSingleGPU(self):
         self.maxDiff = None
-        self.config.gpu_ids = [0]
+        self.config = HardwareConfig(cpu_ids=self.config.cpu_ids, gpu_ids=[0])
         result = cg.createRunOptionsForSingleConfig(self.config, self.version, self._default_options)
         expected = [
             {
@@ -191,7 +193,7 @@ class CreateRunOptionsForSingleConfigTestv2016(unittest.TestCase):
         self.assertCountEqual(result, expected)
 
     def testMultiGPU(self):
-        self.config.gpu_ids = [0, 1]
+        self.config = HardwareConfig(cpu_ids=self.config.cpu_ids, gpu_ids=[0, 1])
         result = cg.createRunOptionsForSingleConfig(self.config, self.version, self._default_options)
         expected = [
             {
@@ -212,6 +214,14 @@ class CreateRunOptionsForSingleConfigTestv2016(unittest.TestCase):
         self.assertCountEqual(result, expected)
 
 
+    def testMinimalSubset(self):
+        # There are no PME, bonded or update options in 2016, so nothing is pruned.
+        self.config = HardwareConfig(cpu_ids=self.config.cpu_ids, gpu_ids=[0])
+        options = cg.GenerateOptions(generate_exhaustive_options=False, max_sims_per_gpu=2)
+        self.assertCountEqual(cg.createRunOptionsForSingleConfig(self.config, self.version, options),
+                              cg.createRunOptionsForSingleConfig(self.config, self.version, self._default_options))
+
+
 class CreateRunOptionsForSingleConfigTestv2018(unittest.TestCase):
     expected_base = {
         **cg._createBaseOptions(),
@@ -240,7 +250,7 @@ class CreateRunOptionsForSingleConfigTestv2018(unittest.TestCase):
 
     def testSingleGPU(self):
         self.maxDiff = None
-        self.config.gpu_ids = [0]
+        self.config = HardwareConfig(cpu_ids=self.config.cpu_ids, gpu_ids=[0])
         result = cg.createRunOptionsForSingleConfig(self.config, self.version, self._default_options)
         expected = [
             {
@@ -299,7 +309,7 @@ class CreateRunOptionsForSingleConfigTestv2018(unittest.TestCase):
         self.assertCountEqual(result, expected)
 
     def testMultiGPU(self):
-        self.config.gpu_ids = [0, 1]
+        self.config = HardwareConfig(cpu_ids=self.config.cpu_ids, gpu_ids=[0, 1])
         result = cg.createRunOptionsForSingleConfig(self.config, self.version, self._default_options)
         expected = [
             {
@@ -370,7 +380,7 @@ class CreateRunOptionsForSingleConfigTestv2019(unittest.TestCase):
 
     def testSingleGPU(self):
         self.maxDiff = None
-        self.config.gpu_ids = [0]
+        self.config = HardwareConfig(cpu_ids=self.config.cpu_ids, gpu_ids=[0])
         result = cg.createRunOptionsForSingleConfig(self.config, self.version, self._default_options)
         expected = [
             # bonded = cpu cases
@@ -496,7 +506,7 @@ class CreateRunOptionsForSingleConfigTestv2019(unittest.TestCase):
         self.assertCountEqual(result, expected)
 
     def testMultiGPU(self):
-        self.config.gpu_ids = [0, 1]
+        self.config = HardwareConfig(cpu_ids=self.config.cpu_ids, gpu_ids=[0, 1])
         result = cg.createRunOptionsForSingleConfig(self.config, self.version, self._default_options)
         expected = [
             # bonded = cpu
@@ -615,7 +625,7 @@ class CreateRunOptionsForSingleConfigTestv2020(unittest.TestCase):
 
     def testSingleGPU(self):
         self.maxDiff = None
-        self.config.gpu_ids = [0]
+        self.config = HardwareConfig(cpu_ids=self.config.cpu_ids, gpu_ids=[0])
         result = cg.createRunOptionsForSingleConfig(self.config, self.version, self._default_options)
         expected = [
             # bonded = cpu cases
@@ -844,7 +854,7 @@ class CreateRunOptionsForSingleConfigTestv2020(unittest.TestCase):
         self.assertCountEqual(result, expected)
 
     def testMultiGPU(self):
-        self.config.gpu_ids = [0, 1]
+        self.config = HardwareConfig(cpu_ids=self.config.cpu_ids, gpu_ids=[0, 1])
         result = cg.createRunOptionsForSingleConfig(self.config, self.version, self._default_options)
         expected = [
             # bonded = cpu
@@ -988,7 +998,7 @@ class CreateRunOptionsForSingleConfigTestv2020(unittest.TestCase):
 
     def testMinimalSubset(self):
         self.maxDiff = None
-        self.config.gpu_ids = [0]
+        self.config = HardwareConfig(cpu_ids=self.config.cpu_ids, gpu_ids=[0])
         options = cg.GenerateOptions(max_sims_per_gpu=2, generate_exhaustive_options=False)
         result = cg.createRunOptionsForSingleConfig(self.config, self.version, options)
         expected = [
@@ -1163,3 +1173,87 @@ class CreateRunOptionsForConfigGroupTest(unittest.TestCase):
             ]
         ]
         self.assertCountEqual(result, expected)
+
+
+class CreateRunOptionsFromShapeTest(unittest.TestCase):
+    def setUp(self):
+        self.options = cg.GenerateOptions(generate_exhaustive_options=True, max_sims_per_gpu=4)
+        cg._createShapeOptions.cache_clear()
+
+    def testMatchesUnmemoizedGeneration(self):
+        configs = [HardwareConfig(cpu_ids=[4, 6, 8, 10], gpu_ids=[2, 3]), HardwareConfig(cpu_ids=[7], gpu_ids=[5]),
+                   HardwareConfig(cpu_ids=[0, 1, 2, 3])]
+        for version in ("2016", "2018", "2019", "2020", "2021"):
+            for config in configs:
+                with self.subTest(version=version, config=config):
+                    self.assertEqual(cg._createRunOptionsFromShape(config, version, self.options),
+                                     cg.createRunOptionsForSingleConfig(config, version, self.options))
+
+    def testSplitComponentsShareGeneration(self):
+        configs = [HardwareConfig(cpu_ids=[2 * i, 2 * i + 1], gpu_ids=[i // 2]) for i in range(4)]
+        result = cg.createRunOptionsForConfigGroup(configs, "2020", self.options)
+        self.assertEqual(cg._createShapeOptions.cache_info().misses, 1)
+        self.assertEqual([component["pinoffset"] for component in result[0]], [0, 2, 4, 6])
+        self.assertEqual([component["gputasks"][0] for component in result[0]], ["0", "0", "1", "1"])
+
+    def testCpuSetMatchesUnmemoizedGeneration(self):
+        config = HardwareConfig(cpu_ids=[0, 1, 8, 9], gpu_ids=[0, 1])
+        result = cg._createRunOptionsFromShape(config, "2020", self.options)
+        self.assertEqual(result, cg.createRunOptionsForSingleConfig(config, "2020", self.options))
+        for opt in result:
+            self.assertEqual(opt["pin"], "off")
+            self.assertNotIn("pinoffset", opt)
+            self.assertNotIn("pinstride", opt)
+        self.assertEqual(cg.launcherCpuSet(config), "0-1,8-9")
+
+    def testTemplateNotModified(self):
+        config = HardwareConfig(cpu_ids=[4, 5], gpu_ids=[1])
+        cg._createRunOptionsFromShape(config, "2020", self.options)[0]["pinoffset"] = 100
+        self.assertEqual(cg._createRunOptionsFromShape(config, "2020", self.options)[0]["pinoffset"], 4)
+
+
+class CreateRunOptionsWithGpuLocalityTest(unittest.TestCase):
+    def setUp(self):
+        # CPUs 0-3 are on NUMA node 0 and CPUs 4-7 on node 1, while GPU 0 is on node 1 and GPU 1 on node 0.
+        self.topology = Topology({cpu: CpuTopology(package=cpu // 4, numa_node=cpu // 4, l3_cache=cpu - cpu % 4,
+                                                   core=cpu) for cpu in range(8)})
+        self.gpu_numa_nodes = {0: 1, 1: 0}
+        self.options = cg.GenerateOptions(generate_exhaustive_options=False, max_sims_per_gpu=2)
+
+    def testRanksUseLocalGpus(self):
+        configs = [HardwareConfig(cpu_ids=list(range(8)), gpu_ids=[0, 1])]
+        result = cg.createRunOptionsForConfigGroup(configs, "2018", self.options, self.topology, self.gpu_numa_nodes)
+        gputasks = {(group[0]["ntmpi"], group[0]["pme"]): group[0]["gputasks"] for group in result}
+        self.assertEqual(gputasks[(2, "cpu")], "10")
+        self.assertEqual(gputasks[(4, "gpu")], "1100")
+        self.assertEqual(gputasks[(8, "cpu")], "11110000")
+        unranked = cg.createRunOptionsForConfigGroup(configs, "2018", self.options)
+        self.assertEqual(unranked[0][0]["gputasks"], "01")
+
+    def testPinningFollowsMdrunNumbering(self):
+        # One thread per core of 4 cores with 2 threads each, with sibling threads adjacent as mdrun numbers them.
+        adjacent = Topology({cpu: CpuTopology(package=0, numa_node=0, l3_cache=0, core=cpu - cpu % 2)
+                             for cpu in range(8)})
+        configs = [HardwareConfig(cpu_ids=[0, 2, 4, 6], gpu_ids=[0])]
+        result = cg.createRunOptionsForConfigGroup(configs, "2018", self.options, adjacent)
+        self.assertEqual((result[0][0]["pinoffset"], result[0][0]["pinstride"]), (0, 2))
+        self.assertIsNone(cg.launcherCpuSet(configs[0], adjacent))
+        # With Linux numbering, CPUs 4-7 are the siblings of CPUs 0-3, which mdrun numbers 1, 3, 5 and 7.
+        linux = Topology({cpu: CpuTopology(package=0, numa_node=0, l3_cache=0, core=cpu % 4) for cpu in range(8)})
+        configs = [HardwareConfig(cpu_ids=[0, 1, 2, 3], gpu_ids=[0])]
+        self.assertEqual(cg.launcherCpuSet(configs[0], linux), "0-3")
+        for group in cg.createRunOptionsForConfigGroup(configs, "2018", self.options, linux):
+            self.assertEqual(group[0]["pin"], "off")
+            self.assertNotIn("pinoffset", group[0])
+            self.assertNotIn("pinstride", group[0])
+        # Using every CPU, mdrun's numbering does not matter.
+        configs = [HardwareConfig(cpu_ids=list(range(8)), gpu_ids=[0])]
+        result = cg.createRunOptionsForConfigGroup(configs, "2018", self.options, linux)
+        self.assertEqual((result[0][0]["pinoffset"], result[0][0]["pinstride"]), (0, 1))
+        self.assertIsNone(cg.launcherCpuSet(configs[0], linux))
+
+    def testSingleGpuUnchanged(self):
+        configs = [HardwareConfig(cpu_ids=[0, 1, 2, 3], gpu_ids=[0]), HardwareConfig(cpu_ids=[4, 5, 6, 7], gpu_ids=[1])]
+        self.assertEqual(cg.createRunOptionsForConfigGroup(configs, "2018", self.options, self.topology,
+                                                           self.gpu_numa_nodes),
+                         cg.createRunOptionsForConfigGroup(configs, "2018", self.options))
@@ -1,6 +1,7 @@
 import unittest
+from unittest import mock
 
-from gromax.command_line import checkArgs, parseArgs, parseIDString
+from gromax.command_line import checkArgs, parseArgs, parseGpuNumaNodes, parseIDString
 from gromax.constants import _SUPPORTED_GMX_VERSIONS
 
 
@@ -54,6 +55,129 @@ class CommandLineHardwareOptionsTest(unittest.TestCase):
             checkArgs(parseArgs(self.args))
         self.assertGreater(sysexit.exception.code, 0)
 
+    def testDetectReplacesHardwareOptions(self):
+        self.args.append("--detect")
+        checkArgs(parseArgs(self.args))
+        checkArgs(parseArgs(self.args + ["--gpu_ids", "0", "--gpu_list_command", "nvidia-smi -L"]))
+
+    def testGpuListCommandRequiresDetect(self):
+        self.args.extend(["--cpu_ids", "0", "--gpu_ids", "0", "--gpu_list_command", "nvidia-smi -L"])
+        with self.assertRaises(SystemExit) as sysexit:
+            checkArgs(parseArgs(self.args))
+        self.assertGreater(sysexit.exception.code, 0)
+
+    def testCalibrateRequiresTpr(self):
+        self.args.extend(["--cpu_ids", "0", "--gpu_ids", "0", "--calibrate"])
+        with self.assertRaises(SystemExit) as sysexit:
+            checkArgs(parseArgs(self.args))
+        self.assertGreater(sysexit.exception.code, 0)
+
+    def testRejectsNonPositiveCalibrationTarget(self):
+        self.args.extend(["--cpu_ids", "0", "--gpu_ids", "0", "--tpr", "topol.tpr", "--calibrate",
+                          "--calibration_target_seconds", "0"])
+        with self.assertRaises(SystemExit) as sysexit:
+            checkArgs(parseArgs(self.args))
+        self.assertGreater(sysexit.exception.code, 0)
+
+    def testRejectsInvalidGpuNumaNodes(self):
+        self.args.extend(["--cpu_ids", "0", "--gpu_ids", "0", "--gpu_numa_nodes", "0-1"])
+        with self.assertRaises(SystemExit) as sysexit:
+            checkArgs(parseArgs(self.args))
+        self.assertGreater(sysexit.exception.code, 0)
+
+
+class CommandLineExecuteOptionsTest(unittest.TestCase):
+    def setUp(self):
+        self.args = ["execute", "--gmx_version", "2020", "--cpu_ids", "0-3", "--gpu_ids", "0"]
+
+    def testRequiresTpr(self):
+        with self.assertRaises(SystemExit) as sysexit:
+            checkArgs(parseArgs(self.args))
+        self.assertGreater(sysexit.exception.code, 0)
+
+    def testRejectsNonPositiveTimeout(self):
+        self.args.extend(["--tpr", "topol.tpr", "--timeout", "0"])
+        with self.assertRaises(SystemExit) as sysexit:
+            checkArgs(parseArgs(self.args))
+        self.assertGreater(sysexit.exception.code, 0)
+
+    def testValid(self):
+        self.args.extend(["--tpr", "topol.tpr", "--timeout", "600"])
+        checkArgs(parseArgs(self.args))
+
+    def testRejectsInvalidHalvingOptions(self):
+        self.args.extend(["--tpr", "topol.tpr", "--successive_halving"])
+        for invalid in (["--halving_rounds", "0"], ["--halving_keep_fraction", "0"],
+                        ["--halving_keep_fraction", "1.5"], ["--halving_step_factor", "0"]):
+            with self.subTest(invalid=invalid):
+                with self.assertRaises(SystemExit) as sysexit:
+                    checkArgs(parseArgs(self.args + invalid))
+                self.assertGreater(sysexit.exception.code, 0)
+
+    def testRejectsInvalidAdaptiveSearchOptions(self):
+        self.args.extend(["--tpr", "topol.tpr", "--adaptive_search"])
+        for invalid in (["--search_budget", "0"], ["--ei_threshold", "-1"], ["--successive_halving"]):
+            with self.subTest(invalid=invalid):
+                with self.assertRaises(SystemExit) as sysexit:
+                    checkArgs(parseArgs(self.args + invalid))
+                self.assertGreater(sysexit.exception.code, 0)
+
+    def testRejectsInvalidAdaptiveTrialOptions(self):
+        self.args.extend(["--tpr", "topol.tpr", "--rel_se_threshold", "0.02"])
+        for invalid in (["--rel_se_threshold", "0"], ["--min_trials", "1"], ["--min_trials", "5", "--max_trials", "4"],
+                        ["--successive_halving"], ["--adaptive_search"]):
+            with self.subTest(invalid=invalid):
+                with self.assertRaises(SystemExit) as sysexit:
+                    checkArgs(parseArgs(self.args + invalid))
+                self.assertGreater(sysexit.exception.code, 0)
+
+    def testValidAdaptiveTrialOptions(self):
+        self.args.extend(["--tpr", "topol.tpr", "--rel_se_threshold", "0.02", "--min_trials", "3", "--max_trials",
+                          "3"])
+        checkArgs(parseArgs(self.args))
+
+    def testRejectsWatch(self):
+        with self.assertRaises(SystemExit) as sysexit:
+            checkArgs(parseArgs(self.args + ["--tpr", "topol.tpr", "--watch"]))
+        self.assertGreater(sysexit.exception.code, 0)
+
+    def testValidHalvingOptions(self):
+        self.args.extend(["--tpr", "topol.tpr", "--successive_halving", "--halving_rounds", "4",
+                          "--halving_keep_fraction", "0.25", "--halving_step_factor", "2"])
+        checkArgs(parseArgs(self.args))
+
+
+class CommandLineAnalyzeOptionsTest(unittest.TestCase):
+    def setUp(self):
+        self.args = ["analyze"]
+
+    def testValidExportFile(self):
+        for name in ("results.csv", "results.jsonl"):
+            with self.subTest(name=name):
+                checkArgs(parseArgs(self.args + ["--export_file", name]))
+
+    def testRejectsUnknownExportFormat(self):
+        with self.assertRaises(SystemExit) as sysexit:
+            checkArgs(parseArgs(self.args + ["--export_file", "results.xlsx"]))
+        self.assertGreater(sysexit.exception.code, 0)
+
+    def testWatchOptions(self):
+        checkArgs(parseArgs(self.args + ["--watch", "--watch_interval", "0.5"]))
+        with self.assertRaises(SystemExit) as sysexit:
+            checkArgs(parseArgs(self.args + ["--watch", "--watch_interval", "0"]))
+        self.assertGreater(sysexit.exception.code, 0)
+
+    def testRejectsManifestAndNoManifest(self):
+        with self.assertRaises(SystemExit) as sysexit:
+            checkArgs(parseArgs(self.args + ["--manifest", "manifest.jsonl", "--no_manifest"]))
+        self.assertGreater(sysexit.exception.code, 0)
+
+    @mock.patch("importlib.util.find_spec", return_value=None)
+    def testParquetRequiresPyarrow(self, _):
+        with self.assertRaises(SystemExit) as sysexit:
+            checkArgs(parseArgs(self.args + ["--export_file", "results.parquet"]))
+        self.assertGreater(sysexit.exception.code, 0)
+
 
 class IDParsingTests(unittest.TestCase):
     def testValidCommas(self):
@@ -74,6 +198,14 @@ class IDParsingTests(unittest.TestCase):
     def testValidSingleInt(self):
         self.assertEqual(parseIDString("5"), [5])
 
+    def testValidMixedRanges(self):
+        self.assertEqual(parseIDString("0-2,8-9,12"), [0, 1, 2, 8, 9, 12])
+        self.assertEqual(parseIDString("0:2:4,16"), [0, 2, 4, 16])
+
+    def testInvalidMixedRanges(self):
+        with self.assertRaises(ValueError):
+            parseIDString("0-2,8-")
+
     def testInvalidCommas(self):
         with self.assertRaises(ValueError):
             parseIDString("0,,,3")
@@ -89,3 +221,14 @@ class IDParsingTests(unittest.TestCase):
     def testOtherInvalid(self):
         with self.assertRaises(ValueError):
             parseIDString("a")
+
+
+class GpuNumaNodeParsingTests(unittest.TestCase):
+    def testValid(self):
+        self.assertEqual(parseGpuNumaNodes("0:0,1:0,2:1"), {0: 0, 1: 0, 2: 1})
+
+    def testInvalid(self):
+        for mapping in ("0", "0:1:2", "a:0", "0:0,"):
+            with self.subTest(mapping=mapping):
+                with self.assertRaises(ValueError):
+                    parseGpuNumaNodes(mapping)
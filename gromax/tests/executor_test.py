@@ -0,0 +1,141 @@
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+import gromax.testutils as testutils
+from gromax.executor import ExecuteOptions, buildComponentCommand, executeGroups, executeTrial
+
+
+def _fakeGmx() -> str:
+    return "{} {} mdrun".format(sys.executable, testutils.get_relative_path("integration", "testdata", "fake_gmx.py"))
+
+
+class BuildComponentCommandTest(unittest.TestCase):
+    def testInjectsNamingAndTiming(self):
+        options = ExecuteOptions(gmx="/path/to/gmx mdrun", tpr="/path/topol.tpr", nsteps=100, resetstep=50)
+        result = buildComponentCommand({"nt": 4, "noconfout": True}, "group_1_trial_1_component_1", options)
+        self.assertEqual(result, ["/path/to/gmx", "mdrun", "-deffnm", "group_1_trial_1_component_1", "-noconfout",
+                                  "-nsteps", "100", "-nt", "4", "-resetstep", "50", "-s", "/path/topol.tpr"])
+
+    def testNoTpr(self):
+        result = buildComponentCommand({}, "name", ExecuteOptions(nsteps=10, resetstep=5))
+        self.assertEqual(result, ["gmx", "mdrun", "-deffnm", "name", "-nsteps", "10", "-resetstep", "5"])
+
+    def testCpuSet(self):
+        result = buildComponentCommand({"nt": 4, "pin": "off"}, "name", ExecuteOptions(nsteps=10, resetstep=5),
+                                       cpu_set="0-1,8-9")
+        self.assertEqual(result, ["taskset", "-c", "0-1,8-9", "gmx", "mdrun", "-deffnm", "name", "-nsteps", "10",
+                                  "-nt", "4", "-pin", "off", "-resetstep", "5"])
+
+    def testDoesNotModifyParams(self):
+        params = {"nt": 4}
+        buildComponentCommand(params, "name", ExecuteOptions())
+        self.assertDictEqual(params, {"nt": 4})
+
+
+class ExecuteTrialTest(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.options = ExecuteOptions(gmx=_fakeGmx(), tpr="topol.tpr", num_trials=2)
+        self.group = [{"nt": 2, "pinoffset": 0}, {"nt": 2, "pinoffset": 2}]
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def testWritesExpectedLayout(self):
+        results = executeTrial(3, 1, self.group, self.tempdir.name, self.options)
+        self.assertEqual(len(results), 2)
+        for component, result in enumerate(results):
+            self.assertTrue(result.succeeded)
+            expected_log = os.path.join(self.tempdir.name, "group_4", "trial_2",
+                                        "group_4_trial_2_component_{}.log".format(component + 1))
+            self.assertEqual(result.log_file, expected_log)
+            self.assertTrue(os.path.isfile(expected_log))
+
+    def testLaunchesCpuSetsUnderTaskset(self):
+        self.options.group_cpu_sets = {0: ["0-1,4-5", None]}
+        with mock.patch("subprocess.Popen") as popen:
+            popen.return_value.wait.return_value = 0
+            executeTrial(0, 0, self.group, self.tempdir.name, self.options)
+        commands = [call.args[0] for call in popen.call_args_list]
+        self.assertEqual(commands[0][:3], ["taskset", "-c", "0-1,4-5"])
+        self.assertNotIn("taskset", commands[1])
+
+    def testRecordsExitCode(self):
+        with mock.patch.dict(os.environ, {"FAKE_GMX_EXIT_CODE": "3"}):
+            results = executeTrial(0, 0, self.group, self.tempdir.name, self.options)
+        self.assertEqual([result.returncode for result in results], [3, 3])
+        self.assertFalse(any(result.succeeded for result in results))
+
+    def testTimeoutKillsRuns(self):
+        self.options.timeout = 0.2
+        with mock.patch.dict(os.environ, {"FAKE_GMX_SLEEP": "30"}):
+            results = executeTrial(0, 0, self.group, self.tempdir.name, self.options)
+        self.assertTrue(all(result.timed_out for result in results))
+        self.assertFalse(os.path.exists(results[0].log_file))
+
+    def testTimeoutCoversLaunches(self):
+        self.options.timeout = 1.0
+        real_popen = subprocess.Popen
+
+        def slowPopen(*args, **kwargs):
+            time.sleep(0.6)
+            return real_popen(*args, **kwargs)
+
+        # Each component runs within the limit, but launches and runs take longer than it in total.
+        with mock.patch("subprocess.Popen", side_effect=slowPopen), \
+                mock.patch.dict(os.environ, {"FAKE_GMX_SLEEP": "0.6"}):
+            results = executeTrial(0, 0, self.group, self.tempdir.name, self.options)
+        self.assertTrue(all(result.timed_out for result in results))
+
+    def testLaunchFailureKillsStartedComponents(self):
+        real_popen = subprocess.Popen
+        started = []
+
+        def failSecondLaunch(*args, **kwargs):
+            if started:
+                raise FileNotFoundError("gmx")
+            started.append(real_popen(*args, **kwargs))
+            return started[-1]
+
+        with mock.patch("subprocess.Popen", side_effect=failSecondLaunch), \
+                mock.patch.dict(os.environ, {"FAKE_GMX_SLEEP": "30"}):
+            with self.assertRaises(FileNotFoundError):
+                executeTrial(0, 0, self.group, self.tempdir.name, self.options)
+        self.assertIsNotNone(started[0].poll())
+
+
+class ExecuteGroupsTest(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def testRunsAllGroupsAndTrials(self):
+        options = ExecuteOptions(gmx=_fakeGmx(), num_trials=2)
+        groups = {0: [{"nt": 4}], 1: [{"nt": 2}, {"nt": 2}]}
+        results = executeGroups(groups, self.tempdir.name, options)
+        self.assertEqual([(r.group, r.trial, r.component) for r in results],
+                         [(0, 0, 0), (0, 1, 0), (1, 0, 0), (1, 0, 1), (1, 1, 0), (1, 1, 1)])
+        self.assertTrue(all(result.succeeded for result in results))
+
+    def testCustomTrials(self):
+        options = ExecuteOptions(gmx=_fakeGmx(), num_trials=2)
+        results = executeGroups({5: [{"nt": 4}]}, self.tempdir.name, options, trials=[4])
+        self.assertEqual(len(results), 1)
+        self.assertTrue(results[0].log_file.endswith("group_6_trial_5_component_1.log"))
+
+    def testGroupStepOverrides(self):
+        options = ExecuteOptions(gmx=_fakeGmx(), num_trials=1, nsteps=300, resetstep=200, group_steps={1: (50, 20)})
+        results = executeGroups({0: [{"nt": 1}], 1: [{"nt": 1}]}, self.tempdir.name, options)
+        with open(results[0].log_file) as fin:
+            self.assertIn("-nsteps 300", fin.read())
+        with open(results[1].log_file) as fin:
+            contents = fin.read()
+        self.assertIn("-nsteps 50", contents)
+        self.assertIn("-resetstep 20", contents)
@@ -0,0 +1,235 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+from typing import List
+from unittest import mock
+
+import gromax
+from gromax.fake_mdrun import FakeRun, createFakeRun, defaultPerformanceModel, formatLog, loadPerformanceModel, \
+    main, modeledWallTime, parseMdrunArgs, _concurrentPeers, _writeRegistration
+from gromax.log_parser import BasicParser, DetailedParser
+
+# Ensures subprocesses can import gromax, whatever their working directory.
+_PACKAGE_ROOT: str = os.path.dirname(os.path.dirname(os.path.abspath(gromax.__file__)))
+
+
+def constantModel(run: FakeRun, peers: List[FakeRun]) -> float:
+    return 100.0 + len(peers)
+
+
+def _run(args: str) -> FakeRun:
+    return createFakeRun(parseMdrunArgs(args.split()))
+
+
+class ParseMdrunArgsTest(unittest.TestCase):
+    def testValuesAndFlags(self):
+        self.assertEqual(parseMdrunArgs(["-deffnm", "name", "-noconfout", "-nt", "4", "-v"]),
+                         {"deffnm": "name", "noconfout": True, "nt": "4", "v": True})
+
+    def testNegativeValues(self):
+        self.assertEqual(parseMdrunArgs(["-nsteps", "-1", "-pinoffset", "-2", "-noresethway"]),
+                         {"nsteps": "-1", "pinoffset": "-2", "noresethway": True})
+
+    def testRejectsStrayValue(self):
+        with self.assertRaises(ValueError):
+            parseMdrunArgs(["name"])
+
+    def testRejectsMissingValue(self):
+        with self.assertRaises(ValueError):
+            parseMdrunArgs(["-nt", "4", "-deffnm"])
+
+
+class ConcurrentPeersTest(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.run = _run("-nt 2")
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def _register(self, name: str, start: float, end, pid: int = os.getpid()) -> str:
+        path = os.path.join(self.tempdir.name, name + ".json")
+        _writeRegistration(path, self.run, start, end)
+        if pid != os.getpid():
+            with open(path) as fin:
+                registration = json.load(fin)
+            registration["pid"] = pid
+            with open(path, "w") as fout:
+                json.dump(registration, fout)
+        return path
+
+    def testPrunesOldRegistrations(self):
+        own = self._register("own", 100.0, None)
+        self._register("running", 90.0, None)
+        self._register("recent", 80.0, 95.0)
+        self._register("finished_before_start", 10.0, 50.0)
+        self._register("old", 10.0, 20.0)
+        peers = _concurrentPeers(self.tempdir.name, own, 100.0, prune_before=30.0)
+        self.assertEqual(len(peers), 1)
+        # Finished simulations are kept until prune_before, even if they finished before this one started.
+        self.assertEqual(sorted(os.listdir(self.tempdir.name)),
+                         ["finished_before_start.json", "own.json", "recent.json", "running.json"])
+
+    def testPrunesKilledSimulations(self):
+        killed = subprocess.Popen([sys.executable, "-c", ""])
+        killed.wait()
+        own = self._register("own", 100.0, None)
+        self._register("killed", 90.0, None, pid=killed.pid)
+        self.assertEqual(_concurrentPeers(self.tempdir.name, own, 100.0, prune_before=0.0), [])
+        self.assertEqual(os.listdir(self.tempdir.name), ["own.json"])
+
+
+class CreateFakeRunTest(unittest.TestCase):
+    def testPinnedGpuRun(self):
+        run = _run("-nt 8 -ntmpi 2 -pin on -pinoffset 8 -pinstride 2 -nb gpu -pme gpu -gputasks 01")
+        self.assertEqual((run.ntmpi, run.ntomp), (2, 4))
+        self.assertEqual(run.cpu_ids, [8, 10, 12, 14, 16, 18, 20, 22])
+        self.assertEqual(run.gpu_ids, [0, 1])
+        self.assertEqual(run.offloaded, ["nb", "pme"])
+        self.assertTrue(run.pinned)
+
+    def testDefaults(self):
+        run = _run("-nb gpu")
+        self.assertEqual((run.ntmpi, run.ntomp, run.cpu_ids, run.gpu_ids), (1, 1, [0], [0]))
+        self.assertFalse(run.pinned)
+
+    def testCpuOnly(self):
+        self.assertEqual(_run("-nt 4 -nb cpu").gpu_ids, [])
+
+    def testRestrictedAffinity(self):
+        run = createFakeRun(parseMdrunArgs("-nt 4 -pin off".split()), affinity=[0, 1, 8, 9])
+        self.assertEqual(run.cpu_ids, [0, 1, 8, 9])
+        self.assertTrue(run.pinned)
+        # mdrun pinning takes precedence.
+        self.assertEqual(createFakeRun(parseMdrunArgs("-nt 2 -pin on -pinoffset 4".split()), affinity=[0, 1]).cpu_ids,
+                         [4, 5])
+
+
+class DefaultPerformanceModelTest(unittest.TestCase):
+    def testMoreThreadsIsFaster(self):
+        self.assertGreater(defaultPerformanceModel(_run("-nt 8 -nb cpu"), []),
+                           defaultPerformanceModel(_run("-nt 4 -nb cpu"), []))
+
+    def testOffloadIsFaster(self):
+        cpu_only = defaultPerformanceModel(_run("-nt 8 -nb cpu"), [])
+        nb_gpu = defaultPerformanceModel(_run("-nt 8 -nb gpu"), [])
+        pme_gpu = defaultPerformanceModel(_run("-nt 8 -nb gpu -pme gpu"), [])
+        self.assertGreater(nb_gpu, cpu_only)
+        self.assertGreater(pme_gpu, nb_gpu)
+
+    def testRanksAddOverhead(self):
+        self.assertGreater(defaultPerformanceModel(_run("-nt 8 -ntmpi 1 -nb cpu"), []),
+                           defaultPerformanceModel(_run("-nt 8 -ntmpi 4 -nb cpu"), []))
+
+    def testOverlappingPinningIsSlower(self):
+        run = _run("-nt 4 -pin on -pinoffset 0 -nb gpu -gputasks 0")
+        overlapping = _run("-nt 4 -pin on -pinoffset 2 -nb gpu -gputasks 1")
+        separate = _run("-nt 4 -pin on -pinoffset 4 -nb gpu -gputasks 1")
+        self.assertLess(defaultPerformanceModel(run, [overlapping]), defaultPerformanceModel(run, [separate]))
+        self.assertAlmostEqual(defaultPerformanceModel(run, [separate]), defaultPerformanceModel(run, []))
+
+    def testSharedGpuIsSlowerPerSimulationButFasterInAggregate(self):
+        run = _run("-nt 2 -pin on -pinoffset 0 -nb gpu -pme gpu -update gpu -gputasks 0")
+        peer = _run("-nt 2 -pin on -pinoffset 2 -nb gpu -pme gpu -update gpu -gputasks 0")
+        alone = defaultPerformanceModel(run, [])
+        shared = defaultPerformanceModel(run, [peer])
+        self.assertLess(shared, alone)
+        self.assertGreater(2 * shared, alone)
+
+
+class FormatLogTest(unittest.TestCase):
+    def testParsedByBasicParser(self):
+        run = _run("-deffnm name -nt 8 -ntmpi 2 -ntomp 4 -nb gpu -pme gpu -gputasks 01 -noconfout -nsteps 1500 "
+                   "-resetstep 1000")
+        result = BasicParser().parse(formatLog(run, 123.4567))
+        self.assertEqual(result["performance"], 123.457)
+        self.assertEqual(result["ntmpi"], 2)
+        self.assertTrue(result["noconfout"])
+        self.assertEqual(result["full_command_line"],
+                         "  gmx mdrun -deffnm name -nt 8 -ntmpi 2 -ntomp 4 -nb gpu -pme gpu -gputasks 01 -noconfout "
+                         "-nsteps 1500 -resetstep 1000")
+
+    def testCycleAccountingFollowsModel(self):
+        run = _run("-nt 8 -nb gpu -pme cpu -nsteps 1500 -resetstep 1000")
+        result = DetailedParser().parse(formatLog(run, 100.0, cpu_time=1.0, gpu_time=2.0))
+        self.assertAlmostEqual(result["cycle_total_wall_time"], modeledWallTime(run, 100.0), places=3)
+        self.assertIn("PME mesh", result["cycle_accounting"])
+        self.assertEqual(max(result["cycle_accounting"], key=lambda name: result["cycle_accounting"][name]["percent"]),
+                         "Wait GPU NB local")
+        # The GPU is the bottleneck, so it is busy for the whole run.
+        self.assertAlmostEqual(result["gpu_total_wall_time"], result["cycle_total_wall_time"], places=2)
+        self.assertEqual(list(result["gpu_timings"]), ["X / q H2D", "Nonbonded F kernel", "F D2H"])
+        self.assertAlmostEqual(result["gpu_cpu_time_ratio"], 2.0)
+
+    def testNoGpuTimingsWithoutOffload(self):
+        result = DetailedParser().parse(formatLog(_run("-nt 8 -nsteps 1500 -resetstep 1000"), 10.0))
+        self.assertNotIn("gpu_timings", result)
+
+    def testWallTimeFollowsPerformance(self):
+        run = _run("-nsteps 15000 -resetstep 10000")
+        # 5000 steps of 2 fs is 0.01 ns, which takes 864 seconds at 1 ns/day.
+        self.assertAlmostEqual(modeledWallTime(run, 1.0), 864.0)
+        self.assertIn("       Time:      864.000      864.000      100.0", formatLog(run, 1.0))
+
+
+class LoadPerformanceModelTest(unittest.TestCase):
+    def testDefault(self):
+        self.assertIs(loadPerformanceModel(None), defaultPerformanceModel)
+        self.assertIs(loadPerformanceModel(""), defaultPerformanceModel)
+
+    def testFromSpec(self):
+        self.assertIs(loadPerformanceModel("gromax.tests.fake_mdrun_test:constantModel"), constantModel)
+
+    def testInvalidSpec(self):
+        with self.assertRaises(ValueError):
+            loadPerformanceModel("gromax.tests.fake_mdrun_test")
+
+
+class MainTest(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.cwd = os.getcwd()
+        os.chdir(self.tempdir.name)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.tempdir.cleanup()
+
+    def testWritesLogWithCustomModel(self):
+        with mock.patch.dict(os.environ, {"GROMAX_FAKE_MDRUN_MODEL": "gromax.tests.fake_mdrun_test:constantModel"}):
+            self.assertEqual(main(["mdrun", "-deffnm", "run", "-nt", "2"]), 0)
+        with open("run.log") as fin:
+            self.assertEqual(BasicParser().parse(fin.read())["performance"], 100.0)
+
+    def testExitCode(self):
+        with mock.patch.dict(os.environ, {"GROMAX_FAKE_MDRUN_EXIT_CODE": "3"}):
+            self.assertEqual(main(["mdrun", "-deffnm", "run"]), 3)
+        self.assertTrue(os.path.isfile("run.log"))
+
+    def testInvalidArguments(self):
+        self.assertEqual(main(["mdrun", "stray"]), 1)
+        self.assertEqual(main(["mdrun", "-nt", "x"]), 1)
+
+    def testConcurrentRunsContend(self):
+        env = dict(os.environ, PYTHONPATH=_PACKAGE_ROOT,
+                   GROMAX_FAKE_MDRUN_STATE_DIR=os.path.join(self.tempdir.name, "state"),
+                   GROMAX_FAKE_MDRUN_MODEL="gromax.tests.fake_mdrun_test:constantModel",
+                   GROMAX_FAKE_MDRUN_STARTUP="1")
+        processes = [subprocess.Popen([sys.executable, "-m", "gromax.fake_mdrun", "mdrun", "-deffnm", name],
+                                      env=env) for name in ("first", "second")]
+        self.assertEqual([process.wait() for process in processes], [0, 0])
+        for name in ("first", "second"):
+            with open(name + ".log") as fin:
+                self.assertEqual(BasicParser().parse(fin.read())["performance"], 101.0)
+        # A later simulation does not contend with finished ones.
+        with mock.patch.dict(os.environ, env):
+            self.assertEqual(main(["mdrun", "-deffnm", "third"]), 0)
+        with open("third.log") as fin:
+            self.assertEqual(BasicParser().parse(fin.read())["performance"], 100.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
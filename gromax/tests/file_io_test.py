@@ -1,146 +1,142 @@
+import os
+import sys
+import tempfile
 import unittest
-from unittest import mock
-from gromax.file_io import parseDirectoryStructure
-from typing import List
+from gromax.file_io import DirectoryWalk, DirectoryWatcher, parseDirectoryStructure, readLogHeadAndTail
+from typing import Dict, List
 
 
-def fakeListDir(input_path: str, dirs: List[str]):
+def _makeTree(root: str, paths: List[str]):
     """
-        Used to fake an os.walk call.
+        Creates a directory tree from paths relative to root. Paths ending in ".log" are created as files, and all
+        others as directories.
     """
+    for path in paths:
+        full_path: str = os.path.join(root, path)
+        if path.endswith(".log"):
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+            open(full_path, "w").close()
+        else:
+            os.makedirs(full_path, exist_ok=True)
 
-    sub_path: str
-    contents: List[str] = []
-    # Account for possibility of input path like "/path/to/subdir/" which should still be valid.
-    path: str = input_path
-    if not path.endswith("/"):
-        path += "/"
-    for sub_path in dirs:
-        # ignore all non subdirectory/subfile entries.
-        if not sub_path.startswith(path):
-            continue
-        trimmed_path: str = sub_path[len(path):]
-        # We only want what's directly in this directory. We can do this because of the "/" handing earlier.
-        if not "/" in trimmed_path:
-            contents.append(sub_path)
-    return contents
+
+def _prefixed(root: str, content: Dict) -> Dict:
+    """
+        Prefixes the leaf paths of a nested dict with root.
+    """
+    return {key: _prefixed(root, val) if isinstance(val, dict) else os.path.join(root, val)
+            for key, val in content.items()}
 
 
 _GOOD_DIRS = [
-    "/path/group_1",
-    "/path/group_1/trial_1",
-    "/path/group_1/trial_1/test_component_1.log",
-    "/path/group_1/trial_1/test_component_2.log",
-    "/path/group_1/trial_2",
-    "/path/group_1/trial_2/test_component_1.log",
-    "/path/group_1/trial_2/test_component_2.log",
-    "/path/group_2",
-    "/path/group_2/trial_14",
-    "/path/group_2/trial_14/component_86.log"
+    "group_1",
+    "group_1/trial_1",
+    "group_1/trial_1/test_component_1.log",
+    "group_1/trial_1/test_component_2.log",
+    "group_1/trial_2",
+    "group_1/trial_2/test_component_1.log",
+    "group_1/trial_2/test_component_2.log",
+    "group_2",
+    "group_2/trial_14",
+    "group_2/trial_14/component_86.log"
 ]
 
 _GOOD_RESULT = {
     0: {
         0: {
-            0: "/path/group_1/trial_1/test_component_1.log",
-            1: "/path/group_1/trial_1/test_component_2.log"
+            0: "group_1/trial_1/test_component_1.log",
+            1: "group_1/trial_1/test_component_2.log"
         },
         1: {
-            0: "/path/group_1/trial_2/test_component_1.log",
-            1: "/path/group_1/trial_2/test_component_2.log"
+            0: "group_1/trial_2/test_component_1.log",
+            1: "group_1/trial_2/test_component_2.log"
         }
     },
     1: {
         13: {
-            85: "/path/group_2/trial_14/component_86.log"
+            85: "group_2/trial_14/component_86.log"
         }
     }
 }
 
 
-@mock.patch("gromax.file_io.os.listdir")
 class ParseDirectoryStructureTest(unittest.TestCase):
     def setUp(self):
         self.maxDiff = None
-
-    def testGoodDirectory(self, mock_listdir):
-
-        def mock_os_wrapper(directory):
-            return fakeListDir(directory, _GOOD_DIRS)
-
-        mock_listdir.side_effect = mock_os_wrapper
-
-        result = parseDirectoryStructure("/path")
-        self.assertDictEqual(_GOOD_RESULT, result)
-
-    def testEmptyDirectory(self, mock_listdir):
-        def mock_os_wrapper(directory):
-            return fakeListDir(directory, [])
-        mock_listdir.side_effect = mock_os_wrapper
-        self.assertDictEqual(parseDirectoryStructure("/path"), {})
-
-    def testBadPath(self, mock_listdir):
-        pass
-
-    def testSomeEmptyGroups(self, mock_listdir):
-        dirs = [
-            "/path/group_1",
-            "/path/group_1/trial_1",
-            "/path/group_1/trial_1/test_component_1.log",
-            "/path/group_2"
-        ]
-
-        def mock_os_wrapper(directory):
-            return fakeListDir(directory, dirs)
-        mock_listdir.side_effect = mock_os_wrapper
-        result = parseDirectoryStructure("/path")
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.root = self.tempdir.name
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def testGoodDirectory(self):
+        _makeTree(self.root, _GOOD_DIRS)
+        for jobs in (1, 2):
+            with self.subTest(jobs=jobs):
+                self.assertDictEqual(_prefixed(self.root, _GOOD_RESULT), parseDirectoryStructure(self.root, jobs))
+
+    def testEmptyDirectory(self):
+        self.assertDictEqual(parseDirectoryStructure(self.root), {})
+
+    def testSomeEmptyGroups(self):
+        _makeTree(self.root, [
+            "group_1",
+            "group_1/trial_1",
+            "group_1/trial_1/test_component_1.log",
+            "group_2"
+        ])
+        result = parseDirectoryStructure(self.root)
 
         expected = {
             0: {
                 0: {
-                    0: "/path/group_1/trial_1/test_component_1.log",
+                    0: "group_1/trial_1/test_component_1.log",
                 }
             },
             1: {}
         }
-        self.assertDictEqual(expected, result)
-
-    def testIgnoresOtherFoldersAndFiles(self, mock_listdir):
-        def mock_os_wrapper(directory):
-            return fakeListDir(directory, _GOOD_DIRS + ["/some/other/path/group_1"])
-        mock_listdir.side_effect = mock_os_wrapper
-
-        result = parseDirectoryStructure("/path")
-        self.assertDictEqual(_GOOD_RESULT, result)
-
-    def testIgnoresBadFormat(self, mock_listdir):
-        dirs = [
-            "/path/group_1",
-            "/path/group_1/trial_1",
-            "/path/group_1/trial_1/test_component_1.log",
+        self.assertDictEqual(_prefixed(self.root, expected), result)
+
+    def testIgnoresOtherFoldersAndFiles(self):
+        _makeTree(self.root, _GOOD_DIRS + [
+            "other/group_1/trial_1/test_component_1.log",
+            # Files named like directories, and directories named like logs.
+            "group_3.log",
+            "group_1/trial_3.log",
+            "group_1/trial_1/test_component_3.log/",
+            "group_1/trial_1/notes",
+        ])
+        with open(os.path.join(self.root, "group_4"), "w"):
+            pass
+        result = parseDirectoryStructure(self.root)
+        self.assertDictEqual(_prefixed(self.root, _GOOD_RESULT), result)
+
+    def testIgnoresBadFormat(self):
+        _makeTree(self.root, [
+            "group_1",
+            "group_1/trial_1",
+            "group_1/trial_1/test_component_1.log",
             # double group in path
-            "/path/group_2_group_2",
-            "/path/group_2_group_2/trial_1",
+            "group_2_group_2",
+            "group_2_group_2/trial_1",
             # valid group
-            "/path/group_3",
+            "group_3",
             # invalid int for trial
-            "/path/group_3/trial_dkfjd",
+            "group_3/trial_dkfjd",
             # valid group and trial
-            "/path/group_4",
-            "/path/group_4/trial_1",
+            "group_4",
+            "group_4/trial_1",
             # double component
-            "/path/group_4/trial_1/test_component_2_component_4.log"
-        ]
-
-        def mock_os_wrapper(directory):
-            return fakeListDir(directory, dirs)
-        mock_listdir.side_effect = mock_os_wrapper
-        result = parseDirectoryStructure("/path")
+            "group_4/trial_1/test_component_2_component_4.log"
+        ])
+        with self.assertLogs("gromax", "WARNING") as logs:
+            result = parseDirectoryStructure(self.root)
+        self.assertEqual(len(logs.output), 3)
 
         expected = {
             0: {
                 0: {
-                    0: "/path/group_1/trial_1/test_component_1.log",
+                    0: "group_1/trial_1/test_component_1.log",
                 }
             },
             2: {},
@@ -148,4 +144,104 @@ class ParseDirectoryStructureTest(unittest.TestCase):
                 0: {}
             }
         }
-        self.assertDictEqual(expected, result)
+        self.assertDictEqual(_prefixed(self.root, expected), result)
+
+
+class DirectoryWalkTest(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        _makeTree(self.tempdir.name, _GOOD_DIRS + ["group_3"])
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def testListsGroupsOnConstruction(self):
+        walk = DirectoryWalk(self.tempdir.name)
+        self.assertEqual(sorted(walk.group_directories), [0, 1, 2])
+        self.assertEqual(walk.content, {})
+
+    def testYieldsLogsAndRecordsContent(self):
+        for jobs in (1, 3):
+            with self.subTest(jobs=jobs):
+                walk = DirectoryWalk(self.tempdir.name, jobs=jobs)
+                paths = list(walk)
+                self.assertEqual(sorted(paths), sorted(os.path.join(self.tempdir.name, path)
+                                                       for path in _GOOD_DIRS if path.endswith(".log")))
+                self.assertDictEqual(walk.content, {**_prefixed(self.tempdir.name, _GOOD_RESULT), 2: {}})
+                self.assertEqual(list(walk.content), list(walk.group_directories))
+
+
+class DirectoryWatcherTest(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.root = self.tempdir.name
+        _makeTree(self.root, ["group_1/trial_1/run_component_1.log", "group_1/trial_1/notes.txt", "other"])
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def _log(self, path: str) -> str:
+        return os.path.join(self.root, path)
+
+    def _append(self, path: str, text: str):
+        with open(self._log(path), "a") as fout:
+            fout.write(text)
+
+    def _checkFindsNewAndChangedLogs(self, use_inotify: bool):
+        watcher = DirectoryWatcher(self.root, use_inotify=use_inotify)
+        self.addCleanup(watcher.close)
+        self.assertEqual(watcher.uses_inotify, use_inotify)
+        # The first poll does not wait.
+        self.assertEqual(watcher.poll(100.0), [((0, 0, 0), self._log("group_1/trial_1/run_component_1.log"))])
+        self.assertEqual(watcher.poll(0.0), [])
+        _makeTree(self.root, ["group_1/trial_2/run_component_2.log", "group_2/trial_1",
+                              "group_1/trial_2/run_component_x.log/"])
+        self._append("group_1/trial_1/run_component_1.log", "Performance:")
+        self.assertEqual(watcher.poll(0.0), [
+            ((0, 0, 0), self._log("group_1/trial_1/run_component_1.log")),
+            ((0, 1, 1), self._log("group_1/trial_2/run_component_2.log")),
+        ])
+        _makeTree(self.root, ["group_2/trial_1/run_component_1.log"])
+        self.assertEqual(watcher.poll(0.0), [((1, 0, 0), self._log("group_2/trial_1/run_component_1.log"))])
+
+    @unittest.skipUnless(sys.platform.startswith("linux"), "inotify is only available on Linux")
+    def testInotify(self):
+        self._checkFindsNewAndChangedLogs(use_inotify=True)
+
+    def testPolling(self):
+        self._checkFindsNewAndChangedLogs(use_inotify=False)
+
+    def testSettledLogsAreNotPolled(self):
+        watcher = DirectoryWatcher(self.root, use_inotify=False)
+        logs = watcher.poll(0.0)
+        watcher.settle([path for _, path in logs])
+        self._append("group_1/trial_1/run_component_1.log", "Performance:")
+        self.assertEqual(watcher.poll(0.0), [])
+
+
+class ReadLogHeadAndTailTest(unittest.TestCase):
+    def setUp(self):
+        self.file = tempfile.NamedTemporaryFile(mode="w", suffix=".log", delete=False)
+
+    def tearDown(self):
+        os.remove(self.file.name)
+
+    def _write(self, contents: str):
+        self.file.write(contents)
+        self.file.close()
+
+    def testSmallFileReadCompletely(self):
+        self._write("head\nmiddle\ntail\n")
+        self.assertEqual(readLogHeadAndTail(self.file.name, head_bytes=10, tail_bytes=10),
+                         ("head\nmiddle\ntail\n", True))
+
+    def testLargeFileSkipsMiddle(self):
+        self._write("head\n" + "x" * 100 + "\ntail\n")
+        contents, complete = readLogHeadAndTail(self.file.name, head_bytes=5, tail_bytes=6)
+        self.assertFalse(complete)
+        self.assertEqual(contents, "head\n\n\ntail\n")
+
+    def testMissingFile(self):
+        self._write("")
+        with self.assertRaises(IOError):
+            readLogHeadAndTail(self.file.name + "_nonexistent")
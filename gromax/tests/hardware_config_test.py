@@ -1,9 +1,11 @@
 import math
 import os
+import tempfile
 import unittest
 import gromax.testutils as testutils
 from gromax.hardware_config import checkProcessorIDContent, HardwareConfig
-from gromax.hardware_config import generateConfigSplitOptions, distributeGpuIdsToTasks
+from gromax.hardware_config import formatCpuList, generateConfigSplitOptions, distributeGpuIdsToTasks
+from gromax.topology import readTopology
 from unittest.mock import patch
 
 
@@ -58,9 +60,15 @@ class ProcessorIDContentTests(unittest.TestCase):
         self.assertTrue(mock_fatal_error.called)
 
     @patch('gromax.utils.fatalError')
-    def testFailIfInconsistentStride(self, mock_fatal_error):
+    def testGoodInconsistentStride(self, mock_fatal_error):
         cpu_ids = [1, 3, 5, 8]
         checkProcessorIDContent(cpu_ids)
+        self.assertFalse(mock_fatal_error.called)
+
+    @patch('gromax.utils.fatalError')
+    def testFailIfDuplicateIDs(self, mock_fatal_error):
+        cpu_ids = [1, 2, 3, 1]
+        checkProcessorIDContent(cpu_ids)
         self.assertTrue(mock_fatal_error.called)
 
 
@@ -77,7 +85,7 @@ class HardwareConfigBasicTests(unittest.TestCase):
         self.assertFalse(len(hw_config.cpu_ids))
         self.assertFalse(len(hw_config.gpu_ids))
 
-    def testGetAndSet(self):
+    def testGet(self):
         cpu = [1, 2, 3]
         gpu = [4, 5]
         hw_config = HardwareConfig(cpu_ids=cpu, gpu_ids=gpu)
@@ -92,31 +100,85 @@ class HardwareConfigBasicTests(unittest.TestCase):
 
     @patch('gromax.utils.fatalError')
     def testGpuIDFailureNotAList(self, mock_fatal):
-        hw_config = HardwareConfig()
-        hw_config.gpu_ids = 5
+        HardwareConfig(gpu_ids=5)
         mock_fatal.assert_called_with("gpu_ids paramater must be iterable")
 
     @patch('gromax.utils.fatalError')
     def testGpuIDFailureNotAnInt(self, mock_fatal):
-        hw_config = HardwareConfig()
-        hw_config.gpu_ids = [1, 1.7584, 3]
+        HardwareConfig(gpu_ids=[1, 1.7584, 3])
         mock_fatal.assert_called_with("All gpu ids must be integers: {} is not an int".format(1.7584))
 
     @patch('gromax.utils.fatalError')
     def testGpuIDFailureNotPositive(self, mock_fatal):
-        hw_config = HardwareConfig()
-        hw_config.gpu_ids = [1, 3, -1]
+        HardwareConfig(gpu_ids=[1, 3, -1])
         mock_fatal.assert_called_with("Cannot have a negative GPU ID")
 
 
+class HardwareConfigRangeTests(unittest.TestCase):
+
+    def testRangeInput(self):
+        hw_config = HardwareConfig(cpu_ids=range(0, 8, 2), gpu_ids=[0])
+        self.assertEqual(hw_config.cpu_ids, [0, 2, 4, 6])
+        self.assertEqual(hw_config.cpu_range, range(0, 8, 2))
+        self.assertEqual(hw_config.cpu_stride, 2)
+
+    def testListStoredAsRange(self):
+        hw_config = HardwareConfig(cpu_ids=[3, 6, 9])
+        self.assertEqual(hw_config.cpu_range, range(3, 12, 3))
+
+    def testSingleCpuStride(self):
+        self.assertEqual(HardwareConfig(cpu_ids=[5]).cpu_stride, 1)
+
+    @patch('gromax.utils.fatalError')
+    def testNegativeRange(self, mock_fatal):
+        HardwareConfig(cpu_ids=range(-2, 2))
+        self.assertTrue(mock_fatal.called)
+
+    def testAccessorsReturnCopies(self):
+        hw_config = HardwareConfig(cpu_ids=[0, 1], gpu_ids=[0])
+        hw_config.cpu_ids.append(2)
+        hw_config.gpu_ids.append(1)
+        self.assertEqual(hw_config, HardwareConfig(cpu_ids=[0, 1], gpu_ids=[0]))
+
+    def testSubConfig(self):
+        hw_config = HardwareConfig(cpu_ids=list(range(0, 16, 2)), gpu_ids=[0, 1])
+        self.assertEqual(hw_config.subConfig(2, 4, [1]), HardwareConfig(cpu_ids=[4, 6], gpu_ids=[1]))
+
+    def testCpuSet(self):
+        hw_config = HardwareConfig(cpu_ids=[8, 9, 0, 1], gpu_ids=[0])
+        self.assertFalse(hw_config.is_strided)
+        self.assertIsNone(hw_config.cpu_stride)
+        self.assertEqual(hw_config.cpu_ids, [0, 1, 8, 9])
+        self.assertTrue(HardwareConfig(cpu_ids=[0, 2, 4]).is_strided)
+
+    def testCpuSetSubConfig(self):
+        hw_config = HardwareConfig(cpu_ids=[0, 1, 2, 3, 8, 9, 10, 11], gpu_ids=[0])
+        self.assertEqual(hw_config.subConfig(4, 8, [0]).cpu_range, range(8, 12))
+        self.assertEqual(hw_config.subConfig(2, 6, [0]).cpu_range, (2, 3, 8, 9))
+        self.assertEqual(hw_config.subConfig(2, 6, [0]), HardwareConfig(cpu_ids=[2, 3, 8, 9], gpu_ids=[0]))
+
+    def testHashable(self):
+        configs = {HardwareConfig(cpu_ids=[0, 1], gpu_ids=[0]), HardwareConfig(cpu_ids=range(2), gpu_ids=[0]),
+                   HardwareConfig(cpu_ids=[0, 1], gpu_ids=[1])}
+        self.assertEqual(len(configs), 2)
+
+    def testNoInstanceDict(self):
+        with self.assertRaises(AttributeError):
+            HardwareConfig().some_attribute = 5
+
+    def testImmutable(self):
+        hw_config = HardwareConfig(cpu_ids=[0, 1], gpu_ids=[0])
+        for attribute in ("cpu_ids", "gpu_ids", "_cpu_ids", "_gpu_ids"):
+            with self.subTest(attribute=attribute):
+                with self.assertRaises(AttributeError):
+                    setattr(hw_config, attribute, [2])
+        self.assertEqual(hw_config, HardwareConfig(cpu_ids=[0, 1], gpu_ids=[0]))
+
+
 class HardwareConfigEqualityTest(unittest.TestCase):
     def setUp(self):
-        self.config1 = HardwareConfig()
-        self.config1.cpu_ids = [0, 2, 4]
-        self.config1.gpu_ids = [0]
-        self.config2 = HardwareConfig()
-        self.config2.cpu_ids = [0, 2, 4]
-        self.config2.gpu_ids = [0]
+        self.config1 = HardwareConfig(cpu_ids=[0, 2, 4], gpu_ids=[0])
+        self.config2 = HardwareConfig(cpu_ids=[0, 2, 4], gpu_ids=[0])
 
     def testEmpty(self):
         self.assertEqual(HardwareConfig(), HardwareConfig())
@@ -125,8 +187,7 @@ class HardwareConfigEqualityTest(unittest.TestCase):
         self.assertEqual(self.config1, self.config2)
 
     def testNotEqual(self):
-        self.config1.cpu_ids = [0, 2]
-        self.assertNotEqual(self.config1, self.config2)
+        self.assertNotEqual(HardwareConfig(cpu_ids=[0, 2], gpu_ids=[0]), self.config2)
 
     def testNonSensical(self):
         self.assertNotEqual(self.config1, [])
@@ -135,20 +196,18 @@ class HardwareConfigEqualityTest(unittest.TestCase):
 
 
 class GenerateConfigSplitOptionsTest(unittest.TestCase):
-    def setUp(self):
-        self.config = HardwareConfig()
+    def _setConfig(self, cpu_ids, gpu_ids):
+        self.config = HardwareConfig(cpu_ids=cpu_ids, gpu_ids=gpu_ids)
         self.expected_base = [[self.config]]
 
     def testNoGpu(self):
-        self.config.cpu_ids = [0, 1, 2, 3]
-        self.config.gpu_ids = []
+        self._setConfig([0, 1, 2, 3], [])
 
         result = generateConfigSplitOptions(self.config)
         self.assertCountEqual(self.expected_base, result)
 
     def testOnlyPrimeDivision(self):
-        self.config.cpu_ids = [0, 1, 2]
-        self.config.gpu_ids = [0]
+        self._setConfig([0, 1, 2], [0])
 
         options = [HardwareConfig(cpu_ids=[i], gpu_ids=[0]) for i in range(3)]
         self.expected_base.append(options)
@@ -157,15 +216,13 @@ class GenerateConfigSplitOptionsTest(unittest.TestCase):
 
     def testNoGoodDecompositionForMultipleGpus(self):
         # with 2 gpus and 3 cpus, the only decomposition is the original
-        self.config.cpu_ids = [0, 1, 2]
-        self.config.gpu_ids = [0, 1]
+        self._setConfig([0, 1, 2], [0, 1])
 
         result = generateConfigSplitOptions(self.config)
         self.assertCountEqual(self.expected_base, result)
 
     def testMultipleDecompositionWithOneGpu(self):
-        self.config.cpu_ids = [0, 1, 2, 3]
-        self.config.gpu_ids = [0]
+        self._setConfig([0, 1, 2, 3], [0])
 
         single_cpu_option = [HardwareConfig(cpu_ids=[i], gpu_ids=[0]) for i in range(4)]
         double_cpu_option = [HardwareConfig(cpu_ids=[i, i + 1], gpu_ids=[0]) for i in (0, 2)]
@@ -176,8 +233,7 @@ class GenerateConfigSplitOptionsTest(unittest.TestCase):
 
     def testMultipleDecompositionWithMultipleGpus(self):
         # with 6 cpus and 2 gpus, the 3x option should not exist
-        self.config.cpu_ids = [0, 1, 2, 3, 4, 5]
-        self.config.gpu_ids = [0, 1]
+        self._setConfig([0, 1, 2, 3, 4, 5], [0, 1])
 
         single_cpu_option = [HardwareConfig(cpu_ids=[i], gpu_ids=[math.floor(i / 3)]) for i in range(6)]
         three_cpu_option = [HardwareConfig(cpu_ids=[i, i+1, i+2], gpu_ids=[gpu_id]) for gpu_id, i in enumerate((0, 3))]
@@ -188,8 +244,7 @@ class GenerateConfigSplitOptionsTest(unittest.TestCase):
 
     def testMultipleDecompositionWithOddRankOption(self):
         # with 6 cpus and 3 gpus, the 3x option exists but not the 2x
-        self.config.cpu_ids = [0, 1, 2, 3, 4, 5]
-        self.config.gpu_ids = [0, 1, 2]
+        self._setConfig([0, 1, 2, 3, 4, 5], [0, 1, 2])
         single_cpu_option = [HardwareConfig(cpu_ids=[i], gpu_ids=[math.floor(i / 2)]) for i in range(6)]
         two_cpu_option = [HardwareConfig(cpu_ids=[i, i+1], gpu_ids=[gpu_id]) for gpu_id, i in enumerate((0, 2, 4))]
         self.expected_base.append(single_cpu_option)
@@ -200,8 +255,7 @@ class GenerateConfigSplitOptionsTest(unittest.TestCase):
     def testLimitSimsPerGpuDefault(self):
         # This case tests that there is no config with 1 CPU - there would be 6, which
         # violates the max of 4.
-        self.config.cpu_ids = [0, 1, 2, 3, 4, 5]
-        self.config.gpu_ids = [0]
+        self._setConfig([0, 1, 2, 3, 4, 5], [0])
         self.expected_base.append([HardwareConfig(cpu_ids=[0, 1, 2], gpu_ids=[0]),
                                    HardwareConfig(cpu_ids=[3, 4, 5], gpu_ids=[0])])
         self.expected_base.append([HardwareConfig(cpu_ids=[0, 1], gpu_ids=[0]),
@@ -211,6 +265,83 @@ class GenerateConfigSplitOptionsTest(unittest.TestCase):
         self.assertCountEqual(self.expected_base, result)
 
 
+class GenerateConfigSplitOptionsWithCpuSetTest(unittest.TestCase):
+    def testSplitsStayInSet(self):
+        config = HardwareConfig(cpu_ids=[0, 1, 2, 3, 8, 9, 10, 11], gpu_ids=[0, 1])
+        splits = generateConfigSplitOptions(config)
+        self.assertIn([HardwareConfig(cpu_ids=[0, 1, 2, 3], gpu_ids=[0]),
+                       HardwareConfig(cpu_ids=[8, 9, 10, 11], gpu_ids=[1])], splits)
+        for split in splits:
+            self.assertEqual(sorted(cpu for component in split for cpu in component.cpu_ids), config.cpu_ids)
+
+
+class FormatCpuListTest(unittest.TestCase):
+    def testFormat(self):
+        self.assertEqual(formatCpuList([64, 65, 0, 1, 2, 3, 66]), "0-3,64-66")
+        self.assertEqual(formatCpuList([0, 2, 3]), "0,2-3")
+        self.assertEqual(formatCpuList([]), "")
+
+
+class GenerateConfigSplitOptionsWithTopologyTest(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        # Two packages of 4 cores, one NUMA node each, with CPUs 8-15 the second hardware threads of 0-7.
+        testutils.writeSysfsTree(self.tempdir.name, num_packages=2, cores_per_package=4, threads_per_core=2)
+        self.topology = readTopology(self.tempdir.name)
+        self.config = HardwareConfig(cpu_ids=list(range(8)), gpu_ids=[0, 1])
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def _cpusPerSim(self, splits):
+        return [split[0].num_cpus for split in splits]
+
+    def testUnrankedOrder(self):
+        self.assertEqual(self._cpusPerSim(generateConfigSplitOptions(self.config)), [8, 1, 2, 4])
+
+    def testAlignedSplitsFirst(self):
+        result = generateConfigSplitOptions(self.config, topology=self.topology)
+        # One simulation per NUMA node comes first, then splits straddling fewer boundaries.
+        self.assertEqual(self._cpusPerSim(result), [8, 4, 2, 1])
+        self.assertCountEqual(result, generateConfigSplitOptions(self.config))
+
+    def testSmtSiblingsInOneSimulation(self):
+        # CPUs 0 and 8 share a core, so only whole-config splits keep both threads of a core together.
+        config = HardwareConfig(cpu_ids=[0, 8], gpu_ids=[0])
+        self.assertEqual(self._cpusPerSim(generateConfigSplitOptions(config, topology=self.topology)), [2, 1])
+
+    def testGpusFollowNumaLocality(self):
+        # GPU 0 is on the NUMA node of CPUs 4-7, and GPU 1 on the node of CPUs 0-3.
+        result = generateConfigSplitOptions(self.config, topology=self.topology, gpu_numa_nodes={0: 1, 1: 0})
+        self.assertEqual(result[1], [HardwareConfig(cpu_ids=[0, 1, 2, 3], gpu_ids=[1]),
+                                     HardwareConfig(cpu_ids=[4, 5, 6, 7], gpu_ids=[0])])
+        self.assertEqual([config.gpu_ids for config in result[2]], [[1], [1], [0], [0]])
+        self.assertEqual(result[0], [self.config])
+        # Without a topology, GPU NUMA nodes cannot be matched and GPUs are assigned in order.
+        unranked = generateConfigSplitOptions(self.config, gpu_numa_nodes={0: 1, 1: 0})
+        self.assertEqual([config.gpu_ids for config in unranked[3]], [[0], [1]])
+
+    def testSmtComponentsFollowTopology(self):
+        # Package 0 holds CPUs 0-3 and their siblings 8-11, as a dual socket node numbers them on Linux.
+        config = HardwareConfig(cpu_ids=list(range(16)), gpu_ids=[0, 1])
+        result = generateConfigSplitOptions(config, topology=self.topology)
+        self.assertEqual(self._cpusPerSim(result), [16, 8, 4, 2])
+        self.assertEqual(result[1], [HardwareConfig(cpu_ids=[0, 1, 2, 3, 8, 9, 10, 11], gpu_ids=[0]),
+                                     HardwareConfig(cpu_ids=[4, 5, 6, 7, 12, 13, 14, 15], gpu_ids=[1])])
+        self.assertEqual([config.cpu_ids for config in result[2]],
+                         [[0, 1, 8, 9], [2, 3, 10, 11], [4, 5, 12, 13], [6, 7, 14, 15]])
+        self.assertEqual([config.cpu_ids for config in result[3][:2]], [[0, 8], [1, 9]])
+        # No component splits the hardware threads of a core, and each NUMA node is a component of the first split.
+        self.assertEqual([self.topology.alignmentKey([config.cpu_range for config in split]) for split in result],
+                         [(0, 0, 0), (0, 0, 0), (4, 4, 0), (8, 8, 0)])
+        # Without a topology, components are slices of the CPU IDs, and straddle NUMA nodes and cores.
+        self.assertEqual(generateConfigSplitOptions(config)[-1][0], HardwareConfig(cpu_ids=range(8), gpu_ids=[0]))
+
+    def testUncoveredCpusAreNotRanked(self):
+        config = HardwareConfig(cpu_ids=list(range(12, 20)), gpu_ids=[0, 1])
+        self.assertEqual(self._cpusPerSim(generateConfigSplitOptions(config, topology=self.topology)), [8, 1, 2, 4])
+
+
 class DistributeGpuIdsToTasksTest(unittest.TestCase):
 
     # noinspection PyTypeChecker
@@ -237,5 +368,19 @@ class DistributeGpuIdsToTasksTest(unittest.TestCase):
         # more tasks than GPUs
         self.assertEqual(distributeGpuIdsToTasks([0, 1], 6), [[0], [0], [0], [1], [1], [1]])
 
+    def testNumaLocality(self):
+        # GPUs 0 and 1 are on node 1, GPUs 2 and 3 on node 0.
+        gpu_numa_nodes = {0: 1, 1: 1, 2: 0, 3: 0}
+        self.assertEqual(distributeGpuIdsToTasks([0, 1, 2, 3], 2, [0, 1], gpu_numa_nodes), [[2, 3], [0, 1]])
+        self.assertEqual(distributeGpuIdsToTasks([0, 1, 2, 3], 4, [0, 0, 1, 1], gpu_numa_nodes), [[2], [3], [0], [1]])
+        self.assertEqual(distributeGpuIdsToTasks([0, 2], 4, [0, 0, 1, 1], gpu_numa_nodes), [[2], [2], [0], [0]])
+
+    def testNumaLocalityKeepsGpuSharingEven(self):
+        # Both tasks are on node 0, which has one GPU, so the second task still gets the other GPU.
+        self.assertEqual(distributeGpuIdsToTasks([0, 1], 2, [0, 0], {0: 1, 1: 0}), [[1], [0]])
+        # Tasks spanning nodes take what is left.
+        self.assertEqual(distributeGpuIdsToTasks([0, 1, 2, 3], 2, [None, 1], {0: 1, 1: 1, 2: 0, 3: 0}),
+                         [[2, 3], [0, 1]])
+
     def testHandlesNonZeroStartingIDs(self):
         self.assertEqual(distributeGpuIdsToTasks([5, 18], 1), [[5, 18]])
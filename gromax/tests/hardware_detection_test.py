@@ -0,0 +1,67 @@
+import sys
+import unittest
+from unittest import mock
+
+import gromax.testutils as testutils
+from gromax.hardware_detection import detectGpuIds, parseGpuListing, parseVisibleDevices, physicalGpuIndices, \
+    readAllowedCpus, runGpuListCommand
+
+
+def _fakeGpuListCommand(num_gpus: str = "") -> str:
+    return "{} {} {}".format(sys.executable,
+                             testutils.get_relative_path("integration", "testdata", "fake_nvidia_smi.py"), num_gpus)
+
+
+class ReadAllowedCpusTest(unittest.TestCase):
+    def testAffinity(self):
+        with mock.patch("os.sched_getaffinity", create=True, return_value={9, 8, 1, 0}):
+            self.assertEqual(readAllowedCpus(), [0, 1, 8, 9])
+
+    def testNoAffinity(self):
+        with mock.patch("gromax.hardware_detection.os", mock.Mock(spec=[])):
+            self.assertIsNone(readAllowedCpus())
+
+
+class VisibleDevicesTest(unittest.TestCase):
+    def testParse(self):
+        self.assertEqual(parseVisibleDevices("2,3"), ["2", "3"])
+        self.assertEqual(parseVisibleDevices("GPU-1234, MIG-5678"), ["GPU-1234", "MIG-5678"])
+        # Devices after an invalid entry are hidden.
+        self.assertEqual(parseVisibleDevices("1,-1,2"), ["1"])
+        self.assertEqual(parseVisibleDevices(""), [])
+        self.assertEqual(parseVisibleDevices("NoDevFiles"), [])
+
+    def testPhysicalGpuIndices(self):
+        self.assertEqual(physicalGpuIndices({"CUDA_VISIBLE_DEVICES": "3,1"}), [3, 1])
+        self.assertEqual(physicalGpuIndices({"ROCR_VISIBLE_DEVICES": "2"}), [2])
+        self.assertIsNone(physicalGpuIndices({"CUDA_VISIBLE_DEVICES": "GPU-1234"}))
+        self.assertIsNone(physicalGpuIndices({}))
+
+
+class DetectGpuIdsTest(unittest.TestCase):
+    def testParseGpuListing(self):
+        output = ("GPU 0: NVIDIA A100-SXM4-40GB (UUID: GPU-0)\n"
+                  "  MIG 1g.5gb     Device  0: (UUID: MIG-0)\n"
+                  "GPU 1: NVIDIA A100-SXM4-40GB (UUID: GPU-1)\n")
+        self.assertEqual(parseGpuListing(output), [0, 1])
+        self.assertEqual(parseGpuListing("No devices were found\n"), [])
+
+    def testRunGpuListCommand(self):
+        self.assertEqual(runGpuListCommand(_fakeGpuListCommand("3")), [0, 1, 2])
+        self.assertIsNone(runGpuListCommand(_fakeGpuListCommand()))
+        self.assertIsNone(runGpuListCommand("/nonexistent/nvidia-smi -L"))
+
+    def testVisibleDevicesTakePrecedence(self):
+        self.assertEqual(detectGpuIds({"CUDA_VISIBLE_DEVICES": "4,6", "ROCR_VISIBLE_DEVICES": "0"},
+                                      _fakeGpuListCommand("8")), [0, 1])
+        self.assertEqual(detectGpuIds({"ROCR_VISIBLE_DEVICES": "0"}), [0])
+        self.assertEqual(detectGpuIds({"CUDA_VISIBLE_DEVICES": ""}), [])
+
+    def testGpuListCommand(self):
+        self.assertEqual(detectGpuIds({}, _fakeGpuListCommand("2")), [0, 1])
+        self.assertIsNone(detectGpuIds({}, _fakeGpuListCommand()))
+        self.assertIsNone(detectGpuIds({}))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,52 @@
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+from gromax.inotify import IN_CLOSE_WRITE, IN_CREATE, IN_ISDIR, IN_MODIFY, IN_MOVED_TO, Inotify
+
+
+@unittest.skipUnless(sys.platform.startswith("linux"), "inotify is only available on Linux")
+class InotifyTest(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.inotify = Inotify()
+        self.wd = self.inotify.addWatch(self.tempdir.name)
+
+    def tearDown(self):
+        self.inotify.close()
+        self.tempdir.cleanup()
+
+    def testNoEvents(self):
+        self.assertEqual(self.inotify.read(), [])
+
+    def testEvents(self):
+        with open(os.path.join(self.tempdir.name, "md.log"), "w") as fout:
+            fout.write("Performance: 1.0\n")
+            fout.flush()
+        os.mkdir(os.path.join(self.tempdir.name, "trial_1"))
+        os.rename(os.path.join(self.tempdir.name, "md.log"), os.path.join(self.tempdir.name, "md_1.log"))
+        self.assertEqual(self.inotify.read(), [
+            (self.wd, IN_CREATE, "md.log"),
+            (self.wd, IN_MODIFY, "md.log"),
+            (self.wd, IN_CLOSE_WRITE, "md.log"),
+            (self.wd, IN_CREATE | IN_ISDIR, "trial_1"),
+            (self.wd, IN_MOVED_TO, "md_1.log"),
+        ])
+        self.assertEqual(self.inotify.read(), [])
+
+    def testMissingDirectory(self):
+        with self.assertRaises(OSError):
+            self.inotify.addWatch(os.path.join(self.tempdir.name, "missing"))
+
+
+class InotifyPlatformTest(unittest.TestCase):
+    def testNotLinux(self):
+        with mock.patch("sys.platform", "darwin"):
+            with self.assertRaises(OSError):
+                Inotify()
+
+
+if __name__ == "__main__":
+    unittest.main()
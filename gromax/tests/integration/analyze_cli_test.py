@@ -2,10 +2,14 @@
     Tests for gromax analyze.
 """
 import contextlib
+import csv
+import json
 import os
+import tempfile
 import unittest
 from io import StringIO
 from unittest import mock
+from gromax.file_io import DirectoryWatcher
 from gromax.main import gromax as gmxentry
 
 
@@ -64,6 +68,14 @@ class AnalyzeTestSuccess(unittest.TestCase):
     def setUp(self):
         self.maxDiff = None
         self.args = ["gromax", "analyze"]
+        # Keep the parse cache out of the user's cache directory, and separate between tests.
+        self.cache_home = tempfile.TemporaryDirectory()
+        self.environ = mock.patch.dict(os.environ, {"XDG_CACHE_HOME": self.cache_home.name})
+        self.environ.start()
+
+    def tearDown(self):
+        self.environ.stop()
+        self.cache_home.cleanup()
 
     def testFullRunSuccess(self):
         reference_folder_path = os.path.join(os.path.dirname(__file__), "testdata", "sample_run_dir")
@@ -74,6 +86,129 @@ class AnalyzeTestSuccess(unittest.TestCase):
         self.assertEqual(rc, 0)
         self.assertEqual(stdout.getvalue(), FULL_RUN_EXPECTED_OUTPUT)
 
+    def testFullRunFullLogScan(self):
+        reference_folder_path = os.path.join(os.path.dirname(__file__), "testdata", "sample_run_dir")
+        self.args.extend(["--directory", reference_folder_path, "--full_log_scan"])
+        stdout = StringIO()
+        with contextlib.redirect_stdout(stdout):
+            rc = self._run_and_capture_output()
+        self.assertEqual(rc, 0)
+        self.assertEqual(stdout.getvalue(), FULL_RUN_EXPECTED_OUTPUT)
+
+    def testBottlenecks(self):
+        reference_folder_path = os.path.join(os.path.dirname(__file__), "testdata", "sample_run_dir")
+        self.args.extend(["--directory", reference_folder_path, "--bottlenecks"])
+        stdout = StringIO()
+        with contextlib.redirect_stdout(stdout):
+            rc = self._run_and_capture_output()
+        self.assertEqual(rc, 0)
+        self.assertTrue(stdout.getvalue().startswith(FULL_RUN_EXPECTED_OUTPUT))
+        self.assertIn("Largest costs per group", stdout.getvalue())
+        self.assertIn("  Group 11: 36.69 ns/day, PME mesh 69.6%", stdout.getvalue())
+        self.assertIn("; CPU waiting for GPU ", stdout.getvalue())
+
+    def testExport(self):
+        reference_folder_path = os.path.join(os.path.dirname(__file__), "testdata", "sample_run_dir_missing_perf")
+        with tempfile.TemporaryDirectory() as tempdir:
+            for name in ("results.csv", "results.jsonl"):
+                export_file = os.path.join(tempdir, name)
+                stdout = StringIO()
+                with contextlib.redirect_stdout(stdout):
+                    with mock.patch("sys.argv", self.args + ["--directory", reference_folder_path, "--export_file",
+                                                             export_file]):
+                        with self.assertRaises(SystemExit) as sysexit:
+                            gmxentry()
+                self.assertEqual(sysexit.exception.code, 0)
+                self.assertEqual(stdout.getvalue(), MISSING_GROUP_2_TRIAL_3_OUTPUT)
+            with open(os.path.join(tempdir, "results.csv"), newline="") as fin:
+                rows = list(csv.DictReader(fin))
+            with open(os.path.join(tempdir, "results.jsonl")) as fin:
+                records = [json.loads(line) for line in fin]
+        self.assertEqual(len(rows), len(records))
+        self.assertEqual(list(rows[0])[:3], ["group", "trial", "component"])
+        self.assertEqual(float(rows[0]["performance"]), records[0]["performance"])
+        # The trial with a missing performance is not exported.
+        self.assertNotIn((2, 3), [(record["group"], record["trial"]) for record in records])
+        self.assertIn((2, 2), [(record["group"], record["trial"]) for record in records])
+
+    def testWatch(self):
+        reference_folder_path = os.path.join(os.path.dirname(__file__), "testdata", "sample_run_dir_missing_perf")
+        polls = []
+
+        def poll(watcher, timeout):
+            # The first poll finds every log, and later polls find nothing new.
+            polls.append(timeout)
+            if len(polls) > 3:
+                raise KeyboardInterrupt()
+            return real_poll(watcher, timeout) if len(polls) == 1 else []
+
+        real_poll = DirectoryWatcher.poll
+        with tempfile.TemporaryDirectory() as tempdir:
+            export_file = os.path.join(tempdir, "results.jsonl")
+            self.args.extend(["--directory", reference_folder_path, "--watch", "--watch_interval", "0.5",
+                              "--export_file", export_file])
+            stdout = StringIO()
+            with contextlib.redirect_stdout(stdout), mock.patch.object(DirectoryWatcher, "poll", poll):
+                rc = self._run_and_capture_output()
+            with open(export_file) as fin:
+                records = [json.loads(line) for line in fin]
+        self.assertEqual(rc, 0)
+        self.assertEqual(polls, [0.5] * 4)
+        # Printed once, as the results do not change after the first poll.
+        self.assertEqual(stdout.getvalue(), MISSING_GROUP_2_TRIAL_3_OUTPUT)
+        self.assertNotIn((2, 3), [(record["group"], record["trial"]) for record in records])
+
+    def testFullRunParallel(self):
+        reference_folder_path = os.path.join(os.path.dirname(__file__), "testdata", "sample_run_dir")
+        for backend in ("thread", "process"):
+            with self.subTest(backend=backend):
+                self.args = ["gromax", "analyze", "--directory", reference_folder_path, "--jobs", "4",
+                             "--jobs_backend", backend]
+                stdout = StringIO()
+                with contextlib.redirect_stdout(stdout):
+                    rc = self._run_and_capture_output()
+                self.assertEqual(rc, 0)
+                self.assertEqual(stdout.getvalue(), FULL_RUN_EXPECTED_OUTPUT)
+
+    def testTossesParseErrorParallel(self):
+        reference_folder_path = os.path.join(os.path.dirname(__file__), "testdata", "sample_run_dir_missing_perf")
+        self.args.extend(["--directory", reference_folder_path, "--jobs", "4"])
+        stdout = StringIO()
+        with contextlib.redirect_stdout(stdout):
+            rc = self._run_and_capture_output()
+        self.assertEqual(rc, 0)
+        self.assertEqual(stdout.getvalue(), MISSING_GROUP_2_TRIAL_3_OUTPUT)
+
+    def testFullRunCached(self):
+        reference_folder_path = os.path.join(os.path.dirname(__file__), "testdata", "sample_run_dir")
+        self.args.extend(["--directory", reference_folder_path])
+        for _ in range(2):
+            stdout = StringIO()
+            with contextlib.redirect_stdout(stdout):
+                rc = self._run_and_capture_output()
+            self.assertEqual(rc, 0)
+            self.assertEqual(stdout.getvalue(), FULL_RUN_EXPECTED_OUTPUT)
+        self.assertTrue(os.path.exists(os.path.join(self.cache_home.name, "gromax", "parse_cache.sqlite")))
+        self.assertFalse(any("cache" in name for name in os.listdir(reference_folder_path)))
+
+    def testCacheDir(self):
+        reference_folder_path = os.path.join(os.path.dirname(__file__), "testdata", "sample_run_dir")
+        cache_dir = os.path.join(self.cache_home.name, "custom")
+        self.args.extend(["--directory", reference_folder_path, "--cache_dir", cache_dir])
+        with contextlib.redirect_stdout(StringIO()):
+            self.assertEqual(self._run_and_capture_output(), 0)
+        self.assertEqual(os.listdir(cache_dir), ["parse_cache.sqlite"])
+
+    def testNoCache(self):
+        reference_folder_path = os.path.join(os.path.dirname(__file__), "testdata", "sample_run_dir")
+        self.args.extend(["--directory", reference_folder_path, "--no_cache"])
+        stdout = StringIO()
+        with contextlib.redirect_stdout(stdout):
+            rc = self._run_and_capture_output()
+        self.assertEqual(rc, 0)
+        self.assertEqual(stdout.getvalue(), FULL_RUN_EXPECTED_OUTPUT)
+        self.assertFalse(os.path.exists(os.path.join(self.cache_home.name, "gromax")))
+
     def testFullRunFromCwd(self):
         cwd = os.getcwd()
         reference_folder_path = os.path.join(os.path.dirname(__file__), "testdata", "sample_run_dir")
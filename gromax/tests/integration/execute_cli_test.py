@@ -0,0 +1,95 @@
+"""
+    Integration tests for gromax execute, using a stand-in gmx executable.
+"""
+import contextlib
+import os
+import sys
+import tempfile
+import unittest
+from io import StringIO
+from unittest import mock
+from gromax.main import gromax as gmxentry
+
+_FAKE_GMX: str = "{} {}".format(sys.executable, os.path.join(os.path.dirname(__file__), "testdata", "fake_gmx.py"))
+
+
+class ExecuteTest(unittest.TestCase):
+
+    def _run_and_get_rc(self) -> int:
+        with mock.patch("sys.argv", self.args):
+            with self.assertRaises(SystemExit) as sysexit:
+                gmxentry()
+            return sysexit.exception.code
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.args = ["gromax", "execute", "--cpu_ids", "0-3", "--gpu_ids", "0", "--gmx_version", "2016",
+                     "--generate_exhaustive_combinations", "--gmx_executable", _FAKE_GMX, "--trials_per_group", "2",
+                     "--directory", self.tempdir.name, "--no_cache", "--log_level", "silent"]
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def testNoTprFails(self):
+        self.assertGreater(self._run_and_get_rc(), 0)
+
+    def testRunsAndReports(self):
+        self.args.extend(["--tpr", os.path.join(self.tempdir.name, "topol.tpr")])
+        stdout = StringIO()
+        with contextlib.redirect_stdout(stdout):
+            self.assertEqual(self._run_and_get_rc(), 0)
+        self.assertTrue(os.path.isfile(os.path.join(self.tempdir.name, "group_1", "trial_2",
+                                                    "group_1_trial_2_component_1.log")))
+        # The fake gmx scales performance with thread count, so all groups add up to the same performance.
+        self.assertIn("Aggregate performance: 40.00 ns/day", stdout.getvalue())
+        self.assertIn("Best single simulation", stdout.getvalue())
+
+    def testSuccessiveHalving(self):
+        self.args.extend(["--tpr", os.path.join(self.tempdir.name, "topol.tpr"), "--successive_halving",
+                          "--halving_rounds", "2", "--halving_keep_fraction", "0.5"])
+        stdout = StringIO()
+        with contextlib.redirect_stdout(stdout):
+            self.assertEqual(self._run_and_get_rc(), 0)
+        self.assertTrue(os.path.isdir(os.path.join(self.tempdir.name, "round_1", "group_1")))
+        self.assertTrue(os.path.isdir(os.path.join(self.tempdir.name, "round_2")))
+        self.assertLess(len(os.listdir(os.path.join(self.tempdir.name, "round_2"))),
+                        len(os.listdir(os.path.join(self.tempdir.name, "round_1"))))
+        self.assertIn("Aggregate performance: 40.00 ns/day", stdout.getvalue())
+        self.assertIn("Best single simulation", stdout.getvalue())
+
+    def testAdaptiveSearch(self):
+        self.args.extend(["--tpr", os.path.join(self.tempdir.name, "topol.tpr"), "--adaptive_search",
+                          "--search_budget", "3"])
+        stdout = StringIO()
+        with contextlib.redirect_stdout(stdout):
+            self.assertEqual(self._run_and_get_rc(), 0)
+        self.assertLessEqual(len([name for name in os.listdir(self.tempdir.name) if name.startswith("group_")]), 4)
+        self.assertIn("Aggregate performance: 40.00 ns/day", stdout.getvalue())
+        self.assertIn("Best single simulation", stdout.getvalue())
+
+    def testAdaptiveSearchExport(self):
+        export_file = os.path.join(self.tempdir.name, "results.csv")
+        self.args.extend(["--tpr", os.path.join(self.tempdir.name, "topol.tpr"), "--adaptive_search",
+                          "--search_budget", "2", "--export_file", export_file])
+        with contextlib.redirect_stdout(StringIO()):
+            self.assertEqual(self._run_and_get_rc(), 0)
+        num_logs = sum(len([name for name in files if name.endswith(".log")])
+                       for _, _, files in os.walk(self.tempdir.name))
+        with open(export_file) as fin:
+            self.assertEqual(len(fin.readlines()), num_logs + 1)
+
+    def testAdaptiveTrials(self):
+        self.args.extend(["--tpr", os.path.join(self.tempdir.name, "topol.tpr"), "--rel_se_threshold", "0.05",
+                          "--max_trials", "4"])
+        stdout = StringIO()
+        with contextlib.redirect_stdout(stdout):
+            self.assertEqual(self._run_and_get_rc(), 0)
+        # The fake gmx performance does not vary, so every group stops after the minimum of 2 trials.
+        self.assertEqual(sorted(os.listdir(os.path.join(self.tempdir.name, "group_1"))), ["trial_1", "trial_2"])
+        self.assertIn("Aggregate performance: 40.00 ns/day", stdout.getvalue())
+
+    def testAllRunsFailing(self):
+        self.args.extend(["--tpr", os.path.join(self.tempdir.name, "topol.tpr")])
+        with mock.patch.dict(os.environ, {"FAKE_GMX_EXIT_CODE": "1", "FAKE_GMX_SLEEP": "5"}):
+            self.args.extend(["--timeout", "0.1"])
+            self.assertGreater(self._run_and_get_rc(), 0)
@@ -0,0 +1,92 @@
+"""
+    Integration tests for the generate, run, analyze loop using the bundled fake mdrun in place of GROMACS.
+"""
+import contextlib
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+from io import StringIO
+from unittest import mock
+
+import gromax
+from gromax.main import gromax as gmxentry
+
+_PACKAGE_ROOT: str = os.path.dirname(os.path.dirname(os.path.abspath(gromax.__file__)))
+_FAKE_GMX: str = "{} -m gromax.fake_mdrun".format(sys.executable)
+
+
+class FakeMdrunWorkflowTest(unittest.TestCase):
+    def _run_and_get_rc(self, args) -> int:
+        with mock.patch("sys.argv", ["gromax"] + args + ["--log_level", "silent"]):
+            with self.assertRaises(SystemExit) as sysexit:
+                gmxentry()
+            return sysexit.exception.code
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.env = {"PYTHONPATH": _PACKAGE_ROOT,
+                    "GROMAX_FAKE_MDRUN_STATE_DIR": os.path.join(self.tempdir.name, ".fake_mdrun_state"),
+                    "GROMAX_FAKE_MDRUN_STARTUP": "0.2"}
+        self.hardware = ["--cpu_ids", "0-7", "--gpu_ids", "0", "--gmx_version", "2018", "--gmx_executable", _FAKE_GMX,
+                         "--trials_per_group", "1"]
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def _analyze(self) -> str:
+        stdout = StringIO()
+        with contextlib.redirect_stdout(stdout):
+            self.assertEqual(self._run_and_get_rc(["analyze", "--directory", self.tempdir.name, "--no_cache"]), 0)
+        return stdout.getvalue()
+
+    def testGeneratedScript(self):
+        run_file = os.path.join(self.tempdir.name, "benchmark.sh")
+        self.assertEqual(self._run_and_get_rc(["generate", "--run_file", run_file, "--tpr", "topol.tpr"] +
+                                              self.hardware), 0)
+        subprocess.run(["bash", run_file], cwd=self.tempdir.name, env=dict(os.environ, **self.env), check=True,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        report: str = self._analyze()
+        self.assertIn("Highest throughput combination", report)
+        self.assertIn("Best single simulation", report)
+
+    def testExecute(self):
+        stdout = StringIO()
+        with mock.patch.dict(os.environ, self.env), contextlib.redirect_stdout(stdout):
+            self.assertEqual(self._run_and_get_rc(["execute", "--directory", self.tempdir.name, "--tpr", "topol.tpr",
+                                                   "--no_cache"] + self.hardware), 0)
+        # Sharing the GPU between simulations increases aggregate throughput in the default model.
+        best: str = stdout.getvalue().split("Best single simulation")[0]
+        self.assertGreater(best.count("gmx mdrun"), 1)
+        self.assertEqual(self._analyze(), stdout.getvalue())
+
+    def testCalibratedGenerate(self):
+        run_file = os.path.join(self.tempdir.name, "benchmark.sh")
+        with mock.patch.dict(os.environ, self.env):
+            self.assertEqual(self._run_and_get_rc(["generate", "--run_file", run_file, "--tpr", "topol.tpr",
+                                                   "--directory", self.tempdir.name, "--calibrate",
+                                                   "--calibration_target_seconds", "5"] + self.hardware), 0)
+        self.assertTrue(os.path.isdir(os.path.join(self.tempdir.name, "calibration", "group_1")))
+        with open(run_file) as fin:
+            script: str = fin.read()
+        self.assertNotIn("-nsteps ${nsteps}", script)
+        self.assertNotIn("-nsteps 15000", script)
+
+    def testCalibratedExecute(self):
+        stdout = StringIO()
+        with mock.patch.dict(os.environ, self.env), contextlib.redirect_stdout(stdout):
+            self.assertEqual(self._run_and_get_rc(["execute", "--directory", self.tempdir.name, "--tpr", "topol.tpr",
+                                                   "--no_cache", "--calibrate", "--calibration_target_seconds", "5",
+                                                   "--single_sim_only"] + self.hardware), 0)
+        with open(os.path.join(self.tempdir.name, "group_1", "trial_1", "group_1_trial_1_component_1.log")) as fin:
+            contents: str = fin.read()
+        # The fake mdrun reports the modeled wall time of the steps after resetstep.
+        wall_time: float = float(contents.split("Time:")[1].split()[1])
+        self.assertGreaterEqual(wall_time, 5.0)
+        self.assertLess(wall_time, 6.0)
+        self.assertIn("Best single simulation", stdout.getvalue())
+
+
+if __name__ == "__main__":
+    unittest.main()
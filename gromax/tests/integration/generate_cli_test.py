@@ -1,7 +1,13 @@
+import contextlib
+import json
 import os
+import subprocess
+import sys
 import tempfile
 import unittest
+from io import StringIO
 from unittest import mock
+import gromax.testutils as testutils
 from gromax.main import gromax as gmxentry
 
 """
@@ -93,6 +99,14 @@ class GenerateSuccessTests(unittest.TestCase):
     def testGmx2016Basic(self):
         self._runAndCompareOutput("generate_test_default_2016.sh")
 
+    def testDefaultIgnoresHostTopology(self):
+        # Without --sysfs_root or --detect, output does not depend on the node generating the script.
+        with mock.patch("gromax.main.readTopology") as mock_topology, \
+                mock.patch("gromax.main.readGpuNumaNodes") as mock_gpu_numa_nodes:
+            self._runAndCompareOutput("generate_test_default_2016.sh")
+        mock_topology.assert_not_called()
+        mock_gpu_numa_nodes.assert_not_called()
+
     def testGmx2018Basic(self):
         self.kvs["--gmx_version"] = "2018"
         self._runAndCompareOutput("generate_test_default_2018.sh")
@@ -161,3 +175,261 @@ class GenerateSuccessTests(unittest.TestCase):
             "--single_sim_only": None,
         }
         self._runAndCompareOutput("generate_test_minimal_subset_single_sim.sh")
+
+    def testTopologyRanksSplits(self):
+        with tempfile.TemporaryDirectory() as sysfs_root:
+            testutils.writeSysfsTree(sysfs_root, num_packages=2, cores_per_package=2)
+            self.kvs["--sysfs_root"] = sysfs_root
+            self._combineArgs()
+            self.assertEqual(self._run_and_get_rc(), 0)
+        manifest_file: str = os.path.join(os.path.dirname(self.kvs["--run_file"]), "gromax_manifest.jsonl")
+        with open(manifest_file) as fin:
+            entries = [json.loads(line) for line in fin]
+        cpus_per_group = {}
+        for entry in entries:
+            cpus_per_group.setdefault(entry["group"], entry["cpu_ids"])
+        # One simulation per package comes before one simulation per CPU.
+        self.assertEqual(list(dict.fromkeys(len(cpus) for _, cpus in sorted(cpus_per_group.items()))), [4, 2, 1])
+
+    def testTopologyAlignedCpuSets(self):
+        with tempfile.TemporaryDirectory() as sysfs_root:
+            # Package 0 holds CPUs 0-1 and their hardware thread siblings 4-5.
+            testutils.writeSysfsTree(sysfs_root, num_packages=2, cores_per_package=2, threads_per_core=2)
+            self.kvs.update({"--cpu_ids": "0-7", "--gpu_ids": "0,1", "--sysfs_root": sysfs_root})
+            self._combineArgs()
+            self.assertEqual(self._run_and_get_rc(), 0)
+        with open(self.kvs["--run_file"]) as fin:
+            script: str = fin.read()
+        self.assertIn("taskset -c 0-1,4-5 $gmx -deffnm group_${group}_trial_${i}_component_1", script)
+        self.assertIn("taskset -c 2-3,6-7 $gmx -deffnm group_${group}_trial_${i}_component_2", script)
+        self.assertEqual(self._manifestHardware()[(0, 4)], [0])
+
+    def _manifestHardware(self):
+        manifest_file: str = os.path.join(os.path.dirname(self.kvs["--run_file"]), "gromax_manifest.jsonl")
+        with open(manifest_file) as fin:
+            return {(entry["cpu_ids"][0], len(entry["cpu_ids"])): entry["gpu_ids"] for entry in map(json.loads, fin)}
+
+    def testGpuNumaLocality(self):
+        with tempfile.TemporaryDirectory() as sysfs_root:
+            testutils.writeSysfsTree(sysfs_root, num_packages=2, cores_per_package=2)
+            # GPU 0 is on the second package and GPU 1 on the first.
+            testutils.writeSysfsGpus(sysfs_root, [1, 0])
+            self.kvs["--sysfs_root"] = sysfs_root
+            self._combineArgs()
+            self.assertEqual(self._run_and_get_rc(), 0)
+        hardware = self._manifestHardware()
+        self.assertEqual(hardware[(0, 2)], [1])
+        self.assertEqual(hardware[(2, 2)], [0])
+
+    def testGpuNumaLocalityWithVisibleDevices(self):
+        with tempfile.TemporaryDirectory() as sysfs_root:
+            testutils.writeSysfsTree(sysfs_root, num_packages=2, cores_per_package=2)
+            testutils.writeSysfsGpus(sysfs_root, [1, 0])
+            self.kvs["--sysfs_root"] = sysfs_root
+            self._combineArgs()
+            # mdrun's GPU 0 is the node's GPU 1, on the first package.
+            with mock.patch.dict(os.environ, {"CUDA_VISIBLE_DEVICES": "1,0"}):
+                self.assertEqual(self._run_and_get_rc(), 0)
+        hardware = self._manifestHardware()
+        self.assertEqual(hardware[(0, 2)], [0])
+        self.assertEqual(hardware[(2, 2)], [1])
+
+    def testGpuNumaNodesOption(self):
+        with tempfile.TemporaryDirectory() as sysfs_root:
+            testutils.writeSysfsTree(sysfs_root, num_packages=2, cores_per_package=2)
+            testutils.writeSysfsGpus(sysfs_root, [0, 1])
+            self.kvs["--sysfs_root"] = sysfs_root
+            self.kvs["--gpu_numa_nodes"] = "0:1,1:0"
+            self._combineArgs()
+            self.assertEqual(self._run_and_get_rc(), 0)
+        self.assertEqual(self._manifestHardware()[(0, 2)], [1])
+
+    def testCpuSet(self):
+        self.kvs["--cpu_ids"] = "0-1,4-5"
+        self._combineArgs()
+        self.assertEqual(self._run_and_get_rc(), 0)
+        with open(self.kvs["--run_file"]) as fin:
+            script: str = fin.read()
+        # The full set has no constant stride, and is bound with taskset, while each half is pinned by mdrun.
+        self.assertIn("taskset -c 0-1,4-5 $gmx -deffnm group_${group}_trial_${i}_component_1", script)
+        self.assertIn("-nt 4 -ntmpi 2 -ntomp 2 -pin off -resetstep", script)
+        self.assertIn("-nt 2 -ntmpi 1 -ntomp 2 -pin on -pinoffset 4 -pinstride 1", script)
+        self.assertIn((0, 4), self._manifestHardware())
+
+    def _generateDetected(self, environ, gpu_list_command=None) -> int:
+        del self.kvs["--cpu_ids"]
+        del self.kvs["--gpu_ids"]
+        self.kvs["--detect"] = None
+        # Detection would otherwise read the topology of the machine running the tests.
+        self.kvs["--sysfs_root"] = os.devnull
+        if gpu_list_command:
+            self.kvs["--gpu_list_command"] = gpu_list_command
+        self._combineArgs()
+        with mock.patch.dict(os.environ, environ):
+            for variable in ("CUDA_VISIBLE_DEVICES", "ROCR_VISIBLE_DEVICES"):
+                if variable not in environ:
+                    os.environ.pop(variable, None)
+            with mock.patch("os.sched_getaffinity", create=True, return_value={2, 3, 6, 7}):
+                return self._run_and_get_rc()
+
+    def testDetect(self):
+        self.assertEqual(self._generateDetected({"CUDA_VISIBLE_DEVICES": "5,7"}), 0)
+        hardware = self._manifestHardware()
+        self.assertEqual(hardware[(2, 4)], [0, 1])
+        self.assertEqual(hardware[(6, 2)], [1])
+        with open(self.kvs["--run_file"]) as fin:
+            self.assertIn("taskset -c 2-3,6-7 $gmx", fin.read())
+
+    def testDetectWithGpuListCommand(self):
+        fake_nvidia_smi: str = testutils.get_relative_path("testdata", "fake_nvidia_smi.py")
+        self.assertEqual(self._generateDetected({}, "{} {} 1".format(sys.executable, fake_nvidia_smi)), 0)
+        self.assertEqual(self._manifestHardware()[(2, 4)], [0])
+
+    def testAffinityOnlyCheckedWithDetect(self):
+        # Explicit CPU IDs are usually those of another node, and are not checked against this process's affinity.
+        self._combineArgs()
+        with mock.patch("gromax.main.readAllowedCpus") as mock_allowed_cpus:
+            self.assertEqual(self._run_and_get_rc(), 0)
+        mock_allowed_cpus.assert_not_called()
+        self.args.extend(["--detect", "--sysfs_root", os.devnull])
+        with mock.patch("os.sched_getaffinity", create=True, return_value={0, 1}):
+            with self.assertLogs("gromax", level="WARNING") as logs:
+                self.assertEqual(self._run_and_get_rc(), 0)
+        self.assertIn("CPUs 2-3 are not in the set this process may run on (0-1)", "\n".join(logs.output))
+
+    def testDetectWithoutGpus(self):
+        self.assertGreater(self._generateDetected({}), 0)
+
+    def _generateSmtSweep(self, threads_per_core: int) -> int:
+        with tempfile.TemporaryDirectory() as sysfs_root:
+            # CPUs 0-3 are the first hardware threads of the 4 cores, and CPUs 4-7 their siblings.
+            testutils.writeSysfsTree(sysfs_root, num_packages=2, cores_per_package=2 * (3 - threads_per_core),
+                                     threads_per_core=threads_per_core)
+            self.kvs.update({"--cpu_ids": "0-7", "--sysfs_root": sysfs_root, "--smt_sweep": None})
+            self._combineArgs()
+            return self._run_and_get_rc()
+
+    def testSmtSweep(self):
+        self.assertEqual(self._generateSmtSweep(threads_per_core=2), 0)
+        manifest_file: str = os.path.join(os.path.dirname(self.kvs["--run_file"]), "gromax_manifest.jsonl")
+        cpus_per_group = {}
+        with open(manifest_file) as fin:
+            for entry in map(json.loads, fin):
+                cpus_per_group.setdefault((entry["group"], entry["smt"]), []).extend(entry["cpu_ids"])
+        groups = sorted(cpus_per_group)
+        self.assertEqual({tuple(sorted(cpus)) for (_, smt), cpus in cpus_per_group.items() if smt},
+                         {tuple(range(8))})
+        self.assertEqual({tuple(sorted(cpus)) for (_, smt), cpus in cpus_per_group.items() if not smt},
+                         {tuple(range(4))})
+        # Groups using SMT come first.
+        self.assertEqual([smt for _, smt in groups], sorted((smt for _, smt in groups), reverse=True))
+        with open(self.kvs["--run_file"]) as fin:
+            script: str = fin.read()
+        # All CPUs are pinned by mdrun, while CPUs 0-3 are not mdrun's CPUs 0-3, which include their siblings.
+        self.assertIn("-nt 8 -ntmpi 2 -ntomp 4 -pin on -pinoffset 0 -pinstride 1", script)
+        self.assertIn("taskset -c 0-3 $gmx -deffnm group_${group}_trial_${i}_component_1 -gputasks 01 -nb gpu "
+                      "-noconfout -nsteps ${nsteps} -nstlist 80 -nt 4 -ntmpi 2 -ntomp 2 -pin off", script)
+        self.assertNotIn("-pinstride 4", script)
+
+    def testSmtSweepWithoutSmt(self):
+        self.assertGreater(self._generateSmtSweep(threads_per_core=1), 0)
+
+    def testSmtSweepWithoutTopology(self):
+        self.kvs["--smt_sweep"] = None
+        self._combineArgs()
+        self.assertGreater(self._run_and_get_rc(), 0)
+
+
+class CompactScriptTest(unittest.TestCase):
+    """
+        Runs expanded and compact scripts with a stand-in gmx, and compares the simulations they run.
+    """
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        fake_gmx: str = "{} {}".format(sys.executable, os.path.join(os.path.dirname(__file__), "testdata",
+                                                                    "fake_gmx.py"))
+        self.args = ["gromax", "generate", "--cpu_ids", "0-3", "--gpu_ids", "0,1", "--gmx_version", "2020",
+                     "--gmx_executable", fake_gmx, "--tpr", "topol.tpr", "--trials_per_group", "2", "--log_level",
+                     "silent"]
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def _generateAndRun(self, name: str, extra_args, script_args=()) -> str:
+        directory: str = os.path.join(self.tempdir.name, name)
+        os.mkdir(directory)
+        run_file: str = os.path.join(directory, "benchmark.sh")
+        with mock.patch("sys.argv", self.args + ["--run_file", run_file] + extra_args):
+            with self.assertRaises(SystemExit) as sysexit:
+                gmxentry()
+        self.assertEqual(sysexit.exception.code, 0)
+        subprocess.run(["bash", run_file] + list(script_args), cwd=directory, check=True)
+        os.remove(run_file)
+        return directory
+
+    def _logs(self, directory: str) -> dict:
+        logs = {}
+        for root, _, files in os.walk(directory):
+            for name in files:
+                with open(os.path.join(root, name)) as fin:
+                    logs[os.path.relpath(os.path.join(root, name), directory)] = fin.read()
+        return logs
+
+    def testMatchesExpandedScript(self):
+        expanded: str = self._generateAndRun("expanded", [])
+        compact: str = self._generateAndRun("compact", ["--script_format", "compact"])
+        expanded_logs = self._logs(expanded)
+        self.assertGreater(len(expanded_logs), 10)
+        self.assertEqual(self._logs(compact), expanded_logs)
+
+    def testRunsSubsetOfGroups(self):
+        compact: str = self._generateAndRun("compact", ["--script_format", "compact"], script_args=("2", "3"))
+        self.assertEqual(sorted(os.listdir(compact)), ["gromax_manifest.jsonl", "group_2", "group_3"])
+        self.assertEqual(sorted(os.listdir(os.path.join(compact, "group_3"))), ["trial_1", "trial_2"])
+
+    def _analyze(self, directory: str, extra_args) -> list:
+        export_file: str = os.path.join(self.tempdir.name, "results.jsonl")
+        with mock.patch("sys.argv", ["gromax", "analyze", "--directory", directory, "--export_file", export_file,
+                                     "--no_cache", "--log_level", "silent"] + extra_args):
+            with self.assertRaises(SystemExit) as sysexit, contextlib.redirect_stdout(StringIO()):
+                gmxentry()
+        self.assertEqual(sysexit.exception.code, 0)
+        with open(export_file) as fin:
+            return [json.loads(line) for line in fin]
+
+    def testAnalyzeWithManifest(self):
+        directory: str = self._generateAndRun("compact", ["--script_format", "compact"], script_args=("2", "3"))
+        with self.assertLogs("gromax", "WARNING") as logs:
+            with_manifest = self._analyze(directory, ["--log_level", "info"])
+        self.assertIn("36 of 40 runs in the manifest have no log", logs.output[0])
+        from_logs = self._analyze(directory, ["--no_manifest"])
+        self.assertEqual(len(with_manifest), 4)
+        for record in with_manifest + from_logs:
+            del record["full_command_line"]
+        self.maxDiff = None
+        self.assertEqual(with_manifest, from_logs)
+
+    def testReportsSmtSweep(self):
+        with tempfile.TemporaryDirectory() as sysfs_root:
+            testutils.writeSysfsTree(sysfs_root, num_packages=1, cores_per_package=2, threads_per_core=2)
+            directory: str = self._generateAndRun("smt", ["--script_format", "compact", "--single_sim_only",
+                                                          "--smt_sweep", "--sysfs_root", sysfs_root])
+        output = StringIO()
+        with mock.patch("sys.argv", ["gromax", "analyze", "--directory", directory, "--no_cache", "--log_level",
+                                     "silent"]):
+            with self.assertRaises(SystemExit) as sysexit, contextlib.redirect_stdout(output):
+                gmxentry()
+        self.assertEqual(sysexit.exception.code, 0)
+        # The stand-in gmx reports 10 ns/day per thread.
+        self.assertIn("  1 concurrent simulation: 40.00 ns/day with SMT, 20.00 ns/day without, +100.0% from SMT",
+                      output.getvalue())
+
+    def testIsSmaller(self):
+        for script_format in ("expanded", "compact"):
+            run_file: str = os.path.join(self.tempdir.name, script_format + ".sh")
+            with mock.patch("sys.argv", self.args + ["--run_file", run_file, "--script_format", script_format,
+                                                     "--generate_exhaustive_combinations"]):
+                with self.assertRaises(SystemExit):
+                    gmxentry()
+        self.assertLess(os.path.getsize(os.path.join(self.tempdir.name, "compact.sh")),
+                        0.75 * os.path.getsize(os.path.join(self.tempdir.name, "expanded.sh")))
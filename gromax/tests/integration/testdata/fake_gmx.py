@@ -0,0 +1,30 @@
+"""
+    Stand-in for 'gmx mdrun' used to test direct execution. Writes a minimal log with the command line and a
+    performance value derived from the thread count.
+
+    Behavior can be altered with environment variables:
+        FAKE_GMX_SLEEP: seconds to sleep before writing the log.
+        FAKE_GMX_EXIT_CODE: exit code to return.
+"""
+import os
+import sys
+import time
+
+
+def main(argv):
+    if not argv or argv[0] != "mdrun":
+        sys.stderr.write("Only mdrun is supported\n")
+        return 1
+    args = argv[1:]
+    deffnm = args[args.index("-deffnm") + 1]
+    nt = int(args[args.index("-nt") + 1]) if "-nt" in args else 1
+    time.sleep(float(os.environ.get("FAKE_GMX_SLEEP", "0")))
+    with open(deffnm + ".log", "w") as fout:
+        fout.write("Log file opened\nCommand line:\n  gmx mdrun {}\n\n".format(" ".join(args)))
+        fout.write("               Core t (s)   Wall t (s)        (%)\n")
+        fout.write("Performance:       {:.3f}        0.708\n".format(10.0 * nt))
+    return int(os.environ.get("FAKE_GMX_EXIT_CODE", "0"))
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,20 @@
+"""
+    Stand-in for 'nvidia-smi -L' used to test GPU detection. Lists the number of GPUs given as the first argument,
+    with a MIG device under the first GPU. Exits with code 1 if the argument is missing.
+"""
+import sys
+
+
+def main(argv):
+    if not argv:
+        sys.stderr.write("Expected a GPU count\n")
+        return 1
+    for index in range(int(argv[0])):
+        print("GPU {}: Fake GPU (UUID: GPU-00000000-0000-0000-0000-00000000000{})".format(index, index))
+        if index == 0:
+            print("  MIG 1g.5gb     Device  0: (UUID: MIG-00000000-0000-0000-0000-000000000000)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
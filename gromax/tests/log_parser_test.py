@@ -1,7 +1,35 @@
 import unittest
 
 from gromax.log_parser import _performanceRegexOp, _typeOfParam, _convert, _commandInputRegexOp, _fullCommandRegexOp
-from gromax.log_parser import LogParser, BasicParser, ParsePerformanceError, ParseGmxCommandError
+from gromax.log_parser import LogParser, BasicParser, ParsePerformanceError, ParseGmxCommandError, TimingParser
+from gromax.log_parser import DetailedParser, MetricsParser, _cycleAccountingRegexOp, _gpuTimingsRegexOp, \
+    _wallTimeRegexOp, ParseSectionError
+
+_CYCLE_TABLE = """
+     R E A L   C Y C L E   A N D   T I M E   A C C O U N T I N G
+
+On 1 MPI rank doing PP, using 4 OpenMP threads, and
+on 1 MPI rank doing PME, using 4 OpenMP threads
+
+ Computing:          Num   Num      Call    Wall time         Giga-Cycles
+                     Ranks Threads  Count      (s)         total sum    %
+-----------------------------------------------------------------------------
+ Neighbor search        1    4         63       0.735         11.450   2.0
+ Wait + Comm. F         1    4       5001       0.001          0.021   0.0
+ PME mesh *             1    4       5001       9.392        146.245  25.8
+ PME wait for PP *                              8.808        137.143  24.2
+ Wait GPU NB local      1    4       5001       6.635        103.308  18.2
+ NB X/F buffer ops.     1    4      19878       1.638         25.508   4.5
+-----------------------------------------------------------------------------
+ Total                                         18.200        566.770 100.0
+-----------------------------------------------------------------------------
+(*) Note that with separate PME ranks, the walltime column actually sums to
+    twice the total reported, but the cycle count total and % are correct.
+-----------------------------------------------------------------------------
+
+               Core t (s)   Wall t (s)        (%)
+       Time:      145.597       18.200      800.0
+"""
 
 
 class TypeOfParamTest(unittest.TestCase):
@@ -102,6 +130,68 @@ class PerformanceParserTest(unittest.TestCase):
     def testfailingParse(self):
         self.assertIsNone(_performanceRegexOp("Some random text"))
 
+_GPU_TIMINGS = """
+ GPU timings
+-----------------------------------------------------------------------------
+ Computing:                         Count  Wall t (s)      ms/step       %
+-----------------------------------------------------------------------------
+ Pair list H2D                        501       0.050        0.100     0.4
+ X / q H2D                          50001       0.651        0.013     4.7
+ Nonbonded F kernel                 49000      11.366        0.232    82.2
+ F D2H                              50001       1.759        0.035    12.7
+-----------------------------------------------------------------------------
+ Total                                         13.826        0.277   100.0
+-----------------------------------------------------------------------------
+
+Average per-step force GPU/CPU evaluation time ratio: 0.277 ms/3.024 ms = 0.092
+For optimal resource utilization this ratio should be close to 1
+"""
+
+
+class WallTimeRegexOpTest(unittest.TestCase):
+    def testSuccessfulParse(self):
+        inp = ("               Core t (s)   Wall t (s)        (%)\n"
+               "       Time:      203.877       25.485      800.0\n"
+               "                 (ns/day)    (hour/ns)\n")
+        self.assertEqual(_wallTimeRegexOp(inp), {"core_time": 203.877, "wall_time": 25.485})
+
+    def testFailingParse(self):
+        self.assertIsNone(_wallTimeRegexOp("Some random text"))
+        self.assertIsNone(_wallTimeRegexOp("Run time: 5 minutes"))
+
+
+class CycleAccountingRegexOpTest(unittest.TestCase):
+    def testSuccessfulParse(self):
+        result = _cycleAccountingRegexOp("Some text\n" + _CYCLE_TABLE)
+        self.assertAlmostEqual(result["cycle_total_wall_time"], 18.2)
+        self.assertEqual(list(result["cycle_accounting"]), ["Neighbor search", "Wait + Comm. F", "PME mesh",
+                                                            "PME wait for PP", "Wait GPU NB local",
+                                                            "NB X/F buffer ops."])
+        self.assertEqual(result["cycle_accounting"]["PME wait for PP"], {"wall_time": 8.808, "percent": 24.2})
+        self.assertEqual(result["cycle_accounting"]["NB X/F buffer ops."], {"wall_time": 1.638, "percent": 4.5})
+
+    def testFailingParse(self):
+        self.assertIsNone(_cycleAccountingRegexOp("Some random text"))
+        # Truncated before the total.
+        self.assertIsNone(_cycleAccountingRegexOp(_CYCLE_TABLE.split(" Total")[0]))
+
+
+class GpuTimingsRegexOpTest(unittest.TestCase):
+    def testSuccessfulParse(self):
+        result = _gpuTimingsRegexOp(_CYCLE_TABLE + _GPU_TIMINGS)
+        self.assertAlmostEqual(result["gpu_total_wall_time"], 13.826)
+        self.assertAlmostEqual(result["gpu_cpu_time_ratio"], 0.092)
+        self.assertEqual(list(result["gpu_timings"]), ["Pair list H2D", "X / q H2D", "Nonbonded F kernel", "F D2H"])
+        self.assertEqual(result["gpu_timings"]["Nonbonded F kernel"], {"wall_time": 11.366, "percent": 82.2})
+
+    def testWithoutRatio(self):
+        result = _gpuTimingsRegexOp(_GPU_TIMINGS.split("Average")[0])
+        self.assertNotIn("gpu_cpu_time_ratio", result)
+
+    def testFailingParse(self):
+        self.assertIsNone(_gpuTimingsRegexOp(_CYCLE_TABLE))
+        self.assertIsNone(_gpuTimingsRegexOp("NOTE: GPU timings are disabled"))
+
 
 class FullCommandRegexOpTest(unittest.TestCase):
     match_cmd = "Some text\nCommand line:\ngmx mdrun -deffnm test -maxh 5 -ntomp 4\n\n"
@@ -124,6 +214,39 @@ class LogParserTest(unittest.TestCase):
         parser = BasicParser()
         self.assertEqual(len(parser._operations), 3)
 
+    def testSignature(self):
+        parser = LogParser(ops=(_performanceRegexOp, _fullCommandRegexOp))
+        self.assertEqual(parser.signature(),
+                         "gromax.log_parser._performanceRegexOp,gromax.log_parser._fullCommandRegexOp")
+        self.assertNotEqual(parser.signature(), BasicParser().signature())
+
+    def testTimingParser(self):
+        contents = self.match_perf + "       Time:      203.877       25.485      800.0\n"
+        self.assertDictEqual(TimingParser().parse(contents),
+                             {"performance": 25.12, "core_time": 203.877, "wall_time": 25.485})
+        with self.assertRaises(ParsePerformanceError):
+            TimingParser().parse(self.match_perf)
+
+    def testDetailedParser(self):
+        result = DetailedParser().parse(self.contents + _CYCLE_TABLE)
+        self.assertEqual(result["performance"], 25.12)
+        self.assertIn("Wait GPU NB local", result["cycle_accounting"])
+        self.assertNotIn("gpu_timings", result)
+        self.assertIn("gpu_timings", DetailedParser().parse(self.contents + _CYCLE_TABLE + _GPU_TIMINGS))
+        # A missing table is reported, but the rest of the result is kept.
+        with self.assertRaises(ParseSectionError) as context:
+            DetailedParser().parse(self.contents)
+        self.assertEqual(context.exception.result["performance"], 25.12)
+        self.assertNotIn("cycle_accounting", context.exception.result)
+
+    def testMetricsParser(self):
+        # Parameters are not parsed, so a log without a command line is fine.
+        self.assertDictEqual(MetricsParser().parse(self.match_perf), {"performance": 25.12})
+        self.assertDictEqual(MetricsParser().parse(self.contents + _CYCLE_TABLE), {"performance": 25.12})
+        self.assertIn("cycle_accounting", MetricsParser(detailed=True).parse(self.match_perf + _CYCLE_TABLE))
+        with self.assertRaises(ParsePerformanceError):
+            MetricsParser().parse(self.match_cmd)
+
     def testNoOps(self):
         parser = LogParser()
         self.assertDictEqual(parser.parse(self.contents), {})
@@ -0,0 +1,114 @@
+import os
+import tempfile
+import unittest
+
+from gromax.hardware_config import HardwareConfig
+from gromax.manifest import createManifestEntries, logFilePath, manifestRunData, missingLogFiles, readManifest, \
+    writeManifest
+
+
+class CreateManifestEntriesTest(unittest.TestCase):
+    def setUp(self):
+        self.groups = [
+            [{"nt": 8, "pme": "gpu"}],
+            [{"nt": 4, "pinoffset": 0}, {"nt": 4, "pinoffset": 4}],
+        ]
+
+    def testEntries(self):
+        entries = list(createManifestEntries(self.groups, "gmx mdrun", "topol.tpr", 2))
+        self.assertEqual(len(entries), 3)
+        self.assertEqual(entries[2], {
+            "group": 2,
+            "component": 2,
+            "gmx": "gmx mdrun",
+            "params": {"nt": 4, "pinoffset": 4, "nsteps": 15000, "resetstep": 10000, "s": "topol.tpr"},
+            "log_files": [os.path.join("group_2", "trial_1", "group_2_trial_1_component_2.log"),
+                          os.path.join("group_2", "trial_2", "group_2_trial_2_component_2.log")],
+        })
+        # Generated parameters are not modified.
+        self.assertEqual(self.groups[1][1], {"nt": 4, "pinoffset": 4})
+
+    def testGroupStepsAndNoTpr(self):
+        entries = list(createManifestEntries(self.groups, "gmx mdrun", None, 1, group_steps={1: (2000, 1000)}))
+        self.assertEqual(entries[0]["params"], {"nt": 8, "pme": "gpu", "nsteps": 15000, "resetstep": 10000})
+        self.assertEqual(entries[1]["params"]["nsteps"], 2000)
+        self.assertEqual(entries[2]["params"]["resetstep"], 1000)
+
+    def testHardware(self):
+        hardware = [
+            [HardwareConfig(cpu_ids=list(range(8)), gpu_ids=[0])],
+            [HardwareConfig(cpu_ids=[0, 1, 2, 3], gpu_ids=[0]), HardwareConfig(cpu_ids=[4, 5, 6, 7], gpu_ids=[1])],
+        ]
+        entries = list(createManifestEntries(self.groups, "gmx mdrun", None, 1, hardware=hardware))
+        self.assertEqual(entries[0]["cpu_ids"], list(range(8)))
+        self.assertEqual(entries[2]["cpu_ids"], [4, 5, 6, 7])
+        self.assertEqual(entries[2]["gpu_ids"], [1])
+
+    def testSmt(self):
+        entries = list(createManifestEntries(self.groups, "gmx mdrun", None, 1, smt=[True, False]))
+        self.assertEqual([entry["smt"] for entry in entries], [True, False, False])
+        self.assertNotIn("smt", next(createManifestEntries(self.groups, "gmx mdrun", None, 1)))
+
+    def testCpuSets(self):
+        entries = list(createManifestEntries(self.groups, "gmx mdrun", None, 1, group_cpu_sets={1: ["0-1,4-5", None]}))
+        self.assertEqual([entry.get("cpu_set") for entry in entries], [None, "0-1,4-5", None])
+        self.assertNotIn("cpu_set", entries[1]["params"])
+
+
+class ReadWriteManifestTest(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tempdir.name, "manifest.jsonl")
+        self.entries = list(createManifestEntries([[{"nt": 4}, {"nt": 4}]], "gmx mdrun", "topol.tpr", 2))
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def testRoundTrip(self):
+        writeManifest(self.path, self.entries)
+        manifest = readManifest(self.path)
+        self.assertEqual(sorted(manifest), [(0, 0), (0, 1)])
+        self.assertEqual(manifest[(0, 1)], self.entries[1])
+
+    def testMalformed(self):
+        for line in ("not json", '{"group": 1}', '{"group": "one", "component": 1, "params": {}}',
+                     '{"group": 1, "component": 1, "params": {"unknown": 1}}'):
+            with self.subTest(line=line):
+                with open(self.path, "w") as fout:
+                    fout.write("\n" + line + "\n")
+                with self.assertRaisesRegex(ValueError, "line 2"):
+                    readManifest(self.path)
+
+    def testMissingFile(self):
+        with self.assertRaises(IOError):
+            readManifest(self.path)
+
+    def testMissingLogFiles(self):
+        manifest = {(0, component): entry for component, entry in enumerate(self.entries)}
+        existing = logFilePath(0, 1, 0)
+        os.makedirs(os.path.join(self.tempdir.name, os.path.dirname(existing)))
+        open(os.path.join(self.tempdir.name, existing), "w").close()
+        self.assertEqual(missingLogFiles(manifest, self.tempdir.name),
+                         [logFilePath(0, 0, 0), logFilePath(0, 0, 1), logFilePath(0, 1, 1)])
+
+
+class ManifestRunDataTest(unittest.TestCase):
+    def testRunData(self):
+        entry = next(createManifestEntries([[{"nt": 4, "noconfout": True, "pinoffset": 8}]], "gmx mdrun",
+                                           "/path/with-dash.tpr", 3))
+        # Values have the types parsed from logs.
+        self.assertEqual(manifestRunData(entry, 2), {
+            "nt": 4, "noconfout": True, "pinoffset": "8", "nsteps": 15000, "resetstep": 10000,
+            "s": "/path/with-dash.tpr",
+            "deffnm": "group_1_trial_3_component_1",
+            "full_command_line": "  gmx mdrun -deffnm group_1_trial_3_component_1 -noconfout -nsteps 15000 -nt 4 "
+                                 "-pinoffset 8 -resetstep 10000 -s /path/with-dash.tpr",
+        })
+
+    def testSmtTag(self):
+        entry = next(createManifestEntries([[{"nt": 4}]], "gmx mdrun", None, 1, smt=[False]))
+        self.assertIs(manifestRunData(entry, 0)["smt"], False)
+
+
+if __name__ == "__main__":
+    unittest.main()
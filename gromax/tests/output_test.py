@@ -1,8 +1,9 @@
 import unittest
 from unittest import mock
-from gromax.output import _serializeParams, _serializeConcurrentGroup, _incrementLines, _wrapInLoop, ParamsToString
-from gromax.output import _injectTpr, _injectFileNaming, _ProcessSingleGroup, _addDirectoryHandling, _ProcessAllGroups
-from gromax.output import WriteRunScript
+from gromax.output import _serializeParams, _serializeConcurrentGroup, _incrementLines, _wrapInLoop
+from gromax.output import _injectTpr, _injectFileNaming, _ProcessSingleGroup, _addDirectoryHandling
+from gromax.output import WriteRunScript, ParamsToArgList, GenerateScriptChunks, GenerateCompactScriptChunks
+from gromax.output import componentName, trialDirectory
 
 
 class SerializeParamsTest(unittest.TestCase):
@@ -37,6 +38,20 @@ class SerializeParamsTest(unittest.TestCase):
         params = {"pme": "gpu", "maxh": 3.5}
         self.assertEqual(_serializeParams(params, prepend="gmx_mpi"), "gmx_mpi -maxh 3.5 -pme gpu")
 
+    def testCpuSetLauncher(self):
+        params = {"nt": 4, "pin": "off"}
+        self.assertEqual(_serializeParams(params, prepend="gmx mdrun", cpu_set="0-1,8-9"),
+                         "taskset -c 0-1,8-9 gmx mdrun -nt 4 -pin off")
+
+
+class ParamsToArgListTest(unittest.TestCase):
+    def testEmpty(self):
+        self.assertEqual(ParamsToArgList({}), [])
+
+    def testMixedTypes(self):
+        params = {"pme": "gpu", "noconfout": True, "notunepme": False, "nt": 0}
+        self.assertEqual(ParamsToArgList(params), ["-noconfout", "-nt", "0", "-pme", "gpu"])
+
 
 class SerializeConcurrentGroupTest(unittest.TestCase):
     param_group = [
@@ -66,6 +81,19 @@ class SerializeConcurrentGroupTest(unittest.TestCase):
         self.assertEqual(_serializeConcurrentGroup(self.param_group, prepend="gmx_mpi"), expected)
 
 
+class RunLayoutTest(unittest.TestCase):
+    def testComponentName(self):
+        self.assertEqual(componentName(0, 2, 1), "group_1_trial_3_component_2")
+
+    def testTrialDirectory(self):
+        self.assertEqual(trialDirectory(3, 0), "group_4/trial_1")
+
+    def testScriptNamingMatches(self):
+        params = [{}]
+        _injectFileNaming(params, group_placeholder="1", trial_placeholder="3")
+        self.assertEqual(params[0]["deffnm"], componentName(0, 2, 0))
+
+
 class InjectionTest(unittest.TestCase):
 
     def setUp(self):
@@ -177,37 +205,72 @@ class ProcessSingleGroupTest(unittest.TestCase):
         self.assertEqual(result, expected)
 
 
-class ProcessAllGroupsTest(unittest.TestCase):
+class GenerateScriptChunksTest(unittest.TestCase):
     @mock.patch("gromax.output._ProcessSingleGroup")
-    def testProcessAllGroups(self, mock_process):
-        groups = [[], [], []]
+    def testScript(self, mock_process):
         mock_process.return_value = "placeholder loop text"
-        result = _ProcessAllGroups(groups, "i", "gmx mdrun")
-        expected = (
-            "group=1\n"
+        chunks = list(GenerateScriptChunks([[], [], []], "mytpr.tpr", "gmx mdrun", 3))
+        group_chunk = (
             "groupdir=$workdir/group_${group}\n"
             "mkdir $groupdir\ncd $groupdir\n"
             "placeholder loop text\n\n\n"
-            "group=2\n"
-            "groupdir=$workdir/group_${group}\n"
-            "mkdir $groupdir\ncd $groupdir\n"            
-            "placeholder loop text\n\n\n"
-            "group=3\n"
-            "groupdir=$workdir/group_${group}\n"
-            "mkdir $groupdir\ncd $groupdir\n"            
-            "placeholder loop text\n\n\n"
         )
-        self.assertEqual(result, expected)
-
-
-class ParamsToStringTest(unittest.TestCase):
-    @mock.patch("gromax.output._ProcessAllGroups")
-    def testParamsToString(self, mock_process):
-        mock_process.return_value = "mock body"
-        result = ParamsToString([[], []], "mytpr.tpr", "gmx mdrun", 3)
-        expected = "#!/bin/bash\n\ngmx='gmx mdrun'\ntpr=mytpr.tpr\nnsteps=15000\nresetstep=10000\nntrials=3\nworkdir" \
-                   "=`pwd`\n\n" + "#" * 80 + "\n\nmock body\n\nexit\n"
-        self.assertEqual(result, expected)
+        expected = [
+            "#!/bin/bash\n\ngmx='gmx mdrun'\ntpr=mytpr.tpr\nnsteps=15000\nresetstep=10000\nntrials=3\nworkdir"
+            "=`pwd`\n\n" + "#" * 80 + "\n\n",
+            "group=1\n" + group_chunk,
+            "group=2\n" + group_chunk,
+            "group=3\n" + group_chunk,
+            "\n\nexit\n",
+        ]
+        self.assertEqual(chunks, expected)
+        mock_process.assert_called_with([], "$gmx", "i", nsteps="${nsteps}", resetstep="${resetstep}",
+                                        tab_increment=2, cpu_sets=None)
+
+    def testGroupStepOverrides(self):
+        groups = [[{"nt": 4}], [{"nt": 2}, {"nt": 2}]]
+        _, first, second, _ = GenerateScriptChunks(groups, "mytpr.tpr", "gmx mdrun", 3, group_steps={1: (3000, 1000)})
+        self.assertIn("$gmx -deffnm group_${group}_trial_${i}_component_1 -nsteps ${nsteps} -nt 4 "
+                      "-resetstep ${resetstep} -s ${tpr}\n", first)
+        self.assertIn("$gmx -deffnm group_${group}_trial_${i}_component_2 -nsteps 3000 -nt 2 -resetstep 1000 "
+                      "-s ${tpr}\n", second)
+        self.assertEqual(groups, [[{"nt": 4}], [{"nt": 2}, {"nt": 2}]])
+
+    def testConsumesGroupsLazily(self):
+        def groups():
+            yield [{"nt": 4}]
+            raise RuntimeError("stop")
+
+        chunks = GenerateScriptChunks(groups(), "mytpr.tpr", "gmx mdrun", 3)
+        next(chunks)
+        self.assertIn("group=1\n", next(chunks))
+        with self.assertRaises(RuntimeError):
+            next(chunks)
+
+
+class GenerateCompactScriptChunksTest(unittest.TestCase):
+    def testSimulationTable(self):
+        groups = [[{"nt": 4}], [{"nt": 2}, {"nt": 2}]]
+        script = "".join(GenerateCompactScriptChunks(groups, "mytpr.tpr", "gmx mdrun", 3,
+                                                     group_steps={1: (3000, 1000)}))
+        self.assertTrue(script.startswith("#!/bin/bash\n\ngmx='gmx mdrun'\ntpr=mytpr.tpr\n"))
+        self.assertIn(
+            "mapfile -t simulations <<'END_OF_SIMULATIONS'\n"
+            "1 @deffnm @nsteps -nt 4 @resetstep @tpr\n"
+            "2 @deffnm -nsteps 3000 -nt 2 -resetstep 1000 @tpr\n"
+            "2 @deffnm -nsteps 3000 -nt 2 -resetstep 1000 @tpr\n"
+            "END_OF_SIMULATIONS\n", script)
+        self.assertEqual(script.count("for i in $(seq 1 ${ntrials}); do"), 1)
+        self.assertTrue(script.endswith("\n\nexit\n"))
+        self.assertEqual(groups[0], [{"nt": 4}])
+
+    def testCpuSet(self):
+        groups = [[{"nt": 4, "pin": "off"}, {"nt": 4, "pinoffset": 4}]]
+        script = "".join(GenerateCompactScriptChunks(groups, "mytpr.tpr", "gmx mdrun", 1,
+                                                     group_cpu_sets={0: ["0-1,8-9", None]}))
+        self.assertIn("1 @taskset 0-1,8-9 @deffnm @nsteps -nt 4 -pin off @resetstep @tpr\n"
+                      "1 @deffnm @nsteps -nt 4 -pinoffset 4 @resetstep @tpr\n", script)
+        self.assertIn("$launcher $gmx $args &", script)
 
 
 class WriteOutputTest(unittest.TestCase):
@@ -216,6 +279,11 @@ class WriteOutputTest(unittest.TestCase):
         with mock.patch("builtins.open", mock.mock_open()):
             WriteRunScript("some_file", "content")
 
+    def testWritesChunks(self):
+        with mock.patch("builtins.open", mock.mock_open()) as mock_file:
+            WriteRunScript("some_file", iter(["first ", "second"]))
+        mock_file().write.assert_has_calls([mock.call("first "), mock.call("second")])
+
     def testBadWrite(self):
         with mock.patch("builtins.open", mock.mock_open()) as mock_file:
             mock_file.side_effect = FileExistsError()
@@ -0,0 +1,157 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+from unittest import mock
+
+from gromax.analysis import constructGromaxData
+from gromax.log_parser import BasicParser, LogParser, _performanceRegexOp
+from gromax.parse_cache import ParseCache, defaultCacheDirectory, openParseCache
+
+
+class ParseCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.log = os.path.join(self.tempdir.name, "component_1.log")
+        self._writeLog("Performance: 10.5\n")
+        self.parser = LogParser(ops=(_performanceRegexOp,))
+        self.cache_dir = os.path.join(self.tempdir.name, "cache")
+        os.mkdir(self.cache_dir)
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def _writeLog(self, contents: str):
+        with open(self.log, "w") as fout:
+            fout.write(contents)
+
+    def testRoundTrip(self):
+        cache = ParseCache(self.cache_dir, self.parser)
+        key = cache.fileKey(self.log)
+        self.assertIsNone(cache.get(key))
+        cache.put(key, {"performance": 10.5, "ntmpi": 2, "pme": "gpu", "noconfout": True})
+        cache.close()
+
+        cache = ParseCache(self.cache_dir, self.parser)
+        self.assertDictEqual(cache.get(cache.fileKey(self.log)),
+                             {"performance": 10.5, "ntmpi": 2, "pme": "gpu", "noconfout": True})
+        cache.close()
+
+    def testKeyIsAbsolutePath(self):
+        cache = ParseCache(self.cache_dir, self.parser)
+        self.assertEqual(cache.fileKey(os.path.relpath(self.log))[0], os.path.abspath(self.log))
+        cache.close()
+
+    def testChangedFileMisses(self):
+        cache = ParseCache(self.cache_dir, self.parser)
+        cache.put(cache.fileKey(self.log), {"performance": 10.5})
+        self._writeLog("Performance: 10.5\nmore\n")
+        self.assertIsNone(cache.get(cache.fileKey(self.log)))
+        cache.close()
+
+    def testEntriesKeyedByParser(self):
+        cache = ParseCache(self.cache_dir, self.parser)
+        cache.put(cache.fileKey(self.log), {"performance": 10.5})
+        cache.close()
+
+        cache = ParseCache(self.cache_dir, BasicParser())
+        self.assertIsNone(cache.get(cache.fileKey(self.log)))
+        cache.put(cache.fileKey(self.log), {"performance": 1.0})
+        cache.close()
+
+        cache = ParseCache(self.cache_dir, self.parser)
+        self.assertDictEqual(cache.get(cache.fileKey(self.log)), {"performance": 10.5})
+        cache.close()
+
+    def testEvictsLeastRecentlyUsed(self):
+        cache = ParseCache(self.cache_dir, self.parser, max_entries=2)
+        for i, path in enumerate(("a.log", "b.log", "c.log")):
+            with mock.patch("gromax.parse_cache.time.time", return_value=float(i)):
+                cache.put((path, 1, 1), {"performance": float(i)})
+        cache.close()
+
+        cache = ParseCache(self.cache_dir, self.parser, max_entries=2)
+        self.assertIsNone(cache.get(("a.log", 1, 1)))
+        self.assertIsNotNone(cache.get(("b.log", 1, 1)))
+        self.assertIsNotNone(cache.get(("c.log", 1, 1)))
+        cache.close()
+
+    def testEvictsBeforeClose(self):
+        cache = ParseCache(self.cache_dir, self.parser, max_entries=2)
+        with mock.patch("gromax.parse_cache._COMMIT_INTERVAL", 2):
+            for i, path in enumerate(("a.log", "b.log", "c.log", "d.log")):
+                cache.put((path, 1, 1), {"performance": float(i)})
+        connection = sqlite3.connect(os.path.join(self.cache_dir, "parse_cache.sqlite"))
+        self.assertEqual(connection.execute("SELECT COUNT(*) FROM entries").fetchone()[0], 2)
+        connection.close()
+        cache.close()
+
+    def testOpenCreatesDirectory(self):
+        cache = openParseCache(os.path.join(self.tempdir.name, "new", "cache"), self.parser)
+        self.assertIsNotNone(cache)
+        cache.close()
+
+    def testOpenFailsGracefully(self):
+        self.assertIsNone(openParseCache(os.path.join(self.log, "cache"), self.parser))
+
+    def testCloseFailureDisablesCache(self):
+        cache = ParseCache(self.cache_dir, self.parser)
+        cache._connection.close()
+        cache._connection = mock.MagicMock(wraps=cache._connection)
+        cache._connection.executemany.side_effect = sqlite3.OperationalError("disk I/O error")
+        with self.assertLogs("gromax", level="WARNING"):
+            cache.close()
+        self.assertIsNone(cache.get(cache.fileKey(self.log)))
+
+    def testPutFailureDisablesCache(self):
+        cache = ParseCache(self.cache_dir, self.parser)
+        cache._connection.close()
+        with self.assertLogs("gromax", level="WARNING"):
+            cache.put(cache.fileKey(self.log), {"performance": 10.5})
+        self.assertIsNone(cache.get(cache.fileKey(self.log)))
+        cache.close()
+
+
+class DefaultCacheDirectoryTest(unittest.TestCase):
+    def testXdgCacheHome(self):
+        self.assertEqual(defaultCacheDirectory({"XDG_CACHE_HOME": "/scratch/cache"}), "/scratch/cache/gromax")
+
+    def testHomeCache(self):
+        with mock.patch("os.path.expanduser", return_value="/home/user"):
+            self.assertEqual(defaultCacheDirectory({}), "/home/user/.cache/gromax")
+
+
+class ConstructGromaxDataCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.log = os.path.join(self.tempdir.name, "component_1.log")
+        with open(self.log, "w") as fout:
+            fout.write("Command line:\n  gmx mdrun -nt 4\n\nPerformance: 10.5\n")
+        self.structure = {0: {0: {0: self.log}}}
+        self.parser = BasicParser()
+        self.cache_dir = os.path.join(self.tempdir.name, "cache")
+        os.mkdir(self.cache_dir)
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def testCachedLogNotReparsed(self):
+        cache = ParseCache(self.cache_dir, self.parser)
+        expected = constructGromaxData(self.structure, parser=self.parser, cache=cache).groupStatistics()
+        cache.close()
+
+        cache = ParseCache(self.cache_dir, self.parser)
+        with mock.patch("gromax.analysis.parseLogFile") as mock_parse:
+            result = constructGromaxData(self.structure, parser=self.parser, cache=cache).groupStatistics()
+            mock_parse.assert_not_called()
+        cache.close()
+        self.assertDictEqual(result, expected)
+
+    def testFailuresNotCached(self):
+        with open(self.log, "w") as fout:
+            fout.write("Command line:\n  gmx mdrun -nt 4\n\n")
+        cache = ParseCache(self.cache_dir, self.parser)
+        self.assertDictEqual(constructGromaxData(self.structure, parser=self.parser, cache=cache).groupStatistics(),
+                             {})
+        self.assertIsNone(cache.get(cache.fileKey(self.log)))
+        cache.close()
@@ -0,0 +1,110 @@
+import csv
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from gromax.results_table import ResultsTable, exportFormat
+
+
+class ResultsTableTest(unittest.TestCase):
+    def setUp(self):
+        self.table = ResultsTable()
+        self.table.insertRows([
+            ((1, 0, 0), {"performance": 10.0, "nt": 4, "full_command_line": "gmx mdrun -nt 4"}),
+            ((0, 0, 0), {"performance": 20.0, "full_command_line": "gmx mdrun -nt 8"}),
+        ])
+
+    def testInsertRows(self):
+        self.assertEqual(len(self.table), 2)
+        self.assertEqual(self.table.columnNames(), ["performance", "nt", "full_command_line"])
+        self.assertEqual(self.table.column("nt"), [4, None])
+        self.assertEqual(self.table.row((0, 0, 0)), {"performance": 20.0, "full_command_line": "gmx mdrun -nt 8"})
+
+    def testSetValueUpdatesRow(self):
+        self.table.setValue((0, 0, 0), "nt", 8)
+        self.table.setValue((0, 0, 0), "performance", 21.0)
+        self.assertEqual(len(self.table), 2)
+        self.assertEqual(self.table.column("nt"), [4, 8])
+        self.assertEqual(self.table.column("performance"), [10.0, 21.0])
+
+    def testStringsAreShared(self):
+        self.table.insertRows([((1, 1, 0), {"full_command_line": "".join(["gmx mdrun", " -nt 4"])})])
+        commands = self.table.column("full_command_line")
+        self.assertIs(commands[0], commands[2])
+
+    def testRemoveRows(self):
+        self.table.removeRows({(1, 0, 0), (5, 5, 5)})
+        self.assertEqual(self.table.keys(), [(0, 0, 0)])
+        self.assertEqual(self.table.column("performance"), [20.0])
+        self.table.setValue((2, 0, 0), "performance", 5.0)
+        self.assertEqual(self.table.row((2, 0, 0)), {"performance": 5.0})
+
+    def testRecords(self):
+        self.table.setValue((0, 0, 0), "cycle_accounting", {"Force": {"wall_time": 1.5, "percent": 50.0}})
+        records = list(self.table.records())
+        self.assertEqual(records[0], {"group": 1, "trial": 1, "component": 1, "performance": 20.0,
+                                      "full_command_line": "gmx mdrun -nt 8",
+                                      "cycle_accounting": {"Force": {"wall_time": 1.5, "percent": 50.0}}})
+        self.assertEqual(records[1]["group"], 2)
+        flat = list(self.table.records(flatten=True))[0]
+        self.assertEqual(flat["cycle_accounting:Force:percent"], 50.0)
+        self.assertNotIn("cycle_accounting", flat)
+
+
+class ExportTest(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.table = ResultsTable()
+        self.table.insertRows([
+            ((0, 0, 0), {"performance": 20.0, "cycle_accounting": {"Force": {"wall_time": 1.5, "percent": 50.0}}}),
+            ((0, 0, 1), {"performance": 10.0, "nt": 4}),
+        ])
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def testCsv(self):
+        path = os.path.join(self.tempdir.name, "results.csv")
+        self.table.export(path)
+        with open(path, newline="") as fin:
+            rows = list(csv.DictReader(fin))
+        self.assertEqual(list(rows[0]), ["group", "trial", "component", "performance",
+                                         "cycle_accounting:Force:wall_time", "cycle_accounting:Force:percent", "nt"])
+        self.assertEqual(rows[0]["cycle_accounting:Force:percent"], "50.0")
+        self.assertEqual(rows[1]["component"], "2")
+        self.assertEqual(rows[1]["cycle_accounting:Force:percent"], "")
+
+    def testJsonLines(self):
+        path = os.path.join(self.tempdir.name, "results.jsonl")
+        self.table.export(path)
+        with open(path) as fin:
+            records = [json.loads(line) for line in fin]
+        self.assertEqual(records, list(self.table.records()))
+
+    def testParquetRequiresPyarrow(self):
+        with mock.patch.dict("sys.modules", {"pyarrow": None}):
+            with self.assertRaises(ImportError):
+                self.table.export(os.path.join(self.tempdir.name, "results.parquet"))
+
+    def testUnknownFormat(self):
+        with self.assertRaises(ValueError):
+            self.table.export(os.path.join(self.tempdir.name, "results.csv"), export_format="xlsx")
+
+
+class ExportFormatTest(unittest.TestCase):
+    def testKnownExtensions(self):
+        self.assertEqual(exportFormat("results.csv"), "csv")
+        self.assertEqual(exportFormat("/path/to/results.JSONL"), "jsonl")
+        self.assertEqual(exportFormat("results.parquet"), "parquet")
+
+    def testUnknownExtension(self):
+        for path in ("results.txt", "results"):
+            with self.subTest(path=path):
+                with self.assertRaises(ValueError):
+                    exportFormat(path)
+
+
+if __name__ == "__main__":
+    unittest.main()
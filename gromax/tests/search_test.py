@@ -0,0 +1,287 @@
+import os
+import sys
+import tempfile
+import unittest
+from typing import Dict, List
+
+import gromax.testutils as testutils
+from gromax.analysis import IncrementalAnalysis
+from gromax.combination_generator import GenerateOptions, ParameterSetGroup, createRunOptionsForConfigGroup
+from gromax.executor import ExecuteOptions
+from gromax.hardware_config import HardwareConfig, generateConfigSplitOptions
+from gromax.search import AdaptiveSearchOptions, AdaptiveTrialOptions, GaussianProcess, SuccessiveHalvingOptions, \
+    adaptiveSearch, encodeGroup, expectedImprovement, finishedGroups, roundDirectory, roundExecuteOptions, \
+    runAdaptiveSearch, runAdaptiveTrials, runSuccessiveHalving, selectTopGroups
+
+
+def _fakeGmx() -> str:
+    return "{} {} mdrun".format(sys.executable, testutils.get_relative_path("integration", "testdata", "fake_gmx.py"))
+
+
+def _stat(performance: float, concurrent_sims: int) -> dict:
+    return {"performance": performance, "concurrent_sims": concurrent_sims}
+
+
+class SelectTopGroupsTest(unittest.TestCase):
+    def testKeepsFractionRoundedUp(self):
+        stats = {0: _stat(10, 1), 1: _stat(40, 1), 2: _stat(30, 1), 3: _stat(20, 1)}
+        self.assertEqual(selectTopGroups(stats, 0.5), [1, 2])
+        self.assertEqual(selectTopGroups(stats, 0.3), [1, 2])
+        self.assertEqual(selectTopGroups(stats, 1.0), [0, 1, 2, 3])
+
+    def testKeepsAtLeastOne(self):
+        self.assertEqual(selectTopGroups({3: _stat(10, 1), 4: _stat(20, 1)}, 0.01), [4])
+
+    def testKeepsBestSingleSimulation(self):
+        stats = {0: _stat(10, 1), 1: _stat(40, 2), 2: _stat(30, 4), 3: _stat(20, 1)}
+        self.assertEqual(selectTopGroups(stats, 0.25), [1, 3])
+
+    def testEmpty(self):
+        self.assertEqual(selectTopGroups({}, 0.5), [])
+
+
+class RoundExecuteOptionsTest(unittest.TestCase):
+    def setUp(self):
+        self.options = ExecuteOptions(num_trials=3, nsteps=18000, resetstep=9000, timeout=5.0)
+        self.halving = SuccessiveHalvingOptions(num_rounds=3, step_factor=3)
+
+    def testFinalRoundUsesFullOptions(self):
+        self.assertEqual(roundExecuteOptions(self.options, self.halving, 2), self.options)
+
+    def testEarlierRoundsAreShorter(self):
+        first: ExecuteOptions = roundExecuteOptions(self.options, self.halving, 0)
+        self.assertEqual((first.nsteps, first.resetstep, first.num_trials), (2000, 1000, 1))
+        second: ExecuteOptions = roundExecuteOptions(self.options, self.halving, 1)
+        self.assertEqual((second.nsteps, second.resetstep, second.num_trials), (6000, 3000, 2))
+        self.assertEqual(second.timeout, 5.0)
+
+
+class RunSuccessiveHalvingTest(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.options = ExecuteOptions(gmx=_fakeGmx(), tpr="topol.tpr", num_trials=2, nsteps=900, resetstep=600)
+        # The fake gmx reports 10 ns/day per thread.
+        self.groups = {0: [{"nt": 1}], 1: [{"nt": 4}], 2: [{"nt": 2}], 3: [{"nt": 3}]}
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def testPromotesBestGroups(self):
+        halving = SuccessiveHalvingOptions(num_rounds=3, keep_fraction=0.5, step_factor=3)
+        stats = runSuccessiveHalving(self.groups, self.tempdir.name, self.options, halving)
+        self.assertEqual(list(stats), [1])
+        self.assertAlmostEqual(stats[1]["performance"], 40.0)
+        self.assertEqual(sorted(os.listdir(roundDirectory(self.tempdir.name, 0))),
+                         ["group_1", "group_2", "group_3", "group_4"])
+        self.assertEqual(sorted(os.listdir(roundDirectory(self.tempdir.name, 1))), ["group_2", "group_4"])
+        self.assertEqual(sorted(os.listdir(roundDirectory(self.tempdir.name, 2))), ["group_2"])
+        with open(os.path.join(roundDirectory(self.tempdir.name, 0), "group_2", "trial_1",
+                               "group_2_trial_1_component_1.log")) as fin:
+            self.assertIn("-nsteps 100", fin.read())
+
+    def testSingleSurvivorSkipsToFinalRound(self):
+        halving = SuccessiveHalvingOptions(num_rounds=3, keep_fraction=0.1, step_factor=3)
+        stats = runSuccessiveHalving(self.groups, self.tempdir.name, self.options, halving)
+        self.assertEqual(list(stats), [1])
+        self.assertFalse(os.path.exists(roundDirectory(self.tempdir.name, 1)))
+        self.assertEqual(sorted(os.listdir(roundDirectory(self.tempdir.name, 2))), ["group_2"])
+
+
+def _exhaustiveGroups() -> Dict[int, ParameterSetGroup]:
+    hw_config = HardwareConfig(cpu_ids=list(range(32)), gpu_ids=[0, 1])
+    generate_options = GenerateOptions(max_sims_per_gpu=4, generate_exhaustive_options=True)
+    groups: List[ParameterSetGroup] = []
+    for config_split in generateConfigSplitOptions(hw_config, max_sims_per_gpu=4):
+        groups.extend(createRunOptionsForConfigGroup(config_split, "2020", generate_options))
+    return dict(enumerate(groups))
+
+
+def _syntheticPerformance(group: ParameterSetGroup) -> float:
+    """
+        Aggregate performance that grows sublinearly with concurrent simulations, rewards GPU offload and penalizes
+        extra ranks.
+    """
+    params = group[0]
+    per_sim: float = 100.0 / len(group) ** 0.7
+    per_sim *= 1.3 if params.get("update") == "gpu" else 1.0
+    per_sim *= 1.2 if params.get("pme") == "gpu" else 1.0
+    per_sim *= 1.1 if params.get("bonded") == "gpu" else 1.0
+    per_sim *= 1 - 0.08 * (params["ntmpi"] - 1)
+    return len(group) * per_sim
+
+
+class EncodeGroupTest(unittest.TestCase):
+    def testEncoding(self):
+        group = [{"nt": 8, "ntmpi": 2, "ntomp": 4, "nb": "gpu", "pme": "gpu", "update": "cpu"}] * 4
+        self.assertEqual(encodeGroup(group), [2.0, 1.0, 2.0, 1.0, 1.0, 0.0, 0.0])
+
+    def testDefaults(self):
+        self.assertEqual(encodeGroup([{"nt": 4}]), [0.0, 0.0, 2.0, 0.0, 0.0, 0.0, 0.0])
+
+
+class GaussianProcessTest(unittest.TestCase):
+    def testInterpolatesObservations(self):
+        model = GaussianProcess([[0.0], [0.5], [1.0]], [10.0, 20.0, 15.0], length_scale=0.3, noise=1e-6)
+        for point, value in (([0.0], 10.0), ([0.5], 20.0), ([1.0], 15.0)):
+            mean, std = model.predict(point)
+            self.assertAlmostEqual(mean, value, places=3)
+            self.assertLess(std, 0.1)
+
+    def testUncertainAwayFromObservations(self):
+        model = GaussianProcess([[0.0], [0.1]], [10.0, 20.0], length_scale=0.1, noise=1e-6)
+        mean, std = model.predict([5.0])
+        self.assertAlmostEqual(mean, 15.0, places=3)
+        self.assertAlmostEqual(std, 5.0, places=3)
+
+
+class ExpectedImprovementTest(unittest.TestCase):
+    def testCertainPoints(self):
+        self.assertEqual(expectedImprovement(12.0, 0.0, 10.0), 2.0)
+        self.assertEqual(expectedImprovement(8.0, 0.0, 10.0), 0.0)
+
+    def testUncertaintyAddsImprovement(self):
+        self.assertAlmostEqual(expectedImprovement(10.0, 1.0, 10.0), 0.398942, places=5)
+        self.assertGreater(expectedImprovement(10.0, 2.0, 10.0), expectedImprovement(10.0, 1.0, 10.0))
+        self.assertGreater(expectedImprovement(11.0, 1.0, 10.0), expectedImprovement(10.0, 1.0, 10.0))
+
+
+class AdaptiveSearchTest(unittest.TestCase):
+    def setUp(self):
+        self.groups = _exhaustiveGroups()
+        self.best: int = max(self.groups, key=lambda index: _syntheticPerformance(self.groups[index]))
+
+    def _objective(self, index: int) -> float:
+        return _syntheticPerformance(self.groups[index])
+
+    def testFindsBestOnSyntheticSurface(self):
+        for seed in range(5):
+            with self.subTest(seed=seed):
+                results = adaptiveSearch(self.groups, self._objective, AdaptiveSearchOptions(seed=seed))
+                self.assertIn(self.best, results)
+                self.assertLess(len(results), len(self.groups) // 2)
+
+    def testRespectsBudget(self):
+        results = adaptiveSearch(self.groups, self._objective, AdaptiveSearchOptions(budget=6, ei_threshold=0.0))
+        self.assertEqual(len(results), 6)
+
+    def testZeroThresholdRunsEverything(self):
+        groups = {index: self.groups[index] for index in range(10)}
+        results = adaptiveSearch(groups, self._objective, AdaptiveSearchOptions(ei_threshold=0.0, noise=0.1))
+        self.assertEqual(sorted(results), list(range(10)))
+
+    def testToleratesFailedGroups(self):
+        groups = {index: self.groups[index] for index in range(6)}
+        results = adaptiveSearch(groups, lambda index: None, AdaptiveSearchOptions(budget=4))
+        self.assertEqual(len(results), 4)
+        self.assertTrue(all(value is None for value in results.values()))
+
+
+class RunAdaptiveSearchTest(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.options = ExecuteOptions(gmx=_fakeGmx(), tpr="topol.tpr", num_trials=1, nsteps=900, resetstep=600)
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def testRunsChosenGroups(self):
+        groups = {0: [{"nt": 2}, {"nt": 2}], 1: [{"nt": 4}], 2: [{"nt": 1}, {"nt": 1}]}
+        stats = runAdaptiveSearch(groups, self.tempdir.name, self.options,
+                                  AdaptiveSearchOptions(budget=2, initial_samples=2))
+        self.assertEqual(len(os.listdir(self.tempdir.name)), len(stats))
+        self.assertIn(1, stats)
+        self.assertAlmostEqual(stats[1]["performance"], 40.0)
+
+    def testRunsSingleSimulationIfNotChosen(self):
+        groups = {0: [{"nt": 2}, {"nt": 2}], 1: [{"nt": 4}]}
+        stats = runAdaptiveSearch(groups, self.tempdir.name, self.options,
+                                  AdaptiveSearchOptions(budget=1, initial_samples=1, seed=1))
+        # Group 0 is the initial sample and uses up the budget.
+        self.assertEqual(sorted(stats), [0, 1])
+
+    def testParsesEachLogOnce(self):
+        groups = {0: [{"nt": 2}, {"nt": 2}], 1: [{"nt": 4}], 2: [{"nt": 1}, {"nt": 1}]}
+        analysis = IncrementalAnalysis()
+        parsed: List[str] = []
+        update = analysis.update
+
+        def recordingUpdate(logs):
+            parsed.extend(path for _, path in logs)
+            return update(logs)
+
+        analysis.update = recordingUpdate
+        stats = runAdaptiveSearch(groups, self.tempdir.name, self.options,
+                                  AdaptiveSearchOptions(budget=3, initial_samples=3), new_analysis=lambda: analysis)
+        self.assertEqual(sorted(stats), [0, 1, 2])
+        self.assertEqual(len(parsed), 5)
+        self.assertEqual(len(set(parsed)), 5)
+
+
+def _trialStat(performance: float, standard_error: float, num_trials: int) -> dict:
+    return {"performance": performance, "standard_error": standard_error, "num_trials": num_trials}
+
+
+class FinishedGroupsTest(unittest.TestCase):
+    def setUp(self):
+        self.options = AdaptiveTrialOptions(rel_se_threshold=0.02, min_trials=3, max_trials=6, contention_z=2.0)
+
+    def testConverged(self):
+        stats = {0: _trialStat(100.0, 1.0, 3), 1: _trialStat(100.0, 5.0, 3)}
+        self.assertEqual(list(finishedGroups(stats, [0, 1], self.options)), [0])
+
+    def testOutOfContention(self):
+        # Group 1 is at most 60 + 2 * 5 = 70, the best group at least 100 - 2 * 5 = 90.
+        stats = {0: _trialStat(100.0, 5.0, 3), 1: _trialStat(60.0, 5.0, 3), 2: _trialStat(85.0, 5.0, 3)}
+        self.assertEqual(list(finishedGroups(stats, [0, 1, 2], self.options)), [1])
+
+    def testMinAndMaxTrials(self):
+        stats = {0: _trialStat(100.0, 10.0, 6), 1: _trialStat(100.0, 0.0, 2), 2: _trialStat(10.0, 1.0, 2)}
+        self.assertEqual(list(finishedGroups(stats, [0, 1, 2], self.options)), [0])
+
+    def testGroupsWithoutResults(self):
+        stats = {0: _trialStat(100.0, 10.0, 3)}
+        self.assertEqual(list(finishedGroups(stats, [0, 1], self.options)), [1])
+
+    def testOnlyActiveGroups(self):
+        stats = {0: _trialStat(100.0, 0.0, 3), 1: _trialStat(100.0, 0.0, 3)}
+        self.assertEqual(list(finishedGroups(stats, [1], self.options)), [1])
+
+
+class RunAdaptiveTrialsTest(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.options = ExecuteOptions(gmx=_fakeGmx(), tpr="topol.tpr", num_trials=1, nsteps=900, resetstep=600)
+        self.groups = {0: [{"nt": 2}, {"nt": 2}], 1: [{"nt": 4}]}
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def testStopsAtMinimumTrialsWithoutNoise(self):
+        stats = runAdaptiveTrials(self.groups, self.tempdir.name, self.options,
+                                  AdaptiveTrialOptions(min_trials=3, max_trials=5))
+        self.assertEqual(sorted(stats), [0, 1])
+        self.assertEqual(stats[1]["num_trials"], 3)
+        self.assertEqual(sorted(os.listdir(os.path.join(self.tempdir.name, "group_2"))),
+                         ["trial_1", "trial_2", "trial_3"])
+
+    def testNoisyGroupsRunMaxTrials(self):
+        noisy_stats = {0: _trialStat(40.0, 4.0, 1), 1: _trialStat(40.0, 4.0, 1)}
+        passes: List[list] = []
+
+        class NoisyAnalysis(object):
+            stats: dict = {}
+
+            def update(self, logs):
+                passes.append(logs)
+                self.stats = {group: dict(stat, num_trials=len(passes)) for group, stat in noisy_stats.items()}
+
+        runAdaptiveTrials(self.groups, self.tempdir.name, self.options,
+                          AdaptiveTrialOptions(min_trials=2, max_trials=4), new_analysis=NoisyAnalysis)
+        self.assertEqual(len(passes), 4)
+        self.assertEqual(len(os.listdir(os.path.join(self.tempdir.name, "group_1"))), 4)
+        # Each pass adds only its own trial's logs.
+        self.assertEqual([sorted({key[1] for key, _ in logs}) for logs in passes], [[0], [1], [2], [3]])
+
+
+if __name__ == "__main__":
+    unittest.main()
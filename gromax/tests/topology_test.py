@@ -0,0 +1,165 @@
+import os
+import tempfile
+import unittest
+
+import gromax.testutils as testutils
+from gromax.topology import CpuTopology, Topology, describeMisalignment, parseCpuList, readGpuNumaNodes, \
+    readTopology
+
+
+class ParseCpuListTest(unittest.TestCase):
+    def testFormats(self):
+        self.assertEqual(parseCpuList("0-3,8-11\n"), [0, 1, 2, 3, 8, 9, 10, 11])
+        self.assertEqual(parseCpuList("5"), [5])
+        self.assertEqual(parseCpuList(""), [])
+
+    def testMalformed(self):
+        for cpu_list in ("0-1-2", "a", "0-b"):
+            with self.subTest(cpu_list=cpu_list):
+                with self.assertRaises(ValueError):
+                    parseCpuList(cpu_list)
+
+
+class ReadTopologyTest(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.root = self.tempdir.name
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def testSmtAndNuma(self):
+        testutils.writeSysfsTree(self.root, num_packages=2, cores_per_package=4, threads_per_core=2,
+                                 numa_nodes_per_package=2)
+        cpus = readTopology(self.root).cpus
+        self.assertEqual(sorted(cpus), list(range(16)))
+        self.assertEqual(cpus[0], CpuTopology(package=0, numa_node=0, l3_cache=0, core=0))
+        self.assertEqual(cpus[10], CpuTopology(package=0, numa_node=1, l3_cache=2, core=2))
+        self.assertEqual(cpus[13], CpuTopology(package=1, numa_node=2, l3_cache=4, core=5))
+
+    def testMultipleL3PerNode(self):
+        testutils.writeSysfsTree(self.root, num_packages=1, cores_per_package=8, l3_caches_per_numa_node=2)
+        topology = readTopology(self.root)
+        self.assertEqual([topology.domain(cpu, "l3_cache") for cpu in range(8)], [0] * 4 + [4] * 4)
+        self.assertEqual({topology.domain(cpu, "numa_node") for cpu in range(8)}, {0})
+
+    def testMissingNumaAndCacheInformation(self):
+        testutils.writeSysfsTree(self.root, num_packages=2, cores_per_package=2)
+        for cpu in range(4):
+            os.remove(os.path.join(self.root, "devices", "system", "cpu", "cpu{}".format(cpu), "cache", "index3",
+                                   "level"))
+            os.remove(os.path.join(self.root, "devices", "system", "cpu", "cpu{}".format(cpu), "cache", "index3",
+                                   "shared_cpu_list"))
+            os.rmdir(os.path.join(self.root, "devices", "system", "cpu", "cpu{}".format(cpu), "cache", "index3"))
+        for node in range(2):
+            os.remove(os.path.join(self.root, "devices", "system", "node", "node{}".format(node), "cpulist"))
+            os.rmdir(os.path.join(self.root, "devices", "system", "node", "node{}".format(node)))
+        cpus = readTopology(self.root).cpus
+        # The L3 cache domain falls back to the package.
+        self.assertEqual(cpus[3], CpuTopology(package=1, numa_node=0, l3_cache=2, core=3))
+
+    def testOfflineCpusAreSkipped(self):
+        testutils.writeSysfsTree(self.root, num_packages=1, cores_per_package=2)
+        os.makedirs(os.path.join(self.root, "devices", "system", "cpu", "cpu2"))
+        os.makedirs(os.path.join(self.root, "devices", "system", "cpu", "cpufreq"))
+        self.assertEqual(sorted(readTopology(self.root).cpus), [0, 1])
+
+    def testUnreadable(self):
+        self.assertIsNone(readTopology(os.path.join(self.root, "missing")))
+        os.makedirs(os.path.join(self.root, "devices", "system", "cpu"))
+        self.assertIsNone(readTopology(self.root))
+        testutils.writeSysfsTree(self.root, num_packages=1, cores_per_package=2)
+        with open(os.path.join(self.root, "devices", "system", "cpu", "cpu1", "topology", "physical_package_id"),
+                  "w") as fout:
+            fout.write("garbage")
+        self.assertIsNone(readTopology(self.root))
+
+
+class ReadGpuNumaNodesTest(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.root = self.tempdir.name
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def testGpusInBusOrder(self):
+        testutils.writeSysfsGpus(self.root, [0, 0, 1, 1])
+        self.assertEqual(readGpuNumaNodes(self.root), {0: 0, 1: 0, 2: 1, 3: 1})
+
+    def testUnknownNodesAreSkipped(self):
+        testutils.writeSysfsGpus(self.root, [-1, 1])
+        self.assertEqual(readGpuNumaNodes(self.root), {1: 1})
+
+    def testUnreadable(self):
+        self.assertEqual(readGpuNumaNodes(self.root), {})
+        testutils.writeSysfsGpus(self.root, [0])
+        with open(os.path.join(self.root, "bus", "pci", "devices", "0000:10:00.0", "numa_node"), "w") as fout:
+            fout.write("garbage")
+        self.assertEqual(readGpuNumaNodes(self.root), {})
+
+
+class TopologyAlignmentTest(unittest.TestCase):
+    def setUp(self):
+        # 2 NUMA nodes of 2 cores with 2 threads each, one L3 cache per node.
+        self.topology = Topology({
+            cpu: CpuTopology(package=0, numa_node=cpu // 4, l3_cache=cpu - cpu % 4, core=cpu - cpu % 2)
+            for cpu in range(8)
+        })
+
+    def testCovers(self):
+        self.assertTrue(self.topology.covers(range(8)))
+        self.assertFalse(self.topology.covers([7, 8]))
+
+    def testAlignmentKey(self):
+        self.assertEqual(self.topology.alignmentKey([range(8)]), (0, 0, 0))
+        self.assertEqual(self.topology.alignmentKey([range(4), range(4, 8)]), (0, 0, 0))
+        self.assertEqual(self.topology.alignmentKey([range(0, 8, 2), range(1, 8, 2)]), (2, 2, 2))
+        self.assertEqual(self.topology.alignmentKey([[cpu] for cpu in range(8)]), (8, 8, 8))
+
+    def testUnusedCpusDoNotCount(self):
+        # Using one thread of each core leaves the other threads idle, which does not misalign the split.
+        self.assertEqual(self.topology.alignmentKey([[0, 2], [4, 6]]), (0, 0, 0))
+        self.assertEqual(self.topology.alignmentKey([[0], [2], [4], [6]]), (4, 4, 0))
+
+    def testFirstThreads(self):
+        self.assertEqual(self.topology.firstThreads(range(8)), [0, 2, 4, 6])
+        self.assertEqual(self.topology.firstThreads([7, 5, 4]), [4, 7])
+
+    def testDomains(self):
+        self.assertEqual(self.topology.domains([5, 0, 1, 4], "numa_node"), {0: [0, 1], 1: [4, 5]})
+        self.assertEqual(self.topology.domains(range(4), "core"), {0: [0, 1], 2: [2, 3]})
+
+    def testLocalityOrder(self):
+        # Linux numbering of 2 NUMA nodes of 2 cores, with CPUs 4-7 the second hardware threads of 0-3.
+        topology = Topology({
+            cpu: CpuTopology(package=cpu % 4 // 2, numa_node=cpu % 4 // 2, l3_cache=cpu % 4 // 2 * 2, core=cpu % 4)
+            for cpu in range(8)
+        })
+        self.assertEqual(topology.localityOrder(range(8)), [0, 4, 1, 5, 2, 6, 3, 7])
+        self.assertEqual(topology.localityOrder([6, 2, 1]), [1, 2, 6])
+        self.assertEqual(self.topology.localityOrder(range(8)), list(range(8)))
+
+    def testNumbersLikeMdrun(self):
+        self.assertTrue(self.topology.numbers_like_mdrun)
+        linux_numbering = Topology({cpu: CpuTopology(package=0, numa_node=0, l3_cache=0, core=cpu % 4)
+                                    for cpu in range(8)})
+        self.assertFalse(linux_numbering.numbers_like_mdrun)
+        # Offline CPUs leave gaps in the IDs, which mdrun does not count.
+        self.assertFalse(Topology({cpu: CpuTopology(package=0, numa_node=0, l3_cache=0, core=cpu)
+                                   for cpu in (0, 1, 3)}).numbers_like_mdrun)
+
+    def testNumaNode(self):
+        self.assertEqual(self.topology.numaNode(range(4)), 0)
+        self.assertEqual(self.topology.numaNode([2, 3, 4]), 0)
+        self.assertEqual(self.topology.numaNode([3, 4, 5]), 1)
+        self.assertIsNone(self.topology.numaNode([7, 8]))
+        self.assertIsNone(self.topology.numaNode([]))
+
+    def testDescribeMisalignment(self):
+        self.assertEqual(describeMisalignment(self.topology, [range(4), range(4, 8)]), "")
+        self.assertEqual(describeMisalignment(self.topology, [[0, 1], [2, 3]]), "NUMA node, L3 cache")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -51,3 +51,55 @@ def mockResultString(result_val: float = None):
     if result_val is not None:
         perf = "Performance: {:f}".format(result_val)
     return pre_string + perf + post_string
+
+
+def writeSysfsTree(root: str, num_packages: int, cores_per_package: int, threads_per_core: int = 1,
+                   numa_nodes_per_package: int = 1, l3_caches_per_numa_node: int = 1):
+    """
+        Writes the CPU and NUMA node parts of a sysfs tree under root, numbering CPUs as Linux does on x86: the first
+        hardware thread of every core comes first, then the second thread of every core, and so on.
+    """
+    num_cores: int = num_packages * cores_per_package
+    cores_per_node: int = cores_per_package // numa_nodes_per_package
+    cores_per_l3: int = cores_per_node // l3_caches_per_numa_node
+
+    def cpuList(cores):
+        return ",".join(str(core + thread * num_cores) for thread in range(threads_per_core) for core in cores)
+
+    def write(path, content):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as fout:
+            fout.write(content + "\n")
+
+    cpu_dir = os.path.join(root, "devices", "system", "cpu")
+    for core in range(num_cores):
+        l3_start = core - core % cores_per_l3
+        for thread in range(threads_per_core):
+            directory = os.path.join(cpu_dir, "cpu{}".format(core + thread * num_cores))
+            write(os.path.join(directory, "topology", "physical_package_id"), str(core // cores_per_package))
+            write(os.path.join(directory, "topology", "core_id"), str(core % cores_per_package))
+            write(os.path.join(directory, "topology", "thread_siblings_list"), cpuList([core]))
+            write(os.path.join(directory, "cache", "index0", "level"), "1")
+            write(os.path.join(directory, "cache", "index0", "shared_cpu_list"), cpuList([core]))
+            write(os.path.join(directory, "cache", "index3", "level"), "3")
+            write(os.path.join(directory, "cache", "index3", "shared_cpu_list"),
+                  cpuList(range(l3_start, l3_start + cores_per_l3)))
+    for node in range(num_packages * numa_nodes_per_package):
+        write(os.path.join(root, "devices", "system", "node", "node{}".format(node), "cpulist"),
+              cpuList(range(node * cores_per_node, (node + 1) * cores_per_node)))
+
+
+def writeSysfsGpus(root: str, numa_nodes):
+    """
+        Writes PCI devices under root for NVIDIA GPUs on the given NUMA nodes, in order, with an onboard VGA
+        controller and a network card in between that are not GPUs.
+    """
+    devices = [("0000:02:00.0", "0x1a03", "0x030000", 0), ("0000:05:00.0", "0x15b3", "0x020000", 0)]
+    devices.extend(("0000:{:02x}:00.0".format(0x10 * (i + 1)), "0x10de", "0x030200", node)
+                   for i, node in enumerate(numa_nodes))
+    for address, vendor, device_class, node in devices:
+        directory = os.path.join(root, "bus", "pci", "devices", address)
+        os.makedirs(directory, exist_ok=True)
+        for name, content in (("vendor", vendor), ("class", device_class), ("numa_node", str(node))):
+            with open(os.path.join(directory, name), "w") as fout:
+                fout.write(content + "\n")
@@ -0,0 +1,269 @@
+import logging
+import os
+import re
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+"""
+    Model of the CPU topology of a node, read from sysfs, used to prefer hardware splits whose simulations do not
+    straddle NUMA nodes, L3 cache domains or physical cores, and to give simulations GPUs on their own NUMA node.
+"""
+
+DEFAULT_SYSFS_ROOT: str = "/sys"
+
+# Topology levels, from coarsest to finest. Alignment is compared level by level in this order.
+TOPOLOGY_LEVELS: Tuple[str, ...] = ("numa_node", "l3_cache", "core")
+
+_CPU_DIR_RE = re.compile(r"cpu([0-9]+)")
+_NODE_DIR_RE = re.compile(r"node([0-9]+)")
+_CACHE_DIR_RE = re.compile(r"index[0-9]+")
+
+# PCI vendor IDs of NVIDIA and AMD, and the PCI class prefix of display controllers, which includes 3D controllers.
+_GPU_VENDORS: Tuple[str, ...] = ("0x10de", "0x1002")
+_DISPLAY_CONTROLLER_CLASS: str = "0x03"
+
+
+@dataclass(frozen=True)
+class CpuTopology:
+    """
+        Location of a logical CPU. Each domain is identified by the lowest CPU ID in it, except NUMA nodes, which use
+        the node number.
+    """
+    package: int
+    numa_node: int
+    l3_cache: int
+    core: int
+
+
+def parseCpuList(cpu_list: str) -> List[int]:
+    """
+        Parses a sysfs CPU list such as "0-3,8-11".
+
+        Raises ValueError for malformed lists.
+    """
+    result: List[int] = []
+    for item in cpu_list.strip().split(","):
+        if not item:
+            continue
+        bounds: List[str] = item.split("-")
+        if len(bounds) > 2:
+            raise ValueError("Invalid CPU list entry '{}'".format(item))
+        result.extend(range(int(bounds[0]), int(bounds[-1]) + 1))
+    return result
+
+
+class Topology(object):
+    """
+        CPU topology of a node, keyed by logical CPU ID.
+    """
+    def __init__(self, cpus: Dict[int, CpuTopology]):
+        self._cpus: Dict[int, CpuTopology] = dict(cpus)
+        self._numbers_like_mdrun: bool = self.localityOrder(self._cpus) == list(range(len(self._cpus)))
+
+    @property
+    def cpus(self) -> Dict[int, CpuTopology]:
+        return dict(self._cpus)
+
+    @property
+    def num_cpus(self) -> int:
+        return len(self._cpus)
+
+    @property
+    def numbers_like_mdrun(self) -> bool:
+        """
+            Whether the CPU IDs are the logical CPU indices that mdrun's -pinoffset and -pinstride count in, i.e. they
+            run from 0 with the hardware threads of each core adjacent. Most x86 Linux nodes number the first thread
+            of every core before any second thread, so their CPU IDs are not mdrun indices.
+        """
+        return self._numbers_like_mdrun
+
+    def covers(self, cpu_ids: Iterable[int]) -> bool:
+        """
+            Returns whether the topology of every given CPU is known.
+        """
+        return all(cpu in self._cpus for cpu in cpu_ids)
+
+    def domain(self, cpu: int, level: str) -> int:
+        return getattr(self._cpus[cpu], level)
+
+    def firstThreads(self, cpu_ids: Iterable[int]) -> List[int]:
+        """
+            Returns the lowest of the given CPUs on each physical core, in ascending order. All CPUs must be known.
+        """
+        first_threads: Dict[int, int] = {}
+        for cpu in cpu_ids:
+            core: int = self._cpus[cpu].core
+            first_threads[core] = min(cpu, first_threads.get(core, cpu))
+        return sorted(first_threads.values())
+
+    def domains(self, cpu_ids: Iterable[int], level: str) -> Dict[int, List[int]]:
+        """
+            Returns the given CPUs grouped by their domain of the given level, in ascending order. All CPUs must be
+            known.
+        """
+        result: Dict[int, List[int]] = {}
+        for cpu in sorted(cpu_ids):
+            result.setdefault(self.domain(cpu, level), []).append(cpu)
+        return dict(sorted(result.items()))
+
+    def localityOrder(self, cpu_ids: Iterable[int]) -> List[int]:
+        """
+            Returns the given CPUs ordered by NUMA node, then L3 cache domain, then physical core, so that any run of
+            consecutive CPUs fills domains before moving on to the next. All CPUs must be known.
+        """
+        return sorted(cpu_ids, key=lambda cpu: (tuple(self.domain(cpu, level) for level in TOPOLOGY_LEVELS), cpu))
+
+    def numaNode(self, cpu_ids: Iterable[int]) -> Optional[int]:
+        """
+            Returns the NUMA node holding most of the given CPUs, the lowest on ties, or None if any CPU is unknown.
+        """
+        counts: Dict[int, int] = {}
+        for cpu in cpu_ids:
+            if cpu not in self._cpus:
+                return None
+            counts[self._cpus[cpu].numa_node] = counts.get(self._cpus[cpu].numa_node, 0) + 1
+        if not counts:
+            return None
+        return min(counts, key=lambda node: (-counts[node], node))
+
+    def misalignedComponents(self, components: Sequence[Iterable[int]], level: str) -> int:
+        """
+            Returns the number of components that share a domain of the given level with another component, i.e. that
+            hold some but not all of the used CPUs of a domain. CPUs that are not in any component do not count, so
+            that e.g. using one hardware thread per core does not make every split misaligned.
+        """
+        component_domains: List[Dict[int, int]] = []
+        domain_sizes: Dict[int, int] = {}
+        for component in components:
+            counts: Dict[int, int] = {}
+            for cpu in component:
+                domain: int = self.domain(cpu, level)
+                counts[domain] = counts.get(domain, 0) + 1
+                domain_sizes[domain] = domain_sizes.get(domain, 0) + 1
+            component_domains.append(counts)
+        return sum(1 for counts in component_domains
+                   if any(count < domain_sizes[domain] for domain, count in counts.items()))
+
+    def alignmentKey(self, components: Sequence[Iterable[int]]) -> Tuple[int, ...]:
+        """
+            Returns the number of misaligned components at each level of TOPOLOGY_LEVELS, so that better aligned
+            splits sort first.
+        """
+        cpu_lists: List[List[int]] = [list(component) for component in components]
+        return tuple(self.misalignedComponents(cpu_lists, level) for level in TOPOLOGY_LEVELS)
+
+
+def _readText(path: str) -> str:
+    with open(path) as fin:
+        return fin.read().strip()
+
+
+def _readL3Cache(cpu_dir: str) -> Optional[List[int]]:
+    cache_dir: str = os.path.join(cpu_dir, "cache")
+    if not os.path.isdir(cache_dir):
+        return None
+    for entry in sorted(os.listdir(cache_dir)):
+        if not _CACHE_DIR_RE.fullmatch(entry):
+            continue
+        index_dir: str = os.path.join(cache_dir, entry)
+        if _readText(os.path.join(index_dir, "level")) == "3":
+            return parseCpuList(_readText(os.path.join(index_dir, "shared_cpu_list")))
+    return None
+
+
+def _readNumaNodes(sysfs_root: str) -> Dict[int, int]:
+    node_dir: str = os.path.join(sysfs_root, "devices", "system", "node")
+    result: Dict[int, int] = {}
+    if not os.path.isdir(node_dir):
+        return result
+    for entry in os.listdir(node_dir):
+        match = _NODE_DIR_RE.fullmatch(entry)
+        if match is None:
+            continue
+        for cpu in parseCpuList(_readText(os.path.join(node_dir, entry, "cpulist"))):
+            result[cpu] = int(match.group(1))
+    return result
+
+
+def readTopology(sysfs_root: str = DEFAULT_SYSFS_ROOT) -> Optional[Topology]:
+    """
+        Reads the topology of the online CPUs from sysfs_root/devices/system/cpu and sysfs_root/devices/system/node.
+        CPUs without NUMA information are put in node 0, and CPUs without L3 cache information share a cache domain
+        with their package.
+
+        Returns None if the topology cannot be read.
+    """
+    logger: logging.Logger = logging.getLogger("gromax")
+    cpu_root: str = os.path.join(sysfs_root, "devices", "system", "cpu")
+    try:
+        numa_nodes: Dict[int, int] = _readNumaNodes(sysfs_root)
+        packages: Dict[int, int] = {}
+        cores: Dict[int, int] = {}
+        l3_caches: Dict[int, Optional[int]] = {}
+        for entry in os.listdir(cpu_root):
+            match = _CPU_DIR_RE.fullmatch(entry)
+            # Offline CPUs have no topology directory.
+            if match is None or not os.path.isdir(os.path.join(cpu_root, entry, "topology")):
+                continue
+            cpu: int = int(match.group(1))
+            cpu_dir: str = os.path.join(cpu_root, entry)
+            packages[cpu] = int(_readText(os.path.join(cpu_dir, "topology", "physical_package_id")))
+            cores[cpu] = min(parseCpuList(_readText(os.path.join(cpu_dir, "topology", "thread_siblings_list"))))
+            l3_cache: Optional[List[int]] = _readL3Cache(cpu_dir)
+            l3_caches[cpu] = min(l3_cache) if l3_cache else None
+    except (OSError, ValueError) as e:
+        logger.debug("Could not read CPU topology from {}: {}".format(sysfs_root, e))
+        return None
+    if not packages:
+        logger.debug("No CPU topology found in {}".format(sysfs_root))
+        return None
+    package_first_cpu: Dict[int, int] = {}
+    for cpu, package in sorted(packages.items()):
+        package_first_cpu.setdefault(package, cpu)
+    topology: Topology = Topology({
+        cpu: CpuTopology(package=packages[cpu], numa_node=numa_nodes.get(cpu, 0),
+                         l3_cache=l3_caches[cpu] if l3_caches[cpu] is not None else package_first_cpu[packages[cpu]],
+                         core=cores[cpu])
+        for cpu in packages
+    })
+    logger.debug("Read topology of {} CPUs in {} packages and {} NUMA nodes".format(
+        len(packages), len(package_first_cpu), len(set(numa_nodes.values())) or 1))
+    return topology
+
+
+def readGpuNumaNodes(sysfs_root: str = DEFAULT_SYSFS_ROOT) -> Dict[int, int]:
+    """
+        Reads the NUMA node of each NVIDIA and AMD GPU from sysfs_root/bus/pci/devices. GPUs are numbered in PCI bus
+        order, as listed by nvidia-smi and by CUDA with CUDA_DEVICE_ORDER=PCI_BUS_ID. GPUs without a known NUMA node
+        are left out.
+
+        Returns an empty mapping if the devices cannot be read.
+    """
+    logger: logging.Logger = logging.getLogger("gromax")
+    device_root: str = os.path.join(sysfs_root, "bus", "pci", "devices")
+    result: Dict[int, int] = {}
+    try:
+        gpu_index: int = 0
+        for entry in sorted(os.listdir(device_root)):
+            device_dir: str = os.path.join(device_root, entry)
+            if not os.path.isfile(os.path.join(device_dir, "class")):
+                continue
+            if (_readText(os.path.join(device_dir, "vendor")) not in _GPU_VENDORS or
+                    not _readText(os.path.join(device_dir, "class")).startswith(_DISPLAY_CONTROLLER_CLASS)):
+                continue
+            numa_node: int = int(_readText(os.path.join(device_dir, "numa_node")))
+            if numa_node >= 0:
+                result[gpu_index] = numa_node
+            gpu_index += 1
+    except (OSError, ValueError) as e:
+        logger.debug("Could not read GPU NUMA nodes from {}: {}".format(sysfs_root, e))
+        return {}
+    return result
+
+
+def describeMisalignment(topology: Topology, components: Sequence[Iterable[int]]) -> str:
+    """
+        Describes which topology boundaries a split straddles, e.g. "NUMA node, core", or "" if none.
+    """
+    names: Dict[str, str] = {"numa_node": "NUMA node", "l3_cache": "L3 cache", "core": "core"}
+    key: Tuple[int, ...] = topology.alignmentKey(components)
+    return ", ".join(names[level] for level, count in zip(TOPOLOGY_LEVELS, key) if count)